@@ -0,0 +1,74 @@
+""" Measure updating an allowed index after the ACL of a folder near the root
+changes, comparing reindexing every resource below it in an ``AllowedIndex``
+with ``RegionAllowedIndex.acl_modified``. """
+import time
+
+from pyramid import testing
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.security import Allow
+
+from substanced.catalog.discriminators import AllowedIndexDiscriminator
+from substanced.catalog.indexes import (
+    AllowedIndex,
+    RegionAllowedIndex,
+    )
+from substanced.interfaces import IFolder
+from substanced.objectmap import ObjectMap
+from substanced.util import postorder
+
+from common import (
+    parser,
+    report,
+    tree_paths,
+    )
+
+def build(size, index):
+    root = testing.DummyResource(__provides__=IFolder)
+    root.__acl__ = [(Allow, 'admin', 'view')]
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    nodes = {(u'',): root}
+    for path in tree_paths(size, prefix=(u'',)):
+        if path != (u'',):
+            node = testing.DummyResource(__provides__=IFolder)
+            nodes[path[:-1]][path[-1]] = node
+            nodes[path] = node
+        objectmap.add(nodes[path], path)
+    catalog = testing.DummyResource()
+    catalog['allowed'] = index
+    catalog.__parent__ = root
+    for node in nodes.values():
+        index.index_doc(node.__oid__, node)
+    return root
+
+def postorder_reindex(index, folder):
+    for node in postorder(folder):
+        index.reindex_doc(node.__oid__, node)
+
+def region_update(index, folder):
+    index.acl_modified(folder)
+
+def main():
+    args = parser(__doc__, [10000, 50000]).parse_args()
+    config = testing.setUp()
+    config.registry.registerUtility(
+        ACLAuthorizationPolicy(), IAuthorizationPolicy
+        )
+    rows = []
+    for size in args.sizes:
+        for name, cls, func in (
+            ('AllowedIndex', AllowedIndex, postorder_reindex),
+            ('RegionAllowedIndex', RegionAllowedIndex, region_update),
+            ):
+            index = cls(AllowedIndexDiscriminator(('view',)))
+            root = build(size, index)
+            folder = root['n0']
+            folder.__acl__ = [(Allow, 'bob', 'view')]
+            start = time.time()
+            func(index, folder)
+            rows.append((size, name, '%.3f' % (time.time() - start)))
+    testing.tearDown()
+    report(('resources', 'index', 'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+""" Measure indexing a batch of new resources into a catalog of field
+indexes, comparing one ``Catalog.index_resource`` call per resource with a
+single ``Catalog.index_resources`` call. """
+import random
+
+import transaction
+
+from substanced.catalog import Catalog
+from substanced.catalog.indexes import FieldIndex
+from substanced.interfaces import MODE_IMMEDIATE
+
+from common import (
+    Storage,
+    parser,
+    report,
+    timed_commit,
+    )
+
+class Resource(object):
+    def __init__(self, n):
+        self.color = n % 7
+        self.size = n % 101
+        self.title = u'title %d' % (n % 1000)
+
+def one_at_a_time(catalog, pairs):
+    for oid, resource in pairs:
+        catalog.index_resource(resource, oid, action_mode=MODE_IMMEDIATE)
+
+def bulk(catalog, pairs):
+    catalog.index_resources(pairs, action_mode=MODE_IMMEDIATE)
+
+def main():
+    args = parser(__doc__, [10000, 50000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        rand = random.Random(size)
+        pairs = [ (rand.randrange(1, 2**62), Resource(n))
+                  for n in range(size) ]
+        for name, func in (('index_resource', one_at_a_time),
+                           ('index_resources', bulk)):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                catalog = Catalog()
+                for attr in ('color', 'size', 'title'):
+                    catalog[attr] = FieldIndex(attr)
+                conn.root()['catalog'] = catalog
+                transaction.commit()
+                elapsed, written = timed_commit(storage, func, catalog, pairs)
+                rows.append((size, name, '%.2f' % elapsed, written))
+                conn.close()
+            finally:
+                storage.close()
+    report(('resources', 'api', 'seconds', 'bytes written'), rows)
+
+if __name__ == '__main__':
+    main()
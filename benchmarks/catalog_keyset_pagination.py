@@ -0,0 +1,84 @@
+""" Measure fetching a page of a sorted result deep into it: sorting the
+first ``start + page size`` ids and skipping ``start`` of them (as the folder
+contents view did for every page), against keyset pagination with
+``substanced.catalog.util.sort_page`` continuing from the cursor of the page
+before.  Both a field index and an unordered folder are used as the sort
+index. """
+import itertools
+import random
+import time
+
+from hypatia.util import ResultSet
+
+from substanced.catalog.indexes import FieldIndex
+from substanced.catalog.util import (
+    encode_cursor,
+    sort_page,
+    )
+from substanced.folder import Folder
+from substanced.objectmap import ObjectMap
+
+from common import (
+    parser,
+    report,
+    )
+
+PAGE = 40
+REPEAT = 5
+
+class Item(object):
+    def __init__(self, oid, title):
+        self.__oid__ = oid
+        self.title = title
+
+def build(size):
+    names = [ u'item%07d' % n for n in random.sample(range(10 ** 7), size) ]
+    items = [ Item(oid + 1, name) for oid, name in enumerate(names) ]
+    folder = Folder(dict((item.title, item) for item in items))
+    folder.__name__ = ''
+    objectmap = folder.__objectmap__ = ObjectMap(folder)
+    for item in items:
+        objectmap.add(item, (u'', item.title))
+    index = FieldIndex('title')
+    index.index_docs([ (item.__oid__, item) for item in items ])
+    return folder, index
+
+def offset_page(sort_index, ids, start):
+    resultset = ResultSet(ids, len(ids), None)
+    resultset = resultset.sort(sort_index, limit=start + PAGE)
+    return list(itertools.islice(resultset.ids, start, start + PAGE))
+
+def keyset_page(sort_index, ids, cursor):
+    resultset = ResultSet(ids, len(ids), None)
+    page, cursor = sort_page(resultset, sort_index, PAGE, cursor=cursor)
+    return list(page.ids)
+
+def timed(func, *arg):
+    start = time.time()
+    for n in range(REPEAT):
+        result = func(*arg)
+    return (time.time() - start) / REPEAT, result
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    random.seed(1)
+    rows = []
+    for size in args.sizes:
+        folder, index = build(size)
+        ids = index.family.IF.Set(range(1, size + 1))
+        for name, sort_index in (('field index', index), ('folder', folder)):
+            ordered = list(sort_index.sort(ids))
+            for start in (0, size // 100, size // 10, size - PAGE):
+                cursor = None
+                if start:
+                    cursor = encode_cursor(
+                        sort_index.sort_key(ordered[start - 1]))
+                offset, expected = timed(offset_page, sort_index, ids, start)
+                keyset, page = timed(keyset_page, sort_index, ids, cursor)
+                assert page == expected
+                rows.append((size, name, start, '%.3f' % (offset * 1000),
+                             '%.3f' % (keyset * 1000)))
+    report(('items', 'sort index', 'start', 'offset ms', 'keyset ms'), rows)
+
+if __name__ == '__main__':
+    main()
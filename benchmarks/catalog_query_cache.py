@@ -0,0 +1,113 @@
+""" Measure executing the same folder contents queries (the children of a
+folder which a set of principals may view) over and over, comparing a
+catalog without a query cache with one which has ``query_cache_size`` set,
+and the cost of misses when an index changes before every round of queries.
+Also measure indexing the resources into each catalog, as index generations
+are only kept for catalogs with a query cache. """
+import time
+
+from pyramid import testing
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.security import Allow
+
+from substanced.catalog import Catalog
+from substanced.catalog.discriminators import AllowedIndexDiscriminator
+from substanced.catalog.indexes import (
+    AllowedIndex,
+    PathIndex,
+    )
+from substanced.interfaces import (
+    IFolder,
+    MODE_IMMEDIATE,
+    )
+from substanced.objectmap import ObjectMap
+
+from common import (
+    parser,
+    report,
+    tree_paths,
+    )
+
+FOLDERS = 20
+REPEAT = 50
+PRINCIPALS = ['system.Everyone', 'system.Authenticated', 'bob', 'group:staff']
+
+def build(size, query_cache_size=None):
+    root = testing.DummyResource(__provides__=IFolder)
+    root.__acl__ = [(Allow, 'group:staff', 'view')]
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    nodes = {(u'',): root}
+    for path in tree_paths(size, prefix=(u'',)):
+        if path != (u'',):
+            node = testing.DummyResource(__provides__=IFolder)
+            nodes[path[:-1]][path[-1]] = node
+            nodes[path] = node
+        objectmap.add(nodes[path], path)
+    catalog = Catalog()
+    catalog.query_cache_size = query_cache_size
+    catalog.__parent__ = root
+    catalog.__name__ = 'catalog'
+    for name, index in (
+        ('path', PathIndex()),
+        ('allowed', AllowedIndex(AllowedIndexDiscriminator(('view',)))),
+        ):
+        index.__parent__ = catalog
+        index.__name__ = name
+        index.action_mode = MODE_IMMEDIATE
+        catalog.data[name] = index
+    start = time.time()
+    for node in nodes.values():
+        catalog.index_resource(node, oid=node.__oid__)
+    indexing = time.time() - start
+    folders = [ nodes[path] for path in sorted(nodes)[:FOLDERS] ]
+    return catalog, folders, indexing
+
+def run(catalog, folders, change=False):
+    path = catalog['path']
+    allowed = catalog['allowed']
+    for n in range(REPEAT):
+        if change:
+            # makes the query of each folder in this round a miss
+            node = folders[-1]
+            catalog.reindex_resource(node, oid=node.__oid__)
+        for folder in folders:
+            query = path.eq(folder, depth=1, include_origin=False)
+            query = query & allowed.allows(PRINCIPALS, 'view')
+            len(query.execute())
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    config = testing.setUp()
+    config.registry.registerUtility(
+        ACLAuthorizationPolicy(), IAuthorizationPolicy
+        )
+    rows = []
+    for size in args.sizes:
+        for name, query_cache_size in (('uncached', None), ('cached', 1000)):
+            catalog, folders, indexing = build(size, query_cache_size)
+            rows.append((size, size, 'index', name, '%.3f' % indexing, '-'))
+
+            def measure(name, change=False):
+                before = catalog.query_cache_info() or {}
+                start = time.time()
+                run(catalog, folders, change)
+                elapsed = time.time() - start
+                after = catalog.query_cache_info()
+                hitrate = '-'
+                if after is not None:
+                    hits = after['hits'] - before.get('hits', 0)
+                    misses = after['misses'] - before.get('misses', 0)
+                    hitrate = '%.2f' % (float(hits) / (hits + misses))
+                rows.append((size, FOLDERS * REPEAT, 'query', name,
+                             '%.3f' % elapsed, hitrate))
+
+            measure(name)
+            if query_cache_size:
+                measure('cached, index changed every round', change=True)
+    testing.tearDown()
+    report(('resources', 'operations', 'operation', 'catalog', 'seconds',
+            'hit rate'), rows)
+
+if __name__ == '__main__':
+    main()
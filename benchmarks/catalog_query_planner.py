@@ -0,0 +1,103 @@
+""" Measure executing folder contents queries written with the least
+selective term first (the allowed index, which matches every resource),
+comparing executing them in the order written with executing them through
+the query planner, which runs the path and name terms first and skips the
+allowed term when they match nothing. """
+import time
+
+from pyramid import testing
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.security import (
+    Allow,
+    Everyone,
+    )
+
+from substanced.catalog import Catalog
+from substanced.catalog.discriminators import AllowedIndexDiscriminator
+from substanced.catalog.indexes import (
+    AllowedIndex,
+    FieldIndex,
+    PathIndex,
+    )
+from substanced.interfaces import (
+    IFolder,
+    MODE_IMMEDIATE,
+    )
+from substanced.objectmap import ObjectMap
+
+from common import (
+    parser,
+    report,
+    tree_paths,
+    )
+
+FOLDERS = 100
+REPEAT = 10
+PRINCIPALS = [Everyone, 'system.Authenticated', 'bob', 'group:staff']
+
+def build(size):
+    root = testing.DummyResource(__provides__=IFolder)
+    root.__acl__ = [(Allow, Everyone, 'view')]
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    nodes = {(u'',): root}
+    for path in tree_paths(size, prefix=(u'',)):
+        if path != (u'',):
+            node = testing.DummyResource(__provides__=IFolder)
+            nodes[path[:-1]][path[-1]] = node
+            nodes[path] = node
+        objectmap.add(nodes[path], path)
+    catalog = Catalog()
+    catalog.__parent__ = root
+    catalog.__name__ = 'catalog'
+    for name, index in (
+        ('path', PathIndex()),
+        ('name', FieldIndex('__name__')),
+        ('allowed', AllowedIndex(AllowedIndexDiscriminator(('view',)))),
+        ):
+        index.__parent__ = catalog
+        index.__name__ = name
+        index.action_mode = MODE_IMMEDIATE
+        catalog.data[name] = index
+    for node in nodes.values():
+        catalog.index_resource(node, oid=node.__oid__)
+    # a mix of folders with children and leaves
+    paths = sorted(nodes, key=len)
+    folders = [ nodes[path] for path in paths[:FOLDERS // 2] ]
+    folders.extend([ nodes[path] for path in paths[-FOLDERS // 2:] ])
+    return catalog, folders
+
+def run(catalog, folders):
+    path = catalog['path']
+    name = catalog['name']
+    allowed = catalog['allowed']
+    found = 0
+    for n in range(REPEAT):
+        for folder in folders:
+            query = (allowed.allows(PRINCIPALS, 'view') &
+                     name.eq(u'n1') &
+                     path.eq(folder, depth=1, include_origin=False))
+            found += len(query.execute())
+    return found
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    config = testing.setUp()
+    config.registry.registerUtility(
+        ACLAuthorizationPolicy(), IAuthorizationPolicy
+        )
+    rows = []
+    for size in args.sizes:
+        catalog, folders = build(size)
+        for name, plan_queries in (('as written', False), ('planned', True)):
+            catalog.plan_queries = plan_queries
+            start = time.time()
+            found = run(catalog, folders)
+            elapsed = time.time() - start
+            rows.append((size, FOLDERS * REPEAT, name, found,
+                         '%.3f' % elapsed))
+    testing.tearDown()
+    report(('resources', 'queries', 'order', 'results', 'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+""" Measure sorting a result set to show its first page (``limit`` docids)
+by result size and limit: sorting all of the result and slicing it, as
+before, against the partial selection done by ``FieldIndex.sort`` and
+``Folder.sort`` when given a limit.  Each sort starts from a cold
+connection cache, so the index sets and resources it needs are loaded from
+the database.
+"""
+import itertools
+import random
+import time
+
+import transaction
+from persistent import Persistent
+
+from substanced.catalog.indexes import FieldIndex
+from substanced.folder import Folder
+from substanced.objectmap import ObjectMap
+from substanced.util import get_oid
+
+from common import (
+    Storage,
+    parser,
+    report,
+    )
+
+LIMITS = (40, 400)
+SHARES = (1, 10, 100)
+
+class Item(Persistent):
+    def __init__(self, oid, title):
+        self.__oid__ = oid
+        self.title = title
+
+def full_folder_sort(folder, oids, reverse=False, limit=None):
+    # Folder.sort before it stopped at ``limit``
+    ids = []
+    for resource in folder.values():
+        oid = get_oid(resource)
+        if oid in oids:
+            ids.append(oid)
+    if reverse:
+        ids = ids[::-1]
+    if limit is not None:
+        ids = ids[:limit]
+    return ids
+
+def build(storage, size):
+    conn = storage.open()
+    root = conn.root()
+    names = [ u'item%07d' % n for n in random.sample(range(10 ** 7), size) ]
+    items = [ Item(oid + 1, name) for oid, name in enumerate(names) ]
+    folder = Folder(dict((item.title, item) for item in items))
+    folder.__name__ = ''
+    objectmap = folder.__objectmap__ = ObjectMap(folder)
+    for item in items:
+        objectmap.add(item, (u'', item.title))
+    index = FieldIndex('title')
+    index.index_docs([ (item.__oid__, item) for item in items ])
+    root['folder'] = folder
+    root['field index'] = index
+    transaction.commit()
+    conn.close()
+
+def full_index_sort(index, docids, limit):
+    return list(itertools.islice(
+        index.sort(docids, sort_type='timsort'), limit))
+
+def index_sort(index, docids, limit):
+    return list(index.sort(docids, limit=limit))
+
+def timed(storage, name, sort, oids, limit):
+    # sort from a cold connection cache
+    conn = storage.open()
+    conn.cacheMinimize()
+    sort_index = conn.root()[name]
+    docids = sort_index.family.IF.Set(oids)
+    start = time.time()
+    sort(sort_index, docids, limit=limit)
+    elapsed = time.time() - start
+    conn.close()
+    return elapsed
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    random.seed(1)
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        build(storage, size)
+        for share in SHARES:
+            oids = sorted(random.sample(range(1, size + 1), size // share))
+            for limit in LIMITS:
+                for name, sorts in (
+                    ('field index', (full_index_sort, index_sort)),
+                    ('folder', (full_folder_sort, Folder.sort)),
+                    ):
+                    timings = []
+                    for sort in sorts:
+                        timings.append(
+                            '%.4f' % timed(storage, name, sort, oids, limit))
+                    rows.append((size, len(oids), limit, name) +
+                                tuple(timings))
+        storage.close()
+    report(('items', 'results', 'limit', 'sort index', 'full sort s',
+            'top-k s'), rows)
+
+if __name__ == '__main__':
+    main()
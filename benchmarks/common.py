@@ -0,0 +1,72 @@
+""" Helpers shared by the benchmark scripts. """
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import transaction
+from ZODB import DB
+from ZODB.FileStorage import FileStorage
+
+class Storage(object):
+    """ A throwaway FileStorage-backed database in a temporary directory """
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'Data.fs')
+        self.db = DB(FileStorage(self.path))
+
+    def open(self):
+        return self.db.open()
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def close(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+class Node(object):
+    """ A minimal located object for use with the object map """
+    def __init__(self, name, parent):
+        self.__name__ = name
+        self.__parent__ = parent
+
+def timed_commit(storage, func, *arg):
+    """ Run ``func(*arg)`` and commit, returning (seconds, bytes written) """
+    before = storage.size()
+    start = time.time()
+    func(*arg)
+    transaction.commit()
+    elapsed = time.time() - start
+    return elapsed, storage.size() - before
+
+def tree_paths(size, fanout=50, prefix=('',)):
+    """ Return ``size`` path tuples forming a tree under ``prefix`` with at
+    most ``fanout`` children per node, parents before children """
+    paths = [prefix]
+    i = 0
+    while len(paths) < size:
+        parent = paths[i]
+        for n in range(fanout):
+            if len(paths) == size:
+                break
+            paths.append(parent + (u'n%d' % n,))
+        i += 1
+    return paths
+
+def parser(description, sizes):
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument(
+        '--sizes', type=int, nargs='+', default=sizes,
+        help='subtree sizes to measure (default: %s)' % (
+            ' '.join(map(str, sizes))),
+        )
+    return p
+
+def report(header, rows):
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    fmt = '  '.join('%%%ds' % w for w in widths)
+    print(fmt % tuple(header))
+    for row in rows:
+        print(fmt % tuple(row))
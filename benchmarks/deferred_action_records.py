@@ -0,0 +1,81 @@
+""" Measure the storage size, load time and conflict resolution time of a
+deferred indexing actions bucket holding many actions, comparing actions
+pickled one instance at a time with the compact record encoding. """
+import time
+
+import persistent
+import transaction
+
+from substanced.catalog.deferred import (
+    ActionsBucket,
+    IndexAction,
+    )
+from substanced.catalog.indexes import FieldIndex
+
+from common import (
+    Storage,
+    parser,
+    report,
+    timed_commit,
+    )
+
+class InstanceBucket(ActionsBucket):
+    """ A bucket which pickles its actions as a list of instances """
+    __getstate__ = persistent.Persistent.__getstate__
+
+def fill(bucket, index, size):
+    bucket.extend([ IndexAction(index, None, oid) for oid in range(size) ])
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        for name, factory in (('instances', InstanceBucket),
+                              ('records', ActionsBucket)):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                root = conn.root()
+                index = root['index'] = FieldIndex('title')
+                index.__oid__ = 1
+                bucket = root['bucket'] = factory()
+                transaction.commit()
+                elapsed, written = timed_commit(
+                    storage, fill, bucket, index, size)
+                conn.close()
+
+                # load the bucket in a fresh connection
+                tm1 = transaction.TransactionManager()
+                conn1 = storage.db.open(transaction_manager=tm1)
+                conn1.cacheMinimize()
+                start = time.time()
+                bucket1 = conn1.root()['bucket']
+                len(bucket1)
+                loaded = time.time() - start
+
+                # append from two connections; the second commit resolves
+                # the conflict
+                tm2 = transaction.TransactionManager()
+                conn2 = storage.db.open(transaction_manager=tm2)
+                bucket2 = conn2.root()['bucket']
+                len(bucket2)
+                index1 = conn1.root()['index']
+                index2 = conn2.root()['index']
+                bucket1.extend([IndexAction(index1, None, size)])
+                bucket2.extend([IndexAction(index2, None, size + 1)])
+                tm1.commit()
+                start = time.time()
+                tm2.commit()
+                resolved = time.time() - start
+                conn1.close()
+                conn2.close()
+
+                rows.append((size, name, written, '%.3f' % elapsed,
+                             '%.3f' % loaded, '%.3f' % resolved))
+            finally:
+                storage.close()
+    report(('actions', 'encoding', 'bytes', 'commit s', 'load s',
+            'resolve s'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+""" Measure locating the resources of a batch of deferred indexing actions
+(one action per index per resource) from a cold connection cache, comparing
+each action traversing from the root with actions sharing the resources and
+folders found while the resource resolver is active. """
+import time
+
+import transaction
+from persistent.mapping import PersistentMapping
+
+from substanced.catalog.deferred import (
+    ReindexAction,
+    resource_resolver,
+    )
+from substanced.catalog.indexes import FieldIndex
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+INDEXES = 5
+
+class Folder(PersistentMapping):
+    __name__ = __parent__ = None
+
+def build(root, size):
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    objectmap.add(root, ('',))
+    oids = []
+    for path in tree_paths(size)[1:]:
+        parent = objectmap.object_for(path[:-1])
+        folder = parent[path[-1]] = Folder()
+        folder.__name__ = path[-1]
+        folder.__parent__ = parent
+        oids.append(objectmap.add(folder, path))
+    return oids
+
+def find_all(indexes, oids):
+    for oid in oids:
+        for index in indexes:
+            ReindexAction(index, None, oid).find_resource()
+
+def resolved(indexes, oids):
+    with resource_resolver.active():
+        find_all(indexes, oids)
+
+def main():
+    args = parser(__doc__, [2000, 20000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        try:
+            conn = storage.open()
+            root = conn.root()['site'] = Folder()
+            for n in range(INDEXES):
+                index = root['index%d' % n] = FieldIndex('title')
+                index.__parent__ = root
+                index.__oid__ = n + 1
+            oids = build(root, size)
+            transaction.commit()
+            conn.close()
+            for name, func in (('per action', find_all),
+                               ('resolver', resolved)):
+                conn = storage.open()
+                conn.cacheMinimize()
+                root = conn.root()['site']
+                indexes = [ root['index%d' % n] for n in range(INDEXES) ]
+                start = time.time()
+                func(indexes, oids)
+                elapsed = time.time() - start
+                rows.append((size, len(oids) * INDEXES, name,
+                             '%.3f' % elapsed))
+                transaction.abort()
+                conn.close()
+        finally:
+            storage.close()
+    report(('resources', 'actions', 'lookup', 'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+""" Measure the cost of appending deferred indexing actions to a queue which
+already holds a backlog, comparing a queue that keeps every action in one
+list with the bucketed ``ActionsQueue``. """
+import transaction
+
+from substanced.catalog.deferred import (
+    ActionsQueue,
+    IndexAction,
+    )
+from substanced.catalog.indexes import FieldIndex
+
+from common import (
+    Storage,
+    parser,
+    report,
+    timed_commit,
+    )
+
+APPENDS = 20
+PER_APPEND = 3 # actions deferred by one request
+
+def single_list():
+    queue = ActionsQueue()
+    queue.buckets = () # queues created before buckets existed
+    return queue
+
+def append(queue, actions):
+    queue.extend(actions)
+
+def main():
+    args = parser(__doc__, [1000, 10000, 50000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        for name, factory in (('single list', single_list),
+                              ('bucketed', ActionsQueue)):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                root = conn.root()
+                index = root['index'] = FieldIndex('title')
+                index.__oid__ = 1
+                queue = root['queue'] = factory()
+                transaction.commit()
+                # build the backlog the way requests would (one small
+                # append at a time), but commit it once
+                oid = 0
+                while oid < size:
+                    queue.extend([ IndexAction(index, None, oid + i)
+                                   for i in range(PER_APPEND) ])
+                    oid += PER_APPEND
+                transaction.commit()
+                elapsed = written = 0
+                for n in range(APPENDS):
+                    actions = [ IndexAction(index, None, oid + i)
+                                for i in range(PER_APPEND) ]
+                    oid += PER_APPEND
+                    e, w = timed_commit(storage, append, queue, actions)
+                    elapsed += e
+                    written += w
+                rows.append((size, name,
+                             '%.2f' % (elapsed * 1000 / APPENDS),
+                             written // APPENDS))
+                conn.close()
+            finally:
+                storage.close()
+    report(('queue length', 'queue', 'ms per append', 'bytes per append'),
+           rows)
+
+if __name__ == '__main__':
+    main()
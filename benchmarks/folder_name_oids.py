@@ -0,0 +1,91 @@
+""" Measure the object loads and time taken to sort the items of an unordered
+folder (the first page and all of them, as the folder contents view does)
+and to set the order of a folder, from a cold connection cache: with the
+folder's name -> oid map, against a folder without one (as created before it
+existed), which loads each of its items to read its oid. """
+import random
+import time
+
+import transaction
+from persistent import Persistent
+
+from substanced.folder import Folder
+
+from common import (
+    Storage,
+    parser,
+    report,
+    )
+
+PAGE = 40
+
+class Item(Persistent):
+    def __init__(self, oid, title):
+        self.__oid__ = oid
+        self.title = title
+
+def build(storage, size):
+    conn = storage.open()
+    root = conn.root()
+    for name in ('mapped', 'unmapped'):
+        numbers = random.sample(range(10 ** 7), size)
+        names = [ u'item%07d' % n for n in numbers ]
+        data = {}
+        for oid, itemname in enumerate(names):
+            data[itemname] = Item(oid + 1, itemname)
+        folder = Folder(data)
+        if name == 'unmapped':
+            del folder._oids
+        root[name] = folder
+    transaction.commit()
+    conn.close()
+
+def first_page(folder, oids):
+    return folder.sort(oids, limit=PAGE)
+
+def all_items(folder, oids):
+    return folder.sort(oids)
+
+def set_order(folder, oids):
+    names = list(folder.keys())
+    names.reverse()
+    folder.set_order(names)
+    transaction.abort()
+
+def timed(storage, name, func, oids):
+    # run from a cold connection cache, counting the objects loaded
+    conn = storage.open()
+    conn.cacheMinimize()
+    folder = conn.root()[name]
+    conn.getTransferCounts(True)
+    start = time.time()
+    func(folder, oids)
+    elapsed = time.time() - start
+    loads = conn.getTransferCounts(True)[0]
+    conn.close()
+    return loads, elapsed
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    random.seed(1)
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        build(storage, size)
+        oids = Folder.family.IF.Set(range(1, size + 1))
+        for opname, func in (
+            ('first page', first_page),
+            ('all items', all_items),
+            ('set order', set_order),
+            ):
+            row = [size, opname]
+            for name in ('unmapped', 'mapped'):
+                loads, elapsed = timed(storage, name, func, oids)
+                row.extend([loads, '%.4f' % elapsed])
+            rows.append(tuple(row))
+        storage.close()
+    report(('items', 'operation', 'loads before', 's before', 'loads after',
+            's after'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""" Compare the storage size, loaded memory and lookup times of object maps
+storing paths as tuples of names (the default) and as interned name ids, with
+the nested and the compact path index. """
+import gc
+import time
+try:
+    import tracemalloc
+except ImportError: # pragma: no cover (python 2)
+    tracemalloc = None
+
+import transaction
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+def named_paths(size, fanout):
+    # tree_paths names siblings n0, n1, ...; give every object a name of its
+    # own, the way content names usually are
+    names = {(u'',): (u'',)}
+    for path in tree_paths(size, fanout=fanout)[1:]:
+        names[path] = names[path[:-1]] + (u'document-%d' % len(names),)
+    return sorted(names.values(), key=len)
+
+def load_paths(conn, oids):
+    # load every path from a cold cache, returning the memory it took
+    conn.cacheMinimize()
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    objectmap = conn.root()['objectmap']
+    for oid in oids:
+        path_tuple = objectmap.path_for(oid)
+        objectmap.objectid_for(path_tuple)
+    if tracemalloc is None:
+        return '-'
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used
+
+def timeit(func, *arg):
+    start = time.time()
+    func(*arg)
+    return '%.3f' % (time.time() - start)
+
+def main():
+    p = parser(__doc__, [10000, 100000])
+    p.add_argument('--fanout', type=int, default=10,
+                   help='children per folder; lower means a deeper tree')
+    args = p.parse_args()
+    rows = []
+    for size in args.sizes:
+        paths = named_paths(size, args.fanout)
+        depth = max(len(path) for path in paths) - 1
+        for compact, intern_paths in ((False, False), (False, True),
+                                      (True, False), (True, True)):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                objectmap = ObjectMap(None, compact_pathindex=compact,
+                                      intern_paths=intern_paths)
+                conn.root()['objectmap'] = objectmap
+                start = time.time()
+                oids = [ objectmap.add(Node(path[-1], None), path)
+                         for path in paths ]
+                transaction.commit()
+                add = '%.3f' % (time.time() - start)
+                memory = load_paths(conn, oids)
+                rows.append((
+                    size,
+                    depth,
+                    compact and 'compact' or 'nested',
+                    intern_paths and 'interned' or 'tuples',
+                    storage.size(),
+                    memory,
+                    add,
+                    timeit(load_paths, conn, oids),
+                    timeit(objectmap.pathlookup, (u'',)),
+                    ))
+                conn.close()
+            finally:
+                storage.close()
+    report(('nodes', 'depth', 'index', 'paths', 'Data.fs bytes', 'loaded bytes',
+            'add s', 'load s', 'lookup s'), rows)
+
+if __name__ == '__main__':
+    main()
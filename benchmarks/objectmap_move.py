@@ -0,0 +1,61 @@
+""" Compare moving a subtree in the object map via ``ObjectMap.move`` against
+the remove-and-readd-every-node strategy Folder.move used to rely on. """
+import transaction
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    parser,
+    report,
+    timed_commit,
+    tree_paths,
+    )
+
+def populate(conn, size):
+    root = conn.root()
+    objectmap = root['objectmap'] = ObjectMap(None)
+    objectmap.add(Node('', None), (u'',))
+    objectmap.add(Node('other', None), (u'', u'other'))
+    for path in tree_paths(size, prefix=(u'', u'src')):
+        objectmap.add(Node(path[-1], None), path)
+    transaction.commit()
+    return objectmap
+
+def remove_and_readd(objectmap, old, new):
+    oids = [(oid, objectmap.path_for(oid))
+            for oid in objectmap.pathlookup(old)]
+    objectmap.remove(old, moving=True)
+    for oid, path in oids:
+        node = Node(path[-1], None)
+        node.__oid__ = oid
+        objectmap.add(node, new + path[len(old):], moving=True)
+
+def move(objectmap, old, new):
+    objectmap.move(old, new)
+
+def main():
+    args = parser(__doc__, [1000, 10000, 50000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        for name, func in (('remove+add', remove_and_readd), ('move', move)):
+            for label, new in (
+                    ('rename', (u'', u'dst')),
+                    ('move', (u'', u'other', u'dst')),
+                    ):
+                storage = Storage()
+                try:
+                    conn = storage.open()
+                    objectmap = populate(conn, size)
+                    elapsed, written = timed_commit(
+                        storage, func, objectmap, (u'', u'src'), new)
+                    rows.append(
+                        (size, label, name, '%.3f' % elapsed, written))
+                    conn.close()
+                finally:
+                    storage.close()
+    report(('nodes', 'operation', 'strategy', 'seconds', 'commit bytes'), rows)
+
+if __name__ == '__main__':
+    main()
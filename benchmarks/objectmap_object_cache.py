@@ -0,0 +1,66 @@
+""" Measure repeated ``ObjectMap.object_for`` lookups of a small set of hot
+object ids (such as the users of authenticated requests) in a tree of
+folders, with and without the object map's object cache. """
+import random
+import time
+
+import transaction
+from persistent.mapping import PersistentMapping
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+LOOKUPS = 100000
+HOT = 100
+
+class Folder(PersistentMapping):
+    __name__ = __parent__ = None
+
+def build(root, size):
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    objectmap.add(root, ('',))
+    for path in tree_paths(size, fanout=10)[1:]:
+        parent = objectmap.object_for(path[:-1])
+        folder = parent[path[-1]] = Folder()
+        folder.__name__ = path[-1]
+        folder.__parent__ = parent
+        objectmap.add(folder, path)
+
+def main():
+    args = parser(__doc__, [1000, 100000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        try:
+            conn = storage.open()
+            build(conn.root().setdefault('site', Folder()), size)
+            transaction.commit()
+            conn.close()
+            for cache_size in (None, 1000):
+                conn = storage.open()
+                objectmap = conn.root()['site'].__objectmap__
+                objectmap.object_cache_size = cache_size
+                oids = list(objectmap.objectid_to_path.keys())
+                hot = random.Random(size).sample(oids, HOT)
+                start = time.time()
+                for n in range(LOOKUPS):
+                    objectmap.object_for(hot[n % HOT])
+                elapsed = time.time() - start
+                info = objectmap.object_cache_info()
+                rows.append((size, cache_size or 'off',
+                             '%.2f' % (elapsed * 1e6 / LOOKUPS),
+                             info and info['hits'] or '-'))
+                transaction.abort()
+                conn.close()
+        finally:
+            storage.close()
+    report(('objects', 'cache', 'us per lookup', 'hits'), rows)
+
+if __name__ == '__main__':
+    main()
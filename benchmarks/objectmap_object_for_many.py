@@ -0,0 +1,69 @@
+""" Measure finding a batch of objects by object id (in object id order, as
+``Catalog.reindex`` does) from a cold connection cache, comparing one
+``ObjectMap.object_for`` call per object id with a single
+``ObjectMap.object_for_many`` call. """
+import time
+
+import transaction
+from persistent.mapping import PersistentMapping
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+class Folder(PersistentMapping):
+    __name__ = __parent__ = None
+
+def build(root, size):
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    objectmap.add(root, ('',))
+    for path in tree_paths(size)[1:]:
+        parent = objectmap.object_for(path[:-1])
+        folder = parent[path[-1]] = Folder()
+        folder.__name__ = path[-1]
+        folder.__parent__ = parent
+        objectmap.add(folder, path)
+    return objectmap
+
+def one_at_a_time(objectmap, oids):
+    for oid in oids:
+        objectmap.object_for(oid)
+
+def many(objectmap, oids):
+    for oid, obj in objectmap.object_for_many(oids, prefetch=100):
+        pass
+
+def main():
+    args = parser(__doc__, [2000, 20000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        try:
+            conn = storage.open()
+            root = conn.root()['site'] = Folder()
+            build(root, size)
+            transaction.commit()
+            conn.close()
+            for name, func in (('object_for', one_at_a_time),
+                               ('object_for_many', many)):
+                conn = storage.open()
+                conn.cacheMinimize()
+                objectmap = conn.root()['site'].__objectmap__
+                oids = list(objectmap.objectid_to_path.keys())
+                start = time.time()
+                func(objectmap, oids)
+                elapsed = time.time() - start
+                rows.append((size, name, '%.3f' % elapsed))
+                transaction.abort()
+                conn.close()
+        finally:
+            storage.close()
+    report(('objects', 'api', 'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
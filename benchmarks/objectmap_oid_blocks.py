@@ -0,0 +1,96 @@
+""" Measure the write conflict rate of concurrent object map adds from several
+threads (each with its own connection to a shared FileStorage, standing in
+for ZEO clients) with and without block allocation of object ids. """
+import argparse
+import threading
+import time
+
+import transaction
+from ZODB.POSException import ConflictError
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    report,
+    )
+
+def worker(db, num, transactions, adds, stats):
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    root = conn.root()
+    for txn in range(transactions):
+        while True:
+            tm.begin()
+            objectmap = root['objectmap']
+            for i in range(adds):
+                path = (u'', u'w%d' % num, u't%d-%d' % (txn, i))
+                objectmap.add(Node(path[-1], None), path)
+            try:
+                tm.commit()
+            except ConflictError:
+                tm.abort()
+                stats['conflicts'] += 1
+            else:
+                stats['commits'] += 1
+                break
+    conn.close()
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--threads', type=int, default=4)
+    p.add_argument('--transactions', type=int, default=200,
+                   help='transactions per thread')
+    p.add_argument('--adds', type=int, default=5,
+                   help='objects added per transaction')
+    p.add_argument('--block-size', type=int, default=100000)
+    args = p.parse_args()
+    rows = []
+    for compact in (False, True):
+        for block_size in (None, args.block_size):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                conn.root()['objectmap'] = objectmap = ObjectMap(
+                    None,
+                    compact_pathindex=compact,
+                    oid_block_size=block_size,
+                    )
+                objectmap.add(Node(u'', None), (u'',))
+                for num in range(args.threads):
+                    path = (u'', u'w%d' % num)
+                    objectmap.add(Node(path[-1], None), path)
+                transaction.commit()
+                conn.close()
+                stats = {'conflicts':0, 'commits':0}
+                threads = [
+                    threading.Thread(
+                        target=worker,
+                        args=(storage.db, num, args.transactions, args.adds,
+                              stats)
+                        )
+                    for num in range(args.threads)
+                    ]
+                start = time.time()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.time() - start
+                attempts = stats['conflicts'] + stats['commits']
+                rows.append((
+                    compact and 'compact' or 'nested',
+                    block_size or 'random',
+                    stats['commits'],
+                    stats['conflicts'],
+                    '%.1f%%' % (100.0 * stats['conflicts'] / attempts),
+                    '%.2f' % elapsed,
+                    ))
+            finally:
+                storage.close()
+    report(('pathindex', 'oids', 'commits', 'conflicts', 'conflict rate',
+            'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+""" Measure ``ObjectMap.pathcount`` of the root (from a cold connection
+cache) and the cost of adding objects, with the per-path object counters
+and with object maps which count the members of oid sets instead (as
+object maps created before the counters existed do). """
+import gc
+import time
+
+import transaction
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    rows = []
+    root_path = (u'',)
+    for size in args.sizes:
+        paths = tree_paths(size, fanout=20)
+        for compact in (False, True):
+            for counted in (False, True):
+                storage = Storage()
+                try:
+                    conn = storage.open()
+                    objectmap = ObjectMap(None, compact_pathindex=compact)
+                    if not counted:
+                        objectmap.pathcounts = None
+                    conn.root()['objectmap'] = objectmap
+                    start = time.time()
+                    for path in paths:
+                        objectmap.add(Node(path[-1], None), path)
+                    transaction.commit()
+                    add = time.time() - start
+                    conn.cacheMinimize()
+                    objectmap._p_activate()
+                    gc.collect()
+                    start = time.time()
+                    objectmap.pathcount(root_path)
+                    count = time.time() - start
+                    start = time.time()
+                    objectmap.pathcount(root_path, depth=2)
+                    count2 = time.time() - start
+                    rows.append((
+                        size,
+                        compact and 'compact' or 'nested',
+                        counted and 'yes' or 'no',
+                        storage.size(),
+                        '%.3f' % add,
+                        '%.5f' % count,
+                        '%.5f' % count2,
+                        ))
+                    conn.close()
+                finally:
+                    storage.close()
+    report(('nodes', 'index', 'counters', 'Data.fs bytes', 'add s',
+            'count s', 'count(2) s'), rows)
+
+if __name__ == '__main__':
+    main()
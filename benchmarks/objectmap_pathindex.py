@@ -0,0 +1,62 @@
+""" Compare the storage size and query times of the nested (default) and
+compact object map path indexes. """
+import time
+
+import transaction
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+def timeit(func, *arg, **kw):
+    start = time.time()
+    func(*arg, **kw)
+    return '%.4f' % (time.time() - start)
+
+def main():
+    p = parser(__doc__, [1000, 10000, 50000])
+    p.add_argument('--fanout', type=int, default=5,
+                   help='children per folder; lower means a deeper tree')
+    args = p.parse_args()
+    rows = []
+    root_path = (u'',)
+    for size in args.sizes:
+        paths = tree_paths(size, fanout=args.fanout)
+        depth = max(len(path) for path in paths) - 1
+        for compact in (False, True):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                objectmap = ObjectMap(None, compact_pathindex=compact)
+                conn.root()['objectmap'] = objectmap
+                start = time.time()
+                for path in paths:
+                    objectmap.add(Node(path[-1], None), path)
+                transaction.commit()
+                add = '%.3f' % (time.time() - start)
+                conn.cacheMinimize()
+                rows.append((
+                    size,
+                    depth,
+                    compact and 'compact' or 'nested',
+                    storage.size(),
+                    add,
+                    timeit(objectmap.pathlookup, root_path),
+                    timeit(objectmap.pathlookup, root_path, depth=1),
+                    timeit(objectmap.pathcount, root_path),
+                    timeit(objectmap.navgen, root_path, depth=2),
+                    ))
+                conn.close()
+            finally:
+                storage.close()
+    report(('nodes', 'depth', 'index', 'Data.fs bytes', 'add s',
+            'lookup s', 'lookup(1) s', 'count s', 'navgen(2) s'), rows)
+
+if __name__ == '__main__':
+    main()
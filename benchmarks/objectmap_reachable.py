@@ -0,0 +1,70 @@
+""" Measure finding every object id reachable through references from one
+object, comparing a breadth-first search in Python over ``targetids`` with
+``ObjectMap.reachable_targetids``. """
+import random
+import time
+
+import transaction
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    parser,
+    report,
+    )
+
+FANOUT = 3 # references from each object
+
+def python_bfs(objectmap, oid, reftype):
+    seen = set([oid])
+    frontier = [oid]
+    while frontier:
+        next_frontier = []
+        for source in frontier:
+            for target in objectmap.targetids(source, reftype):
+                if target not in seen:
+                    seen.add(target)
+                    next_frontier.append(target)
+        frontier = next_frontier
+    seen.discard(oid)
+    return seen
+
+def reachable(objectmap, oid, reftype):
+    return objectmap.reachable_targetids(oid, reftype)
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        try:
+            conn = storage.open()
+            objectmap = ObjectMap(None)
+            conn.root()['objectmap'] = objectmap
+            oids = [ objectmap.add(Node(u'n%d' % n, None), (u'', u'n%d' % n))
+                     for n in range(size) ]
+            rand = random.Random(size)
+            for source in oids:
+                for target in rand.sample(oids, FANOUT):
+                    objectmap.connect(source, target, 'ref')
+            transaction.commit()
+            for name, func in (('python bfs', python_bfs),
+                               ('reachable_targetids', reachable)):
+                conn.cacheMinimize()
+                start = time.time()
+                found = func(objectmap, oids[0], 'ref')
+                cold = time.time() - start
+                start = time.time()
+                func(objectmap, oids[0], 'ref')
+                warm = time.time() - start
+                rows.append((size, name, len(found), '%.3f' % cold,
+                             '%.3f' % warm))
+            conn.close()
+        finally:
+            storage.close()
+    report(('objects', 'search', 'reachable', 'cold s', 'warm s'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+""" Measure removing a subtree from the object map, comparing the batched
+``ObjectMap.remove`` against the previous oid-at-a-time algorithm. """
+import transaction
+
+from substanced.objectmap import ObjectMap
+
+from common import (
+    Node,
+    Storage,
+    parser,
+    report,
+    timed_commit,
+    tree_paths,
+    )
+
+def oid_at_a_time_remove(objectmap, path_tuple):
+    # the pre-batching algorithm, kept here for comparison
+    pathlen = len(path_tuple)
+    omap = objectmap.pathindex.get(path_tuple)
+    items = omap.items()
+    removepaths = []
+    for k, dm in objectmap.pathindex.items(min=path_tuple):
+        if k[:pathlen] == path_tuple:
+            for oidset in dm.values():
+                for oid in oidset:
+                    if oid in objectmap.objectid_to_path:
+                        p = objectmap.objectid_to_path[oid]
+                        del objectmap.objectid_to_path[oid]
+                        del objectmap.path_to_objectid[p]
+            removepaths.append(k)
+        else:
+            break
+    for k in removepaths:
+        del objectmap.pathindex[k]
+    for x in range(pathlen-1):
+        offset = x + 1
+        omap2 = objectmap.pathindex[path_tuple[:pathlen-offset]]
+        for level, oidset in items:
+            i = level + offset
+            oidset2 = omap2[i]
+            for oid in oidset:
+                if oid in oidset2:
+                    oidset2.remove(oid)
+            if not oidset2:
+                del omap2[i]
+
+def batched_remove(objectmap, path_tuple):
+    objectmap.remove(path_tuple, moving=True)
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    rows = []
+    site = (u'', u'site')
+    for size in args.sizes:
+        strategies = (
+            ('nested', 'oid-at-a-time', False, oid_at_a_time_remove),
+            ('nested', 'batched', False, batched_remove),
+            ('compact', 'batched', True, batched_remove),
+            )
+        for index, name, compact, func in strategies:
+            storage = Storage()
+            try:
+                conn = storage.open()
+                objectmap = ObjectMap(None, compact_pathindex=compact)
+                conn.root()['objectmap'] = objectmap
+                # a sibling subtree of the same size keeps ancestors non-empty
+                for prefix in (site + (u'src',), site + (u'keep',)):
+                    for path in tree_paths(size, prefix=prefix):
+                        objectmap.add(Node(path[-1], None), path)
+                transaction.commit()
+                elapsed, written = timed_commit(
+                    storage, func, objectmap, site + (u'src',))
+                rows.append((size, index, name, '%.3f' % elapsed, written))
+                conn.close()
+            finally:
+                storage.close()
+    report(('nodes', 'index', 'algorithm', 'seconds', 'commit bytes'), rows)
+
+if __name__ == '__main__':
+    main()
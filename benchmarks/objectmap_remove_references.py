@@ -0,0 +1,75 @@
+""" Measure removing the references of a removed subtree from the reference
+map of an object map which has several reference types but few references
+into the subtree, comparing the previous oid-at-a-time removal from every
+reference set with the bulk removal guided by the oid to reference type
+index. """
+import time
+
+import BTrees
+import transaction
+
+from substanced.objectmap import ReferenceMap
+
+from common import (
+    Storage,
+    parser,
+    report,
+    )
+
+REFTYPES = 10
+REFERENCES = 1000 # per reference type, outside of the removed subtree
+REMOVED_REFERENCES = 10 # per reference type, from the removed subtree
+
+def oid_at_a_time_remove(referencemap, oids):
+    # the previous algorithm, kept here for comparison
+    for refset in referencemap.refmap.values():
+        for oid in oids:
+            if oid in refset.src2target:
+                for target in refset.src2target.pop(oid):
+                    oidset = refset.target2src.get(target)
+                    oidset.remove(oid)
+                    if not oidset:
+                        del refset.target2src[target]
+            if oid in refset.target2src:
+                for source in refset.target2src.pop(oid):
+                    oidset = refset.src2target.get(source)
+                    oidset.remove(oid)
+                    if not oidset:
+                        del refset.src2target[source]
+
+def bulk_remove(referencemap, oids):
+    referencemap.remove(oids)
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        # the removed subtree's oids are 0..size-1
+        removed = BTrees.family64.IF.Set(range(size))
+        for name, func in (('oid-at-a-time', oid_at_a_time_remove),
+                           ('bulk', bulk_remove)):
+            storage = Storage()
+            try:
+                conn = storage.open()
+                referencemap = conn.root()['refs'] = ReferenceMap()
+                for r in range(REFTYPES):
+                    reftype = 'reftype%d' % r
+                    for n in range(REFERENCES):
+                        referencemap.connect(
+                            size + n, size + REFERENCES + n, reftype)
+                    for n in range(REMOVED_REFERENCES):
+                        referencemap.connect(n * 7, size + n, reftype)
+                transaction.commit()
+                conn.cacheMinimize()
+                start = time.time()
+                func(referencemap, removed)
+                transaction.commit()
+                elapsed = time.time() - start
+                rows.append((size, name, '%.3f' % elapsed))
+                conn.close()
+            finally:
+                storage.close()
+    report(('removed oids', 'removal', 'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+""" Measure walking every resource of a subtree deepest first from a cold
+connection cache, comparing the recursive generator ``postorder`` used to be
+with the iterative ``substanced.util.postorder`` and with the objectids
+``ObjectMap.postorder`` reads from the object map without loading any
+resource. """
+import gc
+import time
+
+import transaction
+from persistent.mapping import PersistentMapping
+from zope.interface import implementer
+
+from substanced.interfaces import IFolder
+from substanced.objectmap import ObjectMap
+from substanced.util import (
+    is_folder,
+    postorder,
+    )
+
+from common import (
+    Storage,
+    parser,
+    report,
+    tree_paths,
+    )
+
+FANOUT = 10
+
+@implementer(IFolder)
+class Folder(PersistentMapping):
+    __name__ = __parent__ = None
+
+def recursive_postorder(startnode):
+    def visit(node):
+        if is_folder(node):
+            for name, child in sorted(node.items()):
+                for result in visit(child):
+                    yield result
+        yield node
+    return visit(startnode)
+
+def build(root, size):
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    objectmap.add(root, ('',))
+    folders = {('',): root}
+    for path in tree_paths(size, FANOUT)[1:]:
+        parent = folders[path[:-1]]
+        folder = folders[path] = parent[path[-1]] = Folder()
+        folder.__name__ = path[-1]
+        folder.__parent__ = parent
+        objectmap.add(folder, path)
+
+def walk_recursive(root):
+    return len([ node for node in recursive_postorder(root) ])
+
+def walk_iterative(root):
+    return len([ node for node in postorder(root) ])
+
+def walk_objectmap(root):
+    return len([ oid for oid in root.__objectmap__.postorder(root) ])
+
+def main():
+    args = parser(__doc__, [10000, 100000]).parse_args()
+    rows = []
+    for size in args.sizes:
+        storage = Storage()
+        try:
+            conn = storage.open()
+            root = conn.root()['site'] = Folder()
+            build(root, size)
+            transaction.commit()
+            conn.close()
+            for name, func in (('recursive', walk_recursive),
+                               ('iterative', walk_iterative),
+                               ('objectmap', walk_objectmap)):
+                conn = storage.open()
+                conn.cacheMinimize()
+                root = conn.root()['site']
+                gc.collect()
+                start = time.time()
+                count = func(root)
+                elapsed = time.time() - start
+                rows.append((size, count, name, '%.3f' % elapsed))
+                transaction.abort()
+                conn.close()
+        finally:
+            storage.close()
+    report(('resources', 'walked', 'postorder', 'seconds'), rows)
+
+if __name__ == '__main__':
+    main()
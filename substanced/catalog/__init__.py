@@ -1,10 +1,13 @@
 import inspect
+import itertools
 import logging
 import transaction
 import venusian
 
 import BTrees
 
+from ZODB.POSException import ConflictError
+
 from zope.deprecation import deprecate
 
 from zope.interface import (
@@ -13,6 +16,7 @@ from zope.interface import (
     providedBy,
     )
 
+from pyramid.settings import asbool
 from pyramid.traversal import resource_path
 from pyramid.threadlocal import get_current_registry
 from pyramid.util import (
@@ -47,10 +51,17 @@ from .factories import (
     Keyword,
     Facet,
     Allowed,
+    RegionAllowed,
     Path,
     )
 
-from .util import oid_from_resource
+from .planner import plan
+from .util import (
+    QueryCache,
+    indexview_memo,
+    oid_from_resource,
+    query_key,
+    )
 
 from . import deferred
 
@@ -59,6 +70,7 @@ Field = Field # API
 Keyword = Keyword # API
 Facet = Facet # API
 Allowed = Allowed # API
+RegionAllowed = RegionAllowed # API
 Path = Path # API
 
 logger = logging.getLogger(__name__) # API
@@ -67,6 +79,9 @@ _SLASH = u('/')
 
 _marker = object()
 
+def _first(pair):
+    return pair[0]
+
 def catalog_buttons(context, request, default_buttons):
     """ Show a reindex button before default buttons in the folder contents
     view of a catalog"""
@@ -92,14 +107,47 @@ def catalog_buttons(context, request, default_buttons):
     )
 @implementer(ICatalog)
 class Catalog(Folder):
+    """ A folder of indexes.
+
+    If ``query_cache_size`` is an integer, the docids matching queries
+    executed against the indexes of this catalog are kept in a least recently
+    used cache of that many results, so that executing an equal query again
+    doesn't search the indexes.  The cache belongs to the database connection
+    the catalog was loaded in.  A cached result is only used while the
+    generations of all the indexes the query involves are unchanged (see
+    :meth:`substanced.catalog.indexes.SDIndex.generation`), which isn't the
+    case once they've been changed by a transaction committed by any
+    connection; queries executed after the current transaction changed one
+    of them aren't cached.  An index only starts keeping its generation when
+    it is first changed while the cache is enabled, so queries involving an
+    index which hasn't changed since aren't cached yet.  The cache pays off
+    when executing queries is expensive, e.g. against large indexes.  Cached
+    results are shared and must not be modified.  See :meth:`query_cache_info`.  It may be changed on an
+    existing catalog at any time, and is set on new catalogs from the
+    ``substanced.catalogs.query_cache_size`` setting.
+
+    If ``plan_queries`` is ``True``, queries are executed through a plan
+    which orders the operands of ``And`` and ``Or`` queries by their
+    estimated number of results and stops executing the operands of an
+    ``And`` once their intersection is empty (see
+    :mod:`substanced.catalog.planner`).  It may be changed on an existing
+    catalog at any time, and is set on new catalogs from the
+    ``substanced.catalogs.plan_queries`` setting.
+    """
     
     family = BTrees.family64
     transaction = transaction
+    reindex_checkpoints = None
+    reindex_prefetch = 100 # objects loaded at once by ``reindex``
+    query_cache_size = None # no query cache
+    plan_queries = False
+    _v_querycache = None
     
     def __init__(self, family=None):
         Folder.__init__(self)
         if family is not None:
             self.family = family
+        self.reindex_checkpoints = self.family.OO.BTree()
         self.reset()
 
     def __sdi_addable__(self, context, introspectable):
@@ -129,6 +177,59 @@ class Catalog(Folder):
             index.reset()
         self.objectids = self.family.IF.TreeSet()
 
+    def _query_cache(self):
+        size = self.query_cache_size
+        if not size:
+            return None
+        cache = self._v_querycache
+        if cache is None or cache.size != size:
+            cache = self._v_querycache = QueryCache(size)
+        return cache
+
+    def query_cache_info(self):
+        """ Return a dictionary of statistics about the query cache of this
+        connection (see ``query_cache_size``): the number of ``hits``, of
+        ``misses``, the ``hitrate`` (``None`` before the first query), the
+        current ``size`` and the ``maxsize``.  Return ``None`` if the query
+        cache is not enabled."""
+        cache = self._query_cache()
+        if cache is None:
+            return None
+        return cache.info()
+
+    def apply_query(self, query, names=None):
+        """ Return the docids matching the hypatia ``query``, from the query
+        cache if it is enabled and holds a current result for it, otherwise
+        by executing the query (through its plan if ``plan_queries`` is
+        true).  Queries involving an index which has no ``generation`` method
+        or whose generation is ``None`` aren't cached."""
+        cache = self._query_cache()
+        if cache is None:
+            return self._execute_query(query, names)
+        try:
+            key, indexes = query_key(query, names)
+        except TypeError: # unhashable value
+            return self._execute_query(query, names)
+        generations = []
+        for index in indexes:
+            generation = getattr(index, 'generation', None)
+            if generation is not None:
+                generation = generation()
+            if generation is None:
+                return self._execute_query(query, names)
+            generations.append(generation)
+        generations = tuple(generations)
+        docids = cache.get(key, generations)
+        if docids is None:
+            docids = self._execute_query(query, names)
+            cache.set(key, generations, docids)
+        return docids
+
+    def _execute_query(self, query, names):
+        if self.plan_queries:
+            return plan(query, names).execute(names)
+        return query._apply(names)
+
     def index_resource(self, resource, oid=None, action_mode=None):
         """Register the resource in indexes of this catalog using ``oid`` as
         the indexing identifier.  If ``oid`` is not supplied, the ``__oid__``
@@ -145,10 +246,35 @@ class Catalog(Folder):
         with statsd_timer('catalog.index_resource'):
             if oid is None:
                 oid = oid_from_resource(resource)
-            for index in self.values():
-                index.index_resource(resource, oid=oid, action_mode=action_mode)
+            with indexview_memo.active():
+                for index in self.values():
+                    index.index_resource(
+                        resource, oid=oid, action_mode=action_mode
+                        )
             self.objectids.insert(oid)
 
+    def index_resources(self, resources, action_mode=None):
+        """Register a batch of resources in the indexes of this catalog.
+        ``resources`` should be a sequence of ``(oid, resource)`` pairs; if an
+        ``oid`` is ``None``, the ``__oid__`` attribute of its resource will be
+        used as the indexing identifier.
+
+        The result is the same as calling :meth:`index_resource` for each
+        pair, but each index is handed the whole batch (sorted by oid) at once
+        so it can apply its updates in a single pass rather than being
+        touched once per resource in arbitrary order.  ``action_mode`` has the
+        same meaning as it does for :meth:`index_resource`."""
+        with statsd_timer('catalog.index_resources'):
+            pairs = []
+            for oid, resource in resources:
+                if oid is None:
+                    oid = oid_from_resource(resource)
+                pairs.append((oid, resource))
+            pairs.sort(key=_first)
+            for index in self.values():
+                index.index_resources(pairs, action_mode=action_mode)
+            self.objectids.update([ oid for oid, resource in pairs ])
+
     @deprecate('index_doc is deprecated, use index_resource')
     def index_doc(self, docid, obj):
         """ Bw compatibility function """
@@ -214,10 +340,11 @@ class Catalog(Folder):
         if oid is None:
             oid = oid_from_resource(resource)
         with statsd_timer('catalog.reindex_resource'):
-            for index in self.values():
-                index.reindex_resource(
-                    resource, oid=oid, action_mode=action_mode
-                    )
+            with indexview_memo.active():
+                for index in self.values():
+                    index.reindex_resource(
+                        resource, oid=oid, action_mode=action_mode
+                        )
             if not oid in self.objectids:
                 self.objectids.insert(oid)
 
@@ -227,7 +354,8 @@ class Catalog(Folder):
         return self.reindex_resource(obj, oid=docid)
 
     def reindex(self, dry_run=False, commit_interval=3000, indexes=None, 
-                path_re=None, output=None, registry=None):
+                path_re=None, output=None, registry=None, oid_range=None,
+                resume=False, retries=3):
 
         """\
         Reindex all objects in the catalog using the existing set of
@@ -260,6 +388,24 @@ class Catalog(Folder):
         passed, the ``get_current_registry()`` function will be used to
         look up the current registry.  This function needs the registry in
         order to access content catalog views.
+
+        ``oid_range``, if passed, should be a ``(min, max)`` tuple of
+        objectids (inclusive; either may be ``None`` to mean unbounded).
+        Only objects whose objectid falls in the range are reindexed.  This
+        allows several processes, each with its own database connection, to
+        reindex disjoint parts of the same catalog at once (see
+        :meth:`reindex_ranges`).
+
+        The last objectid of each committed batch is recorded in a persistent
+        checkpoint keyed by ``oid_range``, and the checkpoint is removed when
+        the reindex of that range completes.  If ``resume`` is ``True``, an
+        interrupted reindex of the same range restarts after the objectid
+        recorded in its checkpoint instead of from the beginning.
+
+        ``retries`` is the number of times a batch is reindexed again after
+        its commit fails with a ``ConflictError`` (e.g. because another
+        process reindexing a different range changed the same index
+        buckets) before the error is raised.
         """
         if output is None: # pragma: no cover
             output = logger.info
@@ -284,47 +430,121 @@ class Catalog(Folder):
 
         self.flush(all=True)
 
-        i = 1
-
         objectmap = find_objectmap(self)
 
-        for oid in self.objectids:
-            resource = objectmap.object_for(oid)
-            if resource is None:
-                path = objectmap.path_for(oid)
-                if path is None:
+        # unbounded ends are stored as the family limits so that checkpoint
+        # keys stay comparable
+        start, stop = oid_range or (None, None)
+        if start is None:
+            start = self.family.minint
+        if stop is None:
+            stop = self.family.maxint
+        oid_range = (start, stop)
+
+        last = None
+        if resume and self.reindex_checkpoints is not None:
+            last = self.reindex_checkpoints.get(oid_range)
+            if last is not None:
+                output and output(
+                    '%s resuming reindex after objectid %s' % (name, last)
+                    )
+
+        while True:
+            if last is None:
+                oids = self.objectids.keys(start, stop)
+            else:
+                oids = self.objectids.keys(last, stop, excludemin=True)
+            batch = list(itertools.islice(oids, commit_interval))
+            done = len(batch) < commit_interval
+            attempt = 0
+            while True:
+                try:
+                    # find the resources of the batch in path order, which
+                    # traverses each folder once and keeps the objects of a
+                    # folder together in the connection cache
+                    found = objectmap.object_for_many(
+                        batch, prefetch=self.reindex_prefetch
+                        )
+                    for oid, resource in found:
+                        self._reindex_oid(
+                            objectmap, oid, resource, indexes, path_re, output
+                            )
+                    checkpoints = self.reindex_checkpoints
+                    if done:
+                        if checkpoints is not None and oid_range in checkpoints:
+                            del checkpoints[oid_range]
+                    else:
+                        if checkpoints is None:
+                            checkpoints = self.family.OO.BTree()
+                            self.reindex_checkpoints = checkpoints
+                        checkpoints[oid_range] = batch[-1]
+                    commit_or_abort()
+                except ConflictError:
+                    self.transaction.abort()
+                    attempt += 1
+                    if attempt > retries:
+                        raise
                     output and output(
-                        'error: no path for objectid %s in object map' % 
-                        oid)
-                    continue
-                upath = _SLASH.join(path)
-                output and output('error: object at path %s not found' % upath)
-                continue
-            path = resource_path(resource)
-            if path_re is not None and path_re.match(path) is None:
-                continue
-            output and output('%s reindexing %s' % (name, path))
-
-            if indexes is None:
-                self.reindex_resource(
+                        '*** conflict, retrying batch (attempt %s) ***' % (
+                            attempt,
+                            )
+                        )
+                else:
+                    break
+            if done:
+                break
+            last = batch[-1]
+
+    def _reindex_oid(self, objectmap, oid, resource, indexes, path_re,
+                     output):
+        if resource is None:
+            path = objectmap.path_for(oid)
+            if path is None:
+                output and output(
+                    'error: no path for objectid %s in object map' % 
+                    oid)
+                return
+            upath = _SLASH.join(path)
+            output and output('error: object at path %s not found' % upath)
+            return
+        path = resource_path(resource)
+        if path_re is not None and path_re.match(path) is None:
+            return
+        output and output('%s reindexing %s' % (self.__name__, path))
+
+        if indexes is None:
+            self.reindex_resource(
+                resource,
+                oid=oid,
+                action_mode=MODE_IMMEDIATE,
+                )
+        else:
+            for index in indexes:
+                self[index].reindex_resource(
                     resource,
                     oid=oid,
                     action_mode=MODE_IMMEDIATE,
                     )
-            else:
-                for index in indexes:
-                    self[index].reindex_resource(
-                        resource,
-                        oid=oid,
-                        action_mode=MODE_IMMEDIATE,
-                        )
-
-            if i % commit_interval == 0: # pragma: no cover
-                commit_or_abort()
-            i+=1
 
-        if i:
-            commit_or_abort()
+    def reindex_ranges(self, count):
+        """ Split the objectid space of this catalog's family into ``count``
+        contiguous ``(min, max)`` ranges of equal width, suitable for passing
+        as the ``oid_range`` argument of :meth:`reindex` in ``count`` separate
+        worker processes.  Objectids are allocated at random across the whole
+        space, so each range holds roughly the same number of objects.  The
+        ranges depend only on ``count``, so a resumed worker finds the
+        checkpoint recorded by the interrupted one."""
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        minint = self.family.minint
+        maxint = self.family.maxint
+        width = (maxint - minint) // count + 1
+        ranges = []
+        for i in range(count):
+            lo = minint + i * width
+            hi = min(lo + width - 1, maxint)
+            ranges.append((lo, hi))
+        return ranges
 
     def update_indexes(
         self,
@@ -435,6 +655,12 @@ class CatalogsService(Folder):
         """
         catalog = self[name] = self.Catalog()
         catalog.__sdi_deletable__ = False
+        settings = get_current_registry().settings or {}
+        query_cache_size = settings.get('substanced.catalogs.query_cache_size')
+        if query_cache_size:
+            catalog.query_cache_size = int(query_cache_size)
+        if asbool(settings.get('substanced.catalogs.plan_queries', False)):
+            catalog.plan_queries = True
         if update_indexes:
             catalog.update_indexes(replace=True, reindex=True)
         # self-index so catalog shows up in folder contents
@@ -460,27 +686,34 @@ class _IndexViewMapper(object):
             view = self.map_function(view)
         return view
 
+    # During an indexing pass (see substanced.catalog.util.IndexViewMemo)
+    # one instance of an index view class is shared by all the index views
+    # that use the class, and the value of an index view is computed once per
+    # resource even if several indexes use it.
+
     def map_method(self, view):
         # it's an unbound class method
         attr = self.attr
         def _method_view(resource, default):
-            inst = view(resource)
-            if attr is None:
-                result = inst(default)
-            else:
-                result = getattr(inst, attr)(default)
-            return result
+            def result():
+                inst = indexview_memo.get(
+                    resource, view, lambda: view(resource)
+                    )
+                if attr is None:
+                    return inst(default)
+                return getattr(inst, attr)(default)
+            return indexview_memo.get(resource, (view, attr, default), result)
         return _method_view
 
     def map_function(self, view):
         # its a function or an instance method
         attr = self.attr
         def _function_view(resource, default):
-            if attr is None:
-                result = view(resource, default)
-            else:
-                result = getattr(view, attr)(resource, default)
-            return result
+            def result():
+                if attr is None:
+                    return view(resource, default)
+                return getattr(view, attr)(resource, default)
+            return indexview_memo.get(resource, (view, attr, default), result)
         return _function_view
 
 class catalog_factory(object):
@@ -730,7 +963,7 @@ def includeme(config): # pragma: no cover
     config.add_directive('add_indexview', add_indexview, action_wrap=False)
     config.add_permission('view') # canonize this as a permission name
     config.registry.registerAdapter(
-        deferred.BasicActionProcessor,
+        deferred.action_processor_factory(config.registry.settings or {}),
         (Interface,), IIndexingActionProcessor
         )
     config.include('.evolve')
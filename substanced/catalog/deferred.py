@@ -1,7 +1,11 @@
 import os
 
+import contextlib
 import logging
+import operator
 import persistent
+import socket
+import struct
 import threading
 import time
 import transaction
@@ -18,9 +22,14 @@ from ..interfaces import (
     MODE_DEFERRED,
     )
 from ..objectmap import find_objectmap
-from ..stats import statsd_gauge
+from ..stats import (
+    statsd_gauge,
+    statsd_incr,
+    )
 from ..util import get_oid
 
+from .util import indexview_memo
+
 logger = logging.getLogger(__name__)
 
 class ResourceNotFound(Exception):
@@ -34,18 +43,132 @@ class ObjectMapNotFound(Exception):
     def __init__(self, action):
         self.action = action
 
+class ResourceResolver(threading.local):
+    """ Remembers, while active, the object map found for each index and the
+    resource found for each oid by :meth:`Action.find_resource`, so that the
+    actions for the several indexes of one resource locate it only once.
+    Folders traversed on the way to a resource are remembered too, so finding
+    a sibling only traverses the last path segment.
+
+    The resolver is active inside ``with resource_resolver.active():``.
+    Passing a transaction to ``active`` keeps what was found until that
+    transaction commits or aborts, so that the indexing action managers of
+    every index, which flush one after another when the transaction commits,
+    share it.
+    """
+    depth = 0
+    txn = None
+    objectmaps = None
+    resources = None
+    folders = None
+
+    @contextlib.contextmanager
+    def active(self, txn=None):
+        if not self.depth and (txn is None or txn is not self.txn):
+            self.txn = txn
+            self.objectmaps = {}
+            self.resources = {}
+            self.folders = {}
+            if txn is not None:
+                txn.addAfterCommitHook(self._after_commit, ())
+                # after-commit hooks don't run when the transaction is
+                # aborted (e.g. when a before-commit hook raises)
+                add_after_abort_hook = getattr(txn, 'addAfterAbortHook', None)
+                if add_after_abort_hook is not None:
+                    add_after_abort_hook(self._after_abort, (txn,))
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth and self.txn is None:
+                self.clear()
+
+    def clear(self):
+        self.txn = self.objectmaps = self.resources = self.folders = None
+
+    def _after_commit(self, status):
+        if not self.depth:
+            self.clear()
+
+    def _after_abort(self, txn):
+        if not self.depth and self.txn is txn:
+            self.clear()
+
+    def objectmap_for(self, index):
+        if self.objectmaps is None:
+            return find_objectmap(index)
+        try:
+            return self.objectmaps[id(index)][1]
+        except KeyError:
+            objectmap = find_objectmap(index)
+            # keep the index alive so its id isn't reused
+            self.objectmaps[id(index)] = (index, objectmap)
+            return objectmap
+
+    def object_for(self, objectmap, oid):
+        root = getattr(objectmap, 'root', None)
+        if self.resources is None or root is None:
+            return objectmap.object_for(oid)
+        key = (id(objectmap), oid)
+        try:
+            return self.resources[key][1]
+        except KeyError:
+            path = objectmap.path_for(oid)
+            resource = None
+            if path is not None:
+                try:
+                    resource = self._traverse(objectmap, path)
+                except KeyError:
+                    pass
+            self.resources[key] = (objectmap, resource)
+            return resource
+
+    def _traverse(self, objectmap, path):
+        folders = self.folders
+        mapid = id(objectmap)
+        # start from the deepest folder already traversed
+        start = len(path) - 1
+        while start > 1 and (mapid, path[:start]) not in folders:
+            start -= 1
+        if start > 1:
+            context = folders[(mapid, path[:start])]
+        else:
+            context = objectmap.root
+            start = 1
+        last = len(path) - 1
+        for i in range(start, len(path)):
+            context = context[path[i]]
+            if i < last:
+                folders[(mapid, path[:i + 1])] = context
+        return context
+
+resource_resolver = ResourceResolver()
+
 # functools.total_ordering allows us to define __eq__ and __lt__ and it takes
 # care of the rest of the rich comparison methods (2.7+ only)
 
 @total_ordering
 class Action(object):
 
-    oid = None
-    index = None
-    index_oid = None
+    __slots__ = ('index', 'index_oid', 'mode', 'oid')
+
     position = None
     logger = logger
 
+    def __init__(self, index=None, mode=None, oid=None, index_oid=None):
+        self.index = index
+        self.index_oid = index_oid
+        self.mode = mode
+        self.oid = oid
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in Action.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __repr__(self):
         klass = self.__class__
         classname = '%s.%s' % (klass.__module__, klass.__name__)
@@ -72,16 +195,17 @@ class Action(object):
         return self_cmp < other_cmp
 
     def find_resource(self):
-        objectmap = find_objectmap(self.index)
+        objectmap = resource_resolver.objectmap_for(self.index)
         if objectmap is None:
             raise ObjectMapNotFound(self)
-        resource = objectmap.object_for(self.oid)
+        resource = resource_resolver.object_for(objectmap, self.oid)
         if resource is None:
             raise ResourceNotFound(self.oid)
         return resource
 
 class IndexAction(Action):
 
+    __slots__ = ()
     position = 2
 
     def __init__(self, index, mode, oid, index_oid=None):
@@ -105,8 +229,9 @@ class IndexAction(Action):
 
 class ReindexAction(Action):
 
+    __slots__ = ()
     position = 1
-    
+
     def __init__(self, index, mode, oid, index_oid=None):
         self.index = index
         if index_oid is None:
@@ -128,8 +253,9 @@ class ReindexAction(Action):
 
 class UnindexAction(Action):
 
+    __slots__ = ()
     position = 0
-    
+
     def __init__(self, index, mode, oid, index_oid=None):
         self.index = index
         if index_oid is None:
@@ -144,14 +270,86 @@ class UnindexAction(Action):
     def anti(self):
         return IndexAction(self.index, self.mode, self.oid, self.index_oid)
 
-class ActionsQueue(persistent.Persistent):
+# indexed by action position
+ACTION_CLASSES = (UnindexAction, ReindexAction, IndexAction)
+
+def encode_actions(actions):
+    """ Return a compact, picklable representation of a sequence of
+    actions, or ``None`` if the sequence contains something other than
+    index, reindex and unindex actions for 64-bit integer oids.
+
+    The representation is a tuple of three elements: a table of the distinct
+    ``(index, index_oid, mode)`` combinations used by the actions (so each
+    index is pickled once rather than once per action), a string of packed
+    unsigned shorts (``table position * 3 + action position``), and a string
+    of packed signed 64-bit oids.
+    """
+    table = []
+    positions = {}
+    kinds = []
+    oids = []
+    for action in actions:
+        cls = action.__class__
+        if cls not in ACTION_CLASSES:
+            return None
+        key = (action.index_oid, action.mode)
+        pos = positions.get(key)
+        if pos is None:
+            pos = positions[key] = len(table)
+            table.append((action.index, action.index_oid, action.mode))
+        kinds.append(pos * 3 + cls.position)
+        oids.append(action.oid)
+    num = len(kinds)
+    try:
+        return (
+            tuple(table),
+            struct.pack('<%dH' % num, *kinds),
+            struct.pack('<%dq' % num, *oids),
+            )
+    except struct.error:
+        return None
+
+def decode_actions(records):
+    """ Return the list of actions represented by ``records``, the result of
+    :func:`encode_actions` """
+    table, kinds, oids = records
+    num = len(oids) // 8
+    kinds = struct.unpack('<%dH' % num, kinds)
+    oids = struct.unpack('<%dq' % num, oids)
+    actions = []
+    append = actions.append
+    for kind, oid in zip(kinds, oids):
+        index, index_oid, mode = table[kind // 3]
+        append(ACTION_CLASSES[kind % 3](index, mode, oid, index_oid))
+    return actions
+
+class ActionsBucket(persistent.Persistent):
+    """ A persistent list of actions.  Concurrent changes to the list are
+    merged by ``_p_resolveConflict``. """
 
     logger = logger # for testing
+    since = None # time the oldest action in the bucket was added
 
     def __init__(self):
         self.gen = 0
         self.actions = []
-        self.pactive = False
+        self.since = None
+
+    def __getstate__(self):
+        # the actions are stored compactly whenever they can be
+        state = persistent.Persistent.__getstate__(self)
+        records = encode_actions(state.get('actions', ()))
+        if records is not None:
+            state = dict(state)
+            del state['actions']
+            state['records'] = records
+        return state
+
+    def __setstate__(self, state):
+        if 'records' in state:
+            state = dict(state)
+            state['actions'] = decode_actions(state.pop('records'))
+        persistent.Persistent.__setstate__(self, state)
 
     def bumpgen(self):
         # At an average rate of 100 bumps per second, this value won't exceed
@@ -183,6 +381,8 @@ class ActionsQueue(persistent.Persistent):
         self.gen = self.gen + 1
 
     def extend(self, actions):
+        if not self.actions:
+            self.since = time.time()
         self.actions.extend(actions)
         self.bumpgen()
 
@@ -194,6 +394,19 @@ class ActionsQueue(persistent.Persistent):
             return None
         actions = self.actions[:]
         self.actions = []
+        self.since = None
+        self.bumpgen()
+        return actions
+
+    def pop(self, count):
+        """ Remove and return at most ``count`` actions from the front of
+        the list, or ``None`` if the list is empty. """
+        if not self.actions:
+            return None
+        actions = self.actions[:count]
+        self.actions = self.actions[count:]
+        if not self.actions:
+            self.since = None
         self.bumpgen()
         return actions
 
@@ -203,6 +416,16 @@ class ActionsQueue(persistent.Persistent):
             'Running _p_resolveConflict for %s' % clsname
             )
 
+        encoded = 'records' in committed_state
+        for state in (old_state, committed_state, new_state):
+            if state is not None and 'records' in state:
+                state['actions'] = decode_actions(state.pop('records'))
+
+        # buckets pickled before ``since`` existed don't have it
+        if 'since' in committed_state or 'since' in new_state:
+            for state in (committed_state, new_state):
+                state['since'] = state.get('since')
+
         # We only know how to merge actions and resolve the generation and undo
         # flag.  If anything else is different, puke.
         if set(new_state.keys()) != set(committed_state.keys()):
@@ -215,7 +438,7 @@ class ActionsQueue(persistent.Persistent):
             raise ConflictError
 
         for key, val in new_state.items():
-            if key not in ('actions', 'gen'):
+            if key not in ('actions', 'gen', 'since'):
                 if val != committed_state[key]:
                     self.logger.info(
                         'Unknown key %s differs in states, cannot resolve '
@@ -399,11 +622,26 @@ class ActionsQueue(persistent.Persistent):
         # actions are already optimized and thus is impossible to have more
         # than one action per (oid,index) in the result, but we sort here to
         # listify and for ease of testing.
-        committed_state['actions'] = sorted(mod_committed)
+        committed_state['actions'] = sorted(
+            mod_committed, key=action_sort_key)
         committed_state['gen'] = gen
 
+        if 'since' in committed_state:
+            since = [ state['since'] for state in (committed_state, new_state)
+                      if state.get('since') is not None ]
+            if committed_state['actions'] and since:
+                committed_state['since'] = min(since)
+            else:
+                committed_state['since'] = None
+
         actionslen = len(committed_state['actions'])
 
+        if encoded:
+            records = encode_actions(committed_state['actions'])
+            if records is not None:
+                committed_state['records'] = records
+                del committed_state['actions']
+
         self.logger.info(
             'resolved %s conflict in _p_resolveConflict: '
             'oldlen %s, committedlen %s, newlen %s, actionslen %s' % (
@@ -412,6 +650,134 @@ class ActionsQueue(persistent.Persistent):
 
         return committed_state
 
+class ActionsQueue(ActionsBucket):
+    """ The queue of deferred actions.
+
+    Actions are appended to a chain of :class:`ActionsBucket` objects rather
+    than to one list, so that appending only rewrites a bucket of at most
+    about ``bucket_size`` actions no matter how long the queue is.  Each
+    append goes to the last nonempty bucket, or to the one after it when that
+    bucket is full, which keeps the buckets in the order their actions were
+    queued; the actions processor consumes the buckets from the front.
+    Concurrent appends to the same bucket are merged by the bucket's
+    ``_p_resolveConflict``, which also generates anti-actions when a
+    transaction that queued actions is undone.
+
+    Appending does not write the queue object itself unless every bucket is
+    full; the actions processor adds ``spare_buckets`` empty buckets whenever
+    it finds fewer of them after consuming the queue, and drops the drained
+    buckets at the front of the chain beyond those, so the chain shrinks back
+    after a burst of actions.  The ``actions`` list
+    inherited from :class:`ActionsBucket` is only used by queues created
+    before buckets existed, until the processor first consumes them.
+    """
+
+    bucket_size = 100
+    spare_buckets = 8
+    max_buckets = 1000
+    buckets = () # BBB for queues created before buckets existed
+
+    def __init__(self):
+        ActionsBucket.__init__(self)
+        self.pactive = False
+        self.buckets = [ ActionsBucket() for i in range(self.spare_buckets) ]
+
+    def extend(self, actions):
+        if not self.buckets:
+            return ActionsBucket.extend(self, actions)
+        self._bucket_for_append().extend(actions)
+
+    def _bucket_for_append(self):
+        buckets = self.buckets
+        for i in range(len(buckets) - 1, -1, -1):
+            if len(buckets[i]):
+                break
+        else:
+            return buckets[0]
+        if len(buckets[i]) < self.bucket_size:
+            return buckets[i]
+        if i + 1 < len(buckets):
+            return buckets[i + 1]
+        if len(buckets) < self.max_buckets:
+            # no spare bucket left: the processor isn't keeping up
+            return self._add_bucket()
+        return buckets[i]
+
+    def _add_bucket(self):
+        bucket = ActionsBucket()
+        self.buckets = self.buckets + [bucket]
+        return bucket
+
+    def __len__(self):
+        return len(self.actions) + sum(len(b) for b in self.buckets)
+
+    def oldest(self):
+        """ Return the time (as per ``time.time()``) at which the oldest
+        action in the queue was added, or ``None`` if the queue is empty. """
+        times = [ b.since for b in self.buckets if b.actions ]
+        if self.actions:
+            times.append(self.since)
+        times = [ t for t in times if t is not None ]
+        if times:
+            return min(times)
+
+    def popall(self):
+        return self.pop(None)
+
+    def pop(self, count):
+        """ Remove and return at most ``count`` actions (all of them if
+        ``count`` is ``None``) from the front of the queue, or ``None`` if the
+        queue is empty. """
+        actions = []
+        if self.actions:
+            if count is None:
+                actions = ActionsBucket.popall(self)
+            else:
+                actions = ActionsBucket.pop(self, count)
+        for bucket in self.buckets:
+            wanted = None
+            if count is not None:
+                wanted = count - len(actions)
+                if wanted <= 0:
+                    break
+            if wanted is None:
+                taken = bucket.popall()
+            else:
+                taken = bucket.pop(wanted)
+            if taken:
+                actions.extend(taken)
+        self._drop_drained_buckets()
+        self._add_spare_buckets()
+        return actions or None
+
+    def _drop_drained_buckets(self):
+        # A dropped bucket is marked as retired.  The key this adds to its
+        # state makes _p_resolveConflict raise a ConflictError for a
+        # concurrent append to it, rather than merging the appended actions
+        # into a bucket which is no longer part of the chain.
+        buckets = self.buckets
+        drop = 0
+        while (drop < len(buckets) - self.spare_buckets and
+               not len(buckets[drop])):
+            buckets[drop].retired = True
+            drop += 1
+        if drop:
+            self.buckets = buckets[drop:]
+
+    def _add_spare_buckets(self):
+        buckets = list(self.buckets)
+        spare = 0
+        for bucket in reversed(buckets):
+            if len(bucket):
+                break
+            spare += 1
+        needed = min(
+            self.spare_buckets - spare, self.max_buckets - len(buckets)
+            )
+        if needed > 0:
+            buckets.extend(ActionsBucket() for i in range(needed))
+            self.buckets = buckets
+
 def commit(tries, msg=''):
     def wrapper(wrapped):
         def retry(self, *arg, **kw):
@@ -432,14 +798,129 @@ def commit(tries, msg=''):
 class Break(Exception):
     pass
 
+def parse_address(address):
+    """ Return a ``(family, address)`` pair suitable for ``socket`` given
+    either a ``host:port`` string (a UDP address) or a filesystem path (a Unix
+    domain datagram socket). """
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+class ActionsNotifier(threading.local):
+    """ Sends the names of the queues that a transaction added actions to as
+    a datagram to an :class:`ActionsListener` once that transaction has
+    committed, waking the action processors waiting on those queues. """
+
+    transaction = transaction # for testing
+    socket = socket # for testing
+    logger = logger # for testing
+
+    def __init__(self):
+        self.txn = None
+        self.pending = {}
+
+    def notify(self, address, name):
+        txn = self.transaction.get()
+        if txn is not self.txn:
+            self.txn = txn
+            self.pending = {}
+        names = self.pending.get(address)
+        if names is None:
+            names = self.pending[address] = set()
+            txn.addAfterCommitHook(self.send, (address,))
+        names.add(name)
+
+    def send(self, status, address):
+        names = self.pending.pop(address, None)
+        if not (status and names):
+            return
+        family, addr = parse_address(address)
+        sock = self.socket.socket(family, self.socket.SOCK_DGRAM)
+        try:
+            sock.sendto(' '.join(sorted(names)).encode('utf-8'), addr)
+        except self.socket.error as e:
+            # no processor is listening; it'll find the actions when it polls
+            self.logger.debug('could not notify %s: %r' % (address, e))
+        finally:
+            sock.close()
+
+notifier = ActionsNotifier()
+
+class ActionsListener(object):
+    """ Receives the datagrams sent by :class:`ActionsNotifier` to
+    ``address`` in a daemon thread, and wakes up the action processors waiting
+    on the queues they name.  One listener can serve several processors in
+    the same process (e.g. one per shard). """
+
+    socket = socket # for testing
+    os = os # for testing
+
+    def __init__(self, address):
+        self.address = address
+        self.events = {}
+        self.lock = threading.Lock()
+        family, addr = parse_address(address)
+        if family != socket.AF_INET and self.os.path.exists(addr):
+            self.os.unlink(addr) # left behind by a previous listener
+        self.sock = self.socket.socket(family, self.socket.SOCK_DGRAM)
+        self.sock.bind(addr)
+        self.thread = threading.Thread(
+            target=self.run, name='indexing-listener')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def event_for(self, name):
+        with self.lock:
+            event = self.events.get(name)
+            if event is None:
+                event = self.events[name] = threading.Event()
+            return event
+
+    def receive(self):
+        data = self.sock.recv(4096)
+        for name in data.decode('utf-8').split():
+            self.event_for(name).set()
+
+    def run(self): # pragma: no cover
+        while True:
+            self.receive()
+
+    def wake_all(self):
+        with self.lock:
+            events = list(self.events.values())
+        for event in events:
+            event.set()
+
+    def wait(self, name, timeout):
+        """ Block until actions are added to the queue named ``name`` or
+        ``timeout`` seconds pass. """
+        event = self.event_for(name)
+        event.wait(timeout)
+        # anything committed before this is seen by the processor's next sync
+        event.clear()
+
 class BasicActionProcessor(object):
 
     logger = logger # for testing
     transaction = transaction # for testing
     queue_name = 'basic_action_queue'
+    metric_prefix = 'catalog'
+    # when set, at most this many actions are executed (and committed) per
+    # transaction; a conflict then only requeues the conflicting batch
+    batch_size = None
+    # when set (a threading.Event), process stops once it is set
+    stop_event = None
+    # when set (an ActionsListener), process waits for notifications instead
+    # of sleeping
+    listener = None
     
-    def __init__(self, context):
+    def __init__(self, context, batch_size=None):
         self.context = context
+        if batch_size is not None:
+            self.batch_size = batch_size
 
     def get_root(self):
         jar = self.context._p_jar
@@ -458,6 +939,13 @@ class BasicActionProcessor(object):
             zodb_root[self.queue_name] = queue
         return queue
 
+    def work_queue(self):
+        """ Return the queue that ``process`` drains """
+        return self.get_queue()
+
+    def work_queue_name(self):
+        return self.queue_name
+
     def active(self):
         queue = self.get_queue()
         if queue is None:
@@ -488,43 +976,101 @@ class BasicActionProcessor(object):
         if queue is None:
             raise RuntimeError('Queue processor not engaged')
         queue.extend(actions)
+        self.notify(self.queue_name)
+
+    def notify(self, name):
+        """ Wake the processor waiting on the queue named ``name`` when the
+        current transaction commits, if notification addresses (whitespace
+        separated) are configured via
+        ``substanced.catalogs.action_processor_notify`` """
+        settings = getattr(get_current_registry(), 'settings', None) or {}
+        addresses = settings.get(
+            'substanced.catalogs.action_processor_notify', '')
+        for address in addresses.split():
+            notifier.notify(address, name)
+
+    def wait(self, timeout):
+        if self.listener is not None:
+            self.listener.wait(self.work_queue_name(), timeout)
+        elif self.stop_event is not None:
+            self.stop_event.wait(timeout)
+        else:
+            time.sleep(timeout)
 
     def process(self, sleep=5, once=False):
         self.logger.info('starting basic action processor')
         self.engage()
         i = 0
+        backlog = False
+        prefix = self.metric_prefix
         while True:
             try:
 
-                if not once: # pragma: no cover
-                    time.sleep(sleep)
+                if self.stop_event is not None and self.stop_event.is_set():
+                    raise Break()
+
+                # don't sleep while a previous bounded batch left work behind
+                if not (once or backlog): # pragma: no cover
+                    self.wait(sleep)
 
                 self.sync()
                 self.transaction.begin()
 
                 executed = False
                 commit = False
+                failed = []
 
-                queue = self.get_queue()
+                queue = self.work_queue()
                 queue_len = len(queue)
-                actions = queue.popall()
-                statsd_gauge('catalog.queue_length', queue_len, rate=.5)
+                if self.batch_size:
+                    actions = queue.pop(self.batch_size)
+                    backlog = queue_len > self.batch_size
+                else:
+                    actions = queue.popall()
+                statsd_gauge('%s.queue_length' % prefix, queue_len, rate=.5)
+                oldest = queue.oldest()
+                lag = 0
+                if oldest is not None:
+                    lag = int((time.time() - oldest) * 1000)
+                statsd_gauge('%s.queue_lag' % prefix, lag, rate=.5)
+
+                start = time.time()
 
                 if actions is not None:
                     actions = optimize_actions(actions)
-                    for action in actions:
-                        self.logger.info('executing %s' % (action,))
-                        try:
-                            executed = True
-                            action.execute()
-                        except ResourceNotFound as e:
-                            self.logger.info(repr(e))
-                        except (SystemExit, KeyboardInterrupt, Break):
-                            raise
-                        except Exception as e:
-                            self.logger.error(repr(e))
-                        else:
-                            commit = True
+                    # actions are sorted by oid, so the actions for all the
+                    # indexes of one resource can share index view results;
+                    # each resource is located once per batch
+                    with resource_resolver.active():
+                        with indexview_memo.active():
+                            for action in actions:
+                                self.logger.info('executing %s' % (action,))
+                                try:
+                                    executed = True
+                                    action.execute()
+                                except ResourceNotFound as e:
+                                    self.logger.info(repr(e))
+                                except (SystemExit, KeyboardInterrupt, Break):
+                                    raise
+                                except Exception as e:
+                                    self.logger.error(repr(e))
+                                    failed.append(action)
+                                else:
+                                    commit = True
+
+                if executed and self.batch_size:
+                    # don't hurry back to a batch which only failed
+                    backlog = backlog and commit
+                    # commit the pop of a bounded batch even when none of its
+                    # actions succeeded, requeueing the failed ones at the
+                    # tail; otherwise the abort puts the batch back at the
+                    # head of the queue, where it is retried forever ahead of
+                    # the actions behind it
+                    if failed:
+                        self.logger.info(
+                            'requeueing %s failed actions' % len(failed))
+                        queue.extend(failed)
+                    commit = True
 
                 if commit:
                     self.logger.info('committing')
@@ -537,8 +1083,18 @@ class BasicActionProcessor(object):
                         self.transaction.commit()
                         self.logger.info('committed')
                     except ConflictError:
+                        # the aborted batch is back in the queue; it is
+                        # retried by the next iteration
                         self.transaction.abort()
                         self.logger.info('aborted due to conflict error')
+                        statsd_incr('%s.conflicts' % prefix)
+                        backlog = True
+                    else:
+                        elapsed = max(time.time() - start, 1e-6)
+                        statsd_gauge(
+                            '%s.actions_per_second' % prefix,
+                            int(len(actions) / elapsed),
+                            )
 
                 if not executed:
                     if i % 12 == 0:
@@ -561,6 +1117,136 @@ class BasicActionProcessor(object):
                         'once more'
                         )
 
+class ShardedActionProcessor(BasicActionProcessor):
+    """ An action processor which partitions deferred actions across
+    ``shards`` queues so that several workers can drain them concurrently.
+
+    Actions are assigned to a shard by the oid of the index they target
+    (``partition='index'``, the default) or by the oid of the resource they
+    target (``partition='oid'``).  Either way, all the actions for one
+    resource/index combination land in the same shard, so their relative
+    order is preserved.  Partitioning by index keeps workers from conflicting
+    on index data structures; partitioning by oid spreads the work more evenly
+    when there are only a few indexes.
+
+    A worker is an instance constructed with a ``shard`` number; its
+    ``process`` method drains only that shard's queue.  Each worker flags its
+    own shard queue as active while it is engaged, and the processor is
+    active while any worker is, so one worker stopping doesn't make
+    ``IIndexingActionProcessor`` consumers execute actions immediately while
+    the other shards still hold older ones.  Workers leave the flag of the
+    unsharded queue alone: no worker drains that queue, so a processor which
+    only looks at it shouldn't defer actions into it.
+    """
+
+    partitions = ('index', 'oid')
+
+    def __init__(self, context, shards=4, shard=None, partition='index',
+                 batch_size=None):
+        BasicActionProcessor.__init__(self, context, batch_size=batch_size)
+        if partition not in self.partitions:
+            raise ValueError('Unknown partition %r' % (partition,))
+        if shard is not None and not (0 <= shard < shards):
+            raise ValueError('Shard %s out of range' % (shard,))
+        self.shards = shards
+        self.shard = shard
+        self.partition = partition
+        if shard is not None:
+            self.metric_prefix = 'catalog.shard%s' % shard
+
+    def shard_for(self, action):
+        if self.partition == 'index':
+            return action.index_oid % self.shards
+        return action.oid % self.shards
+
+    def shard_queue_name(self, shard):
+        return '%s.%s' % (self.queue_name, shard)
+
+    def get_shard_queue(self, shard):
+        zodb_root = self.get_root()
+        if zodb_root is None:
+            return None
+        name = self.shard_queue_name(shard)
+        queue = zodb_root.get(name)
+        if queue is None:
+            queue = ActionsQueue()
+            zodb_root[name] = queue
+        return queue
+
+    def work_queue(self):
+        if self.shard is None:
+            raise RuntimeError('No shard selected for this worker')
+        return self.get_shard_queue(self.shard)
+
+    def work_queue_name(self):
+        return self.shard_queue_name(self.shard)
+
+    def active(self):
+        zodb_root = self.get_root()
+        if zodb_root is None:
+            return False
+        for shard in range(self.shards):
+            queue = zodb_root.get(self.shard_queue_name(shard))
+            if queue is not None and queue.pactive:
+                return True
+        return False
+
+    @commit(5, 'engaging actions processor')
+    def engage(self):
+        queue = self.get_queue()
+        if queue is None:
+            raise RuntimeError('Context has no jar')
+        if self.shard is None:
+            queue.pactive = True
+        else:
+            self.get_shard_queue(self.shard).pactive = True
+        # redistribute whatever an unsharded processor left behind
+        actions = queue.popall()
+        if actions:
+            self._distribute(actions)
+
+    @commit(1, 'disengaging actions processor')
+    def disengage(self):
+        if self.shard is None:
+            queue = self.get_queue()
+        else:
+            queue = self.get_shard_queue(self.shard)
+        if queue is None:
+            raise RuntimeError('Context has no jar')
+        queue.pactive = False
+
+    def add(self, actions):
+        if self.get_queue() is None:
+            raise RuntimeError('Queue processor not engaged')
+        self._distribute(actions)
+
+    def _distribute(self, actions):
+        byshard = {}
+        for action in actions:
+            byshard.setdefault(self.shard_for(action), []).append(action)
+        for shard, shard_actions in sorted(byshard.items()):
+            self.get_shard_queue(shard).extend(shard_actions)
+            self.notify(self.shard_queue_name(shard))
+
+def action_processor_factory(settings):
+    """ Return the ``IIndexingActionProcessor`` adapter factory configured by
+    ``settings``: :class:`ShardedActionProcessor` when
+    ``substanced.catalogs.action_processor_shards`` is greater than one,
+    :class:`BasicActionProcessor` otherwise. """
+    shards = int(
+        settings.get('substanced.catalogs.action_processor_shards', 1)
+        )
+    if shards <= 1:
+        return BasicActionProcessor
+    partition = settings.get(
+        'substanced.catalogs.action_processor_partition', 'index'
+        )
+    def factory(context):
+        return ShardedActionProcessor(
+            context, shards=shards, partition=partition
+            )
+    return factory
+
 class IndexActionSavepoint(object):
     """ Transaction savepoints  """
 
@@ -626,7 +1312,11 @@ class IndexActionTM(threading.local):
             actions = self.actions
             self.actions = []
             actions = optimize_actions(actions)
-            self._process(actions, all=all)
+            # when flushed at commit, share found resources with the flushes
+            # of the other indexes
+            txn = None if all else self.transaction.get()
+            with resource_resolver.active(txn):
+                self._process(actions, all=all)
 
     def _process(self, actions, all=True):
         registry = get_current_registry()
@@ -693,19 +1383,43 @@ class IndexActionTM(threading.local):
         self.logger.debug('done processing index actions')
 
     def execute_actions_immediately(self, actions):
+        # index actions are handed to the index as one batch (actions arrive
+        # here optimized, so there is at most one action per oid and the
+        # order between different oids doesn't matter)
+        bulk = [ a for a in actions if isinstance(a, IndexAction) ]
+        if len(bulk) > 1:
+            actions = [ a for a in actions if not isinstance(a, IndexAction) ]
         for action in actions:
             self.logger.debug('executing action %r' % (action,))
             action.execute()
+        if len(bulk) > 1:
+            self.execute_index_actions(bulk)
+
+    def execute_index_actions(self, actions):
+        pairs = []
+        for action in actions:
+            self.logger.debug('executing action %r' % (action,))
+            try:
+                resource = action.find_resource()
+            except ObjectMapNotFound:
+                self.logger.info(
+                    'Objectmap not found for index %s' % (action.index,)
+                    )
+                return
+            pairs.append((action.oid, resource))
+        actions[0].index.index_docs(pairs)
 
     def execute_actions_deferred(self, actions, processor, force=False):
         deferred = []
+        immediate = []
         for action in actions:
             if force or action.mode is MODE_DEFERRED:
                 self.logger.debug('adding deferred action %r' % (action,))
                 deferred.append(action)
             else:
-                self.logger.debug('executing action %r' % (action,))
-                action.execute()
+                immediate.append(action)
+        if immediate:
+            self.execute_actions_immediately(immediate)
         if deferred:
             processor.add(deferred)
 
@@ -715,13 +1429,14 @@ def action_intersection(s1, s2):
     should be preferred.  If neither is preferred, a ConflictError will be
     raised."""
     isect = s1 & s2
-    L1 = [ ( (a.oid, a.index_oid), a) for a in s1 ]
-    L2 = [ ( (a.oid, a.index_oid), a) for a in s2 ]
-    ds1 = dict(L1)
-    ds2 = dict(L2)
-    for k1, action1 in ds1.items():
-        action2 = ds2.get(k1)
-        if action2 is not None:
+    if not isect:
+        return isect
+    ds2 = dict(( ((a.oid, a.index_oid), a) for a in s2 ))
+    for action1 in s1:
+        action2 = ds2.get((action1.oid, action1.index_oid))
+        # actions of the same class never conflict and which_action would
+        # return the one already in the intersection
+        if action2 is not None and action1.__class__ is not action2.__class__:
             # replace action in union with correct one or conflict
             isect.add(which_action(action1, action2))
     return isect
@@ -740,20 +1455,28 @@ def which_action(a1, a2):
 
                  REINDEX           index*     conflict*   reindex
     """
-    def doconflict(a1, a2):
-        raise ConflictError
-    def dosecond(a1, a2):
-        return a2
-    def dofirst(a1, a2):
-        return a1
-    statefuncs = {
-        (IndexAction, UnindexAction):doconflict,
-        (UnindexAction, IndexAction):doconflict,
-        (ReindexAction, UnindexAction):doconflict,
-        (UnindexAction, ReindexAction):doconflict,
-        (ReindexAction, IndexAction):dosecond,
-        }
-    return statefuncs.get((a1.__class__, a2.__class__), dofirst)(a1, a2)
+    return _which_action_funcs.get(
+        (a1.__class__, a2.__class__), _dofirst)(a1, a2)
+
+def _doconflict(a1, a2):
+    raise ConflictError
+
+def _dosecond(a1, a2):
+    return a2
+
+def _dofirst(a1, a2):
+    return a1
+
+_which_action_funcs = {
+    (IndexAction, UnindexAction):_doconflict,
+    (UnindexAction, IndexAction):_doconflict,
+    (ReindexAction, UnindexAction):_doconflict,
+    (UnindexAction, ReindexAction):_doconflict,
+    (ReindexAction, IndexAction):_dosecond,
+    }
+
+# sorts like Action.__lt__ but without calling it for every comparison
+action_sort_key = operator.attrgetter('oid', 'index_oid', 'position')
 
 def optimize_actions(actions):
     """
@@ -810,7 +1533,7 @@ def optimize_actions(actions):
             )
         statefunc(oid, index_oid, oldaction, newaction)
 
-    result = list(sorted(result.values()))
+    result = sorted(result.values(), key=action_sort_key)
     return result
 
 def optimize_states(old_state, committed_state, new_state):
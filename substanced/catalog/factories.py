@@ -20,6 +20,7 @@ from .indexes import (
     FacetIndex,
     AllowedIndex,
     PathIndex,
+    RegionAllowedIndex,
     )
 
 from .discriminators import (
@@ -108,6 +109,9 @@ class Allowed(IndexFactory):
         values['permissions'] = tuple(sorted(permissions))
         return values
 
+class RegionAllowed(Allowed):
+    index_type = RegionAllowedIndex
+
 class Path(IndexFactory):
     index_type = PathIndex
 
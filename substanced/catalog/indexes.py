@@ -1,8 +1,10 @@
 import colander
 import deform.widget
+import heapq
 import re
 
 import BTrees
+import hypatia.exc
 import hypatia.query
 import hypatia.interfaces
 import hypatia.field
@@ -19,6 +21,7 @@ from pyramid.settings import asbool
 from pyramid.security import effective_principals
 from pyramid.traversal import resource_path_tuple
 from pyramid.interfaces import IRequest
+from pyramid.location import lineage
 from zope.interface import implementer
 
 from ..content import content
@@ -34,7 +37,13 @@ from ..stats import statsd_timer
 from .._compat import STRING_TYPES
 from .._compat import INT_TYPES
 from .._compat import u
-from ..util import get_principal_repr
+from ..util import (
+    bump_generation,
+    get_generation,
+    get_oid,
+    get_principal_repr,
+    reversed_items,
+    )
 
 from .discriminators import dummy_discriminator
 from .util import oid_from_resource
@@ -47,6 +56,42 @@ _SLASH = u('/')
 
 _marker = object()
 
+# a sort with a limit walks the forward index in value order when that is
+# expected to visit fewer documents before finding ``limit`` of them than
+# there are docids, counting each visit as this many docid value lookups (a
+# heap selection looks up the value of every docid; walking also loads the
+# set of docids of every value it visits, cheap when cached, about ten times
+# the cost of a lookup when not)
+SORT_WALK_RATIO = 4
+
+def _first(pair):
+    return pair[0]
+
+def _descending(pair):
+    # heap key selecting the largest values first and, among documents with
+    # the same value, the smallest docids first
+    return (pair[0], -pair[1])
+
+def _matches(keywords, values, operator):
+    # whether the container ``keywords`` holds any (operator 'or') or all
+    # (operator 'and') of ``values``
+    if operator == 'or':
+        for value in values:
+            if value in keywords:
+                return True
+        return False
+    for value in values:
+        if not value in keywords:
+            return False
+    return True
+
+def _set_lengths(fwd_index, values):
+    lengths = []
+    for value in values:
+        docids = fwd_index.get(value)
+        lengths.append(0 if docids is None else len(docids))
+    return lengths
+
 class SDIndex(object):
 
     _p_action_tm = None
@@ -63,10 +108,67 @@ class SDIndex(object):
             resolver = objectmap.object_for
         with statsd_timer('catalog.query'):
             query.flush()
-            docids = query._apply(names)
+            catalog = getattr(self, '__parent__', None)
+            apply_query = getattr(catalog, 'apply_query', None)
+            if apply_query is None:
+                docids = query._apply(names)
+            else:
+                docids = apply_query(query, names)
             numdocs = len(docids)
             return hypatia.util.ResultSet(docids, numdocs, resolver)
 
+    def generation(self):
+        """ Return a token which changes whenever the documents of this index
+        change, or ``None`` if they have been changed by the current
+        transaction or the index doesn't keep a generation (see
+        :func:`substanced.util.get_generation`).  Catalog query caches use it
+        to tell whether a cached result is stale.  An index only starts
+        keeping a generation when it is first changed while its catalog has
+        a query cache, so that writes to catalogs without one don't pay for
+        it."""
+        return get_generation(self)
+
+    def _bump_generation(self):
+        catalog = getattr(self, '__parent__', None)
+        create = bool(getattr(catalog, 'query_cache_size', None))
+        bump_generation(self, create)
+
+    def estimate(self, query, names=None):
+        """ Return an estimate of the number of documents matched by the
+        comparator ``query`` against this index, or ``None`` if no estimate
+        can be made cheaply.  The query planner (see
+        :mod:`substanced.catalog.planner`) uses it to order the operands of
+        ``And`` and ``Or`` queries.  By default, this is the number of
+        documents indexed, if the index counts them."""
+        num_docs = getattr(self, '_num_docs', None)
+        if num_docs is None:
+            return None
+        return num_docs()
+
+    def narrow(self, query, docids, names=None):
+        """ Return the set of the members of ``docids`` matched by the
+        comparator ``query`` against this index, found by looking up each
+        docid, or ``None`` if the index can't.  The query planner calls it
+        rather than executing ``query`` when ``docids`` is much smaller than
+        the estimate of ``query``.  By default, it returns ``None``."""
+        return None
+
+    def reset(self):
+        self._bump_generation()
+        super(SDIndex, self).reset()
+
+    def index_doc(self, docid, obj):
+        self._bump_generation()
+        return super(SDIndex, self).index_doc(docid, obj)
+
+    def unindex_doc(self, docid):
+        self._bump_generation()
+        return super(SDIndex, self).unindex_doc(docid)
+
+    def reindex_doc(self, docid, obj):
+        self._bump_generation()
+        return super(SDIndex, self).reindex_doc(docid, obj)
+
     def get_action_tm(self):
         action_tm = self._p_action_tm
         if action_tm is None:
@@ -96,6 +198,26 @@ class SDIndex(object):
             action = deferred.IndexAction(self, action_mode, oid)
             self.add_action(action)
 
+    def index_resources(self, resources, action_mode=None):
+        """ Index a batch of resources.  ``resources`` should be a sequence
+        of ``(oid, resource)`` pairs; they are indexed in oid order. """
+        if action_mode is None:
+            action_mode = self.action_mode
+        pairs = sorted(resources, key=_first)
+        if action_mode is MODE_IMMEDIATE:
+            self.index_docs(pairs)
+        else:
+            for oid, resource in pairs:
+                action = deferred.IndexAction(self, action_mode, oid)
+                self.add_action(action)
+
+    def index_docs(self, pairs):
+        """ Index the ``(oid, resource)`` pairs in ``pairs`` immediately.
+        Subclasses may override this to update their data structures in bulk;
+        by default it calls ``index_doc`` for each pair. """
+        for oid, resource in pairs:
+            self.index_doc(oid, resource)
+
     def reindex_resource(self, resource, oid=None, action_mode=None):
         if oid is None:
             oid = oid_from_resource(resource)
@@ -107,6 +229,22 @@ class SDIndex(object):
             action = deferred.ReindexAction(self, action_mode, oid)
             self.add_action(action)
 
+    def reindex_oids(self, oids, action_mode=None):
+        """ Reindex the resources identified by the object ids in ``oids``.
+        Unless the reindex is immediate, no resource is loaded: the deferred
+        actions find their resources when they are executed. """
+        if action_mode is None:
+            action_mode = self.action_mode
+        if action_mode is MODE_IMMEDIATE:
+            objectmap = find_objectmap(self)
+            for oid, resource in objectmap.object_for_many(oids, self):
+                if resource is not None:
+                    self.reindex_doc(oid, resource)
+        else:
+            for oid in oids:
+                action = deferred.ReindexAction(self, action_mode, oid)
+                self.add_action(action)
+
     def unindex_resource(self, resource_or_oid, action_mode=None):
         if isinstance(resource_or_oid, INT_TYPES):
             oid = resource_or_oid
@@ -153,17 +291,43 @@ class PathIndex(SDIndex, hypatia.util.BaseIndexMixin, Persistent):
         return path
 
     def reset(self):
+        self._bump_generation()
         self._not_indexed = self.family.IF.TreeSet()
 
     def index_doc(self, docid, obj):
-        pass
+        # the documents of this index are the objectids of its catalog
+        self._bump_generation()
 
     def unindex_doc(self, docid):
-        pass
+        self._bump_generation()
 
     def reindex_doc(self, docid, obj):
         pass
 
+    def _bump_generation(self):
+        SDIndex._bump_generation(self)
+        if getattr(self, '_generation', None) is None:
+            return
+        # the object map only keeps a generation once a path index needs it
+        objectmap = find_objectmap(getattr(self, '__parent__', None))
+        if (objectmap is not None and
+            getattr(objectmap, '_generation', None) is None):
+            bump_generation(objectmap)
+
+    def generation(self):
+        """ Return a token which changes whenever the objectids of the catalog
+        or the paths of the object map change, or ``None`` if the current
+        transaction has changed either or either doesn't keep a
+        generation."""
+        objectmap = find_objectmap(self.__parent__)
+        mine = get_generation(self)
+        if objectmap is None or mine is None:
+            return None
+        theirs = objectmap.generation()
+        if theirs is None:
+            return None
+        return (mine, theirs)
+
     def docids(self):
         return self.__parent__.objectids
 
@@ -234,7 +398,7 @@ class PathIndex(SDIndex, hypatia.util.BaseIndexMixin, Persistent):
                     obj_or_path,))
         return path_tuple, depth, include_origin
 
-    def apply(self, obj_path_or_dict):
+    def _parse_query(self, obj_path_or_dict):
         if isinstance(obj_path_or_dict, dict):
             path_tuple, depth, include_origin = self._parse_path(
                 obj_path_or_dict['path'])
@@ -244,6 +408,11 @@ class PathIndex(SDIndex, hypatia.util.BaseIndexMixin, Persistent):
         else:
             path_tuple, depth, include_origin = self._parse_path(
                 obj_path_or_dict)
+        return path_tuple, depth, include_origin
+
+    def apply(self, obj_path_or_dict):
+        path_tuple, depth, include_origin = self._parse_query(
+            obj_path_or_dict)
 
         rs = self.search(path_tuple, depth, include_origin)
 
@@ -254,6 +423,19 @@ class PathIndex(SDIndex, hypatia.util.BaseIndexMixin, Persistent):
 
     applyEq = apply
 
+    def estimate(self, query, names=None):
+        """ The number of objects an ``Eq`` query matches is counted by the
+        object map (see :meth:`substanced.objectmap.ObjectMap.pathcount`);
+        other queries have no estimate."""
+        if not isinstance(query, hypatia.query.Eq):
+            return None
+        objectmap = find_objectmap(self.__parent__)
+        if objectmap is None:
+            return None
+        path_tuple, depth, include_origin = self._parse_query(
+            query._get_value(names))
+        return objectmap.pathcount(path_tuple, depth, include_origin)
+
     def eq(self, path, depth=None, include_origin=None):
         val = {'path':path}
         if depth is not None:
@@ -305,6 +487,184 @@ class FieldIndex(SDIndex, hypatia.field.FieldIndex):
         if action_mode is not None:
             self.action_mode = action_mode
 
+    def estimate(self, query, names=None):
+        """ ``Eq`` and ``Any`` queries are estimated from the number of
+        documents indexed under each value."""
+        if isinstance(query, hypatia.query.Eq):
+            values = [query._get_value(names)]
+        elif isinstance(query, hypatia.query.Any):
+            values = query._get_value(names)
+        else:
+            return SDIndex.estimate(self, query, names)
+        try:
+            return sum(_set_lengths(self._fwd_index, values))
+        except TypeError: # unhashable value
+            return SDIndex.estimate(self, query, names)
+
+    def narrow(self, query, docids, names=None):
+        """ ``Eq`` and ``Any`` queries are answered from the value each
+        document is indexed under."""
+        if isinstance(query, hypatia.query.Eq):
+            values = [query._get_value(names)]
+        elif isinstance(query, hypatia.query.Any):
+            values = query._get_value(names)
+        else:
+            return None
+        try:
+            values = set(values)
+        except TypeError: # unhashable value
+            return None
+        rev_index = self._rev_index
+        return self.family.IF.Set(
+            [ docid for docid in docids
+              if rev_index.get(docid, _marker) in values ])
+
+    def sort(self, docids, reverse=False, limit=None, sort_type=None,
+             raise_unsortable=True, after=None):
+        """ When ``limit`` is passed without a ``sort_type``, only the first
+        ``limit`` documents are selected rather than sorting all of
+        ``docids``: by walking the forward index in value order until
+        ``limit`` of them were found if ``docids`` are a large enough share
+        of the documents indexed, or by keeping the ``limit`` smallest (or
+        largest) with a heap.  Documents with the same value are returned
+        by ascending docid either way.
+
+        If ``after`` is a ``(value, docid)`` pair (see :meth:`sort_key`),
+        only the documents which sort after it are returned, so that a
+        sorted result can be paged through without sorting and skipping the
+        documents of the pages before; documents which aren't indexed are
+        left out rather than raising ``Unsortable``."""
+        numdocs = self._num_docs.value
+        if after is None and (
+            limit is None or sort_type is not None or not (docids and numdocs)
+            ):
+            return hypatia.field.FieldIndex.sort(
+                self, docids, reverse=reverse, limit=limit,
+                sort_type=sort_type, raise_unsortable=raise_unsortable)
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError('limit must be 1 or greater')
+            rlen = len(docids)
+            if SORT_WALK_RATIO * limit * numdocs <= rlen * rlen:
+                return self._walk_sort(
+                    docids, reverse, limit, raise_unsortable, after)
+        return self._heap_sort(docids, reverse, limit, raise_unsortable, after)
+
+    def sort_key(self, docid, default=None):
+        """ Return the ``(value, docid)`` pair ``docid`` is sorted by, to be
+        passed as the ``after`` argument of :meth:`sort`, or ``default`` if
+        the document isn't indexed."""
+        value = self._rev_index.get(docid, _marker)
+        if value is _marker:
+            return default
+        return (value, docid)
+
+    def _walk_sort(self, docids, reverse, limit, raise_unsortable,
+                   after=None):
+        IF = self.family.IF
+        if not isinstance(docids, (IF.Set, IF.TreeSet, IF.Bucket, IF.BTree)):
+            docids = IF.TreeSet(docids)
+        fwd_index = self._fwd_index
+        if after is None:
+            after_value = None
+        else:
+            after_value = after[0]
+        if reverse:
+            items = reversed_items(fwd_index, max=after_value)
+        else:
+            items = fwd_index.items(min=after_value)
+        n = 0
+        for value, valueids in items:
+            if after is not None and value == after[0]:
+                valueids = valueids.keys(min=after[1], excludemin=True)
+            for docid in valueids:
+                if docid in docids:
+                    yield docid
+                    n += 1
+                    if n >= limit:
+                        return
+        if raise_unsortable and after is None and n < len(docids):
+            rev_index = self._rev_index
+            raise hypatia.exc.Unsortable(
+                [ docid for docid in docids if not docid in rev_index ])
+
+    def _heap_sort(self, docids, reverse, limit, raise_unsortable,
+                   after=None):
+        rev_index = self._rev_index
+        pairs = []
+        missing = []
+        for docid in docids:
+            value = rev_index.get(docid, _marker)
+            if value is _marker:
+                missing.append(docid)
+            else:
+                pairs.append((value, docid))
+        if after is not None:
+            if reverse:
+                after = _descending(after)
+                pairs = [ pair for pair in pairs if _descending(pair) < after ]
+            else:
+                pairs = [ pair for pair in pairs if pair > after ]
+        if limit is None:
+            if reverse:
+                pairs = sorted(pairs, key=_descending, reverse=True)
+            else:
+                pairs = sorted(pairs)
+        elif reverse:
+            pairs = heapq.nlargest(limit, pairs, key=_descending)
+        else:
+            pairs = heapq.nsmallest(limit, pairs)
+        for value, docid in pairs:
+            yield docid
+        if raise_unsortable and after is None and missing and (
+            limit is None or len(pairs) < limit):
+            raise hypatia.exc.Unsortable(missing)
+
+    def index_docs(self, pairs):
+        """ Documents not yet known to this index are discriminated up front
+        and added to the forward index with a single set update per distinct
+        value and to the reverse index with a single update; documents which
+        are already indexed (or whose value is unhashable) are indexed one at a
+        time with ``index_doc``. """
+        self._bump_generation()
+        rev_index = self._rev_index
+        not_indexed = self._not_indexed
+        byvalue = {}
+        rev = []
+        missing = []
+        later = []
+        seen = set()
+        for oid, resource in pairs:
+            if oid in seen or oid in rev_index or oid in not_indexed:
+                later.append((oid, resource))
+                continue
+            seen.add(oid)
+            value = self.discriminate(resource, _marker)
+            if value is _marker:
+                missing.append(oid)
+                continue
+            try:
+                byvalue.setdefault(value, []).append(oid)
+            except TypeError: # unhashable
+                seen.discard(oid)
+                later.append((oid, resource))
+                continue
+            rev.append((oid, value))
+        fwd_index = self._fwd_index
+        for value, oids in byvalue.items():
+            docids = fwd_index.get(value)
+            if docids is None:
+                docids = fwd_index[value] = self.family.IF.TreeSet()
+            docids.update(oids)
+        if rev:
+            rev_index.update(rev)
+            self._num_docs.change(len(rev))
+        if missing:
+            not_indexed.update(missing)
+        for oid, resource in later:
+            self.index_doc(oid, resource)
+
 @content(
     'Keyword Index',
     icon='glyphicon glyphicon-search',
@@ -321,6 +681,59 @@ class KeywordIndex(SDIndex, hypatia.keyword.KeywordIndex):
         if action_mode is not None:
             self.action_mode = action_mode
 
+    def _keywords(self, query, names):
+        # return the (operator, keywords) of an Eq, Any or All query, or
+        # (None, None) for other queries
+        if isinstance(query, hypatia.query.Eq):
+            operator = 'and'
+            values = [query._get_value(names)]
+        elif isinstance(query, hypatia.query.Any):
+            operator = 'or'
+            values = query._get_value(names)
+        elif isinstance(query, hypatia.query.All):
+            operator = 'and'
+            values = query._get_value(names)
+        else:
+            return None, None
+        if isinstance(values, STRING_TYPES):
+            values = [values]
+        return operator, self.normalize(values)
+
+    def estimate(self, query, names=None):
+        """ ``Eq``, ``Any`` and ``All`` queries are estimated from the number
+        of documents indexed under each keyword."""
+        operator, values = self._keywords(query, names)
+        if operator is None:
+            return SDIndex.estimate(self, query, names)
+        try:
+            lengths = _set_lengths(self._fwd_index, values)
+        except TypeError: # unhashable value
+            return SDIndex.estimate(self, query, names)
+        if not lengths:
+            return 0
+        if operator == 'or':
+            return sum(lengths)
+        return min(lengths)
+
+    def narrow(self, query, docids, names=None):
+        """ ``Eq``, ``Any`` and ``All`` queries are answered from the
+        keywords each document is indexed under."""
+        operator, values = self._keywords(query, names)
+        if operator is None:
+            return None
+        if not values:
+            return self.family.IF.Set()
+        try:
+            values = set(values)
+        except TypeError: # unhashable value
+            return None
+        found = []
+        for docid in docids:
+            keywords = self._rev_index.get(docid)
+            if keywords and _matches(keywords, values, operator):
+                found.append(docid)
+        return self.family.IF.Set(found)
+
 @content(
     'Text Index',
     icon='glyphicon glyphicon-search',
@@ -400,3 +813,235 @@ class AllowedIndex(KeywordIndex):
         values = [(principal, permission) for principal in principals]
         return hypatia.query.Any(self, values)
 
+
+@content(
+    'Region Allowed Index',
+    icon='glyphicon glyphicon-search',
+    is_index=True,
+    propertysheets = ( ('', IndexPropertySheet), ),
+    )
+class RegionAllowedIndex(AllowedIndex):
+    """ An allowed index which stores the allowed ``(principal, permission)``
+    values once per ACL *region* rather than once per document.
+
+    The region of a resource is its nearest ancestor (or the resource itself)
+    which has an ``__acl__``, or the root of its lineage if none has.  Every
+    resource in a region has the same effective permissions, so each document
+    is indexed under the objectid of its region, and the values computed by
+    the discriminator for the region's resource are indexed under the region.
+    When an ACL changes (see :meth:`acl_modified`) only the values of the
+    regions at or below the changed resource are recomputed, and only the
+    documents whose region changes are moved, instead of every document below
+    it being reindexed."""
+
+    def reset(self):
+        AllowedIndex.reset(self)
+        # region oid -> docids in the region
+        self._fwd_index = self.family.IO.BTree()
+        # docid -> region oid
+        self._rev_index = self.family.II.BTree()
+        # region oid -> tuple of allowed values
+        self._region_values = self.family.IO.BTree()
+        # allowed value -> region oids
+        self._value_regions = self.family.OO.BTree()
+
+    def region_for(self, resource, default=None):
+        """ Return a tuple of ``(region_oid, region_resource)`` for the region
+        ``resource`` belongs to.  If the region resource has no objectid,
+        return ``(default, resource)``: any resource of a region has the same
+        effective permissions, so ``resource`` then acts as its own region."""
+        region = resource
+        for node in lineage(resource):
+            region = node
+            if getattr(node, '__acl__', _marker) is not _marker:
+                break
+        oid = get_oid(region, None)
+        if oid is None:
+            return default, resource
+        return oid, region
+
+    def index_doc(self, docid, obj):
+        self._bump_generation()
+        region, node = self.region_for(obj, docid)
+        if node is obj or not region in self._region_values:
+            self._update_region(region, node)
+        old = self._rev_index.get(docid)
+        if old == region:
+            return
+        if old is not None:
+            self._remove_from_region(docid, old)
+        else:
+            self._num_docs.change(1)
+        docids = self._fwd_index.get(region)
+        if docids is None:
+            docids = self._fwd_index[region] = self.family.IF.TreeSet()
+        docids.insert(docid)
+        self._rev_index[docid] = region
+
+    reindex_doc = index_doc
+
+    def unindex_doc(self, docid):
+        self._bump_generation()
+        if docid in self._not_indexed:
+            self._not_indexed.remove(docid)
+        region = self._rev_index.get(docid)
+        if region is None:
+            return
+        del self._rev_index[docid]
+        self._remove_from_region(docid, region)
+        self._num_docs.change(-1)
+
+    def estimate(self, query, names=None):
+        """ Documents are indexed per region rather than per value, so
+        queries are estimated by the number of documents indexed."""
+        return SDIndex.estimate(self, query, names)
+
+    def narrow(self, query, docids, names=None):
+        """ ``Eq``, ``Any`` and ``All`` queries are answered from the values
+        of the region each document is indexed under."""
+        operator, values = self._keywords(query, names)
+        if operator is None:
+            return None
+        if not values:
+            return self.family.IF.Set()
+        try:
+            values = set(values)
+        except TypeError: # unhashable value
+            return None
+        region_values = self._region_values
+        matches = {} # region -> bool
+        found = []
+        for docid in docids:
+            region = self._rev_index.get(docid)
+            if region is None:
+                continue
+            match = matches.get(region)
+            if match is None:
+                match = matches[region] = _matches(
+                    region_values.get(region, ()), values, operator)
+            if match:
+                found.append(docid)
+        return self.family.IF.Set(found)
+
+    def search(self, query, operator='and'):
+        """ Return the docids in the regions which allow any (``or``) or all
+        (``and``) of the ``(principal, permission)`` values in ``query``."""
+        IF = self.family.IF
+        sets = [ self._value_regions.get(value, IF.Set()) for value in query ]
+        if operator == 'or':
+            regions = IF.multiunion(sets)
+        elif operator == 'and':
+            sets.sort(key=len)
+            regions = None
+            for regionset in sets:
+                regions = IF.intersection(regions, regionset)
+                if not regions:
+                    break
+        else:
+            raise TypeError('Keyword index only supports `and` and `or` '
+                            'operators, not `%s`.' % operator)
+        if not regions:
+            return IF.Set()
+        return AllowedIndex.search(self, list(regions), operator='or')
+
+    def acl_modified(self, resource):
+        """ Update this index after the ACL of ``resource`` has been changed:
+        move the documents at or below ``resource`` which belonged to its
+        region (or to the region of its parent) into the region it belongs to
+        now, and recompute the values of each region at or below it.  Return
+        ``False`` (doing nothing) if ``resource`` has no objectid or there is
+        no object map, in which case every document below it must be
+        reindexed instead; otherwise return ``True``."""
+        oid = get_oid(resource, None)
+        objectmap = find_objectmap(self)
+        if oid is None or objectmap is None:
+            return False
+        path = objectmap.path_for(oid)
+        if path is None:
+            return False
+        self._bump_generation()
+        IF = self.family.IF
+        subtree = objectmap.pathlookup(path)
+        region, node = self.region_for(resource, oid)
+        sources = [oid]
+        parent = getattr(resource, '__parent__', None)
+        if parent is not None:
+            parent_region = self.region_for(parent)[0]
+            if parent_region is not None:
+                sources.append(parent_region)
+        for source in sources:
+            if source == region:
+                continue
+            docids = self._fwd_index.get(source)
+            if not docids:
+                continue
+            moving = IF.intersection(docids, subtree)
+            if not moving:
+                continue
+            # change the region's set in place so that a concurrent index
+            # into the same region conflicts rather than being lost
+            for docid in moving:
+                docids.remove(docid)
+            if not docids:
+                del self._fwd_index[source]
+            target = self._fwd_index.get(region)
+            if target is None:
+                target = self._fwd_index[region] = IF.TreeSet()
+            target.update(moving)
+            for docid in moving:
+                self._rev_index[docid] = region
+        if region != oid:
+            self._drop_region(oid)
+        if region in self._fwd_index:
+            self._update_region(region, node)
+        for r in IF.intersection(subtree, self._region_values):
+            if r == region:
+                continue
+            if not r in self._fwd_index:
+                self._drop_region(r)
+                continue
+            rnode = objectmap.object_for(r)
+            if rnode is not None:
+                self._update_region(r, rnode)
+        return True
+
+    def _remove_from_region(self, docid, region):
+        docids = self._fwd_index.get(region)
+        if docids is not None:
+            if docid in docids:
+                docids.remove(docid)
+            if not docids:
+                del self._fwd_index[region]
+                self._drop_region(region)
+
+    def _update_region(self, region, node):
+        values = self.discriminate(node, ())
+        new = tuple(sorted(set(values)))
+        old = self._region_values.get(region, ())
+        if new == old and region in self._region_values:
+            return
+        self._set_region_values(region, old, new)
+        self._region_values[region] = new
+
+    def _drop_region(self, region):
+        old = self._region_values.get(region)
+        if old is not None:
+            self._set_region_values(region, old, ())
+            del self._region_values[region]
+
+    def _set_region_values(self, region, old, new):
+        value_regions = self._value_regions
+        new_set = set(new)
+        old_set = set(old)
+        for value in old_set - new_set:
+            regions = value_regions.get(value)
+            if regions is not None:
+                if region in regions:
+                    regions.remove(region)
+                if not regions:
+                    del value_regions[value]
+        for value in new_set - old_set:
+            regions = value_regions.get(value)
+            if regions is None:
+                regions = value_regions[value] = self.family.IF.TreeSet()
+            regions.insert(region)
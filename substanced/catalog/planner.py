@@ -0,0 +1,184 @@
+""" Planning the execution of catalog queries.
+
+hypatia executes the operands of an ``And`` or ``Or`` query in the order they
+were written.  :func:`plan` estimates the number of documents each comparator
+matches (see :meth:`substanced.catalog.indexes.SDIndex.estimate`) and orders
+the operands of each ``And`` and ``Or`` from the most selective to the least
+selective, comparators which can't be estimated (e.g. text index queries)
+going last.  When a plan of an ``And`` is executed, the operands which remain
+aren't executed once the intersection of the ones executed so far is empty,
+and an operand whose estimate is more than ``NARROW_RATIO`` times the size of
+that intersection is evaluated by looking up each of its members in the
+index (see :meth:`substanced.catalog.indexes.SDIndex.narrow`) rather than
+executed, if the index can do so.
+
+:func:`explain` executes a query through its plan and returns the plan with
+the number of documents each node matched and the time it took::
+
+  >>> print(explain(path.eq(folder, depth=1) & text.eq('foo*')))
+  And: estimated 12, matched 3 in 0.41 ms
+    path == <Folder ...>: estimated 12, matched 12 in 0.05 ms
+    text == 'foo*': matched 3 in 0.33 ms
+"""
+import time
+
+import hypatia.query
+
+# an operand of an And is narrowed instead of executed when its estimate is
+# larger than the intersection so far times this ratio, looking up one
+# document in the index costing about as much as merging this many docids
+NARROW_RATIO = 16
+
+def _order(node):
+    estimate = node.estimate
+    return (estimate is None, estimate or 0)
+
+class PlanNode(object):
+    """ A node of a query plan: the hypatia ``query`` it executes, the
+    ``estimate`` of the number of documents it matches (``None`` if unknown)
+    and, for ``And`` and ``Or`` queries, the plans of the operands in the
+    order they are executed (``children``).  Once the plan has been executed
+    with ``explain=True``, ``size`` is the number of documents the node
+    matched and ``elapsed`` the number of seconds it took; both are ``None``
+    for nodes which weren't executed.  ``narrowed`` is true for nodes which
+    were evaluated by narrowing the result of the operands before them."""
+    size = None
+    elapsed = None
+    narrowed = False
+
+    def __init__(self, query, estimate, children=()):
+        self.query = query
+        self.estimate = estimate
+        self.children = list(children)
+
+    def execute(self, names=None, explain=False):
+        """ Return the docids matched by the query, executing the operands of
+        ``And`` and ``Or`` queries in plan order.  If ``explain`` is true,
+        record the ``size`` and ``elapsed`` time of each node executed."""
+        if explain:
+            start = time.time()
+        query = self.query
+        IF = query.family.IF
+        # results are combined like hypatia does, keeping the weights of
+        # text index results
+        if isinstance(query, hypatia.query.And):
+            result = None
+            for child in self.children:
+                if result is not None:
+                    narrowed = child.narrow(result, names, explain)
+                    if narrowed is not None:
+                        result = narrowed
+                        if not result:
+                            break
+                        continue
+                docids = child.execute(names, explain)
+                if result is None:
+                    result = docids
+                elif docids:
+                    result = IF.weightedIntersection(result, docids)[1]
+                if not docids or not result:
+                    result = IF.Set()
+                    break
+        elif isinstance(query, hypatia.query.Or):
+            result = None
+            for child in self.children:
+                docids = child.execute(names, explain)
+                if not result:
+                    result = docids
+                elif docids:
+                    result = IF.weightedUnion(result, docids)[1]
+        else:
+            result = query._apply(names)
+        if explain:
+            self.elapsed = time.time() - start
+            self.size = len(result)
+        return result
+
+    def narrow(self, docids, names=None, explain=False):
+        """ Return the members of the docid set ``docids`` matched by the
+        query of this node, found by the ``narrow`` method of its index, or
+        ``None`` if the query is better executed: if it isn't a comparator,
+        if its index has no ``narrow`` method or can't narrow it, if
+        ``docids`` isn't a plain set (text index results carry weights) or if
+        ``docids`` isn't much smaller than the estimate of the query."""
+        if self.children or self.estimate is None:
+            return None
+        index = getattr(self.query, 'index', None)
+        narrow = getattr(index, 'narrow', None)
+        IF = self.query.family.IF
+        if narrow is None or not isinstance(docids, (IF.Set, IF.TreeSet)):
+            return None
+        if len(docids) * NARROW_RATIO >= self.estimate:
+            return None
+        if explain:
+            start = time.time()
+        result = narrow(self.query, docids, names)
+        if explain and result is not None:
+            self.elapsed = time.time() - start
+            self.size = len(result)
+            self.narrowed = True
+        return result
+
+    def lines(self, level=0):
+        """ Return the lines of the textual representation of this plan, one
+        per node, indented by ``level``."""
+        notes = []
+        if self.estimate is not None:
+            notes.append('estimated %s' % self.estimate)
+        if self.narrowed:
+            notes.append(
+                'narrowed to %s in %.2f ms' % (self.size, self.elapsed * 1000))
+        elif self.size is not None:
+            notes.append(
+                'matched %s in %.2f ms' % (self.size, self.elapsed * 1000))
+        else:
+            notes.append('not executed')
+        lines = ['%s%s: %s' % ('  ' * level, self.query, ', '.join(notes))]
+        for child in self.children:
+            lines.extend(child.lines(level + 1))
+        return lines
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+def estimate(query, names=None):
+    """ Return an estimate of the number of documents the comparator
+    ``query`` matches from the ``estimate`` method of its index, or ``None``
+    if there is none."""
+    index = getattr(query, 'index', None)
+    estimator = getattr(index, 'estimate', None)
+    if estimator is None:
+        return None
+    return estimator(query, names)
+
+def plan(query, names=None):
+    """ Return the :class:`PlanNode` tree for executing the hypatia ``query``
+    with the placeholder values ``names``.  The estimate of an ``And`` is the
+    smallest estimate of its operands and the estimate of an ``Or`` the sum of
+    the estimates of its operands (``None`` if one of them is unknown)."""
+    if not isinstance(query, hypatia.query.BoolOp):
+        return PlanNode(query, estimate(query, names))
+    children = [ plan(q, names) for q in query.queries ]
+    children.sort(key=_order)
+    estimates = [ child.estimate for child in children ]
+    known = [ e for e in estimates if e is not None ]
+    total = None
+    if isinstance(query, hypatia.query.And):
+        if known:
+            total = min(known)
+    elif known and len(known) == len(estimates):
+        total = sum(known)
+    return PlanNode(query, total, children)
+
+def explain(query, names=None, optimize=True):
+    """ Execute the hypatia ``query`` through its plan (see :func:`plan`),
+    after flushing the pending indexing actions of its indexes and, if
+    ``optimize`` is true, optimizing it like ``query.execute`` does.  Return
+    the :class:`PlanNode` tree with the number of documents matched by each
+    node and the time it took; printing it prints one line per node."""
+    if optimize:
+        query = query._optimize()
+    query.flush()
+    node = plan(query, names)
+    node.execute(names, explain=True)
+    return node
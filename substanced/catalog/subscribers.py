@@ -120,19 +120,37 @@ def acl_modified(event):
     catalogs = find_catalogs(resource)
 
     for catalog in catalogs:
-        # hellishly expensive
         indexes = catalog.values()
         for index in indexes:
             index_path = resource_path(index)
-            if registry.content.istype(index, 'Allowed Index'):
-                for node in postorder(resource):
-                    logger.info(
-                        '%s: reindexing %s due to ACL modified' % (
-                            index_path, node)
-                        )
-                    oid = get_oid(node, None)
-                    if oid is not None:
-                        index.reindex_resource(node, oid=oid)
+            if registry.content.istype(index, 'Region Allowed Index'):
+                logger.info(
+                    '%s: updating ACL regions under %s due to ACL modified' % (
+                        index_path, resource)
+                    )
+                if index.acl_modified(resource):
+                    continue
+            elif not registry.content.istype(index, 'Allowed Index'):
+                continue
+            objectmap = find_objectmap(resource)
+            if objectmap is not None:
+                # the object map knows the subtree; deferred reindexing then
+                # needs only the oids, so no resource under it is woken here
+                logger.info(
+                    '%s: reindexing resources under %s due to ACL modified' % (
+                        index_path, resource)
+                    )
+                index.reindex_oids(objectmap.postorder(resource))
+                continue
+            # hellishly expensive
+            for node in postorder(resource):
+                logger.info(
+                    '%s: reindexing %s due to ACL modified' % (
+                        index_path, node)
+                    )
+                oid = get_oid(node, None)
+                if oid is not None:
+                    index.reindex_resource(node, oid=oid)
 
 @subscriber(ApplicationCreated)
 def on_startup(event):
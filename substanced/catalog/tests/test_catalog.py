@@ -9,6 +9,7 @@ from zope.interface import (
     )
 
 from hypatia.interfaces import IIndex
+from hypatia.query import Query
 
 from ..._compat import u
 _BLANK = u('')
@@ -86,6 +87,105 @@ class TestCatalog(unittest.TestCase):
         catalog.reset()
         self.assertEqual(idx.cleared, True)
         
+    def _makeQueryCatalog(self, size=10):
+        from ..indexes import FieldIndex
+        inst = self._makeOne()
+        inst.query_cache_size = size
+        index = inst['title'] = FieldIndex('title')
+        index.__name__ = 'title'
+        index.__oid__ = 10
+        for docid, title in ((1, 'a'), (2, 'b'), (3, 'a')):
+            index.index_doc(docid, testing.DummyResource(title=title))
+        return inst, index
+
+    def test_query_cache_info_disabled(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.query_cache_info(), None)
+
+    def test_apply_query_no_cache(self):
+        from hypatia.query import Eq
+        inst, index = self._makeQueryCatalog(size=None)
+        result = inst.apply_query(Eq(index, 'a'))
+        self.assertEqual(list(result), [1, 3])
+        self.assertEqual(inst._v_querycache, None)
+
+    def test_apply_query_cached(self):
+        from hypatia.query import Eq
+        inst, index = self._makeQueryCatalog()
+        first = inst.apply_query(Eq(index, 'a'))
+        second = inst.apply_query(Eq(index, 'a'))
+        self.assertTrue(first is second)
+        self.assertEqual(list(second), [1, 3])
+        info = inst.query_cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hitrate'], 0.5)
+        self.assertEqual(info['size'], 1)
+        self.assertEqual(info['maxsize'], 10)
+
+    def test_apply_query_equivalent_queries_share_result(self):
+        from hypatia.query import Any
+        inst, index = self._makeQueryCatalog()
+        first = inst.apply_query(Any(index, ['a', 'b']))
+        second = inst.apply_query(Any(index, ['b', 'a']))
+        self.assertTrue(first is second)
+
+    def test_apply_query_stale_after_index_change(self):
+        from hypatia.query import Eq
+        inst, index = self._makeQueryCatalog()
+        first = inst.apply_query(Eq(index, 'a'))
+        index.index_doc(4, testing.DummyResource(title='a'))
+        second = inst.apply_query(Eq(index, 'a'))
+        self.assertFalse(first is second)
+        self.assertEqual(list(second), [1, 3, 4])
+        self.assertEqual(inst.query_cache_info()['misses'], 2)
+
+    def test_apply_query_index_without_generation(self):
+        inst = self._makeOne()
+        inst.query_cache_size = 10
+        query = DummyQuery(DummyIndex(), [1])
+        self.assertEqual(inst.apply_query(query), [1])
+        self.assertEqual(inst.apply_query(query), [1])
+        self.assertEqual(query.applied, 2)
+        self.assertEqual(inst.query_cache_info()['size'], 0)
+
+    def test_apply_query_unhashable_value(self):
+        inst = self._makeOne()
+        inst.query_cache_size = 10
+        index = DummyIndex()
+        index.generation = lambda: 0
+        query = DummyQuery(index, [1], value=[bytearray(b'a')])
+        self.assertEqual(inst.apply_query(query), [1])
+        self.assertEqual(inst.query_cache_info()['size'], 0)
+
+    def test_apply_query_cache_size_changed(self):
+        from hypatia.query import Eq
+        inst, index = self._makeQueryCatalog()
+        inst.apply_query(Eq(index, 'a'))
+        inst.query_cache_size = 5
+        inst.apply_query(Eq(index, 'a'))
+        info = inst.query_cache_info()
+        self.assertEqual(info['maxsize'], 5)
+        self.assertEqual(info['misses'], 1)
+
+    def test_apply_query_planned(self):
+        from hypatia.query import Eq
+        inst, index = self._makeQueryCatalog(size=None)
+        inst.plan_queries = True
+        unplanned = DummyQuery(DummyIndex(), [1, 2])
+        query = unplanned & Eq(index, 'nope')
+        self.assertEqual(list(inst.apply_query(query)), [])
+        self.assertEqual(unplanned.applied, 0)
+
+    def test_apply_query_planned_and_cached(self):
+        from hypatia.query import Eq
+        inst, index = self._makeQueryCatalog()
+        inst.plan_queries = True
+        query = Eq(index, 'a') & Eq(index, 'a')
+        first = inst.apply_query(query)
+        self.assertEqual(list(first), [1, 3])
+        self.assertTrue(inst.apply_query(query) is first)
+
     def test_reset_objectids(self):
         inst = self._makeOne()
         inst.objectids.insert(1)
@@ -95,6 +195,7 @@ class TestCatalog(unittest.TestCase):
     def test_ctor_defaults(self):
         catalog = self._makeOne()
         self.assertTrue(catalog.family is self.family)
+        self.assertEqual(len(catalog.reindex_checkpoints), 0)
 
     def test_ctor_explicit_family(self):
         catalog = self._makeOne(family=BTrees.family32)
@@ -113,6 +214,17 @@ class TestCatalog(unittest.TestCase):
         inst.index_resource(object(), 1)
         self.assertEqual(list(inst.objectids), [1])
 
+    def test_index_resources(self):
+        resource = testing.DummyResource()
+        resource.__oid__ = 3
+        catalog = self._makeOne()
+        idx = DummyIndex()
+        catalog['name'] = idx
+        catalog.index_resources([(2, 'b'), (None, resource), (1, 'a')])
+        self.assertEqual(idx.bulk, [(1, 'a'), (2, 'b'), (3, resource)])
+        self.assertEqual(idx.action_mode, None)
+        self.assertEqual(list(catalog.objectids), [1, 2, 3])
+
     def test_index_resource_nonint_docid(self):
         catalog = self._makeOne()
         idx = DummyIndex()
@@ -216,7 +328,7 @@ class TestCatalog(unittest.TestCase):
         objectmap = DummyObjectMap({1:[a, (_BLANK, _A)]})
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
-        inst.objectids = [1]
+        inst.objectids = self.family.IF.TreeSet([1])
         def reindex_resource(resource, oid=None, action_mode=None):
             L.append((oid, resource))
         inst.reindex_resource = reindex_resource
@@ -231,6 +343,26 @@ class TestCatalog(unittest.TestCase):
                           '*** committing ***'])
         self.assertEqual(transaction.committed, 1)
 
+    def test_reindex_in_path_order(self):
+        a = testing.DummyModel()
+        b = testing.DummyModel()
+        L = []
+        transaction = DummyTransaction()
+        inst = self._makeOne()
+        inst.transaction = transaction
+        objectmap = DummyObjectMap({1:[b, (_BLANK, _B)],
+                                    2:[a, (_BLANK, _A)]})
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        inst.objectids = self.family.IF.TreeSet([1, 2])
+        def reindex_resource(resource, oid=None, action_mode=None):
+            L.append(oid)
+        inst.reindex_resource = reindex_resource
+        inst.flush = lambda *arg, **kw: True
+        inst.reindex(output=False)
+        self.assertEqual(L, [2, 1])
+
     def test_reindex_with_missing_path(self):
         a = testing.DummyModel()
         L = []
@@ -242,7 +374,7 @@ class TestCatalog(unittest.TestCase):
         inst.transaction = transaction
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
-        inst.objectids = [1, 2]
+        inst.objectids = self.family.IF.TreeSet([1, 2])
         def reindex_resource(resource, oid=None, action_mode=None):
             L.append((oid, resource))
         inst.reindex_resource = reindex_resource
@@ -267,7 +399,7 @@ class TestCatalog(unittest.TestCase):
         inst.flush = lambda *arg, **kw: True
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
-        inst.objectids = [1]
+        inst.objectids = self.family.IF.TreeSet([1])
         out = []
         inst.reindex(output=out.append)
         self.assertEqual(L, [])
@@ -290,7 +422,7 @@ class TestCatalog(unittest.TestCase):
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         site['b'] = b
-        inst.objectids = [1, 2]
+        inst.objectids = self.family.IF.TreeSet([1, 2])
         def reindex_resource(resource, oid=None, action_mode=None):
             L.append((oid, resource))
         inst.reindex_resource = reindex_resource
@@ -317,7 +449,7 @@ class TestCatalog(unittest.TestCase):
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         site['b'] = b
-        inst.objectids = [1,2]
+        inst.objectids = self.family.IF.TreeSet([1,2])
         def reindex_resource(resource, oid, action_mode=None):
             L.append((oid, resource))
         inst.reindex_resource = reindex_resource
@@ -346,7 +478,7 @@ class TestCatalog(unittest.TestCase):
         inst.transaction = transaction
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
-        inst.objectids = [1]
+        inst.objectids = self.family.IF.TreeSet([1])
         index = DummyIndex()
         inst['index'] = index
         self.config.registry._substanced_indexes = {'index':index}
@@ -365,6 +497,130 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(L[0][0], 1)
         self.assertEqual(L[0][1], a)
 
+    def _setup_reindex(self, *oids):
+        L = []
+        transaction = DummyTransaction()
+        inst = self._makeOne()
+        inst.transaction = transaction
+        inst.flush = lambda *arg, **kw: True
+        objectmap = DummyObjectMap()
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        for oid in oids:
+            name = u('o%s') % oid
+            resource = testing.DummyModel()
+            site[name] = resource
+            objectmap.objectid_to[oid] = [resource, (_BLANK, name)]
+        inst.objectids = self.family.IF.TreeSet(oids)
+        def reindex_resource(resource, oid=None, action_mode=None):
+            L.append(oid)
+        inst.reindex_resource = reindex_resource
+        return inst, transaction, L
+
+    def test_reindex_commit_interval_records_checkpoint(self):
+        inst, transaction, L = self._setup_reindex(1, 2, 3)
+        checkpoints = []
+        def commit():
+            transaction.committed += 1
+            checkpoints.append(dict(inst.reindex_checkpoints))
+        transaction.commit = commit
+        inst.reindex(commit_interval=2, output=False)
+        self.assertEqual(L, [1, 2, 3])
+        self.assertEqual(transaction.committed, 2)
+        full = (self.family.minint, self.family.maxint)
+        self.assertEqual(checkpoints, [{full:2}, {}])
+
+    def test_reindex_commit_interval_old_catalog_without_checkpoints(self):
+        inst, transaction, L = self._setup_reindex(1, 2, 3)
+        inst.reindex_checkpoints = None
+        inst.reindex(commit_interval=2, output=False)
+        self.assertEqual(L, [1, 2, 3])
+        self.assertEqual(len(inst.reindex_checkpoints), 0)
+
+    def test_reindex_resume(self):
+        inst, transaction, L = self._setup_reindex(1, 2, 3)
+        full = (self.family.minint, self.family.maxint)
+        inst.reindex_checkpoints = self.family.OO.BTree({full:1})
+        out = []
+        inst.reindex(resume=True, output=out.append)
+        self.assertEqual(L, [2, 3])
+        self.assertEqual(out[0], 'catalog resuming reindex after objectid 1')
+        self.assertEqual(len(inst.reindex_checkpoints), 0)
+
+    def test_reindex_resume_no_checkpoint(self):
+        inst, transaction, L = self._setup_reindex(1, 2)
+        inst.reindex(resume=True, output=False)
+        self.assertEqual(L, [1, 2])
+
+    def test_reindex_without_resume_ignores_checkpoint(self):
+        inst, transaction, L = self._setup_reindex(1, 2)
+        full = (self.family.minint, self.family.maxint)
+        inst.reindex_checkpoints = self.family.OO.BTree({full:1})
+        inst.reindex(output=False)
+        self.assertEqual(L, [1, 2])
+        self.assertEqual(len(inst.reindex_checkpoints), 0)
+
+    def test_reindex_oid_range(self):
+        inst, transaction, L = self._setup_reindex(1, 2, 3, 4)
+        full = (self.family.minint, self.family.maxint)
+        inst.reindex_checkpoints = self.family.OO.BTree({full:1, (2, 3):2})
+        inst.reindex(oid_range=[2, 3], resume=True, output=False)
+        self.assertEqual(L, [3])
+        self.assertEqual(dict(inst.reindex_checkpoints), {full:1})
+
+    def test_reindex_oid_range_open_ended(self):
+        inst, transaction, L = self._setup_reindex(1, 2, 3, 4)
+        inst.reindex(oid_range=(3, None), output=False)
+        self.assertEqual(L, [3, 4])
+
+    def test_reindex_conflict_retries_batch(self):
+        from ZODB.POSException import ConflictError
+        inst, transaction, L = self._setup_reindex(1, 2)
+        def commit():
+            transaction.committed += 1
+            if transaction.committed == 1:
+                raise ConflictError
+        transaction.commit = commit
+        out = []
+        inst.reindex(output=out.append)
+        self.assertEqual(L, [1, 2, 1, 2])
+        self.assertEqual(transaction.aborted, 1)
+        self.assertEqual(transaction.committed, 2)
+        self.assertTrue(
+            '*** conflict, retrying batch (attempt 1) ***' in out
+            )
+
+    def test_reindex_conflict_retries_exhausted(self):
+        from ZODB.POSException import ConflictError
+        inst, transaction, L = self._setup_reindex(1)
+        def commit():
+            raise ConflictError
+        transaction.commit = commit
+        self.assertRaises(
+            ConflictError, inst.reindex, retries=1, output=False
+            )
+        self.assertEqual(L, [1, 1])
+        self.assertEqual(transaction.aborted, 2)
+
+    def test_reindex_ranges_one(self):
+        inst = self._makeOne()
+        self.assertEqual(
+            inst.reindex_ranges(1),
+            [(self.family.minint, self.family.maxint)]
+            )
+
+    def test_reindex_ranges_many(self):
+        inst = self._makeOne()
+        ranges = inst.reindex_ranges(3)
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(ranges[0][0], self.family.minint)
+        self.assertEqual(ranges[-1][1], self.family.maxint)
+        for (lo1, hi1), (lo2, hi2) in zip(ranges, ranges[1:]):
+            self.assertEqual(hi1 + 1, lo2)
+
+    def test_reindex_ranges_bad_count(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.reindex_ranges, 0)
+
     def _setup_factory(self, factory=None):
         from substanced.interfaces import ICatalogFactory
         registry = self.config.registry
@@ -691,6 +947,54 @@ class Test_IndexViewMapper(unittest.TestCase):
         result = view('123', None)
         self.assertEqual(result, '123')
 
+    def test_call_class_memoized_instance_and_result(self):
+        from ..util import indexview_memo
+        L = []
+        class Foo(object):
+            def __init__(self, resource):
+                L.append(resource)
+                self.resource = resource
+            def meth(self, default):
+                L.append(default)
+                return self.resource
+            def other(self, default):
+                return id(self)
+        meth = self._makeOne(attr='meth')(Foo)
+        other = self._makeOne(attr='other')(Foo)
+        resource = testing.DummyResource()
+        with indexview_memo.active():
+            self.assertEqual(meth(resource, None), resource)
+            self.assertEqual(meth(resource, None), resource)
+            self.assertEqual(meth(resource, 1), resource)
+            first = other(resource, None)
+            self.assertEqual(other(resource, None), first)
+        self.assertEqual(L, [resource, None, 1])
+
+    def test_call_function_memoized_result(self):
+        from ..util import indexview_memo
+        L = []
+        def foo(resource, default):
+            L.append(resource)
+            return resource
+        view = self._makeOne()(foo)
+        with indexview_memo.active():
+            self.assertEqual(view('123', None), '123')
+            self.assertEqual(view('123', None), '123')
+        self.assertEqual(view('123', None), '123')
+        self.assertEqual(L, ['123', '123'])
+
+    def test_call_function_unhashable_default(self):
+        from ..util import indexview_memo
+        L = []
+        def foo(resource, default):
+            L.append(default)
+            return default
+        view = self._makeOne()(foo)
+        with indexview_memo.active():
+            self.assertEqual(view('123', []), [])
+            self.assertEqual(view('123', {}), {})
+        self.assertEqual(L, [[], {}])
+
 class TestCatalogsService(unittest.TestCase):
     def _makeOne(self, *arg, **kw):
         from .. import CatalogsService
@@ -720,6 +1024,27 @@ class TestCatalogsService(unittest.TestCase):
         self.assertTrue('foo' in inst)
         self.assertTrue(catalog.updated)
 
+    def test_add_catalog_query_cache_size_setting(self):
+        testing.setUp(
+            settings={'substanced.catalogs.query_cache_size':'100'})
+        try:
+            inst = self._makeOne()
+            inst.Catalog = DummyCatalog
+            catalog = inst.add_catalog('foo', update_indexes=False)
+        finally:
+            testing.tearDown()
+        self.assertEqual(catalog.query_cache_size, 100)
+
+    def test_add_catalog_plan_queries_setting(self):
+        testing.setUp(settings={'substanced.catalogs.plan_queries':'true'})
+        try:
+            inst = self._makeOne()
+            inst.Catalog = DummyCatalog
+            catalog = inst.add_catalog('foo', update_indexes=False)
+        finally:
+            testing.tearDown()
+        self.assertTrue(catalog.plan_queries)
+
     def test___sdi_addable__(self):
         inst = self._makeOne()
         self.assertFalse(inst.__sdi_addable__(None, None))
@@ -889,6 +1214,10 @@ class DummyObjectMap(object):
             return
         return data[0]
 
+    def object_for_many(self, objectids, prefetch=0):
+        return [ (oid, self.object_for(oid)) for oid in
+                 sorted(objectids, key=lambda oid: self.path_for(oid) or ()) ]
+
     def add(self, node, path_tuple, duplicating=False, moving=False):
         pass
 
@@ -936,6 +1265,10 @@ class DummyIndex(object):
         self.oid = oid
         self.action_mode = action_mode
 
+    def index_resources(self, resources, action_mode=None):
+        self.bulk = resources
+        self.action_mode = action_mode
+
     def unindex_resource(self, oid, action_mode=None):
         self.unindexed = oid
 
@@ -955,6 +1288,20 @@ class DummyIndex(object):
                 L.append(docid)
         return L
 
+class DummyQuery(Query):
+    def __init__(self, index, result, value=None):
+        self.index = index
+        self.result = result
+        self._value = value
+        self.applied = 0
+
+    def _apply(self, names):
+        self.applied += 1
+        return self.result
+
+    def __str__(self):
+        return 'dummy'
+
 class Dummy(object):
     pass
 
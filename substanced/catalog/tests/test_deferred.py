@@ -70,6 +70,169 @@ class TestAction(unittest.TestCase):
         inst.oid = 1
         self.assertEqual(inst.find_resource(), 'abc')
 
+class TestResourceResolver(unittest.TestCase):
+    def _makeOne(self):
+        from ..deferred import ResourceResolver
+        return ResourceResolver()
+
+    def _makeTree(self):
+        root = DummyFolder()
+        root['a'] = a = DummyFolder()
+        a['b'] = b = DummyFolder()
+        b['c'] = DummyFolder()
+        b['d'] = DummyFolder()
+        paths = {
+            1:('',), 2:('', 'a'), 3:('', 'a', 'b'), 4:('', 'a', 'b', 'c'),
+            5:('', 'a', 'b', 'd'), 6:('', 'a', 'b', 'missing'),
+            }
+        return root, DummyObjectmap(None, root=root, paths=paths)
+
+    def test_objectmap_for_inactive(self):
+        inst = self._makeOne()
+        index = testing.DummyResource()
+        objectmap = index.__objectmap__ = DummyObjectmap(None)
+        self.assertEqual(inst.objectmap_for(index), objectmap)
+        self.assertEqual(inst.objectmaps, None)
+
+    def test_objectmap_for_active(self):
+        inst = self._makeOne()
+        index = testing.DummyResource()
+        objectmap = index.__objectmap__ = DummyObjectmap(None)
+        with inst.active():
+            self.assertEqual(inst.objectmap_for(index), objectmap)
+            del index.__objectmap__
+            self.assertEqual(inst.objectmap_for(index), objectmap)
+        self.assertEqual(inst.objectmaps, None)
+
+    def test_object_for_inactive(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        objectmap.result = 'abc'
+        self.assertEqual(inst.object_for(objectmap, 4), 'abc')
+
+    def test_object_for_active_no_root(self):
+        inst = self._makeOne()
+        objectmap = DummyObjectmap('abc')
+        with inst.active():
+            self.assertEqual(inst.object_for(objectmap, 1), 'abc')
+
+    def test_object_for_active(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        b = root.get('a').get('b')
+        with inst.active():
+            self.assertEqual(inst.object_for(objectmap, 1), root)
+            self.assertEqual(inst.object_for(objectmap, 4), b.get('c'))
+            self.assertEqual(DummyFolder.traversed, ['a', 'b', 'c'])
+            self.assertEqual(inst.object_for(objectmap, 4), b.get('c'))
+            self.assertEqual(inst.object_for(objectmap, 5), b.get('d'))
+            self.assertEqual(inst.object_for(objectmap, 3), b)
+            self.assertEqual(DummyFolder.traversed, ['a', 'b', 'c', 'd', 'b'])
+
+    def test_object_for_active_not_found(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        with inst.active():
+            self.assertEqual(inst.object_for(objectmap, 6), None)
+            self.assertEqual(inst.object_for(objectmap, 7), None)
+            self.assertEqual(inst.object_for(objectmap, 6), None)
+            self.assertEqual(DummyFolder.traversed, ['a', 'b', 'missing'])
+
+    def test_active_nested(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        with inst.active():
+            inst.object_for(objectmap, 2)
+            with inst.active():
+                inst.object_for(objectmap, 2)
+            self.assertEqual(DummyFolder.traversed, ['a'])
+        self.assertEqual(inst.resources, None)
+        self.assertEqual(inst.depth, 0)
+
+    def test_active_clears_on_exception(self):
+        inst = self._makeOne()
+        def run():
+            with inst.active():
+                raise ValueError
+        self.assertRaises(ValueError, run)
+        self.assertEqual(inst.resources, None)
+        self.assertEqual(inst.depth, 0)
+
+    def test_active_with_transaction(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        txn = DummyTransaction()
+        with inst.active(txn):
+            inst.object_for(objectmap, 2)
+        with inst.active(txn):
+            inst.object_for(objectmap, 2)
+        self.assertEqual(DummyFolder.traversed, ['a'])
+        fn, args = txn.aftercommit
+        fn(True, *args)
+        self.assertEqual(inst.txn, None)
+        self.assertEqual(inst.resources, None)
+
+    def test_active_with_transaction_aborted(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        txn = DummyTransaction()
+        with inst.active(txn):
+            inst.object_for(objectmap, 2)
+        fn, args = txn.afterabort
+        fn(*args)
+        self.assertEqual(inst.txn, None)
+        self.assertEqual(inst.resources, None)
+
+    def test_active_with_transaction_aborted_after_another_began(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        txn = DummyTransaction()
+        with inst.active(txn):
+            inst.object_for(objectmap, 2)
+        other = DummyTransaction()
+        with inst.active(other):
+            inst.object_for(objectmap, 2)
+        fn, args = txn.afterabort
+        fn(*args)
+        self.assertTrue(inst.txn is other)
+        self.assertEqual(len(inst.resources), 1)
+
+    def test_active_with_real_transaction_aborted(self):
+        import transaction
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        manager = transaction.TransactionManager()
+        txn = manager.begin()
+        with inst.active(txn):
+            inst.object_for(objectmap, 2)
+        self.assertEqual(len(inst.resources), 1)
+        manager.abort()
+        self.assertEqual(inst.txn, None)
+        self.assertEqual(inst.resources, None)
+
+    def test_active_with_other_transaction(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        with inst.active(DummyTransaction()):
+            inst.object_for(objectmap, 2)
+        with inst.active(DummyTransaction()):
+            inst.object_for(objectmap, 2)
+        self.assertEqual(DummyFolder.traversed, ['a', 'a'])
+
+    def test_active_without_transaction_after_transaction(self):
+        inst = self._makeOne()
+        root, objectmap = self._makeTree()
+        with inst.active(DummyTransaction()):
+            inst.object_for(objectmap, 2)
+        with inst.active():
+            inst.object_for(objectmap, 2)
+        self.assertEqual(DummyFolder.traversed, ['a', 'a'])
+        self.assertEqual(inst.txn, None)
+        self.assertEqual(inst.resources, None)
+
+    def setUp(self):
+        DummyFolder.traversed = []
+
 class TestResourceNotFound(unittest.TestCase):
     def _makeOne(self, action):
         from ..deferred import ResourceNotFound
@@ -85,7 +248,27 @@ class TestResourceNotFound(unittest.TestCase):
 class TestIndexAction(unittest.TestCase):
     def _makeOne(self, index, mode='mode', oid='oid'):
         from ..deferred import IndexAction
-        return IndexAction(index, mode, oid)
+        return patchable(IndexAction)(index, mode, oid)
+
+    def test_slots(self):
+        from ..deferred import IndexAction
+        inst = IndexAction(DummyIndex(), 'mode', 'oid')
+        self.assertFalse(hasattr(inst, '__dict__'))
+
+    def test_pickle_roundtrip(self):
+        import pickle
+        from ..deferred import IndexAction
+        inst = IndexAction(None, None, 1, 2)
+        result = pickle.loads(pickle.dumps(inst, 1))
+        self.assertEqual(result.__class__, IndexAction)
+        self.assertEqual((result.oid, result.index_oid), (1, 2))
+
+    def test_setstate_instance_dict(self):
+        # actions pickled before they used __slots__
+        from ..deferred import IndexAction
+        inst = IndexAction.__new__(IndexAction)
+        inst.__setstate__({'index':None, 'index_oid':2, 'mode':None, 'oid':1})
+        self.assertEqual((inst.oid, inst.index_oid), (1, 2))
 
     def test_index_oid_from_index(self):
         index = DummyIndex()
@@ -129,7 +312,7 @@ class TestIndexAction(unittest.TestCase):
 class TestReindexAction(unittest.TestCase):
     def _makeOne(self, index, mode='mode', oid='oid'):
         from ..deferred import ReindexAction
-        return ReindexAction(index, mode, oid)
+        return patchable(ReindexAction)(index, mode, oid)
 
     def test_index_oid_from_index(self):
         index = DummyIndex()
@@ -162,7 +345,7 @@ class TestReindexAction(unittest.TestCase):
         from ..deferred import ReindexAction
         index = testing.DummyResource()
         index.__oid__ = 1
-        inst = self._makeOne(index)
+        inst = ReindexAction(index, 'mode', 'oid')
         result = inst.anti()
         self.assertEqual(result.__class__, ReindexAction)
         self.assertEqual(result.index, index)
@@ -206,11 +389,83 @@ class TestActionsQueue(unittest.TestCase):
     def test_extend(self):
         inst = self._makeOne()
         inst.extend([1])
-        self.assertEqual(inst.actions, [1])
+        self.assertEqual(inst.actions, [])
+        self.assertEqual(inst.buckets[0].actions, [1])
         # cant check for _p_changed getting set, some magic goes on that causes
         # it to be false, bleh
+        self.assertEqual(inst.buckets[0].gen, 1)
+        self.assertEqual(inst.gen, 0)
+
+    def test_extend_sets_since(self):
+        inst = self._makeOne()
+        inst.extend([1])
+        bucket = inst.buckets[0]
+        since = bucket.since
+        self.assertTrue(since is not None)
+        inst.extend([2])
+        self.assertEqual(bucket.since, since)
+        self.assertEqual(inst.oldest(), since)
+        inst.pop(1)
+        self.assertEqual(bucket.since, since)
+        inst.popall()
+        self.assertEqual(bucket.since, None)
+        self.assertEqual(inst.oldest(), None)
+
+    def test_oldest(self):
+        inst = self._makeOne()
+        inst.actions = [1]
+        inst.since = 30
+        inst.buckets[0].extend([2])
+        inst.buckets[0].since = 20
+        inst.buckets[1].extend([3])
+        inst.buckets[1].since = 40
+        self.assertEqual(inst.oldest(), 20)
+
+    def test_extend_no_buckets(self):
+        inst = self._makeOne()
+        inst.buckets = ()
+        inst.extend([1])
+        self.assertEqual(inst.actions, [1])
         self.assertEqual(inst.gen, 1)
 
+    def test_extend_bucket_full(self):
+        inst = self._makeOne()
+        inst.bucket_size = 2
+        inst.extend([1, 2])
+        inst.extend([3])
+        inst.extend([4])
+        self.assertEqual(inst.buckets[0].actions, [1, 2])
+        self.assertEqual(inst.buckets[1].actions, [3, 4])
+        self.assertEqual(len(inst), 4)
+
+    def test_extend_after_last_nonempty_bucket(self):
+        inst = self._makeOne()
+        inst.buckets[0].extend([1])
+        inst.buckets[2].extend([2])
+        inst.extend([3])
+        self.assertEqual(inst.buckets[0].actions, [1])
+        self.assertEqual(inst.buckets[2].actions, [2, 3])
+
+    def test_extend_all_buckets_full(self):
+        inst = self._makeOne()
+        inst.bucket_size = 1
+        inst.spare_buckets = 1
+        inst.buckets = inst.buckets[:1]
+        inst.extend([1])
+        inst.extend([2])
+        self.assertEqual(len(inst.buckets), 2)
+        self.assertEqual(inst.buckets[1].actions, [2])
+
+    def test_extend_max_buckets(self):
+        inst = self._makeOne()
+        inst.bucket_size = 1
+        inst.max_buckets = 1
+        inst.buckets = inst.buckets[:1]
+        inst.extend([1])
+        inst.extend([2])
+        self.assertEqual(len(inst.buckets), 1)
+        self.assertEqual(inst.buckets[0].actions, [1, 2])
+
     def test_len(self):
         inst = self._makeOne()
         inst.extend([1])
@@ -228,6 +483,93 @@ class TestActionsQueue(unittest.TestCase):
         self.assertEqual(inst.actions, [])
         self.assertEqual(inst.gen, 1)
 
+    def test_pop_no_actions(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.pop(2), None)
+        self.assertEqual(inst.gen, 0)
+
+    def test_pop_with_actions(self):
+        inst = self._makeOne()
+        inst.actions = [1, 2, 3]
+        self.assertEqual(inst.pop(2), [1,2])
+        self.assertEqual(inst.actions, [3])
+        self.assertEqual(inst.gen, 1)
+        self.assertEqual(inst.pop(2), [3])
+        self.assertEqual(inst.actions, [])
+
+    def test_popall_legacy_actions_first(self):
+        inst = self._makeOne()
+        inst.actions = [1]
+        inst.extend([2])
+        inst.buckets[1].extend([3])
+        self.assertEqual(inst.popall(), [1, 2, 3])
+        self.assertEqual(len(inst), 0)
+
+    def test_pop_across_buckets(self):
+        inst = self._makeOne()
+        inst.buckets[0].extend([1, 2])
+        inst.buckets[1].extend([3, 4])
+        self.assertEqual(inst.pop(3), [1, 2, 3])
+        self.assertEqual(inst.buckets[0].actions, [])
+        self.assertEqual(inst.buckets[1].actions, [4])
+        inst.extend([5])
+        self.assertEqual(inst.buckets[1].actions, [4, 5])
+        self.assertEqual(inst.pop(3), [4, 5])
+
+    def test_pop_adds_spare_buckets(self):
+        inst = self._makeOne()
+        inst.bucket_size = 1
+        for i in range(len(inst.buckets)):
+            inst.extend([i])
+        inst.extend([100])
+        self.assertEqual(len(inst.buckets), inst.spare_buckets + 1)
+        inst.pop(1)
+        # the drained first bucket is dropped; the last bucket is still
+        # nonempty, so spares are appended after it
+        self.assertEqual(len(inst.buckets), 2 * inst.spare_buckets)
+
+    def test_pop_drops_drained_buckets(self):
+        inst = self._makeOne()
+        inst.bucket_size = 1
+        for i in range(20):
+            inst.extend([i])
+        buckets = list(inst.buckets)
+        self.assertEqual(len(buckets), 20)
+        self.assertEqual(inst.pop(15), list(range(15)))
+        # drained buckets are dropped until spare_buckets buckets are left
+        self.assertEqual(inst.buckets[:8], buckets[12:])
+        self.assertEqual(len(inst.buckets), 2 * inst.spare_buckets)
+        self.assertTrue(buckets[11].retired)
+        self.assertFalse(hasattr(buckets[12], 'retired'))
+        self.assertEqual(inst.popall(), list(range(15, 20)))
+        self.assertEqual(len(inst.buckets), inst.spare_buckets)
+
+    def test_pop_keeps_spare_drained_buckets(self):
+        inst = self._makeOne()
+        inst.extend([1])
+        buckets = list(inst.buckets)
+        self.assertEqual(inst.popall(), [1])
+        self.assertEqual(inst.buckets, buckets)
+        self.assertFalse(hasattr(buckets[0], 'retired'))
+
+    def test__p_resolveConflict_append_to_retired_bucket(self):
+        from ZODB.POSException import ConflictError
+        inst = self._makeOne()
+        inst.logger = DummyLogger()
+        old = state([])
+        committed = state([])
+        committed['retired'] = True
+        new = state([DummyAction(1)])
+        self.assertRaises(
+            ConflictError, inst._p_resolveConflict, old, committed, new)
+
+    def test_pop_adds_buckets_to_old_queue(self):
+        inst = self._makeOne()
+        inst.buckets = ()
+        inst.actions = [1]
+        self.assertEqual(inst.popall(), [1])
+        self.assertEqual(len(inst.buckets), inst.spare_buckets)
+
     def test__p_resolveConflict_states_have_different_keys(self):
         from ZODB.POSException import ConflictError
         inst = self._makeOne()
@@ -244,6 +586,118 @@ class TestActionsQueue(unittest.TestCase):
             inst._p_resolveConflict, None, {'a':1}, {'a':2}
             )
 
+    def test___getstate___encodes_actions(self):
+        from ..deferred import IndexAction
+        inst = self._makeOne()
+        index = DummyIndex()
+        inst.actions = [IndexAction(index, 'mode', 1)]
+        state = inst.__getstate__()
+        self.assertFalse('actions' in state)
+        table, kinds, oids = state['records']
+        self.assertEqual(table, ((index, index.__oid__, 'mode'),))
+        self.assertTrue(inst.actions) # unchanged
+
+    def test___getstate___unencodable_actions(self):
+        inst = self._makeOne()
+        inst.actions = [DummyAction(1)]
+        state = inst.__getstate__()
+        self.assertEqual(state['actions'], inst.actions)
+        self.assertFalse('records' in state)
+
+    def test___setstate___records(self):
+        from ..deferred import (
+            IndexAction,
+            encode_actions,
+            )
+        inst = self._makeOne()
+        index = DummyIndex()
+        state = inst.__getstate__()
+        state['records'] = encode_actions([IndexAction(index, 'mode', 1)])
+        other = self._makeOne()
+        other.__setstate__(state)
+        self.assertEqual(len(other.actions), 1)
+        self.assertEqual(other.actions[0].oid, 1)
+        self.assertEqual(other.actions[0].index, index)
+
+    def test___setstate___actions(self):
+        inst = self._makeOne()
+        state = inst.__getstate__()
+        del state['records']
+        state['actions'] = [1]
+        other = self._makeOne()
+        other.__setstate__(state)
+        self.assertEqual(other.actions, [1])
+
+    def test__p_resolveConflict_records(self):
+        from ..deferred import (
+            IndexAction,
+            decode_actions,
+            encode_actions,
+            )
+        inst = self._makeOne()
+        inst.logger = DummyLogger()
+        index = DummyIndex()
+        a1 = IndexAction(index, 'mode', 1)
+        a2 = IndexAction(index, 'mode', 2)
+        old = state([])
+        committed = state([])
+        committed['records'] = encode_actions([a1])
+        del committed['actions']
+        new = state([a2]) # a state written before records existed
+        result = inst._p_resolveConflict(old, committed, new)
+        self.assertFalse('actions' in result)
+        actions = decode_actions(result['records'])
+        self.assertEqual([a.oid for a in actions], [1, 2])
+
+    def test__p_resolveConflict_since_earliest_kept(self):
+        inst = self._makeOne()
+        inst.logger = DummyLogger()
+        a1 = DummyAction(1)
+        a2 = DummyAction(2)
+        old = state([])
+        old['since'] = None
+        committed = state([a1])
+        committed['since'] = 20
+        new = state([a2])
+        new['since'] = 10
+        result = inst._p_resolveConflict(old, committed, new)
+        self.assertEqual(result['since'], 10)
+
+    def test__p_resolveConflict_since_reset_when_empty(self):
+        inst = self._makeOne()
+        inst.logger = DummyLogger()
+        a1 = DummyAction(1)
+        old = state([a1])
+        old['since'] = 10
+        committed = state([])
+        committed['since'] = None
+        new = state([a1])
+        new['since'] = 10
+        result = inst._p_resolveConflict(old, committed, new)
+        self.assertEqual(result['since'], None)
+
+    def test__p_resolveConflict_since_missing_from_old_format_state(self):
+        inst = self._makeOne()
+        inst.logger = DummyLogger()
+        a1 = DummyAction(1)
+        a2 = DummyAction(2)
+        a3 = DummyAction(3)
+        # states written before buckets kept ``since``
+        old = state([a1])
+        committed = state([a1, a2])
+        new = state([a1, a3])
+        new['since'] = 10
+        result = inst._p_resolveConflict(old, committed, new)
+        self.assertEqual([a.oid for a in result['actions']], [1, 2, 3])
+        self.assertEqual(result['since'], 10)
+        old = state([a1])
+        committed = state([])
+        committed['since'] = None
+        new = state([a1, a3])
+        result = inst._p_resolveConflict(old, committed, new)
+        self.assertEqual([a.oid for a in result['actions']], [3])
+        self.assertEqual(result['since'], None)
+
     def test__p_resolveConflict_states_get_optimized(self):
         inst = self._makeOne()
         logger = DummyLogger()
@@ -926,6 +1380,505 @@ class TestBasicActionProcessor(unittest.TestCase):
              'ValueError()',
              'stopping basic action processor']
             )
+
+    def test_process_batch_size(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        inst.batch_size = 2
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        inst.logger = DummyLogger()
+        inst.engage = lambda *arg, **kw: False
+        inst.disengage = lambda *arg, **kw: False
+        a1, a2, a3 = DummyAction(1), DummyAction(2), DummyAction(3)
+        queue = DummyQueue([a1, a2, a3])
+        context._p_jar = DummyJar({inst.queue_name:queue})
+        inst.process(once=True)
+        self.assertTrue(a1.executed)
+        self.assertTrue(a2.executed)
+        self.assertFalse(a3.executed)
+        self.assertEqual(queue.result, [a3])
+        self.assertEqual(transaction.committed, 1)
+        self.assertEqual(transaction._note,
+                         'indexing action processor executed 2 actions')
+
+    def test_process_batch_size_commits_failed_batch(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        inst.batch_size = 2
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        inst.logger = DummyLogger()
+        inst.engage = lambda *arg, **kw: False
+        inst.disengage = lambda *arg, **kw: False
+        a1, a2, a3 = DummyAction(1), DummyAction(2), DummyAction(3)
+        a1.raises = ValueError()
+        a2.raises = ValueError()
+        queue = DummyQueue([a1, a2, a3])
+        context._p_jar = DummyJar({inst.queue_name:queue})
+        inst.process(once=True)
+        self.assertEqual(queue.result, [a3, a1, a2])
+        self.assertEqual(transaction.committed, 1)
+
+    def test_process_batch_size_requeues_failed_actions(self):
+        from ..deferred import ResourceNotFound
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        inst.batch_size = 3
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        inst.logger = DummyLogger()
+        inst.engage = lambda *arg, **kw: False
+        inst.disengage = lambda *arg, **kw: False
+        a1, a2, a3, a4 = [ DummyAction(i) for i in range(1, 5) ]
+        a1.raises = ValueError()
+        a3.raises = ResourceNotFound(3)
+        queue = DummyQueue([a1, a2, a3, a4])
+        context._p_jar = DummyJar({inst.queue_name:queue})
+        inst.process(once=True)
+        self.assertTrue(a2.executed)
+        # the failed action is retried after the ones behind it; the one
+        # whose resource is gone is dropped
+        self.assertEqual(queue.result, [a4, a1])
+        self.assertEqual(transaction.committed, 1)
+
+    def test_process_conflicterror_leaves_later_batches_alone(self):
+        from ZODB.POSException import ConflictError
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        inst.batch_size = 1
+        transaction = DummyTransaction([ConflictError])
+        inst.transaction = transaction
+        inst.logger = DummyLogger()
+        inst.engage = lambda *arg, **kw: False
+        inst.disengage = lambda *arg, **kw: False
+        a1, a2 = DummyAction(1), DummyAction(2)
+        queue = DummyQueue([a1, a2])
+        context._p_jar = DummyJar({inst.queue_name:queue})
+        inst.process(once=True)
+        self.assertTrue(transaction.aborted)
+        self.assertFalse(a2.executed)
+        self.assertEqual(queue.result, [a2])
+
+    def test_process_stop_event_set(self):
+        import threading
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        logger = DummyLogger()
+        inst.logger = logger
+        inst.engage = lambda *arg, **kw: False
+        inst.disengage = lambda *arg, **kw: False
+        inst.stop_event = threading.Event()
+        inst.stop_event.set()
+        a1 = DummyAction(1)
+        queue = DummyQueue([a1])
+        context._p_jar = DummyJar({inst.queue_name:queue})
+        inst.process()
+        self.assertFalse(a1.executed)
+        self.assertEqual(
+            logger.messages,
+            ['starting basic action processor',
+             'stopping basic action processor']
+            )
+
+    def test_add_notifies(self):
+        from .. import deferred
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        root = {inst.queue_name:DummyQueue()}
+        root[inst.queue_name].extend = lambda actions: None
+        context._p_jar = DummyJar(root)
+        notifier = DummyNotifier()
+        saved = deferred.notifier
+        deferred.notifier = notifier
+        testing.setUp(settings={
+            'substanced.catalogs.action_processor_notify':'/tmp/sock'})
+        try:
+            inst.add([1])
+        finally:
+            deferred.notifier = saved
+            testing.tearDown()
+        self.assertEqual(notifier.notified, [('/tmp/sock', inst.queue_name)])
+
+    def test_notify_no_address(self):
+        from .. import deferred
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        notifier = DummyNotifier()
+        saved = deferred.notifier
+        deferred.notifier = notifier
+        testing.setUp(settings={})
+        try:
+            inst.notify(inst.queue_name)
+        finally:
+            deferred.notifier = saved
+            testing.tearDown()
+        self.assertEqual(notifier.notified, [])
+
+    def test_wait_listener(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        listener = DummyListener()
+        inst.listener = listener
+        inst.wait(3)
+        self.assertEqual(listener.waited, [(inst.queue_name, 3)])
+
+    def test_wait_stop_event(self):
+        import threading
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        inst.stop_event = threading.Event()
+        inst.stop_event.set()
+        inst.wait(3) # returns at once
+
+class Test_parse_address(unittest.TestCase):
+    def _callFUT(self, address):
+        from ..deferred import parse_address
+        return parse_address(address)
+
+    def test_host_port(self):
+        import socket
+        self.assertEqual(self._callFUT('localhost:8125'),
+                         (socket.AF_INET, ('localhost', 8125)))
+
+    def test_path(self):
+        import socket
+        self.assertEqual(self._callFUT('/var/run/sd.sock'),
+                         (socket.AF_UNIX, '/var/run/sd.sock'))
+
+class Test_encode_actions(unittest.TestCase):
+    def _callFUT(self, actions):
+        from ..deferred import encode_actions
+        return encode_actions(actions)
+
+    def test_roundtrip(self):
+        from ..deferred import (
+            IndexAction,
+            ReindexAction,
+            UnindexAction,
+            decode_actions,
+            )
+        index1 = DummyIndex()
+        index2 = DummyIndex()
+        index2.__oid__ = 2
+        actions = [
+            IndexAction(index1, 'mode', 1),
+            ReindexAction(index2, 'mode', -2**63),
+            UnindexAction(index1, 'mode', 2**63 - 1),
+            IndexAction(index1, 'other', 4),
+            ]
+        records = self._callFUT(actions)
+        self.assertEqual(len(records[0]), 3)
+        result = decode_actions(records)
+        self.assertEqual(
+            [ (a.__class__, a.index, a.index_oid, a.mode, a.oid)
+              for a in result ],
+            [ (a.__class__, a.index, a.index_oid, a.mode, a.oid)
+              for a in actions ],
+            )
+
+    def test_empty(self):
+        from ..deferred import decode_actions
+        self.assertEqual(decode_actions(self._callFUT([])), [])
+
+    def test_unknown_action_class(self):
+        self.assertEqual(self._callFUT([DummyAction(1)]), None)
+
+    def test_oid_not_an_integer(self):
+        from ..deferred import IndexAction
+        self.assertEqual(
+            self._callFUT([IndexAction(DummyIndex(), 'mode', 'oid')]), None)
+
+class TestActionsNotifier(unittest.TestCase):
+    def _makeOne(self):
+        from ..deferred import ActionsNotifier
+        inst = ActionsNotifier()
+        inst.transaction = DummyTransaction()
+        inst.socket = DummySocketModule()
+        inst.logger = DummyLogger()
+        return inst
+
+    def test_notify_registers_one_hook_per_address(self):
+        inst = self._makeOne()
+        inst.notify('/tmp/sock', 'b')
+        inst.notify('/tmp/sock', 'a')
+        hook, args = inst.transaction.aftercommit
+        self.assertEqual(args, ('/tmp/sock',))
+        hook(True, *args)
+        sock = inst.socket.created[0]
+        self.assertEqual(sock.sent, [(b'a b', '/tmp/sock')])
+        self.assertTrue(sock.closed)
+        self.assertEqual(inst.pending, {})
+
+    def test_notify_new_transaction_forgets_pending(self):
+        inst = self._makeOne()
+        inst.notify('/tmp/sock', 'a')
+        inst.transaction = DummyTransaction()
+        inst.notify('/tmp/sock', 'b')
+        self.assertEqual(inst.pending, {'/tmp/sock':set(['b'])})
+        self.assertTrue(inst.transaction.aftercommit)
+
+    def test_send_aborted(self):
+        inst = self._makeOne()
+        inst.notify('/tmp/sock', 'a')
+        inst.send(False, '/tmp/sock')
+        self.assertEqual(inst.socket.created, [])
+        self.assertEqual(inst.pending, {})
+
+    def test_send_socket_error(self):
+        inst = self._makeOne()
+        inst.socket.raises = inst.socket.error('nobody home')
+        inst.notify('/tmp/sock', 'a')
+        inst.send(True, '/tmp/sock')
+        self.assertTrue(inst.socket.created[0].closed)
+        self.assertEqual(len(inst.logger.messages), 1)
+
+class TestActionsListener(unittest.TestCase):
+    def _makeOne(self, address='/tmp/sock', exists=False):
+        from .. import deferred
+        socket = DummySocketModule()
+        os = DummyOS(exists)
+        saved = deferred.ActionsListener.socket, deferred.ActionsListener.os
+        deferred.ActionsListener.socket = socket
+        deferred.ActionsListener.os = os
+        try:
+            inst = deferred.ActionsListener(address)
+            inst.os = os
+            return inst
+        finally:
+            deferred.ActionsListener.socket, deferred.ActionsListener.os = saved
+
+    def test_ctor_binds(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.sock.bound, '/tmp/sock')
+        self.assertTrue(inst.thread.daemon)
+
+    def test_ctor_removes_stale_socket(self):
+        inst = self._makeOne(exists=True)
+        self.assertEqual(inst.os.unlinked, '/tmp/sock')
+
+    def test_receive_and_wait(self):
+        inst = self._makeOne()
+        inst.sock.received = [b'a b']
+        inst.receive()
+        self.assertTrue(inst.event_for('a').is_set())
+        self.assertTrue(inst.event_for('b').is_set())
+        self.assertFalse(inst.event_for('c').is_set())
+        inst.wait('a', 10) # returns at once
+        self.assertFalse(inst.event_for('a').is_set())
+
+    def test_wake_all(self):
+        inst = self._makeOne()
+        inst.event_for('a')
+        inst.wake_all()
+        self.assertTrue(inst.event_for('a').is_set())
+
+    def test_notifier_roundtrip(self):
+        import os
+        import shutil
+        import tempfile
+        from ..deferred import (
+            ActionsListener,
+            ActionsNotifier,
+            )
+        tmpdir = tempfile.mkdtemp()
+        try:
+            address = os.path.join(tmpdir, 'sock')
+            listener = ActionsListener(address)
+            notifier = ActionsNotifier()
+            notifier.transaction = DummyTransaction()
+            notifier.notify(address, 'q')
+            notifier.send(True, address)
+            listener.receive()
+            self.assertTrue(listener.event_for('q').is_set())
+            listener.sock.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+class TestShardedActionProcessor(unittest.TestCase):
+    def _makeOne(self, context, **kw):
+        from ..deferred import ShardedActionProcessor
+        return ShardedActionProcessor(context, **kw)
+
+    def test_ctor_bad_partition(self):
+        context = testing.DummyResource()
+        self.assertRaises(ValueError, self._makeOne, context, partition='x')
+
+    def test_ctor_shard_out_of_range(self):
+        context = testing.DummyResource()
+        self.assertRaises(
+            ValueError, self._makeOne, context, shards=2, shard=2)
+
+    def test_ctor_metric_prefix(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2, shard=1)
+        self.assertEqual(inst.metric_prefix, 'catalog.shard1')
+
+    def test_shard_for_index(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=3)
+        self.assertEqual(inst.shard_for(DummyAction(1, index_oid=5)), 2)
+
+    def test_shard_for_oid(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=3, partition='oid')
+        self.assertEqual(inst.shard_for(DummyAction(1, index_oid=5)), 1)
+
+    def test_get_shard_queue_no_root(self):
+        context = testing.DummyResource()
+        context._p_jar = None
+        inst = self._makeOne(context)
+        self.assertEqual(inst.get_shard_queue(0), None)
+
+    def test_get_shard_queue_created(self):
+        from ..deferred import ActionsQueue
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        root = {}
+        context._p_jar = DummyJar(root)
+        queue = inst.get_shard_queue(1)
+        self.assertTrue(isinstance(queue, ActionsQueue))
+        self.assertTrue(root[inst.queue_name + '.1'] is queue)
+        self.assertTrue(inst.get_shard_queue(1) is queue)
+
+    def test_work_queue_no_shard(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context)
+        self.assertRaises(RuntimeError, inst.work_queue)
+
+    def test_work_queue(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2, shard=1)
+        root = {inst.queue_name + '.1':'queue'}
+        context._p_jar = DummyJar(root)
+        self.assertEqual(inst.work_queue(), 'queue')
+
+    def test_work_queue_name(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2, shard=1)
+        self.assertEqual(inst.work_queue_name(), inst.queue_name + '.1')
+
+    def test_add_not_engaged(self):
+        context = testing.DummyResource()
+        context._p_jar = None
+        inst = self._makeOne(context)
+        self.assertRaises(RuntimeError, inst.add, [DummyAction(1)])
+
+    def test_add_partitions(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2, partition='oid')
+        root = {}
+        context._p_jar = DummyJar(root)
+        a1, a2, a3 = DummyAction(1), DummyAction(2), DummyAction(3)
+        inst.add([a1, a2, a3])
+        self.assertEqual(root[inst.queue_name + '.0'].popall(), [a2])
+        self.assertEqual(root[inst.queue_name + '.1'].popall(), [a1, a3])
+        self.assertEqual(len(root[inst.queue_name]), 0)
+
+    def test_engage_redistributes_unsharded_actions(self):
+        from ..deferred import ActionsQueue
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2, partition='oid')
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        queue = ActionsQueue()
+        a1, a2 = DummyAction(1), DummyAction(2)
+        queue.extend([a1, a2])
+        root = {inst.queue_name:queue}
+        context._p_jar = DummyJar(root)
+        inst.engage()
+        self.assertTrue(queue.pactive)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(root[inst.queue_name + '.0'].popall(), [a2])
+        self.assertEqual(root[inst.queue_name + '.1'].popall(), [a1])
+        self.assertTrue(transaction.committed)
+
+    def test_active_no_root(self):
+        context = testing.DummyResource()
+        context._p_jar = None
+        inst = self._makeOne(context)
+        self.assertFalse(inst.active())
+
+    def test_active_until_last_worker_disengages(self):
+        context = testing.DummyResource()
+        root = {}
+        context._p_jar = DummyJar(root)
+        workers = []
+        for shard in range(2):
+            worker = self._makeOne(context, shards=2, shard=shard)
+            worker.transaction = DummyTransaction()
+            workers.append(worker)
+        inst = self._makeOne(context, shards=2)
+        self.assertFalse(inst.active())
+        for worker in workers:
+            worker.engage()
+        self.assertTrue(inst.active())
+        self.assertFalse(root[inst.queue_name].pactive)
+        workers[0].disengage()
+        self.assertFalse(root[inst.queue_name + '.0'].pactive)
+        self.assertTrue(inst.active())
+        workers[1].disengage()
+        self.assertFalse(inst.active())
+
+    def test_disengage_no_shard(self):
+        from ..deferred import ActionsQueue
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2)
+        inst.transaction = DummyTransaction()
+        queue = ActionsQueue()
+        queue.pactive = True
+        context._p_jar = DummyJar({inst.queue_name:queue})
+        inst.disengage()
+        self.assertFalse(queue.pactive)
+
+    def test_disengage_no_jar(self):
+        context = testing.DummyResource()
+        context._p_jar = None
+        inst = self._makeOne(context, shards=2, shard=0)
+        inst.transaction = DummyTransaction()
+        self.assertRaises(RuntimeError, inst.disengage)
+
+    def test_process_drains_own_shard(self):
+        context = testing.DummyResource()
+        inst = self._makeOne(context, shards=2, shard=1)
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        inst.logger = DummyLogger()
+        inst.engage = lambda *arg, **kw: False
+        inst.disengage = lambda *arg, **kw: False
+        a1, a2 = DummyAction(1), DummyAction(2)
+        root = {
+            inst.queue_name + '.0':DummyQueue([a2]),
+            inst.queue_name + '.1':DummyQueue([a1]),
+            }
+        context._p_jar = DummyJar(root)
+        inst.process(once=True)
+        self.assertTrue(a1.executed)
+        self.assertFalse(a2.executed)
+
+class Test_action_processor_factory(unittest.TestCase):
+    def _callFUT(self, settings):
+        from ..deferred import action_processor_factory
+        return action_processor_factory(settings)
+
+    def test_default(self):
+        from ..deferred import BasicActionProcessor
+        self.assertTrue(self._callFUT({}) is BasicActionProcessor)
+
+    def test_sharded(self):
+        from ..deferred import ShardedActionProcessor
+        factory = self._callFUT({
+            'substanced.catalogs.action_processor_shards':'3',
+            'substanced.catalogs.action_processor_partition':'oid',
+            })
+        context = testing.DummyResource()
+        inst = factory(context)
+        self.assertTrue(isinstance(inst, ShardedActionProcessor))
+        self.assertEqual(inst.shards, 3)
+        self.assertEqual(inst.partition, 'oid')
+        self.assertEqual(inst.shard, None)
         
 class TestIndexActionSavepoint(unittest.TestCase):
     def _makeOne(self, tm):
@@ -1002,14 +1955,35 @@ class TestIndexActionTM(unittest.TestCase):
         self.assertEqual(inst.actions, [1])
 
     def test_flush(self):
+        from ..deferred import resource_resolver
         index = DummyIndex()
         inst = self._makeOne(index)
         a1 = DummyAction(1)
         inst.actions = [a1]
         L = []
-        inst._process = lambda actions, all=None: L.append((actions, all))
+        transaction = DummyTransaction()
+        inst.transaction = transaction
+        def _process(actions, all=None):
+            L.append((actions, all, resource_resolver.txn))
+        inst._process = _process
         inst.flush(all=False)
-        self.assertEqual(L, [([a1], False)])
+        self.assertEqual(L, [([a1], False, transaction)])
+        fn, args = transaction.aftercommit
+        fn(True, *args)
+
+    def test_flush_all(self):
+        from ..deferred import resource_resolver
+        index = DummyIndex()
+        inst = self._makeOne(index)
+        a1 = DummyAction(1)
+        inst.actions = [a1]
+        L = []
+        def _process(actions, all=None):
+            L.append((actions, all, resource_resolver.depth))
+        inst._process = _process
+        inst.flush()
+        self.assertEqual(L, [([a1], True, 1)])
+        self.assertEqual(resource_resolver.resources, None)
 
     def test_flush_no_actions(self):
         index = DummyIndex()
@@ -1035,6 +2009,55 @@ class TestIndexActionTM(unittest.TestCase):
              'done processing index actions']
             )
 
+    def _makeIndexActions(self, index, *oids):
+        from ..deferred import IndexAction
+        actions = []
+        for oid in oids:
+            action = patchable(IndexAction)(index, 'mode', oid)
+            action.find_resource = lambda oid=oid: 'resource%s' % oid
+            actions.append(action)
+        return actions
+
+    def test_execute_actions_immediately_bulk_index_actions(self):
+        index = DummyIndex()
+        inst = self._makeOne(index)
+        inst.logger = DummyLogger()
+        a0 = DummyAction(0)
+        a1, a2 = self._makeIndexActions(index, 1, 2)
+        inst.execute_actions_immediately([a0, a1, a2])
+        self.assertTrue(a0.executed)
+        self.assertEqual(
+            index.bulk, [(1, 'resource1'), (2, 'resource2')]
+            )
+        self.assertEqual(index.oid, None)
+
+    def test_execute_actions_immediately_single_index_action(self):
+        index = DummyIndex()
+        inst = self._makeOne(index)
+        inst.logger = DummyLogger()
+        a1, = self._makeIndexActions(index, 1)
+        inst.execute_actions_immediately([a1])
+        self.assertEqual(index.bulk, None)
+        self.assertEqual(index.oid, 1)
+        self.assertEqual(index.resource, 'resource1')
+
+    def test_execute_index_actions_objectmap_not_found(self):
+        from ..deferred import ObjectMapNotFound
+        index = DummyIndex()
+        inst = self._makeOne(index)
+        logger = DummyLogger()
+        inst.logger = logger
+        a1, a2 = self._makeIndexActions(index, 1, 2)
+        def find_resource():
+            raise ObjectMapNotFound(None)
+        a1.find_resource = find_resource
+        inst.execute_index_actions([a1, a2])
+        self.assertEqual(index.bulk, None)
+        self.assertEqual(
+            logger.messages[-1],
+            'Objectmap not found for index %s' % (index,)
+            )
+
     def test__process_all_False_no_action_processor(self):
         index = DummyIndex()
         inst = self._makeOne(index)
@@ -1240,10 +2263,14 @@ class DummyIndexActionTM(object):
 class DummyIndex(object):
     __oid__ = 1
     oid = None
+    bulk = None
     def index_doc(self, oid, resource):
         self.oid = oid
         self.resource = resource
 
+    def index_docs(self, pairs):
+        self.bulk = pairs
+
     reindex_doc = index_doc
 
     def unindex_doc(self, oid):
@@ -1305,6 +2332,12 @@ class DummyTransaction(object):
         self.beforecommit_fn = fn
         self.beforecommit_args = args
 
+    def addAfterCommitHook(self, fn, args):
+        self.aftercommit = (fn, args)
+
+    def addAfterAbortHook(self, fn, args):
+        self.afterabort = (fn, args)
+
 from substanced._compat import total_ordering
 
 @total_ordering
@@ -1346,9 +2379,68 @@ class DummyQueue(object):
         result = self.result[:]
         self.result = []
         return result
+    def pop(self, count):
+        result = self.result[:count]
+        self.result = self.result[count:]
+        return result
+    def extend(self, actions):
+        self.result = self.result + list(actions)
+    def oldest(self):
+        return None
     def __len__(self):
         return len(self.result)
 
+class DummyNotifier(object):
+    def __init__(self):
+        self.notified = []
+    def notify(self, address, name):
+        self.notified.append((address, name))
+
+class DummyListener(object):
+    def __init__(self):
+        self.waited = []
+    def wait(self, name, timeout):
+        self.waited.append((name, timeout))
+
+class DummySocket(object):
+    closed = False
+    bound = None
+    def __init__(self, raises=None):
+        self.raises = raises
+        self.sent = []
+        self.received = []
+    def sendto(self, data, address):
+        if self.raises is not None:
+            raise self.raises
+        self.sent.append((data, address))
+    def bind(self, address):
+        self.bound = address
+    def recv(self, size):
+        return self.received.pop(0)
+    def close(self):
+        self.closed = True
+
+class DummySocketModule(object):
+    SOCK_DGRAM = 'dgram'
+    error = IOError
+    raises = None
+    def __init__(self):
+        self.created = []
+    def socket(self, family, type):
+        sock = DummySocket(self.raises)
+        self.created.append(sock)
+        return sock
+
+class DummyOS(object):
+    unlinked = None
+    def __init__(self, exists):
+        self.path = self
+        self._exists = exists
+    def exists(self, path):
+        return self._exists
+    def unlink(self, path):
+        self.unlinked = path
+
 class DummyActionProcessor(object):
     def __init__(self, context, commit_raises=None):
         self.context = context
@@ -1371,11 +2463,27 @@ class DummyActionProcessor(object):
         return self.context.queue
     
 class DummyObjectmap(object):
-    def __init__(self, result):
+    def __init__(self, result, root=None, paths=None):
         self.result = result
+        self.root = root
+        self.paths = paths
 
     def object_for(self, oid):
         return self.result
+
+    def path_for(self, oid):
+        return self.paths.get(oid)
+
+class DummyFolder(dict):
+    traversed = []
+    def __getitem__(self, name):
+        DummyFolder.traversed.append(name)
+        return dict.__getitem__(self, name)
     
+def patchable(cls):
+    # actions use __slots__; return a subclass whose instances methods can
+    # be replaced on
+    return type(cls.__name__, (cls,), {})
+
 def state(actions, gen=0, pactive=True, undo=False):
     return dict(locals())
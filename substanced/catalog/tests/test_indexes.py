@@ -44,6 +44,29 @@ class TestSDIndex(unittest.TestCase):
         self.assertEqual(resultset.resolver, resolver)
         self.assertTrue(query.flushed)
 
+    def test_resultset_from_query_catalog_applies_query(self):
+        inst = self._makeOne()
+        inst.__objectmap__ = DummyObjectmap()
+        inst.__parent__ = DummyQueryCatalog([4, 5])
+        query = DummyQuery()
+        resultset = inst.resultset_from_query(query, names={'a':1})
+        self.assertEqual(resultset.ids, [4, 5])
+        self.assertEqual(inst.__parent__.applied, [(query, {'a':1})])
+
+    def test_estimate_no_document_count(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.estimate(DummyQuery()), None)
+
+    def test_estimate_document_count(self):
+        from BTrees.Length import Length
+        inst = self._makeOne()
+        inst._num_docs = Length(5)
+        self.assertEqual(inst.estimate(DummyQuery()), 5)
+
+    def test_narrow(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.narrow(DummyQuery(), [1]), None)
+
     def test_get_action_tm_existing_action_tm(self):
         inst = self._makeOne()
         tm = DummyActionTM(None)
@@ -118,6 +141,30 @@ class TestSDIndex(unittest.TestCase):
         inst.index_resource(resource, action_mode=MODE_IMMEDIATE)
         self.assertEqual(L, [(1, resource)])
 
+    def test_index_resources_action_MODE_IMMEDIATE(self):
+        from substanced.interfaces import MODE_IMMEDIATE
+        r1 = testing.DummyResource()
+        r2 = testing.DummyResource()
+        inst = self._makeOne()
+        L = []
+        inst.index_doc = lambda oid, resource: L.append((oid, resource))
+        inst.index_resources([(2, r2), (1, r1)], action_mode=MODE_IMMEDIATE)
+        self.assertEqual(L, [(1, r1), (2, r2)])
+
+    def test_index_resources_default_action_mode(self):
+        from substanced.interfaces import MODE_ATCOMMIT
+        r1 = testing.DummyResource()
+        r2 = testing.DummyResource()
+        inst = self._makeOne()
+        tm = DummyActionTM(None)
+        inst._p_action_tm = tm
+        inst.index_resources([(2, r2), (1, r1)])
+        self.assertEqual([ a.oid for a in tm.actions ], [1, 2])
+        for action in tm.actions:
+            self.assertEqual(action.__class__.__name__, 'IndexAction')
+            self.assertEqual(action.mode, MODE_ATCOMMIT)
+            self.assertEqual(action.index, inst)
+
     def test_reindex_resource_default_action_mode_is_MODE_ATCOMMIT(self):
         resource = testing.DummyResource()
         inst = self._makeOne()
@@ -160,6 +207,32 @@ class TestSDIndex(unittest.TestCase):
         inst.reindex_resource(resource, action_mode=MODE_IMMEDIATE)
         self.assertEqual(L, [(1, resource)])
 
+    def test_reindex_oids_default_action_mode_is_MODE_ATCOMMIT(self):
+        from substanced.interfaces import MODE_ATCOMMIT
+        inst = self._makeOne()
+        tm = DummyActionTM(None)
+        inst._p_action_tm = tm
+        inst.reindex_oids(iter([2, 1]))
+        self.assertEqual(len(tm.actions), 2)
+        for action, oid in zip(tm.actions, [2, 1]):
+            self.assertEqual(action.__class__.__name__, 'ReindexAction')
+            self.assertEqual(action.oid, oid)
+            self.assertEqual(action.mode, MODE_ATCOMMIT)
+            self.assertEqual(action.index, inst)
+
+    def test_reindex_oids_action_MODE_IMMEDIATE(self):
+        from substanced.interfaces import MODE_IMMEDIATE
+        resource = testing.DummyResource()
+        inst = self._makeOne()
+        objectmap = DummyObjectmap()
+        objectmap.objects = {1:resource}
+        inst.__objectmap__ = objectmap
+        L = []
+        inst.reindex_doc = lambda oid, resource: L.append((oid, resource))
+        inst.reindex_oids([1, 2], action_mode=MODE_IMMEDIATE)
+        self.assertEqual(L, [(1, resource)])
+        self.assertEqual(objectmap.context, inst)
+
     def test_unindex_resource_default_mode_is_MODE_ATCOMMIT(self):
         inst = self._makeOne()
         tm = DummyActionTM(None)
@@ -246,6 +319,60 @@ class TestPathIndex(unittest.TestCase):
         result = inst.index_doc(1, None)
         self.assertEqual(result, None)
 
+    def test_estimate_eq(self):
+        inst = self._makeOne()
+        objectmap = self._acquire(inst, '__objectmap__')
+        for path in ((_BLANK,), (_BLANK, 'a'), (_BLANK, 'a', 'b')):
+            objectmap.add(testing.DummyResource(), path)
+        self.assertEqual(inst.estimate(inst.eq('/a')), 2)
+        self.assertEqual(inst.estimate(inst.eq('/', depth=1)), 2)
+        self.assertEqual(
+            inst.estimate(inst.eq((_BLANK,), include_origin=False)), 2)
+        self.assertEqual(inst.estimate(inst.eq('/nope')), 0)
+
+    def test_estimate_other_query(self):
+        from hypatia.query import NotEq
+        inst = self._makeOne()
+        self.assertEqual(inst.estimate(NotEq(inst, '/a')), None)
+
+    def test_estimate_no_objectmap(self):
+        from ..indexes import PathIndex
+        inst = PathIndex()
+        inst.__parent__ = DummyCatalog()
+        self.assertEqual(inst.estimate(inst.eq('/a')), None)
+
+    def test_generation(self):
+        inst = self._makeOne()
+        inst.__parent__.query_cache_size = 10
+        objectmap = self._acquire(inst, '__objectmap__')
+        generations = [inst.generation()]
+        inst.index_doc(1, None)
+        generations.append(inst.generation())
+        objectmap.add(testing.DummyResource(), (_BLANK,))
+        generations.append(inst.generation())
+        inst.unindex_doc(1)
+        generations.append(inst.generation())
+        inst.reindex_doc(1, None)
+        generations.append(inst.generation())
+        self.assertEqual(len(set(generations)), 4)
+        self.assertEqual(generations[-1], generations[-2])
+        self.assertEqual(generations[0], None)
+
+    def test_generation_not_kept_without_query_cache(self):
+        inst = self._makeOne()
+        objectmap = self._acquire(inst, '__objectmap__')
+        inst.index_doc(1, None)
+        objectmap.add(testing.DummyResource(), (_BLANK,))
+        self.assertFalse('_generation' in inst.__dict__)
+        self.assertFalse('_generation' in objectmap.__dict__)
+        self.assertEqual(inst.generation(), None)
+
+    def test_generation_no_objectmap(self):
+        from ..indexes import PathIndex
+        inst = PathIndex()
+        inst.__parent__ = DummyCatalog()
+        self.assertEqual(inst.generation(), None)
+
     def test_unindex_doc(self):
         inst = self._makeOne()
         result = inst.unindex_doc(1)
@@ -438,6 +565,236 @@ class TestFieldIndex(unittest.TestCase):
         inst = self._makeOne('abc')
         self.assertEqual(inst.action_mode, MODE_ATCOMMIT)
 
+    def _index_each(self, pairs):
+        inst = self._makeOne('value')
+        for oid, resource in pairs:
+            inst.index_doc(oid, resource)
+        return inst
+
+    def _assertSameIndex(self, inst, other):
+        self.assertEqual(
+            [ (k, list(v)) for k, v in inst._fwd_index.items() ],
+            [ (k, list(v)) for k, v in other._fwd_index.items() ],
+            )
+        self.assertEqual(
+            list(inst._rev_index.items()),
+            list(other._rev_index.items()),
+            )
+        self.assertEqual(list(inst._not_indexed), list(other._not_indexed))
+        self.assertEqual(inst.indexed_count(), other.indexed_count())
+
+    def test_generation_changes(self):
+        inst = self._makeOne('value')
+        inst.__parent__ = testing.DummyResource(query_cache_size=10)
+        generations = [inst.generation()]
+        inst.index_doc(1, Dummy(value='a'))
+        generations.append(inst.generation())
+        inst.reindex_doc(1, Dummy(value='b'))
+        generations.append(inst.generation())
+        inst.index_docs([(2, Dummy(value='a'))])
+        generations.append(inst.generation())
+        inst.unindex_doc(1)
+        generations.append(inst.generation())
+        inst.reset()
+        generations.append(inst.generation())
+        self.assertEqual(len(set(generations)), 6)
+
+    def test_generation_not_kept_without_query_cache(self):
+        inst = self._makeOne('value')
+        inst.index_doc(1, Dummy(value='a'))
+        inst.index_docs([(2, Dummy(value='a'))])
+        self.assertFalse('_generation' in inst.__dict__)
+        self.assertEqual(inst.generation(), None)
+
+    def test_generation_kept_once_counted(self):
+        inst = self._makeOne('value')
+        catalog = inst.__parent__ = testing.DummyResource(query_cache_size=10)
+        inst.index_doc(1, Dummy(value='a'))
+        first = inst.generation()
+        # a change made without the cache enabled still changes it
+        catalog.query_cache_size = None
+        inst.unindex_doc(1)
+        self.assertNotEqual(inst.generation(), first)
+
+    def test_estimate(self):
+        inst = self._makeOne('value')
+        for docid, value in ((1, 'a'), (2, 'b'), (3, 'a'), (4, 'c')):
+            inst.index_doc(docid, Dummy(value=value))
+        self.assertEqual(inst.estimate(inst.eq('a')), 2)
+        self.assertEqual(inst.estimate(inst.eq('nope')), 0)
+        self.assertEqual(inst.estimate(inst.any(['a', 'c'])), 3)
+        self.assertEqual(inst.estimate(inst.noteq('a')), 4)
+        self.assertEqual(inst.estimate(inst.eq(['unhashable'])), 4)
+
+    def test_narrow(self):
+        inst = self._makeOne('value')
+        for docid, value in ((1, 'a'), (2, 'b'), (3, 'a'), (4, 'c')):
+            inst.index_doc(docid, Dummy(value=value))
+        inst.index_doc(5, Dummy())
+        docids = [1, 2, 4, 5, 6]
+        self.assertEqual(list(inst.narrow(inst.eq('a'), docids)), [1])
+        self.assertEqual(
+            list(inst.narrow(inst.any(['b', 'c']), docids)), [2, 4])
+        self.assertEqual(inst.narrow(inst.noteq('a'), docids), None)
+        self.assertEqual(inst.narrow(inst.any([['a']]), docids), None)
+
+    def _makeSortable(self):
+        inst = self._makeOne('value')
+        for docid, value in ((1, 'c'), (2, 'a'), (3, 'b'), (4, 'a'),
+                             (5, 'c'), (6, 'b')):
+            inst.index_doc(docid, Dummy(value=value))
+        return inst
+
+    def _sortAll(self, inst, docids, **kw):
+        from .. import indexes
+        old_ratio = indexes.SORT_WALK_RATIO
+        results = []
+        # a ratio of 0 always walks, a large one never does
+        for ratio in (0, 1000):
+            indexes.SORT_WALK_RATIO = ratio
+            try:
+                results.append(list(inst.sort(docids, **kw)))
+            finally:
+                indexes.SORT_WALK_RATIO = old_ratio
+        self.assertEqual(results[0], results[1])
+        return results[0]
+
+    def test_sort_limit(self):
+        inst = self._makeSortable()
+        docids = inst.family.IF.Set([1, 2, 3, 4, 5, 6])
+        self.assertEqual(self._sortAll(inst, docids, limit=3), [2, 4, 3])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=10), [2, 4, 3, 6, 1, 5])
+
+    def test_sort_limit_reverse(self):
+        inst = self._makeSortable()
+        docids = inst.family.IF.Set([1, 2, 3, 4, 5, 6])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=3, reverse=True), [1, 5, 3])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=10, reverse=True),
+            [1, 5, 3, 6, 2, 4])
+
+    def test_sort_limit_docids_list(self):
+        inst = self._makeSortable()
+        self.assertEqual(self._sortAll(inst, [6, 1, 4], limit=2), [4, 6])
+
+    def test_sort_limit_matches_hypatia(self):
+        from hypatia.interfaces import NBEST
+        inst = self._makeSortable()
+        docids = inst.family.IF.Set([1, 3, 4, 5])
+        for reverse in (False, True):
+            expected = list(inst.sort(docids, reverse=reverse, limit=3,
+                                      sort_type=NBEST))
+            self.assertEqual(
+                sorted(self._sortAll(inst, docids, reverse=reverse, limit=3)),
+                sorted(expected))
+
+    def test_sort_limit_unsortable(self):
+        from hypatia.exc import Unsortable
+        from .. import indexes
+        inst = self._makeSortable()
+        old_ratio = indexes.SORT_WALK_RATIO
+        for ratio in (0, 1000):
+            indexes.SORT_WALK_RATIO = ratio
+            try:
+                result = inst.sort([2, 7], limit=5)
+                self.assertEqual(next(result), 2)
+                self.assertRaises(Unsortable, list, result)
+                self.assertEqual(
+                    list(inst.sort([2, 7], limit=5, raise_unsortable=False)),
+                    [2])
+                self.assertEqual(list(inst.sort([2, 7], limit=1)), [2])
+            finally:
+                indexes.SORT_WALK_RATIO = old_ratio
+
+    def test_sort_after(self):
+        inst = self._makeSortable()
+        docids = inst.family.IF.Set([1, 2, 3, 4, 5, 6])
+        # ascending: 2 4 3 6 1 5
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=2, after=('a', 4)), [3, 6])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=3, after=('a', 2)), [4, 3, 6])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=3, after=('c', 5)), [])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=2, after=('b', 99)), [1, 5])
+        self.assertEqual(
+            list(inst.sort(docids, after=('b', 3))), [6, 1, 5])
+
+    def test_sort_after_reverse(self):
+        inst = self._makeSortable()
+        docids = inst.family.IF.Set([1, 2, 3, 4, 5, 6])
+        # descending: 1 5 3 6 2 4
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=2, reverse=True,
+                          after=('c', 5)), [3, 6])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=3, reverse=True,
+                          after=('c', 1)), [5, 3, 6])
+        self.assertEqual(
+            self._sortAll(inst, docids, limit=2, reverse=True,
+                          after=('bb', 1)), [3, 6])
+        self.assertEqual(
+            list(inst.sort(docids, reverse=True, after=('b', 6))), [2, 4])
+
+    def test_sort_after_leaves_out_unindexed(self):
+        inst = self._makeSortable()
+        self.assertEqual(
+            self._sortAll(inst, [2, 7, 4], limit=5, after=('a', 0)), [2, 4])
+
+    def test_sort_key(self):
+        inst = self._makeSortable()
+        self.assertEqual(inst.sort_key(3), ('b', 3))
+        self.assertEqual(inst.sort_key(7), None)
+        self.assertEqual(inst.sort_key(7, 'default'), 'default')
+
+    def test_sort_limit_invalid(self):
+        inst = self._makeSortable()
+        self.assertRaises(ValueError, inst.sort, [1], limit=0)
+
+    def test_sort_without_limit(self):
+        inst = self._makeSortable()
+        self.assertEqual(list(inst.sort([1, 2, 3])), [2, 3, 1])
+
+    def test_sort_empty_index(self):
+        from hypatia.exc import Unsortable
+        inst = self._makeOne('value')
+        self.assertRaises(Unsortable, inst.sort, [1], limit=1)
+
+    def test_index_docs_new(self):
+        pairs = [
+            (1, Dummy(value='a')),
+            (2, Dummy(value='b')),
+            (3, Dummy(value='a')),
+            (4, Dummy()),
+            ]
+        inst = self._makeOne('value')
+        inst.index_docs(pairs)
+        self._assertSameIndex(inst, self._index_each(pairs))
+        self.assertEqual(inst.indexed_count(), 3)
+
+    def test_index_docs_existing_and_duplicate(self):
+        existing = [(1, Dummy(value='a')), (2, Dummy())]
+        pairs = [
+            (1, Dummy(value='b')),
+            (2, Dummy(value='a')),
+            (3, Dummy(value='c')),
+            (3, Dummy(value='d')),
+            ]
+        inst = self._index_each(existing)
+        inst.index_docs(pairs)
+        self._assertSameIndex(inst, self._index_each(existing + pairs))
+        self.assertEqual(list(inst._fwd_index['d']), [3])
+        self.assertFalse('c' in inst._fwd_index)
+
+    def test_index_docs_unhashable_value(self):
+        pairs = [(1, Dummy(value=['a'])), (2, Dummy(value=['b']))]
+        inst = self._makeOne('value')
+        inst.index_docs(pairs)
+        self._assertSameIndex(inst, self._index_each(pairs))
+
 class TestKeywordIndex(unittest.TestCase):
     def _makeOne(self, discriminator=None, family=None, action_mode=None):
         from ..indexes import KeywordIndex
@@ -456,6 +813,33 @@ class TestKeywordIndex(unittest.TestCase):
         inst = self._makeOne('abc', action_mode=MODE_IMMEDIATE)
         self.assertEqual(inst.action_mode, MODE_IMMEDIATE)
 
+    def test_narrow(self):
+        inst = self._makeOne('tags')
+        for docid, tags in ((1, ['x', 'y']), (2, ['x']), (3, ['z'])):
+            inst.index_doc(docid, Dummy(tags=tags))
+        docids = [1, 2, 3, 4]
+        self.assertEqual(list(inst.narrow(inst.eq('x'), docids)), [1, 2])
+        self.assertEqual(list(inst.narrow(inst.eq('x'), [2, 3])), [2])
+        self.assertEqual(
+            list(inst.narrow(inst.any(['y', 'z']), docids)), [1, 3])
+        self.assertEqual(
+            list(inst.narrow(inst.all(['x', 'y']), docids)), [1])
+        self.assertEqual(list(inst.narrow(inst.all([]), docids)), [])
+        self.assertEqual(inst.narrow(inst.notany(['x']), docids), None)
+        self.assertEqual(inst.narrow(inst.any([['x']]), docids), None)
+
+    def test_estimate(self):
+        inst = self._makeOne('tags')
+        for docid, tags in ((1, ['x', 'y']), (2, ['x']), (3, ['z'])):
+            inst.index_doc(docid, Dummy(tags=tags))
+        self.assertEqual(inst.estimate(inst.eq('x')), 2)
+        self.assertEqual(inst.estimate(inst.any(['x', 'z'])), 3)
+        self.assertEqual(inst.estimate(inst.all(['x', 'y'])), 1)
+        self.assertEqual(inst.estimate(inst.all('y')), 1)
+        self.assertEqual(inst.estimate(inst.all([])), 0)
+        self.assertEqual(inst.estimate(inst.notany(['x'])), 3)
+        self.assertEqual(inst.estimate(inst.eq(['unhashable'])), 3)
+
     def test_ctor_without_action_mode(self):
         from substanced.interfaces import MODE_ATCOMMIT
         inst = self._makeOne('abc')
@@ -567,6 +951,271 @@ class TestAllowedIndex(unittest.TestCase):
         q = index.allows('bob', 'edit')
         self.assertEqual(q._value, [('bob', 'edit')])
 
+class TestRegionAllowedIndex(unittest.TestCase):
+    def setUp(self):
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from pyramid.interfaces import IAuthorizationPolicy
+        self.config = testing.setUp()
+        self.config.registry.registerUtility(
+            ACLAuthorizationPolicy(), IAuthorizationPolicy
+            )
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, family=None):
+        from ..indexes import RegionAllowedIndex
+        from ..discriminators import AllowedIndexDiscriminator
+        index = RegionAllowedIndex(
+            AllowedIndexDiscriminator(('view',)), family=family
+            )
+        return index
+
+    def _makeTree(self):
+        from pyramid.security import Allow
+        from ...objectmap import ObjectMap
+        root = testing.DummyResource()
+        root.__acl__ = [(Allow, 'admin', 'view')]
+        objectmap = root.__objectmap__ = ObjectMap(root)
+        objectmap.add(root, ('',))
+        a = root['a'] = testing.DummyResource()
+        b = a['b'] = testing.DummyResource()
+        c = a['c'] = testing.DummyResource()
+        c.__acl__ = [(Allow, 'bob', 'view')]
+        d = c['d'] = testing.DummyResource()
+        for path, node in (
+            (('', 'a'), a),
+            (('', 'a', 'b'), b),
+            (('', 'a', 'c'), c),
+            (('', 'a', 'c', 'd'), d),
+            ):
+            objectmap.add(node, path)
+        catalog = root['catalog'] = testing.DummyResource()
+        index = self._makeOne()
+        catalog['allowed'] = index
+        for node in (root, a, b, c, d):
+            index.index_doc(node.__oid__, node)
+        return root, index
+
+    def _assertMatchesAllowedIndex(self, root, index):
+        from ..indexes import AllowedIndex
+        expected = AllowedIndex(index.discriminator)
+        for docid in index.indexed():
+            node = root.__objectmap__.object_for(docid)
+            expected.index_doc(docid, node)
+        for principal in ('admin', 'bob', 'joe', 'system.Everyone'):
+            value = [(principal, 'view')]
+            self.assertEqual(
+                sorted(index.applyAny(value)),
+                sorted(expected.applyAny(value)),
+                principal,
+                )
+
+    def _allowed(self, index, principal):
+        return set(index.applyAny([(principal, 'view')]))
+
+    def test_index_doc(self):
+        root, index = self._makeTree()
+        a, c = root['a'], root['a']['c']
+        self.assertEqual(
+            self._allowed(index, 'admin'),
+            set([root.__oid__, a.__oid__, a['b'].__oid__, c.__oid__,
+                 c['d'].__oid__])
+            )
+        self.assertEqual(
+            self._allowed(index, 'bob'),
+            set([c.__oid__, c['d'].__oid__])
+            )
+        self.assertEqual(index.indexed_count(), 5)
+        self.assertEqual(
+            sorted(index._region_values.keys()),
+            sorted([root.__oid__, c.__oid__])
+            )
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_index_doc_already_indexed(self):
+        root, index = self._makeTree()
+        b = root['a']['b']
+        index.index_doc(b.__oid__, b)
+        self.assertEqual(index.indexed_count(), 5)
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_reindex_doc_after_move_into_other_region(self):
+        root, index = self._makeTree()
+        b = root['a']['b']
+        c = root['a']['c']
+        del root['a']['b']
+        c['b'] = b
+        index.reindex_doc(b.__oid__, b)
+        self.assertEqual(index.indexed_count(), 5)
+        self.assertTrue(b.__oid__ in self._allowed(index, 'bob'))
+
+    def test_unindex_doc_drops_empty_region(self):
+        root, index = self._makeTree()
+        c = root['a']['c']
+        index.unindex_doc(c['d'].__oid__)
+        self.assertTrue(c.__oid__ in index._region_values)
+        index.unindex_doc(c.__oid__)
+        self.assertFalse(c.__oid__ in index._region_values)
+        self.assertFalse(('bob', 'view') in index._value_regions)
+        self.assertEqual(index.indexed_count(), 3)
+        index.unindex_doc(c.__oid__)
+        self.assertEqual(index.indexed_count(), 3)
+
+    def test_unindex_doc_not_indexed(self):
+        index = self._makeOne()
+        index._not_indexed.insert(1)
+        index.unindex_doc(1)
+        self.assertEqual(list(index.not_indexed()), [])
+
+    def test_estimate(self):
+        root, index = self._makeTree()
+        query = index.allows(['bob'], 'view')
+        self.assertEqual(index.estimate(query), 5)
+
+    def test_narrow(self):
+        root, index = self._makeTree()
+        a, c = root['a'], root['a']['c']
+        docids = [ node.__oid__ for node in (root, a, a['b'], c, c['d']) ]
+        docids.append(12345)
+        self.assertEqual(
+            set(index.narrow(index.allows(['bob'], 'view'), docids)),
+            set([c.__oid__, c['d'].__oid__]))
+        self.assertEqual(
+            set(index.narrow(index.allows(['admin'], 'view'), docids)),
+            set(docids[:-1]))
+        self.assertEqual(
+            list(index.narrow(index.all([('bob', 'view'), ('joe', 'view')]),
+                              docids)),
+            [])
+        self.assertEqual(list(index.narrow(index.any([]), docids)), [])
+        self.assertEqual(
+            index.narrow(index.notany([('bob', 'view')]), docids), None)
+        self.assertEqual(index.narrow(index.any([['x']]), docids), None)
+
+    def test_generation_changes(self):
+        from pyramid.security import Allow
+        root, index = self._makeTree()
+        root['catalog'].query_cache_size = 10
+        a = root['a']
+        generations = [index.generation()]
+        index.index_doc(a['b'].__oid__, a['b'])
+        generations.append(index.generation())
+        a.__acl__ = [(Allow, 'joe', 'view')]
+        index.acl_modified(a)
+        generations.append(index.generation())
+        index.unindex_doc(a['b'].__oid__)
+        generations.append(index.generation())
+        self.assertEqual(len(set(generations)), 4)
+
+    def test_acl_modified_acl_added(self):
+        from pyramid.security import Allow
+        root, index = self._makeTree()
+        a = root['a']
+        a.__acl__ = [(Allow, 'joe', 'view')]
+        self.assertTrue(index.acl_modified(a))
+        self.assertEqual(
+            self._allowed(index, 'joe'),
+            set([a.__oid__, a['b'].__oid__, a['c'].__oid__,
+                 a['c']['d'].__oid__])
+            )
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_acl_modified_changes_source_region_in_place(self):
+        from pyramid.security import Allow
+        root, index = self._makeTree()
+        a = root['a']
+        docids = index._fwd_index[root.__oid__]
+        a.__acl__ = [(Allow, 'joe', 'view')]
+        index.acl_modified(a)
+        self.assertTrue(index._fwd_index[root.__oid__] is docids)
+        self.assertEqual(list(docids), [root.__oid__])
+
+    def test_acl_modified_acl_changed(self):
+        from pyramid.security import Allow
+        root, index = self._makeTree()
+        c = root['a']['c']
+        c.__acl__ = [(Allow, 'joe', 'view')]
+        self.assertTrue(index.acl_modified(c))
+        self.assertEqual(self._allowed(index, 'bob'), set())
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_acl_modified_acl_removed(self):
+        root, index = self._makeTree()
+        c = root['a']['c']
+        del c.__acl__
+        self.assertTrue(index.acl_modified(c))
+        self.assertFalse(c.__oid__ in index._region_values)
+        self.assertEqual(self._allowed(index, 'bob'), set())
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_acl_modified_root(self):
+        from pyramid.security import (
+            Allow,
+            Deny,
+            )
+        root, index = self._makeTree()
+        root.__acl__ = [(Deny, 'bob', 'view'), (Allow, 'joe', 'view')]
+        self.assertTrue(index.acl_modified(root))
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_acl_modified_unindexed_parent_region(self):
+        from pyramid.security import Allow
+        root, index = self._makeTree()
+        c = root['a']['c']
+        index.unindex_doc(root.__oid__)
+        index.unindex_doc(root['a'].__oid__)
+        index.unindex_doc(root['a']['b'].__oid__)
+        del c.__acl__
+        self.assertTrue(index.acl_modified(c))
+        self.assertEqual(
+            self._allowed(index, 'admin'),
+            set([c.__oid__, c['d'].__oid__])
+            )
+        c.__acl__ = [(Allow, 'bob', 'view')]
+        self.assertTrue(index.acl_modified(c))
+        self._assertMatchesAllowedIndex(root, index)
+
+    def test_acl_modified_no_objectmap(self):
+        index = self._makeOne()
+        resource = testing.DummyResource()
+        resource.__oid__ = 1
+        self.assertFalse(index.acl_modified(resource))
+
+    def test_acl_modified_no_oid(self):
+        root, index = self._makeTree()
+        self.assertFalse(index.acl_modified(testing.DummyResource()))
+
+    def test_acl_modified_not_in_objectmap(self):
+        root, index = self._makeTree()
+        resource = testing.DummyResource()
+        resource.__oid__ = 12345
+        self.assertFalse(index.acl_modified(resource))
+
+    def test_region_for_without_oid(self):
+        index = self._makeOne()
+        resource = testing.DummyResource()
+        self.assertEqual(index.region_for(resource, 5), (5, resource))
+
+    def test_search_and(self):
+        from pyramid.security import Allow
+        root, index = self._makeTree()
+        c = root['a']['c']
+        c.__acl__ = [(Allow, 'bob', 'view'), (Allow, 'joe', 'view')]
+        index.acl_modified(c)
+        self.assertEqual(
+            sorted(index.applyAll([('bob', 'view'), ('joe', 'view')])),
+            sorted([c.__oid__, c['d'].__oid__])
+            )
+        self.assertEqual(
+            list(index.applyAll([('bob', 'view'), ('nobody', 'view')])),
+            []
+            )
+
+    def test_search_bad_operator(self):
+        index = self._makeOne()
+        self.assertRaises(TypeError, index.search, [], operator='xor')
+
 class TestIndexPropertySheet(unittest.TestCase):
     def _makeOne(self, context, request):
         from ..indexes import IndexPropertySheet
@@ -600,7 +1249,8 @@ class TestIndexPropertySheet(unittest.TestCase):
         self.assertEqual(result['action_mode'], 'MODE_IMMEDIATE')
 
 class Dummy(object):
-    pass
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
 
 class DummyCatalog(object):
     family = BTrees.family64
@@ -609,9 +1259,23 @@ class DummyCatalog(object):
             objectids = self.family.II.TreeSet()
         self.objectids = objectids
 
+class DummyQueryCatalog(object):
+    def __init__(self, result):
+        self.result = result
+        self.applied = []
+
+    def apply_query(self, query, names=None):
+        self.applied.append((query, names))
+        return self.result
+
 class DummyObjectmap(object):
+    objects = {}
     def object_for(self, docid): return 'a'
 
+    def object_for_many(self, oids, context=None):
+        self.context = context
+        return [ (oid, self.objects.get(oid)) for oid in oids ]
+
 class DummyQuery(object):
     def flush(self, *arg, **kw):
         self.flushed = True
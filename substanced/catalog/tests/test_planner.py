@@ -0,0 +1,239 @@
+import unittest
+from hypatia.query import Query
+from pyramid import testing
+
+def _makeIndexes():
+    from ..indexes import (
+        FieldIndex,
+        KeywordIndex,
+        )
+    title = FieldIndex('title')
+    title.__name__ = 'title'
+    tags = KeywordIndex('tags')
+    tags.__name__ = 'tags'
+    for docid, t, tg in (
+        (1, 'a', ['x', 'y']),
+        (2, 'b', ['x']),
+        (3, 'a', ['x']),
+        (4, 'c', ['z']),
+        ):
+        resource = testing.DummyResource(title=t, tags=tg)
+        title.index_doc(docid, resource)
+        tags.index_doc(docid, resource)
+    return title, tags
+
+class Test_estimate(unittest.TestCase):
+    def _callFUT(self, query, names=None):
+        from ..planner import estimate
+        return estimate(query, names)
+
+    def test_index_estimate(self):
+        title, tags = _makeIndexes()
+        self.assertEqual(self._callFUT(title.eq('a')), 2)
+
+    def test_no_index_estimate(self):
+        self.assertEqual(self._callFUT(DummyQuery([1])), None)
+
+class Test_plan(unittest.TestCase):
+    def _callFUT(self, query, names=None):
+        from ..planner import plan
+        return plan(query, names)
+
+    def test_comparator(self):
+        title, tags = _makeIndexes()
+        query = title.eq('a')
+        node = self._callFUT(query)
+        self.assertTrue(node.query is query)
+        self.assertEqual(node.estimate, 2)
+        self.assertEqual(node.children, [])
+
+    def test_and_orders_operands(self):
+        title, tags = _makeIndexes()
+        unknown = DummyQuery([1, 2, 3])
+        x = tags.eq('x')
+        a = title.eq('a')
+        node = self._callFUT(unknown & x & a)
+        self.assertEqual([ c.query for c in node.children ], [a, x, unknown])
+        self.assertEqual(node.estimate, 2)
+
+    def test_or_orders_operands(self):
+        title, tags = _makeIndexes()
+        x = tags.eq('x')
+        c = title.eq('c')
+        node = self._callFUT(x | c)
+        self.assertEqual([ n.query for n in node.children ], [c, x])
+        self.assertEqual(node.estimate, 4)
+
+    def test_or_unknown_estimate(self):
+        title, tags = _makeIndexes()
+        node = self._callFUT(title.eq('c') | DummyQuery([1]))
+        self.assertEqual(node.estimate, None)
+
+    def test_and_unknown_estimates(self):
+        node = self._callFUT(DummyQuery([1]) & DummyQuery([1]))
+        self.assertEqual(node.estimate, None)
+
+    def test_names(self):
+        from hypatia.query import Name
+        title, tags = _makeIndexes()
+        node = self._callFUT(title.eq(Name('t')), {'t':'b'})
+        self.assertEqual(node.estimate, 1)
+
+class TestPlanNode(unittest.TestCase):
+    def _plan(self, query, names=None):
+        from ..planner import plan
+        return plan(query, names)
+
+    def test_execute_comparator(self):
+        title, tags = _makeIndexes()
+        node = self._plan(title.eq('a'))
+        self.assertEqual(list(node.execute()), [1, 3])
+        self.assertEqual(node.size, None)
+
+    def test_execute_and(self):
+        title, tags = _makeIndexes()
+        node = self._plan(tags.eq('x') & title.eq('a') & tags.eq('y'))
+        self.assertEqual(list(node.execute()), [1])
+
+    def test_execute_and_stops_when_empty(self):
+        title, tags = _makeIndexes()
+        unknown = DummyQuery([1, 2])
+        node = self._plan(unknown & title.eq('nope'))
+        self.assertEqual(list(node.execute(explain=True)), [])
+        self.assertEqual(unknown.applied, 0)
+        self.assertEqual(node.size, 0)
+        self.assertEqual(node.children[1].size, None)
+
+    def test_execute_or(self):
+        title, tags = _makeIndexes()
+        node = self._plan(title.eq('c') | tags.eq('y') | title.eq('nope'))
+        self.assertEqual(sorted(node.execute()), [1, 4])
+
+    def test_execute_nested(self):
+        title, tags = _makeIndexes()
+        node = self._plan((title.eq('a') | title.eq('c')) & tags.eq('x'))
+        self.assertEqual(sorted(node.execute()), [1, 3])
+
+    def test_execute_matches_hypatia(self):
+        title, tags = _makeIndexes()
+        queries = [
+            title.eq('a') & tags.eq('x'),
+            title.eq('a') | tags.eq('z'),
+            (tags.eq('x') | title.eq('c')) & title.noteq('b'),
+            tags.any(['y', 'z']) & title.inrange('a', 'b'),
+            ]
+        for query in queries:
+            self.assertEqual(sorted(self._plan(query).execute()),
+                             sorted(query._apply(None)))
+
+    def test_execute_explain(self):
+        title, tags = _makeIndexes()
+        node = self._plan(title.eq('a') & tags.eq('x'))
+        node.execute(explain=True)
+        self.assertEqual(node.size, 2)
+        self.assertTrue(node.elapsed >= 0)
+        self.assertEqual([ c.size for c in node.children ], [2, 3])
+
+    def test_execute_and_narrows(self):
+        from .. import planner
+        title, tags = _makeIndexes()
+        small = DummyQuery([2])
+        node = self._plan(small & tags.eq('x'))
+        # the estimate of the unknown query sorts it last; put it first
+        node.children.reverse()
+        old_ratio = planner.NARROW_RATIO
+        planner.NARROW_RATIO = 2
+        try:
+            self.assertEqual(list(node.execute(explain=True)), [2])
+        finally:
+            planner.NARROW_RATIO = old_ratio
+        self.assertTrue(node.children[1].narrowed)
+        self.assertEqual(node.children[1].size, 1)
+        self.assertTrue('x\': estimated 3, narrowed to 1 in ' in str(node))
+
+    def test_narrow_estimate_too_small(self):
+        title, tags = _makeIndexes()
+        node = self._plan(tags.eq('x'))
+        IF = node.query.family.IF
+        self.assertEqual(node.narrow(IF.Set([2])), None)
+
+    def test_narrow_weighted_result(self):
+        from .. import planner
+        title, tags = _makeIndexes()
+        node = self._plan(tags.eq('x'))
+        IF = node.query.family.IF
+        old_ratio = planner.NARROW_RATIO
+        planner.NARROW_RATIO = 2
+        try:
+            self.assertEqual(list(node.narrow(IF.Set([2]))), [2])
+            self.assertEqual(node.narrow(IF.Bucket({2:1.0})), None)
+        finally:
+            planner.NARROW_RATIO = old_ratio
+
+    def test_narrow_unknown_estimate(self):
+        node = self._plan(DummyQuery([1]))
+        IF = node.query.family.IF
+        self.assertEqual(node.narrow(IF.Set()), None)
+
+    def test___str__(self):
+        title, tags = _makeIndexes()
+        unknown = DummyQuery([1, 2])
+        node = self._plan(unknown & title.eq('nope'))
+        node.execute(explain=True)
+        lines = str(node).split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(
+            lines[0].startswith('And: estimated 0, matched 0 in '))
+        self.assertTrue(
+            lines[1].startswith("  title == 'nope': estimated 0, "))
+        self.assertEqual(lines[2], '  dummy: not executed')
+
+class Test_explain(unittest.TestCase):
+    def _callFUT(self, query, names=None, optimize=True):
+        from ..planner import explain
+        return explain(query, names, optimize=optimize)
+
+    def test_it(self):
+        title, tags = _makeIndexes()
+        query = title.eq('a') & tags.eq('x')
+        node = self._callFUT(query)
+        self.assertEqual(node.size, 2)
+
+    def test_optimizes(self):
+        from hypatia.query import Any
+        title, tags = _makeIndexes()
+        node = self._callFUT(title.eq('a') | title.eq('b'))
+        self.assertEqual(node.query.__class__, Any)
+        self.assertEqual(node.size, 3)
+
+    def test_not_optimized(self):
+        from hypatia.query import Or
+        title, tags = _makeIndexes()
+        node = self._callFUT(title.eq('a') | title.eq('b'), optimize=False)
+        self.assertEqual(node.query.__class__, Or)
+        self.assertEqual(node.size, 3)
+
+    def test_flushes(self):
+        query = DummyQuery([1])
+        self._callFUT(query)
+        self.assertTrue(query.flushed)
+
+class DummyQuery(Query):
+    flushed = False
+
+    def __init__(self, result):
+        self.result = result
+        self.applied = 0
+
+    def _apply(self, names):
+        self.applied += 1
+        return self.family.IF.Set(self.result)
+
+    def _optimize(self):
+        return self
+
+    def flush(self, *arg, **kw):
+        self.flushed = True
+
+    def __str__(self):
+        return 'dummy'
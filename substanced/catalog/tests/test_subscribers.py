@@ -324,6 +324,60 @@ class Test_acl_modified(unittest.TestCase):
         self.assertEqual(index.oid, 1)
         self.assertEqual(index.resource, resource)
 
+    def _makeIndexed(self, content_type, index):
+        from substanced.interfaces import IFolder
+        resource = testing.DummyResource(__provides__=IFolder)
+        resource.__oid__ = 1
+        catalog = DummyCatalog()
+        catalog.__name__ = 'catalog'
+        catalogs = resource['catalogs'] = testing.DummyResource(
+            __provides__=IFolder, __is_service__=True, __name__='catalogs')
+        catalogs['catalog'] = catalog
+        index.__name__ = 'index'
+        catalog['index'] = index
+        event = DummyEvent(resource, None)
+        event.registry = DummyRegistry(content=DummyContent(content_type))
+        return resource, event
+
+    def test_region_allowed_index(self):
+        index = DummyIndex()
+        resource, event = self._makeIndexed('Region Allowed Index', index)
+        self._callFUT(event)
+        self.assertEqual(index.acl_modified_resources, [resource])
+        self.assertEqual(index.oid, None)
+
+    def test_region_allowed_index_cannot_update_regions(self):
+        index = DummyIndex(acl_modified_result=False)
+        resource, event = self._makeIndexed('Region Allowed Index', index)
+        self._callFUT(event)
+        self.assertEqual(index.acl_modified_resources, [resource])
+        self.assertEqual(index.oid, 1)
+        self.assertEqual(index.resource, resource)
+
+    def test_allowed_index_with_objectmap(self):
+        index = DummyIndex()
+        resource, event = self._makeIndexed('Allowed Index', index)
+        resource.__objectmap__ = DummyObjectMap([3, 2, 1])
+        self._callFUT(event)
+        self.assertEqual(index.reindexed_oids, [3, 2, 1])
+        self.assertEqual(resource.__objectmap__.postordered, resource)
+        self.assertEqual(index.oid, None)
+
+    def test_region_allowed_index_cannot_update_regions_with_objectmap(self):
+        index = DummyIndex(acl_modified_result=False)
+        resource, event = self._makeIndexed('Region Allowed Index', index)
+        resource.__objectmap__ = DummyObjectMap([1])
+        self._callFUT(event)
+        self.assertEqual(index.acl_modified_resources, [resource])
+        self.assertEqual(index.reindexed_oids, [1])
+
+    def test_other_index(self):
+        index = DummyIndex()
+        resource, event = self._makeIndexed('Field Index', index)
+        self._callFUT(event)
+        self.assertEqual(index.acl_modified_resources, [])
+        self.assertEqual(index.oid, None)
+
 class Test_on_startup(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp()
@@ -492,6 +546,10 @@ class DummyObjectMap:
 
     def object_for(self, oid):
         return self.object_result
+
+    def postorder(self, obj):
+        self.postordered = obj
+        return iter(self.result)
     
 class DummyEvent(object):
     removed_oids = None
@@ -502,21 +560,35 @@ class DummyEvent(object):
         self.moving = moving
         
 class DummyContent(object):
+    def __init__(self, type='Allowed Index'):
+        self.type = type
+
     def istype(self, obj, whatever):
-        return True
+        return whatever == self.type
 
 class DummyRegistry(object):
     def __init__(self, content):
         self.content = content
         
 class DummyIndex(object):
-    def __init__(self):
+    oid = None
+    resource = None
+    def __init__(self, acl_modified_result=True):
         self.reindexed = []
+        self.acl_modified_result = acl_modified_result
+        self.acl_modified_resources = []
 
     def reindex_resource(self, resource, oid=None, action_mode=None):
         self.oid = oid
         self.resource = resource
 
+    def reindex_oids(self, oids, action_mode=None):
+        self.reindexed_oids = list(oids)
+
+    def acl_modified(self, resource):
+        self.acl_modified_resources.append(resource)
+        return self.acl_modified_result
+
 class DummyContentRegistry(object):
     def __init__(self, result=None):
         self.result = result
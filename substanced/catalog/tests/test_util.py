@@ -19,3 +19,338 @@ class Test_oid_from_resource(unittest.TestCase):
         resource.__oid__ = 1
         self.assertEqual(self._callFUT(resource), 1)
 
+
+class Test_query_key(unittest.TestCase):
+    def _callFUT(self, query, names=None):
+        from ..util import query_key
+        return query_key(query, names)
+
+    def _makeIndex(self, name, oid=None):
+        index = testing.DummyResource()
+        index.__name__ = name
+        if oid is not None:
+            index.__oid__ = oid
+        return index
+
+    def test_comparator(self):
+        from hypatia.query import Eq
+        index = self._makeIndex('title', 1)
+        key, indexes = self._callFUT(Eq(index, 'a'))
+        self.assertEqual(indexes, [index])
+        self.assertEqual(key, self._callFUT(Eq(index, 'a'))[0])
+        self.assertNotEqual(key, self._callFUT(Eq(index, 'b'))[0])
+        hash(key)
+
+    def test_different_comparators_differ(self):
+        from hypatia.query import Eq, NotEq
+        index = self._makeIndex('title')
+        self.assertNotEqual(self._callFUT(Eq(index, 'a'))[0],
+                            self._callFUT(NotEq(index, 'a'))[0])
+
+    def test_different_indexes_differ(self):
+        from hypatia.query import Eq
+        index1 = self._makeIndex('title', 1)
+        index2 = self._makeIndex('title', 2)
+        self.assertNotEqual(self._callFUT(Eq(index1, 'a'))[0],
+                            self._callFUT(Eq(index2, 'a'))[0])
+
+    def test_unordered_values(self):
+        from hypatia.query import Any
+        index = self._makeIndex('allowed')
+        self.assertEqual(
+            self._callFUT(Any(index, [('p', 'view'), ('q', 'view')]))[0],
+            self._callFUT(Any(index, [('q', 'view'), ('p', 'view')]))[0])
+
+    def test_boolean_operands_unordered(self):
+        from hypatia.query import Eq
+        index1 = self._makeIndex('title', 1)
+        index2 = self._makeIndex('name', 2)
+        key1, indexes1 = self._callFUT(Eq(index1, 'a') & Eq(index2, 'b'))
+        key2, indexes2 = self._callFUT(Eq(index2, 'b') & Eq(index1, 'a'))
+        self.assertEqual(key1, key2)
+        self.assertEqual(indexes1, indexes2)
+        key3 = self._callFUT(Eq(index1, 'a') | Eq(index2, 'b'))[0]
+        self.assertNotEqual(key1, key3)
+
+    def test_not(self):
+        from hypatia.query import Eq, Not
+        index = self._makeIndex('title')
+        key, indexes = self._callFUT(Not(Eq(index, 'a')))
+        self.assertEqual(indexes, [index])
+        self.assertNotEqual(key, self._callFUT(Eq(index, 'a'))[0])
+
+    def test_range(self):
+        from hypatia.query import InRange
+        index = self._makeIndex('date')
+        self.assertNotEqual(self._callFUT(InRange(index, 1, 2))[0],
+                            self._callFUT(InRange(index, 1, 3))[0])
+
+    def test_names(self):
+        from hypatia.query import Eq, Name
+        index = self._makeIndex('title')
+        query = Eq(index, Name('title'))
+        self.assertNotEqual(self._callFUT(query, {'title':'a'})[0],
+                            self._callFUT(query, {'title':'b'})[0])
+
+    def test_resource_value(self):
+        from hypatia.query import Eq
+        index = self._makeIndex('path')
+        root = testing.DummyResource()
+        a = root['a'] = testing.DummyResource()
+        key = self._callFUT(Eq(index, a))[0]
+        self.assertEqual(key, self._callFUT(Eq(index, root['a']))[0])
+        self.assertNotEqual(key, self._callFUT(Eq(index, root))[0])
+
+    def test_dict_and_set_values(self):
+        from hypatia.query import Eq
+        index = self._makeIndex('path')
+        key = self._callFUT(Eq(index, {'a':[1], 'b':set([2, 3])}))[0]
+        self.assertEqual(
+            key, self._callFUT(Eq(index, {'b':set([3, 2]), 'a':[1]}))[0])
+        hash(key)
+
+    def test_unhashable_value(self):
+        from hypatia.query import Eq
+        index = self._makeIndex('title')
+        self.assertRaises(
+            TypeError, self._callFUT, Eq(index, bytearray(b'a')))
+
+class TestQueryCache(unittest.TestCase):
+    def _makeOne(self, size):
+        from ..util import QueryCache
+        return QueryCache(size)
+
+    def test_miss(self):
+        inst = self._makeOne(2)
+        self.assertEqual(inst.get('key', (1,)), None)
+        self.assertEqual(inst.misses, 1)
+
+    def test_hit(self):
+        inst = self._makeOne(2)
+        docids = [1, 2]
+        inst.set('key', (1,), docids)
+        self.assertTrue(inst.get('key', (1,)) is docids)
+        self.assertEqual(inst.hits, 1)
+
+    def test_stale(self):
+        inst = self._makeOne(2)
+        inst.set('key', (1,), [1])
+        self.assertEqual(inst.get('key', (2,)), None)
+        self.assertEqual(inst.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        inst = self._makeOne(2)
+        inst.set('a', (1,), [1])
+        inst.set('b', (1,), [2])
+        inst.get('a', (1,))
+        inst.set('c', (1,), [3])
+        self.assertEqual(sorted(inst.entries), ['a', 'c'])
+
+    def test_info(self):
+        inst = self._makeOne(2)
+        self.assertEqual(inst.info()['hitrate'], None)
+        inst.set('a', (1,), [1])
+        inst.get('a', (1,))
+        inst.get('b', (1,))
+        inst.get('a', (1,))
+        self.assertEqual(
+            inst.info(),
+            {'hits':2, 'misses':1, 'hitrate':2/3.0, 'size':1, 'maxsize':2})
+
+class Test_encode_cursor(unittest.TestCase):
+    def _callFUT(self, sort_key):
+        from ..util import encode_cursor
+        return encode_cursor(sort_key)
+
+    def _decode(self, cursor):
+        from ..util import _decode_cursor
+        return _decode_cursor(cursor)
+
+    def test_json_key(self):
+        cursor = self._callFUT((u'f\xe9e', 12))
+        self.assertTrue(isinstance(cursor, str))
+        self.assertEqual(self._decode(cursor), [12, u'f\xe9e'])
+
+    def test_key_not_json(self):
+        import datetime
+        cursor = self._callFUT((datetime.date(2013, 1, 1), 12))
+        self.assertEqual(self._decode(cursor), [12])
+
+    def test_key_changed_by_json(self):
+        cursor = self._callFUT((('a', 1), 12))
+        self.assertEqual(self._decode(cursor), [12])
+
+    def test_decode_invalid(self):
+        import base64
+        def encode(data):
+            return base64.urlsafe_b64encode(data).decode('ascii')
+        for cursor in (u'?', u'\xe9', encode(b'{"a"'), encode(b'"a"'),
+                       encode(b'[]'), encode(b'[1, 2, 3]'), encode(b'["1"]'),
+                       encode(b'[true]')):
+            self.assertRaises(ValueError, self._decode, cursor)
+
+class Test_sort_page(unittest.TestCase):
+    def _callFUT(self, resultset, index, limit, cursor=None, reverse=False):
+        from ..util import sort_page
+        return sort_page(resultset, index, limit, cursor=cursor,
+                         reverse=reverse)
+
+    def _makeIndex(self):
+        from ..indexes import FieldIndex
+        index = FieldIndex('title')
+        for docid, title in ((1, 'c'), (2, 'a'), (3, 'b'), (4, 'a'),
+                             (5, 'd')):
+            index.index_doc(docid, testing.DummyResource(title=title))
+        return index
+
+    def _makeResultSet(self, ids):
+        from hypatia.util import ResultSet
+        return ResultSet(ids, len(ids), None)
+
+    def _pages(self, index, ids, limit, reverse=False):
+        pages = []
+        cursor = None
+        while True:
+            resultset, cursor = self._callFUT(
+                self._makeResultSet(ids), index, limit, cursor=cursor,
+                reverse=reverse)
+            pages.append(list(resultset.ids))
+            if cursor is None:
+                return pages
+
+    def test_pages(self):
+        index = self._makeIndex()
+        ids = index.family.IF.Set([1, 2, 3, 4, 5])
+        self.assertEqual(self._pages(index, ids, 2), [[2, 4], [3, 1], [5]])
+        self.assertEqual(self._pages(index, ids, 5), [[2, 4, 3, 1, 5], []])
+
+    def test_pages_reverse(self):
+        index = self._makeIndex()
+        ids = index.family.IF.Set([1, 2, 3, 4])
+        self.assertEqual(
+            self._pages(index, ids, 3, reverse=True), [[1, 3, 2], [4]])
+
+    def test_resultset(self):
+        index = self._makeIndex()
+        resolver = object()
+        from hypatia.util import ResultSet
+        resultset, cursor = self._callFUT(
+            ResultSet(iter([1, 2]), 2, resolver), index, 1)
+        self.assertEqual(list(resultset.ids), [2])
+        self.assertEqual(len(resultset), 1)
+        self.assertTrue(resultset.resolver is resolver)
+
+    def test_cursor_item_removed(self):
+        from ..util import encode_cursor
+        index = self._makeIndex()
+        cursor = encode_cursor(index.sort_key(3))
+        index.unindex_doc(3)
+        resultset, cursor = self._callFUT(
+            self._makeResultSet([1, 2, 4, 5]), index, 1, cursor=cursor)
+        self.assertEqual(list(resultset.ids), [1])
+
+    def test_cursor_item_removed_key_unknown(self):
+        import datetime
+        from ..util import encode_cursor
+        index = self._makeIndex()
+        cursor = encode_cursor((datetime.date(2013, 1, 1), 3))
+        index.unindex_doc(3)
+        self.assertRaises(ValueError, self._callFUT,
+                          self._makeResultSet([1]), index, 1, cursor=cursor)
+
+    def test_cursor_key_of_other_type(self):
+        from ..util import encode_cursor
+        index = self._makeIndex()
+        cursor = encode_cursor((1, 99))
+        self.assertRaises(ValueError, self._callFUT,
+                          self._makeResultSet([1, 2]), index, 1, cursor=cursor)
+
+    def test_invalid_cursor(self):
+        index = self._makeIndex()
+        self.assertRaises(ValueError, self._callFUT,
+                          self._makeResultSet([1]), index, 1, cursor='?')
+
+class TestIndexViewMemo(unittest.TestCase):
+    def _makeOne(self):
+        from ..util import IndexViewMemo
+        return IndexViewMemo()
+
+    def test_get_inactive(self):
+        inst = self._makeOne()
+        L = []
+        factory = lambda: L.append(1) or len(L)
+        self.assertEqual(inst.get('a', 'key', factory), 1)
+        self.assertEqual(inst.get('a', 'key', factory), 2)
+        self.assertEqual((inst.hits, inst.misses), (0, 0))
+
+    def test_get_active(self):
+        inst = self._makeOne()
+        L = []
+        factory = lambda: L.append(1) or len(L)
+        with inst.active():
+            self.assertEqual(inst.get('a', 'key', factory), 1)
+            self.assertEqual(inst.get('a', 'key', factory), 1)
+            self.assertEqual(inst.get('a', 'other', factory), 2)
+        self.assertEqual((inst.hits, inst.misses), (1, 2))
+        self.assertEqual(inst.entries, None)
+        self.assertEqual(inst.resource, None)
+
+    def test_get_active_new_resource_forgets_previous(self):
+        inst = self._makeOne()
+        L = []
+        factory = lambda: L.append(1) or len(L)
+        with inst.active():
+            self.assertEqual(inst.get('a', 'key', factory), 1)
+            self.assertEqual(inst.get('b', 'key', factory), 2)
+            self.assertEqual(inst.get('a', 'key', factory), 3)
+        self.assertEqual((inst.hits, inst.misses), (0, 3))
+
+    def test_active_nested(self):
+        inst = self._makeOne()
+        factory = lambda: object()
+        with inst.active():
+            with inst.active():
+                value = inst.get('a', 'key', factory)
+            self.assertEqual(inst.depth, 1)
+            self.assertTrue(inst.get('a', 'key', factory) is value)
+        self.assertEqual(inst.depth, 0)
+
+    def test_active_reports_to_statsd(self):
+        from .. import util
+        inst = self._makeOne()
+        L = []
+        old = util.statsd_incr
+        util.statsd_incr = lambda name, value: L.append((name, value))
+        try:
+            with inst.active():
+                inst.get('a', 'key', lambda: 1)
+                inst.get('a', 'key', lambda: 1)
+                inst.get('a', 'key2', lambda: 1)
+            with inst.active():
+                pass
+        finally:
+            util.statsd_incr = old
+        self.assertEqual(
+            L,
+            [('catalog.indexview_memo.hits', 1),
+             ('catalog.indexview_memo.misses', 2)]
+            )
+
+    def test_get_active_unhashable_key(self):
+        inst = self._makeOne()
+        L = []
+        factory = lambda: L.append(1) or len(L)
+        with inst.active():
+            self.assertEqual(inst.get('a', ('key', []), factory), 1)
+            self.assertEqual(inst.get('a', ('key', []), factory), 2)
+        self.assertEqual((inst.hits, inst.misses), (0, 0))
+
+    def test_active_exception(self):
+        inst = self._makeOne()
+        def fail():
+            with inst.active():
+                inst.get('a', 'key', lambda: 1)
+                raise ValueError
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(inst.depth, 0)
+        self.assertEqual(inst.entries, None)
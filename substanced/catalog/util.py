@@ -1,5 +1,23 @@
+import base64
+import binascii
+import contextlib
+import heapq
+import json
+import threading
+
+import hypatia.interfaces
+import hypatia.query
+from pyramid.traversal import resource_path_tuple
+
+from ..stats import statsd_incr
 from ..util import get_oid
-from .._compat import INT_TYPES
+from .._compat import (
+    INT_TYPES,
+    STRING_TYPES,
+    )
+
+def _first(pair):
+    return pair[0]
 
 def oid_from_resource(resource):
     oid = get_oid(resource, None)
@@ -8,3 +26,267 @@ def oid_from_resource(resource):
             'Resource must be an object with an integer __oid__ attribute'
             )
     return oid
+
+_RESOURCE = object()
+
+# The members of unordered collections and the operands of And and Or are
+# put in a canonical order by their hash, which is much cheaper than
+# comparing their reprs.  Keys of different queries still differ; equivalent
+# queries whose members happen to have equal hashes may just not share a key.
+
+# comparators whose value is a collection of values in no particular order
+_UNORDERED = (
+    hypatia.query.Any,
+    hypatia.query.All,
+    hypatia.query.NotAny,
+    hypatia.query.NotAll,
+    )
+
+# values which are their own key
+_SCALARS = frozenset(STRING_TYPES + INT_TYPES + (bytes, float, bool,
+                                                type(None)))
+
+def _freeze(value):
+    if value.__class__ in _SCALARS:
+        return value
+    if isinstance(value, hypatia.query.Name):
+        return (hypatia.query.Name, value.name)
+    if isinstance(value, dict):
+        items = [ (_freeze(k), _freeze(v)) for k, v in value.items() ]
+        return (dict, tuple(sorted(items, key=hash)))
+    if isinstance(value, (list, tuple)):
+        return tuple([ v if v.__class__ in _SCALARS else _freeze(v)
+                       for v in value ])
+    if isinstance(value, (set, frozenset)):
+        frozen = [ v if v.__class__ in _SCALARS else _freeze(v)
+                   for v in value ]
+        return (frozenset, tuple(sorted(frozen, key=hash)))
+    if hasattr(value, '__parent__'):
+        return (_RESOURCE, resource_path_tuple(value))
+    hash(value) # raises TypeError if unhashable
+    return value
+
+def _query_key(query, indexes):
+    if isinstance(query, hypatia.query.BoolOp):
+        children = []
+        for q in query.queries:
+            found = []
+            key = _query_key(q, found)
+            children.append((hash(key), key, found))
+        children.sort(key=_first)
+        for h, key, found in children:
+            indexes.extend(found)
+        return (query.__class__, tuple([ c[1] for c in children ]))
+    if isinstance(query, hypatia.query.Not):
+        return (query.__class__, _query_key(query.query, indexes))
+    index = query.index
+    indexes.append(index)
+    state = []
+    for name, value in sorted(query.__dict__.items()):
+        if name == 'index':
+            continue
+        frozen = _freeze(value)
+        if (name == '_value' and isinstance(query, _UNORDERED) and
+            isinstance(value, (list, tuple))):
+            frozen = tuple(sorted(frozen, key=hash))
+        state.append((name, frozen))
+    index_key = (getattr(index, '__name__', None), get_oid(index, None))
+    return (query.__class__, index_key, tuple(state))
+
+def query_key(query, names=None):
+    """ Return a tuple of ``(key, indexes)`` for the hypatia ``query`` to be
+    executed with the placeholder values ``names``.  ``key`` is hashable and
+    equal for queries which ask the same thing of the same indexes, even if
+    the operands of ``And`` and ``Or`` or the values of ``Any`` and ``All``
+    are in a different order (the principals ``AllowedIndex.allows`` asks
+    about are among the values); resources are represented by their path.
+    ``indexes`` is the list of the indexes the query involves.  Raise a
+    ``TypeError`` if the query contains a value which can't be hashed."""
+    indexes = []
+    key = (_query_key(query, indexes), _freeze(names))
+    return key, indexes
+
+class QueryCache(object):
+    """ A cache of query results holding at most ``size`` of them, evicting
+    the least recently used ones when it is full.  Each result is stored
+    along with the generations of the indexes its query involves (see
+    :meth:`substanced.catalog.indexes.SDIndex.generation`) and is only
+    returned while they are unchanged."""
+    def __init__(self, size):
+        self.size = size
+        self.entries = {} # key -> [generations, docids, last used]
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generations):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != generations:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        entry[2] = self.clock
+        return entry[1]
+
+    def set(self, key, generations, docids):
+        entries = self.entries
+        if len(entries) >= self.size and key not in entries:
+            # evicting a quarter at a time keeps eviction O(1) amortized
+            count = max(self.size // 4, 1)
+            for last, k in heapq.nsmallest(
+                count, [ (e[2], k) for k, e in entries.items() ],
+                key=_first):
+                del entries[k]
+        self.clock += 1
+        entries[key] = [generations, docids, self.clock]
+
+    def info(self):
+        hits = self.hits
+        lookups = hits + self.misses
+        return {
+            'hits':hits,
+            'misses':self.misses,
+            'hitrate':float(hits) / lookups if lookups else None,
+            'size':len(self.entries),
+            'maxsize':self.size,
+            }
+
+def encode_cursor(sort_key):
+    """ Return an opaque string (safe to use in a URL) standing for the sort
+    key ``sort_key``, a ``(key, oid)`` pair returned by the ``sort_key``
+    method of a sort index, to be passed to :func:`sort_page`.  The key is
+    only kept if it survives being encoded as JSON; otherwise it is looked
+    up by oid when the cursor is used."""
+    key, oid = sort_key
+    data = [oid, key]
+    try:
+        payload = json.dumps(data)
+        if json.loads(payload) != data:
+            payload = None
+    except (TypeError, ValueError):
+        payload = None
+    if payload is None:
+        payload = json.dumps([oid])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    try:
+        payload = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        data = json.loads(payload.decode('utf-8'))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor %r' % (cursor,))
+    if (not isinstance(data, list) or not 1 <= len(data) <= 2 or
+        not isinstance(data[0], INT_TYPES) or isinstance(data[0], bool)):
+        raise ValueError('Invalid cursor %r' % (cursor,))
+    return data
+
+def sort_page(resultset, index, limit, cursor=None, reverse=False):
+    """ Return the page of at most ``limit`` ids of the hypatia
+    ``resultset`` sorted by the sort index ``index`` which follows the
+    position ``cursor`` (the first page if ``cursor`` is ``None``), along
+    with the cursor of the next page (``None`` if there is none), as a
+    ``(resultset, cursor)`` tuple.
+
+    Unlike sorting and skipping the ids of the pages before, finding a page
+    costs about as much however deep into the sorted ids it is.  ``index``
+    must accept an ``after`` argument to its ``sort`` method and have a
+    ``sort_key`` method, like
+    :class:`substanced.catalog.indexes.FieldIndex` and
+    :class:`substanced.folder.Folder`.  Cursors are only meaningful for the
+    index and sort order they were returned for; if the item a cursor
+    points at was removed, the page starts after the key it had.  Raise a
+    ``ValueError`` if ``cursor`` isn't a valid cursor."""
+    after = None
+    from_cursor = False
+    if cursor is not None:
+        data = _decode_cursor(cursor)
+        after = index.sort_key(data[0])
+        if after is None:
+            if len(data) < 2:
+                raise ValueError('Cursor %r points at no item' % (cursor,))
+            after = (data[1], data[0])
+            from_cursor = True
+    ids = resultset.ids
+    if not hasattr(ids, '__len__'):
+        ids = list(ids)
+    try:
+        ids = list(index.sort(ids, reverse=reverse, limit=limit, after=after))
+    except TypeError:
+        if not from_cursor:
+            raise
+        # the key of the cursor can't be compared with the index's keys
+        raise ValueError('Invalid cursor %r' % (cursor,))
+    next_cursor = None
+    if ids and limit is not None and len(ids) >= limit:
+        sort_key = index.sort_key(ids[-1])
+        if sort_key is not None:
+            next_cursor = encode_cursor(sort_key)
+    page = resultset.__class__(
+        ids, len(ids), resultset.resolver,
+        sort_type=hypatia.interfaces.STABLE)
+    return page, next_cursor
+
+class IndexViewMemo(threading.local):
+    """ Remembers the index view instances constructed for, and the values
+    computed by index views from, the resource currently being indexed, so
+    that the indexes of a catalog which share an index view class (or the
+    same index view) don't each construct and call it anew.
+
+    The memo is only consulted inside ``with indexview_memo.active():`` and
+    only holds entries for one resource at a time: asking for an entry for a
+    different resource forgets the entries of the previous one.  ``hits`` and
+    ``misses`` count the lookups answered from the memo and the ones which
+    had to compute a value; they are also reported to statsd as
+    ``catalog.indexview_memo.hits`` and ``catalog.indexview_memo.misses``
+    when the outermost ``active`` block exits."""
+    depth = 0
+    resource = None
+    entries = None
+    hits = 0
+    misses = 0
+    started = (0, 0)
+
+    @contextlib.contextmanager
+    def active(self):
+        if not self.depth:
+            self.started = (self.hits, self.misses)
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.resource = self.entries = None
+                hits, misses = self.started
+                if self.hits > hits:
+                    statsd_incr('catalog.indexview_memo.hits', self.hits-hits)
+                if self.misses > misses:
+                    statsd_incr(
+                        'catalog.indexview_memo.misses', self.misses-misses
+                        )
+
+    def get(self, resource, key, factory):
+        """ Return the value remembered for ``resource`` under ``key``,
+        computing it by calling ``factory`` with no arguments if there is
+        none.  When the memo isn't active, or when ``key`` can't be hashed
+        (e.g. it holds an index view default which is a list), always call
+        ``factory``."""
+        if not self.depth:
+            return factory()
+        if resource is not self.resource:
+            self.resource = resource
+            self.entries = {}
+        entries = self.entries
+        try:
+            value = entries[key]
+        except KeyError:
+            self.misses += 1
+            value = entries[key] = factory()
+        except TypeError:
+            return factory()
+        else:
+            self.hits += 1
+        return value
+
+indexview_memo = IndexViewMemo()
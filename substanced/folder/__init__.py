@@ -1,3 +1,4 @@
+import heapq
 import random
 import string
 
@@ -42,6 +43,7 @@ from ..util import (
     postorder,
     find_service,
     find_services,
+    reversed_items,
     )
 from .._compat import STRING_TYPES
 from .._compat import u
@@ -71,6 +73,11 @@ class Folder(Persistent):
     _order_oids = None # tuple of oids
     _reorderable = None
 
+    # name -> oid of each item which has one, so that sorting and ordering
+    # don't need to load the items; ``None`` in folders created before it
+    # existed (see ``substanced.folder.evolve.map_folder_oids``)
+    _oids = None
+
     def __init__(self, data=None, family=None):
         """ Constructor.  Data may be an initial dictionary mapping object
         name to object. """
@@ -80,6 +87,38 @@ class Folder(Persistent):
             data = {}
         self.data = self.family.OO.BTree(data)
         self._num_objects = Length(len(data))
+        self._map_oids()
+
+    def _map_oids(self):
+        # (re)map the oid of every item, updating an existing map in place
+        oids = self._oids
+        if oids is None:
+            # oids are 64-bit whatever the family of the folder
+            oids = self._oids = BTrees.family64.OI.BTree()
+        for name, resource in self.data.items():
+            oid = get_oid(resource, None)
+            if oid is not None:
+                oids[name] = oid
+
+    def _map_missing_oids(self):
+        # map the oids of the items which had none when they were added
+        # (e.g. while this folder was detached), without loading the others
+        oids = self._oids
+        data = self.data
+        for name in data.keys():
+            if not name in oids:
+                oid = get_oid(data[name], None)
+                if oid is not None:
+                    oids[name] = oid
+
+    def _oid_for(self, name):
+        # the oid of the item named ``name``, without loading it if it's in
+        # the name -> oid map
+        if self._oids is not None:
+            oid = self._oids.get(name)
+            if oid is not None:
+                return oid
+        return get_oid(self.data[name])
 
     def set_order(self, names, reorderable=None):
         """ Sets the folder order. ``names`` is a list of names for existing
@@ -114,7 +153,7 @@ class Folder(Persistent):
         for name in names:
             assert(isinstance(name, string_types))
             name = u(name)
-            oid = get_oid(self[name])
+            oid = self._oid_for(name)
             order.append(name)
             order_oids.append(oid)
 
@@ -206,7 +245,7 @@ class Folder(Persistent):
 
         for oid, name in zip(order_oids, order_names):
             # belt and suspenders check
-            assert oid == get_oid(self[name])
+            assert oid == self._oid_for(name)
 
         self._order = tuple(order_names)
         self._order_oids = tuple(order_oids)
@@ -220,23 +259,95 @@ class Folder(Persistent):
         """ Return true if the folder can be reordered, false otherwise."""
         return self._reorderable
 
-    def sort(self, oids, reverse=False, limit=None, **kw):
+    def sort(self, oids, reverse=False, limit=None, after=None, **kw):
         # used by the hypatia resultset "sort" method when the folder contents
-        # view uses us as a "sort index"
+        # view uses us as a "sort index".  The folder's items are walked in
+        # order until ``limit`` of ``oids`` were found.  When ``oids`` are
+        # too few a share of an unordered folder for the walk to end early,
+        # their names are looked up in the objectmap instead and the first
+        # ``limit`` of them selected with a heap.  If ``after`` is a sort key
+        # (see ``sort_key``), the walk starts after the item it belongs to.
+        # The oids of an unordered folder's items are walked in its name ->
+        # oid map, so the items aren't loaded (unless it has no such map).
         if self._order_oids is not None:
-            ids = [oid for oid in self._order_oids if oid in oids]
+            candidates = self._order_oids
+            if after is not None:
+                position, oid = after
+                if oid in candidates:
+                    position = candidates.index(oid)
+                if reverse:
+                    candidates = candidates[:max(position, 0)]
+                else:
+                    candidates = candidates[position + 1:]
+            if reverse:
+                candidates = reversed(candidates)
         else:
-            ids = []
-            for resource in self.values():
-                oid = get_oid(resource)
-                if oid in oids:
-                    ids.append(oid)
-        if reverse:
-            ids = ids[::-1]
-        if limit is not None:
-            ids = ids[:limit]
+            if limit is not None and limit * len(self) > len(oids) ** 2:
+                ids = self._sort_by_name(oids, reverse, limit, after)
+                if ids is not None:
+                    return ids
+            mapping = self.data if self._oids is None else self._oids
+            if reverse:
+                if after is None:
+                    items = reversed_items(mapping)
+                else:
+                    items = reversed_items(
+                        mapping, max=after[0], excludemax=True)
+            elif after is None:
+                items = mapping.items()
+            else:
+                items = mapping.items(min=after[0], excludemin=True)
+            if self._oids is None:
+                candidates = (get_oid(resource) for name, resource in items)
+            else:
+                candidates = (oid for name, oid in items)
+        ids = []
+        if limit == 0:
+            return ids
+        for oid in candidates:
+            if oid in oids:
+                ids.append(oid)
+                if len(ids) == limit:
+                    break
         return ids
 
+    def sort_key(self, oid, default=None):
+        """ Return the key the item with the oid ``oid`` is sorted by when
+        the folder is used as a sort index, to be passed as the ``after``
+        argument of ``sort``: its ``(position, oid)`` in an ordered folder,
+        its ``(name, oid)`` otherwise.  Return ``default`` if it isn't an
+        item of the folder (or if its name can't be found in the objectmap).
+        """
+        if self._order_oids is not None:
+            if oid in self._order_oids:
+                return (self._order_oids.index(oid), oid)
+            return default
+        objectmap = find_objectmap(self)
+        if objectmap is not None:
+            path = objectmap.path_for(oid)
+            if path is not None and path[:-1] == resource_path_tuple(self):
+                return (path[-1], oid)
+        return default
+
+    def _sort_by_name(self, oids, reverse, limit, after=None):
+        objectmap = find_objectmap(self)
+        if objectmap is None:
+            return None
+        path = resource_path_tuple(self)
+        pairs = []
+        for oid in oids:
+            oidpath = objectmap.path_for(oid)
+            if oidpath is not None and oidpath[:-1] == path:
+                name = oidpath[-1]
+                if after is None or (name < after[0] if reverse
+                                     else name > after[0]):
+                    pairs.append((name, oid))
+        if reverse:
+            pairs = heapq.nlargest(limit, pairs)
+        else:
+            pairs = heapq.nsmallest(limit, pairs)
+        return [ oid for name, oid in pairs ]
+
     def find_service(self, service_name):
         """ Return a service named by ``service_name`` in this folder *or any
         parent service folder* or ``None`` if no such service exists.  A
@@ -435,7 +546,9 @@ class Folder(Persistent):
         duplicated; a result of a non-``None`` duplicating means that oids will
         be replaced in objectmap.  If ``moving`` is not ``None``, it must be
         the folder from which the object is moving; this will be the ``moving``
-        attribute of events sent by this function too.  If ``loading`` is
+        attribute of events sent by this function too; if the object is still
+        present in the objectmap (see ``remove``), its objectmap entries and
+        those of its descendants are moved to the new path.  If ``loading`` is
         ``True``, the ``loading`` attribute of events sent as a result of
         calling this method will be ``True`` too.
 
@@ -464,18 +577,40 @@ class Folder(Persistent):
 
                 basepath = resource_path_tuple(self)
 
-                for node in postorder(other):
-                    node_path = node_path_tuple(node)
-                    path_tuple = basepath + (name,) + node_path[1:]
-                    # the below gives node an objectid; if the will-be-added
-                    # event is the result of a duplication, replace the oid of
-                    # the node with a new one
-                    objectmap.add(
-                        node,
-                        path_tuple,
-                        duplicating=duplicating is not None,
-                        moving=moving is not None,
-                        )
+                old_path_tuple = None
+
+                if moving is not None:
+                    # an object removed from its old folder as part of a move
+                    # is left in the objectmap by ``remove``; rebase it
+                    oid = get_oid(other, None)
+                    if oid is not None:
+                        old_path_tuple = objectmap.path_for(oid)
+
+                if old_path_tuple is not None:
+                    objectmap.move(old_path_tuple, basepath + (name,))
+
+                else:
+                    for node in postorder(other):
+                        node_path = node_path_tuple(node)
+                        path_tuple = basepath + (name,) + node_path[1:]
+                        # the below gives node an objectid; if the
+                        # will-be-added event is the result of a duplication,
+                        # replace the oid of the node with a new one
+                        objectmap.add(
+                            node,
+                            path_tuple,
+                            duplicating=duplicating is not None,
+                            moving=moving is not None,
+                            )
+                        if isinstance(node, Folder) and node._oids is not None:
+                            # its items were given their oids by now
+                            if duplicating is not None:
+                                # new ones, replacing those it mapped
+                                node._map_oids()
+                            else:
+                                # possibly after they were added to it while
+                                # it was detached
+                                node._map_missing_oids()
 
             if send_events:
                 event = ObjectWillBeAdded(
@@ -490,6 +625,11 @@ class Folder(Persistent):
             self.data[name] = other
             self._num_objects.change(1)
 
+            if self._oids is not None:
+                oid = get_oid(other, None)
+                if oid is not None:
+                    self._oids[name] = oid
+
             if self._order is not None:
                 oid = get_oid(other)
                 self._order += (name,)
@@ -571,6 +711,11 @@ class Folder(Persistent):
         result of this action.  If ``loading`` is ``True``, the ``loading``
         attribute of events sent as a result of calling this method will be
         ``True`` too.
+
+        When ``moving`` is not ``None``, the removed object and its
+        descendants are left in the objectmap under their old paths; the
+        subsequent ``add`` of the object to the folder named by ``moving``
+        rebases them to their new paths.
         """
         name = u(name)
         other = self.data[name]
@@ -596,6 +741,9 @@ class Folder(Persistent):
             del self.data[name]
             self._num_objects.change(-1)
 
+            if self._oids is not None:
+                self._oids.pop(name, None)
+
             if self._order is not None:
                 assert(len(self._order) == len(self._order_oids))
                 idx = self._order.index(name)
@@ -611,7 +759,13 @@ class Folder(Persistent):
             removed_oids = set([oid])
 
             if objectmap is not None and oid is not None:
-                removed_oids = objectmap.remove(oid, moving=moving is not None)
+                path_tuple = objectmap.path_for(oid)
+                if moving is not None and path_tuple is not None:
+                    # leave the subtree in the objectmap; the ``add`` to the
+                    # new location will rebase its paths via objectmap.move
+                    removed_oids = objectmap.pathlookup(path_tuple)
+                else:
+                    removed_oids = objectmap.remove(oid)
 
             if send_events:
                 event = ObjectRemoved(other, self, name, removed_oids,
@@ -649,7 +803,10 @@ class Folder(Persistent):
 
         This operation is done in terms of a remove and an add.  The Removed
         and WillBeRemoved events as well as the Added and WillBeAdded events
-        sent will indicate that the object is moving.
+        sent will indicate that the object is moving.  The objectmap entries
+        of the object and its descendants are rebased in bulk via
+        :meth:`substanced.objectmap.ObjectMap.move` rather than being removed
+        and readded, so object ids, references and extents are retained.
         """
         if newname is None:
             newname = name
@@ -916,4 +1073,5 @@ def includeme(config): # pragma: no cover
     config.add_static_view('fcstatic', 'substanced.folder:static',
                            cache_max_age=YEAR)
     config.include('.views')
+    config.include('.evolve')
 
@@ -0,0 +1,17 @@
+from . import Folder
+
+def map_folder_oids(root):
+    """ Build the name -> oid map of each :class:`substanced.folder.Folder`
+    under ``root`` which was created before folders had one, so that sorting
+    and ordering them no longer loads their items. """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Folder):
+            continue
+        if node._oids is None:
+            node._map_oids()
+        stack.extend(node.data.values())
+
+def includeme(config): # pragma: no cover
+    config.add_evolution_step(map_folder_oids)
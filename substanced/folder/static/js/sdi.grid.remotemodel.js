@@ -84,6 +84,8 @@
         var grid;
         var data;
         var ids_to_data_key = {}; // maps row id (like "document_0") to data key
+        var cursors = {};         // maps a row number to the server's cursor
+                                  // for fetching the rows from there on
         var activeRequest;
         var scrollPosition;  // scrolling movement (prefetch) forward or backward
 
@@ -265,6 +267,7 @@
             // do not do any fetch _beyond_ the total.
             data.length = null;
             ids_to_data_key = {};
+            cursors = {};
         }
 
         function clearData(/*optional*/ scrollToTop) {
@@ -291,6 +294,11 @@
                     }
                 }
                 data.length = _data.total;
+                if (_data.cursor) {
+                    // the server can continue from the end of this batch
+                    // without skipping the rows before it
+                    cursors[to] = _data.cursor;
+                }
                 // Update the grid.
                 grid.updateRowCount();
                 grid.render();
@@ -419,6 +427,10 @@
                     sortDir: options.sortDir || ''
                 }, (options.extraQuery || {}));
 
+            if (cursors[from] !== undefined) {
+                results.cursor = cursors[from];
+            }
+
             //log('Will load:', from, to, direction);
 
             return results;
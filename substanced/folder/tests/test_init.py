@@ -203,6 +203,188 @@ class TestFolder(unittest.TestCase):
         result = folder.sort([1, 2], limit=1)
         self.assertEqual(result, [1])
 
+    def test_sort_with_explicit_folder_order_reverse_limit(self):
+        folder = self._makeOne({'a': DummyModel(1), 'b': DummyModel(2),
+                                'c': DummyModel(3)})
+        folder.set_order(['b', 'c', 'a'])
+        self.assertEqual(folder.sort([1, 2, 3], reverse=True, limit=2), [1, 3])
+        self.assertEqual(folder.sort([1, 2], limit=1), [2])
+
+    def test_sort_limit_zero(self):
+        folder = self._makeOne({'a': DummyModel(1)})
+        self.assertEqual(folder.sort([1], limit=0), [])
+
+    def _makeSortByName(self):
+        data = {}
+        paths = {}
+        for oid, name in enumerate('abcdefghij'):
+            data[name] = DummyModel(oid + 1)
+            paths[oid + 1] = ('', name)
+        paths[20] = ('', 'a', 'b')
+        folder = self._makeOne(data)
+        folder.__name__ = ''
+        folder.__objectmap__ = DummyObjectMap(paths)
+        return folder
+
+    def test_sort_by_name_few_oids(self):
+        folder = self._makeSortByName()
+        oids = [5, 20, 2]
+        self.assertEqual(folder._sort_by_name(oids, False, 1), [2])
+        self.assertEqual(folder.sort(oids, limit=1), [2])
+        self.assertEqual(folder.sort(oids, limit=3), [2, 5])
+        self.assertEqual(folder.sort(oids, reverse=True, limit=1), [5])
+
+    def test_sort_by_name_without_objectmap(self):
+        folder = self._makeSortByName()
+        del folder.__objectmap__
+        oids = [5, 20, 2]
+        self.assertEqual(folder.sort(oids, limit=1), [2])
+        self.assertEqual(folder.sort(oids, reverse=True, limit=1), [5])
+
+    def test_sort_with_explicit_folder_order_after(self):
+        folder = self._makeOne({'a': DummyModel(1), 'b': DummyModel(2),
+                                'c': DummyModel(3)})
+        folder.set_order(['b', 'c', 'a'])
+        oids = [1, 2, 3]
+        self.assertEqual(folder.sort(oids, after=(0, 2)), [3, 1])
+        self.assertEqual(folder.sort(oids, after=(2, 1)), [])
+        self.assertEqual(folder.sort(oids, reverse=True, after=(2, 1)), [3, 2])
+        # the position is only used if the oid is no longer in the folder
+        self.assertEqual(folder.sort(oids, limit=1, after=(0, 3)), [1])
+        self.assertEqual(folder.sort(oids, after=(1, 4)), [1])
+        self.assertEqual(folder.sort(oids, reverse=True, after=(0, 4)), [])
+
+    def test_sort_after(self):
+        folder = self._makeSortByName()
+        oids = [2, 3, 4, 5, 6]
+        self.assertEqual(folder.sort(oids, limit=2, after=('c', 3)), [4, 5])
+        self.assertEqual(
+            folder.sort(oids, limit=2, reverse=True, after=('e', 5)), [4, 3])
+        self.assertEqual(folder.sort(oids, after=('cc', 99)), [4, 5, 6])
+
+    def test_sort_by_name_after(self):
+        folder = self._makeSortByName()
+        oids = [5, 20, 2]
+        self.assertEqual(folder.sort(oids, limit=1, after=('b', 2)), [5])
+        self.assertEqual(
+            folder.sort(oids, limit=1, reverse=True, after=('e', 5)), [2])
+
+    def test_sort_key_ordered(self):
+        folder = self._makeOne({'a': DummyModel(1), 'b': DummyModel(2)})
+        folder.set_order(['b', 'a'])
+        self.assertEqual(folder.sort_key(1), (1, 1))
+        self.assertEqual(folder.sort_key(3), None)
+
+    def test_sort_key_unordered(self):
+        folder = self._makeSortByName()
+        self.assertEqual(folder.sort_key(3), ('c', 3))
+        self.assertEqual(folder.sort_key(20), None)
+        self.assertEqual(folder.sort_key(99, 'default'), 'default')
+        del folder.__objectmap__
+        self.assertEqual(folder.sort_key(3), None)
+
+    def test_ctor_maps_oids(self):
+        folder = self._makeOne({'a': DummyModel(1), 'b': DummyModel(2),
+                                'c': DummyModel(None)})
+        self.assertEqual(list(folder._oids.items()), [('a', 1), ('b', 2)])
+
+    def test_sort_doesnt_load_items(self):
+        folder = self._makeSortByName()
+        for resource in folder.values():
+            del resource.__oid__
+        oids = [2, 3, 4, 5, 6]
+        self.assertEqual(folder.sort(oids, limit=2), [2, 3])
+        self.assertEqual(folder.sort(oids, reverse=True), [6, 5, 4, 3, 2])
+        self.assertEqual(folder.sort(oids, limit=2, after=('c', 3)), [4, 5])
+        self.assertEqual(
+            folder.sort(oids, limit=2, reverse=True, after=('e', 5)), [4, 3])
+
+    def test_sort_without_oids_map(self):
+        folder = self._makeSortByName()
+        del folder._oids
+        oids = [2, 3, 4, 5, 6]
+        self.assertEqual(folder.sort(oids, limit=2), [2, 3])
+        self.assertEqual(
+            folder.sort(oids, limit=2, reverse=True, after=('e', 5)), [4, 3])
+
+    def test_set_order_and_reorder_dont_load_items(self):
+        folder = self._makeOne({'a': DummyModel(1), 'b': DummyModel(2),
+                                'c': DummyModel(3)})
+        for resource in folder.values():
+            del resource.__oid__
+        folder.set_order(['c', 'a', 'b'], reorderable=True)
+        self.assertEqual(folder._order_oids, (3, 1, 2))
+        folder.reorder(['b'], 'c')
+        self.assertEqual(folder._order_oids, (2, 3, 1))
+
+    def test_set_order_without_oids_map(self):
+        folder = self._makeOne({'a': DummyModel(1), 'b': DummyModel(2)})
+        del folder._oids
+        folder.set_order(['b', 'a'])
+        self.assertEqual(folder._order_oids, (2, 1))
+
+    def test_add_and_remove_map_oids(self):
+        folder = self._makeOne()
+        folder.add('a', DummyModel(5), send_events=False)
+        folder.add('b', DummyModel(None), send_events=False)
+        self.assertEqual(list(folder._oids.items()), [('a', 5)])
+        folder.remove('a', send_events=False)
+        folder.remove('b', send_events=False)
+        self.assertEqual(list(folder._oids.items()), [])
+
+    def test_add_and_remove_without_oids_map(self):
+        folder = self._makeOne()
+        del folder._oids
+        folder.add('a', DummyModel(5), send_events=False)
+        folder.remove('a', send_events=False)
+        self.assertEqual(folder._oids, None)
+
+    def test_add_maps_oids_of_folder_filled_while_detached(self):
+        from substanced.objectmap import ObjectMap
+        from substanced.util import get_oid
+        root = self._makeOne()
+        root.__name__ = ''
+        root.__objectmap__ = ObjectMap(root)
+        sub = self._makeOne()
+        for name in ('a', 'b', 'c'):
+            sub.add(name, self._makeOne(), send_events=False)
+        self.assertEqual(len(sub._oids), 0)
+        mapping = sub._oids
+        root.add('sub', sub, send_events=False)
+        oids = [ get_oid(sub[name]) for name in ('a', 'b', 'c') ]
+        self.assertTrue(sub._oids is mapping)
+        self.assertEqual(list(sub._oids.values()), oids)
+        self.assertEqual(sub.sort(oids), oids)
+        self.assertEqual(sub.sort(oids, reverse=True, limit=2),
+                         [oids[2], oids[1]])
+
+    def test_add_duplicating_remaps_oids(self):
+        folder = self._makeOne()
+        folder.__objectmap__ = RenumberingObjectMap()
+        original = DummyModel(1)
+        copied = self._makeOne({'x': DummyModel(2)})
+        copied.__oid__ = 3
+        mapping = copied._oids
+        folder.add('copy', copied, duplicating=original, send_events=False)
+        self.assertEqual(copied.__oid__, 103)
+        self.assertTrue(copied._oids is mapping)
+        self.assertEqual(list(copied._oids.items()), [('x', 102)])
+
+    def test_add_maps_only_missing_oids(self):
+        from substanced.objectmap import ObjectMap
+        root = self._makeOne()
+        root.__name__ = ''
+        root.__objectmap__ = ObjectMap(root)
+        sub = self._makeOne()
+        sub.add('a', DummyModel(1), send_events=False)
+        sub.add('b', self._makeOne(), send_events=False)
+        mapping = sub._oids
+        mapping['a'] = 12345 # not looked up again
+        root.add('sub', sub, send_events=False)
+        self.assertTrue(sub._oids is mapping)
+        self.assertEqual(mapping['a'], 12345)
+        self.assertEqual(mapping['b'], sub['b'].__oid__)
+
     def test__iter__(self):
         model1 = DummyModel()
         model2 = DummyModel()
@@ -594,6 +776,23 @@ class TestFolder(unittest.TestCase):
         self.assertFalse(objectmap.moving)
 
     def test_remove_with_objectmap_moving(self):
+        from substanced.interfaces import IObjectRemoved
+        events = []
+        def listener(event, obj, container):
+            events.append(event)
+        self._registerEventListener(listener, IObjectRemoved)
+        dummy = DummyModel()
+        dummy.__parent__ = None
+        dummy.__name__ = None
+        dummy.__oid__ = 1
+        folder = self._makeOne({'a': dummy})
+        objectmap = DummyObjectMap({1:('', 'a'), 2:('', 'a', 'b')})
+        folder.__objectmap__ = objectmap
+        folder.remove("a", moving=True)
+        self.assertEqual(objectmap.removed, [])
+        self.assertEqual(sorted(events[0].removed_oids), [1, 2])
+
+    def test_remove_with_objectmap_moving_not_in_objectmap(self):
         dummy = DummyModel()
         dummy.__parent__ = None
         dummy.__name__ = None
@@ -603,7 +802,6 @@ class TestFolder(unittest.TestCase):
         folder.__objectmap__ = objectmap
         folder.remove("a", moving=True)
         self.assertEqual(objectmap.removed, [1])
-        self.assertTrue(objectmap.moving)
 
     def test_move_no_newname(self):
         folder = self._makeOne()
@@ -628,6 +826,59 @@ class TestFolder(unittest.TestCase):
         self.assertFalse('a' in other)
         self.assertFalse('a' in folder)
 
+    def test_move_with_objectmap(self):
+        from substanced.interfaces import IFolder
+        objectmap = DummyObjectMap()
+        site = self._makeSite(objectmap)
+        folder = self._makeOne()
+        other = self._makeOne()
+        site['folder'] = folder
+        site['other'] = other
+        one = testing.DummyModel(__provides__=IFolder)
+        one['two'] = testing.DummyModel()
+        folder.add('one', one)
+        objectmap.paths[1] = ('', 'folder', 'one')
+        objectmap.added = []
+        folder.move('one', other, 'uno')
+        self.assertEqual(objectmap.removed, [])
+        self.assertEqual(objectmap.added, [])
+        self.assertEqual(
+            objectmap.moved,
+            [(('', 'folder', 'one'), ('', 'other', 'uno'))]
+            )
+        self.assertEqual(other['uno'], one)
+
+    def test_rename_with_objectmap(self):
+        objectmap = DummyObjectMap()
+        site = self._makeSite(objectmap)
+        folder = self._makeOne()
+        site['folder'] = folder
+        folder['a'] = DummyModel()
+        objectmap.paths[1] = ('', 'folder', 'a')
+        folder.rename('a', 'b')
+        self.assertEqual(
+            objectmap.moved,
+            [(('', 'folder', 'a'), ('', 'folder', 'b'))]
+            )
+
+    def test_add_moving_not_in_objectmap(self):
+        objectmap = DummyObjectMap()
+        folder = self._makeOne()
+        folder.__objectmap__ = objectmap
+        a = DummyModel()
+        folder.add('a', a, moving=True)
+        self.assertEqual(objectmap.moved, [])
+        self.assertEqual(objectmap.added, [(a, ('', 'a'))])
+
+    def test_add_moving_no_oid(self):
+        objectmap = DummyObjectMap()
+        folder = self._makeOne()
+        folder.__objectmap__ = objectmap
+        a = testing.DummyModel()
+        folder.add('a', a, moving=True)
+        self.assertEqual(objectmap.moved, [])
+        self.assertEqual(objectmap.added, [(a, ('', 'a'))])
+
     def test_move_is_service(self):
         folder = self._makeOne()
         other = self._makeOne()
@@ -1074,15 +1325,56 @@ class TestCopyHook(unittest.TestCase):
         inst = self._makeOne(child)
         self.assertRaises(ResumeCopy, inst, parent, None)
 
+class Test_map_folder_oids(unittest.TestCase):
+    def _callFUT(self, root):
+        from ..evolve import map_folder_oids
+        return map_folder_oids(root)
+
+    def _makeFolder(self, data):
+        from .. import Folder
+        folder = Folder(data)
+        del folder._oids
+        return folder
+
+    def test_it(self):
+        sub = self._makeFolder({'x': DummyModel(3)})
+        root = self._makeFolder({'a': DummyModel(1), 'sub': sub,
+                                 'other': testing.DummyResource()})
+        sub.__oid__ = 2
+        self._callFUT(root)
+        self.assertEqual(list(root._oids.items()), [('a', 1), ('sub', 2)])
+        self.assertEqual(list(sub._oids.items()), [('x', 3)])
+
+    def test_already_mapped(self):
+        from .. import Folder
+        root = Folder({'a': DummyModel(1)})
+        oids = root._oids
+        self._callFUT(root)
+        self.assertTrue(root._oids is oids)
+
 class DummyModel(object):
     def __init__(self, oid=1):
         self.__oid__ = oid
 
 class DummyObjectMap(object):
-    def __init__(self):
+    def __init__(self, paths=None):
         self.added = []
         self.removed = []
+        self.moved = []
         self.moving = False
+        if paths is None:
+            paths = {}
+        self.paths = paths
+
+    def path_for(self, objectid):
+        return self.paths.get(objectid)
+
+    def pathlookup(self, path_tuple):
+        return [oid for oid, path in self.paths.items()
+                if path[:len(path_tuple)] == path_tuple]
+
+    def move(self, old_path_tuple, new_path_tuple):
+        self.moved.append((old_path_tuple, new_path_tuple))
 
     def add(self, obj, path, duplicating=False, moving=False):
         self.added.append((obj, path))
@@ -1097,3 +1389,8 @@ class DummyObjectMap(object):
         self.removed.append(objectid)
         return [objectid]
 
+class RenumberingObjectMap(DummyObjectMap):
+    def add(self, obj, path, duplicating=False, moving=False):
+        if duplicating:
+            obj.__oid__ += 100
+        return DummyObjectMap.add(self, obj, path, duplicating, moving)
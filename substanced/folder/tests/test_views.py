@@ -352,6 +352,101 @@ class TestFolderContents(unittest.TestCase):
         self.assertEqual(result['sorter'], True)
         self.assertEqual(result['column_name'], 'col2')
         
+    def test__sort_info_context_is_ordered_sort_index(self):
+        context = testing.DummyResource(
+            is_ordered=lambda: True,
+            sort_key=lambda oid: None,
+            )
+        request = self._makeRequest()
+        inst = self._makeOne(context, request)
+        result = inst._sort_info([])
+        self.assertTrue(result['sort_index'] is context)
+
+    def test__sort_info_context_is_ordered_no_sort_key(self):
+        context = testing.DummyResource(is_ordered=lambda: True)
+        request = self._makeRequest()
+        inst = self._makeOne(context, request)
+        result = inst._sort_info([])
+        self.assertEqual(result['sort_index'], None)
+
+    def test__sort_info_column_sort_index(self):
+        context = testing.DummyResource(is_ordered=lambda: False)
+        request = self._makeRequest()
+        inst = self._makeOne(context, request)
+        index = DummySortIndex()
+        columns = [{'name':'col1', 'sorter':'a', 'sort_index':index}]
+        result = inst._sort_info(columns)
+        self.assertTrue(result['sort_index'] is index)
+
+    def test__sort_info_name_sorter_sort_index(self):
+        context = testing.DummyResource(is_ordered=lambda: False)
+        request = self._makeRequest()
+        inst = self._makeOne(context, request)
+        index = DummySortIndex()
+        inst.system_catalog = {'name':index}
+        columns = [{'name':'Name', 'sorter':inst._name_sorter}]
+        result = inst._sort_info(columns)
+        self.assertTrue(result['sort_index'] is index)
+        columns = [{'name':'Name', 'sorter':'a'}]
+        result = inst._sort_info(columns)
+        self.assertEqual(result['sort_index'], None)
+
+    def _makeSortIndexContents(self, oids, sorted):
+        from substanced.interfaces import IFolder
+        context = DummyFolder(__provides__=IFolder)
+        request = self._makeRequest()
+        context['catalogs'] = self._makeCatalogs(oids=oids)
+        result = testing.DummyResource()
+        result.__name__ = 'fred'
+        context.__objectmap__ = DummyObjectMap(result)
+        inst = self._makeOne(context, request)
+        def sorter(context, resultset, reverse, limit):
+            sorted.append(limit)
+            return resultset
+        def get_columns(folder, subobject, request, default_columns):
+            return [{'name': 'Col 1', 'value': 'val1', 'sorter':sorter,
+                     'sort_index':DummySortIndex()}]
+        request.registry.content = DummyContent(columns=get_columns)
+        return inst
+
+    def test__folder_contents_next_cursor(self):
+        from substanced.catalog.util import encode_cursor
+        sorted = []
+        inst = self._makeSortIndexContents([1, 2, 3], sorted)
+        info = inst._folder_contents(1, 2)
+        self.assertEqual(len(info['records']), 1)
+        self.assertEqual(info['cursor'], encode_cursor(('k', 2)))
+        self.assertEqual(sorted, [2])
+
+    def test__folder_contents_last_page_no_cursor(self):
+        sorted = []
+        inst = self._makeSortIndexContents([1, 2, 3], sorted)
+        info = inst._folder_contents(2, 4)
+        self.assertEqual(len(info['records']), 1)
+        self.assertEqual(info['cursor'], None)
+
+    def test__folder_contents_with_cursor(self):
+        from substanced.catalog.util import encode_cursor
+        sorted = []
+        inst = self._makeSortIndexContents([1, 2, 3], sorted)
+        with mock.patch('substanced.folder.views.sort_page') as sort_page:
+            sort_page.return_value = (DummyResultSet([3]), 'next')
+            info = inst._folder_contents(
+                2, 3, cursor=encode_cursor(('k', 2)))
+        self.assertEqual(len(info['records']), 1)
+        self.assertEqual(info['cursor'], 'next')
+        self.assertEqual(sorted, [])
+        args, kw = sort_page.call_args
+        self.assertEqual(args[2], 1)
+        self.assertEqual(kw['cursor'], encode_cursor(('k', 2)))
+
+    def test__folder_contents_with_invalid_cursor(self):
+        sorted = []
+        inst = self._makeSortIndexContents([1, 2, 3], sorted)
+        info = inst._folder_contents(1, 3, cursor='?')
+        self.assertEqual(len(info['records']), 2)
+        self.assertEqual(sorted, [3])
+
     def test__folder_contents_columns_callable(self):
         from substanced.interfaces import IFolder
         context = DummyFolder(__provides__=IFolder)
@@ -783,6 +878,26 @@ class TestFolderContents(unittest.TestCase):
             {'from':1, 'to':2, 'records':folder_contents['records'], 'total':1}
             )
 
+    def test_show_json_cursor(self):
+        folder_contents = {
+            'length':3,
+            'sort_column_name':None,
+            'records': [],
+            'cursor':'next',
+            }
+        context = testing.DummyResource()
+        request = self._makeRequest()
+        request.params['from'] = '1'
+        request.params['to'] = '2'
+        request.params['cursor'] = 'this'
+        inst = self._makeOne(context, request)
+        inst._folder_contents = mock.Mock(
+            return_value=folder_contents
+            )
+        result = inst.show_json()
+        self.assertEqual(inst._folder_contents.call_args[1]['cursor'], 'this')
+        self.assertEqual(result['cursor'], 'next')
+
     def test_show_json_no_from(self):
         context = testing.DummyResource()
         request = self._makeRequest()
@@ -1843,6 +1958,10 @@ class DummyIndex(object):
     def check_query(self, querytext):
         return True
     
+class DummySortIndex(object):
+    def sort_key(self, oid):
+        return ('k', oid)
+
 class DummyObjectMap(object):
     def __init__(self, result):
         self.result = result
@@ -11,6 +11,10 @@ from pyramid.security import has_permission
 from pyramid.util import action_method
 
 from substanced._compat import escape
+from substanced.catalog.util import (
+    encode_cursor,
+    sort_page,
+    )
 from substanced.form import FormView
 from substanced.interfaces import IFolder
 from substanced.objectmap import find_objectmap
@@ -441,6 +445,7 @@ class FolderContents(object):
 
         sort_column = None
         sorter = None
+        sort_index = None
         
         # Is the folder content ordered?
         is_ordered = context.is_ordered()
@@ -451,6 +456,7 @@ class FolderContents(object):
             # by anything except their explicit ordering.
             def sorter(folder, resultset, reverse=False, limit=None):
                 return resultset.sort(folder, limit=limit, reverse=reverse)
+            sort_index = context
 
         elif sort_column_name is None:
             # The default sort always uses the intitial_sort_column, defaulting
@@ -473,11 +479,19 @@ class FolderContents(object):
 
         if sort_column is not None:
             sorter = sort_column['sorter']
+            sort_index = sort_column.get('sort_index')
+            if sort_index is None and sorter == self._name_sorter:
+                sort_index = self.system_catalog.get('name')
+
+        # only sort indexes which can page by cursor are of use
+        if not hasattr(sort_index, 'sort_key'):
+            sort_index = None
             
         return {
             'column':sort_column,
             'column_name':sort_column_name,
             'sorter':sorter,
+            'sort_index':sort_index,
             }
    
     def _global_text_filter(self, context, filter_text, q):
@@ -495,6 +509,7 @@ class FolderContents(object):
         reverse=None,
         sort_column_name=None,
         filter_values=(),
+        cursor=None,
         ):
 
         """
@@ -537,6 +552,15 @@ class FolderContents(object):
         ``columns``
 
           A sequence of column header values.
+
+        ``cursor``
+
+          An opaque string which, passed back as ``cursor`` along with a
+          ``start`` equal to this call's ``end``, makes the next page be
+          found by keyset pagination (see
+          :func:`substanced.catalog.util.sort_page`) rather than by sorting
+          and skipping ``start`` records.  ``None`` if this is the last page
+          or if the sort index can't page by cursor.
         
         XXX TODO Document ``sort_column_name``, ``reverse``, and
         ``filter_values`` arguments.  Document ``columns`` return value.
@@ -583,12 +607,32 @@ class FolderContents(object):
             if column:
                 reverse = column.get('initial_sort_reverse', False)
 
-        if sorter is not None:
-            resultset = sorter(
-                folder, resultset, reverse=reverse, limit=end
-                )
-
-        ids = resultset.ids
+        sort_index = sort_info['sort_index']
+        next_cursor = None
+        ids = None
+
+        if cursor is not None and sort_index is not None:
+            try:
+                resultset, next_cursor = sort_page(
+                    resultset, sort_index, end - start, cursor=cursor,
+                    reverse=reverse
+                    )
+            except ValueError:
+                # a stale or invalid cursor: skip to ``start`` instead
+                pass
+            else:
+                ids = resultset.ids
+
+        if ids is None:
+            if sorter is not None:
+                resultset = sorter(
+                    folder, resultset, reverse=reverse, limit=end
+                    )
+            ids = list(itertools.islice(resultset.ids, start, end))
+            if sort_index is not None and ids and len(ids) == end - start:
+                sort_key = sort_index.sort_key(ids[-1])
+                if sort_key is not None:
+                    next_cursor = encode_cursor(sort_key)
 
         buttons = self.get_buttons()
         show_checkbox_column = self.show_checkbox_column(
@@ -596,7 +640,7 @@ class FolderContents(object):
 
         records = []
 
-        for oid in itertools.islice(ids, start, end):
+        for oid in ids:
             resource = objectmap.object_for(oid)
             name = getattr(resource, '__name__', '')
             record = dict(
@@ -634,6 +678,7 @@ class FolderContents(object):
             'sort_reverse':reverse,
             'columns':columns,
             'show_checkbox_column':show_checkbox_column,
+            'cursor':next_cursor,
             }
 
     def show(self):
@@ -672,6 +717,9 @@ class FolderContents(object):
             'records':records,
             'total':folder_length,
             }
+        next_cursor = folder_contents.get('cursor')
+        if next_cursor is not None:
+            items['cursor'] = next_cursor
 
         # We pass the wrapper options which contains all information
         # needed to configure the several components of the grid config.
@@ -717,6 +765,7 @@ class FolderContents(object):
             end = int(request.params.get('to'))
             sort_column_name = request.params.get('sortCol')
             sort_dir = request.params.get('sortDir') in ('true', 'True')
+            cursor = request.params.get('cursor') or None
             filter_values = self.get_filter_values()
 
             reverse = (not sort_dir)
@@ -727,6 +776,7 @@ class FolderContents(object):
                 reverse=reverse,
                 filter_values=filter_values,
                 sort_column_name=sort_column_name,
+                cursor=cursor,
                 )
 
             folder_length = folder_contents['length']
@@ -738,6 +788,9 @@ class FolderContents(object):
                 'records': records,
                 'total': folder_length,
                 }
+            next_cursor = folder_contents.get('cursor')
+            if next_cursor is not None:
+                items['cursor'] = next_cursor
         else:
             # If the request did not ask for an data update,
             # just return an empty dict.
@@ -56,6 +56,16 @@ class IObjectMap(Interface):
         """ Return the object associated with ``objectid`` or ``None`` if the
         object cannot be found."""
 
+    def object_for_many(objectids):
+        """ Return an iterator of ``(objectid, object)`` pairs for each object
+        id in ``objectids``, ordered by path rather than in the order given.
+        The object is ``None`` if it cannot be found."""
+
+    def object_cache_info():
+        """ Return a dictionary of statistics (``hits``, ``misses``, ``size``
+        and ``maxsize``) about the cache of objects found by ``object_for``,
+        or ``None`` if the object cache is not enabled."""
+
     def add(obj):
         """ Add a new object to the object map.  Assigns a new objectid to
         obj.__oid__ to the object if it doesn't already have one.  The
@@ -69,6 +79,11 @@ class IObjectMap(Interface):
         inclusive) removed as the result of removing this object from the
         object map."""
 
+    def move(old_path_tuple, new_path_tuple):
+        """ Moves the object at ``old_path_tuple`` and its descendants to
+        ``new_path_tuple``, retaining their object ids.  Returns the set of
+        objectids (children, inclusive) moved."""
+
     def pathlookup(obj_or_path_tuple, depth=None, include_origin=True):
         """ Returns an iterator of document ids within
         obj_or_path_tuple (a traversable object or a path tuple).  If depth
@@ -77,6 +92,18 @@ class IObjectMap(Interface):
         passed as ``obj_or_path_tuple`` in the returned set, otherwise it
         omits it."""
 
+    def postorder(obj_or_path_tuple, include_origin=True):
+        """ Returns an iterator of the document ids within
+        obj_or_path_tuple (a traversable object or a path tuple), deepest
+        first, without loading any of the objects.  If ``include_origin`` is
+        ``True``, the docid of the object passed as ``obj_or_path_tuple`` is
+        returned last, otherwise it is omitted."""
+
+    def generation():
+        """ Return a token which changes whenever objects are added,
+        removed or moved, or ``None`` if the current transaction has done
+        so."""
+
     def connect(src, target, reftype):
         """Connect ``src_object`` to ``target_object`` using the reference
         type ``reftype``.  ``src`` and ``target`` may be objects or object
@@ -105,6 +132,18 @@ class IObjectMap(Interface):
         """ Return a set of objectids which have ``obj`` as a relationship
         source using ``reftype``.  ``obj`` can be an object or an object id."""
 
+    def reachable_targetids(obj, reftypes, depth=None, include_origin=False):
+        """ Return a set of the objectids reachable from ``obj`` by following
+        relationships of any of ``reftypes`` from source to target, at most
+        ``depth`` relationships in a row (any number if ``depth`` is
+        ``None``).  ``obj`` can be an object or an object id."""
+
+    def reachable_sourceids(obj, reftypes, depth=None, include_origin=False):
+        """ Return a set of the objectids reachable from ``obj`` by following
+        relationships of any of ``reftypes`` from target to source, at most
+        ``depth`` relationships in a row (any number if ``depth`` is
+        ``None``).  ``obj`` can be an object or an object id."""
+
 class IObjectWillBeAdded(IObjectEvent):
     """ An event type sent when an before an object is added """
     object = Attribute('The object being added')
@@ -1,4 +1,7 @@
+import heapq
 import random
+import struct
+import zlib
 
 from persistent.list import PersistentList
 import BTrees
@@ -8,6 +11,7 @@ from pyramid.compat import is_nonstr_iter
 from pyramid.traversal import (
     resource_path_tuple,
     find_resource,
+    find_root,
     )
 from zope.interface import implementer
 from zope.interface.interfaces import IInterface
@@ -15,8 +19,10 @@ from zope.interface.interfaces import IInterface
 from ..event import subscribe_will_be_removed
 from ..interfaces import IObjectMap
 from ..util import (
+    bump_generation,
     get_oid,
     get_factory_type,
+    get_generation,
     set_oid,
     find_objectmap,
     )
@@ -78,31 +84,201 @@ references to the objectid represented by '/a' *and* any children
 
 {(u'',):      {1: set([3])},
  (u'', u'z'): {0: set([3])}}
- 
+
+The nested pathindex stores every objectid once per ancestor, so its size
+grows with the number of objects multiplied by their depth.  An object map
+constructed with ``compact_pathindex=True`` keeps no pathindex; instead it
+keeps a ``childindex`` which maps each parent path to the set of names of its
+children, so every object is mentioned once:
+
+>>> map = ObjectMap(compact_pathindex=True)
+>>> map.add('/a/b/c')
+>>> map.add('/a')
+>>> map.add('/z')
+>>> map.childindex
+
+{(u'',):          set([u'a', u'z']),
+ (u'', u'a'):     set([u'b']),
+ (u'', u'a', u'b'): set([u'c'])}
+
+Lookups without a depth use the fact that all the paths under a given path are
+a contiguous range of ``path_to_objectid`` keys; lookups with a depth walk the
+childindex breadth-first.
+
+Independently of the kind of path index, an object map constructed with
+``intern_paths=True`` gives each name an integer id and stores the paths of
+all of the maps above as strings of four byte ids:
+
+>>> map = ObjectMap(intern_paths=True)
+>>> map.add('/a/b/c')
+>>> map.pathnames.names
+
+{271: u'a', 577: u'c', 1618: u'b', 3141: u''}
+
+>>> map.path_to_objectid.data
+
+{struct.pack('>4I', 3141, 271, 1618, 577): 1}
+
+The ids of a path's names are a prefix of the ids of its descendants', so the
+paths under a given path are still a contiguous range of keys.
 """
 
 _marker = object()
 
+class ObjectCache(object):
+    """ A cache of object id to object holding at most ``size`` objects,
+    evicting the least recently used ones when it is full.  Each object is
+    stored along with the path it was found at and is only returned for that
+    path, so an object id which has since been moved or removed is a miss.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = {} # objectid -> [path_tuple, obj, last used]
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, objectid, path_tuple):
+        entry = self.entries.get(objectid)
+        if entry is None or entry[0] != path_tuple:
+            self.misses += 1
+            return _marker
+        self.hits += 1
+        self.clock += 1
+        entry[2] = self.clock
+        return entry[1]
+
+    def set(self, objectid, path_tuple, obj):
+        entries = self.entries
+        if len(entries) >= self.size and objectid not in entries:
+            # evicting a quarter at a time keeps eviction O(1) amortized
+            count = max(self.size // 4, 1)
+            for last, oid in heapq.nsmallest(
+                count, [ (e[2], oid) for oid, e in entries.items() ]):
+                del entries[oid]
+        self.clock += 1
+        entries[objectid] = [path_tuple, obj, self.clock]
+
+    def invalidate(self, objectids):
+        entries = self.entries
+        for objectid in objectids:
+            entries.pop(objectid, None)
+
+    def info(self):
+        return {
+            'hits':self.hits,
+            'misses':self.misses,
+            'size':len(self.entries),
+            'maxsize':self.size,
+            }
+
 @implementer(IObjectMap)
 class ObjectMap(Persistent):
+    """ A map of object ids to paths, paths to object ids, and a reference
+    engine.  ``root`` is the root of the resource tree.
+
+    If ``compact_pathindex`` is ``True``, the object map maintains a compact
+    path index (a map of each parent path to the names of its children)
+    instead of the default nested path index, which mentions each object id
+    once for every one of its ancestors.  The compact index is much smaller on
+    deep trees, at the expense of depth-limited ``pathlookup``, ``pathcount``
+    and ``navgen`` calls walking the tree rather than unioning precomputed
+    sets.  Existing object maps can be converted using the
+    :func:`substanced.objectmap.evolve.compact_objectmap_pathindex` evolution
+    step.
+
+    If ``oid_block_size`` is an integer, ``new_objectid`` hands out object ids
+    sequentially from a block of that many ids which no existing object id
+    falls into, reserving a new randomly chosen block when the current one is
+    used up.  Each database connection reserves its own blocks, so content
+    added concurrently by different clients lands in different buckets of
+    the BTrees keyed by object id, reducing write conflicts.  It may be
+    changed on an existing object map at any time.
+
+    If ``object_cache_size`` is an integer, ``object_for`` keeps up to that
+    many objects it found by object id in a least recently used cache, so
+    that looking up the same object id again (e.g. the user of every
+    request) does not traverse its path.  The cache belongs to the database
+    connection the object map was loaded in.  Before a cached object is
+    returned, the current path of its object id is checked against the path
+    it was found at, so objects moved or removed (by this connection or by
+    transactions committed by others) are found again.  See
+    :meth:`object_cache_info`.  It may be changed on an existing object map
+    at any time.
+
+    The object map keeps a :class:`PathCount` for each path which has
+    descendants, so that ``pathcount`` is answered without counting the
+    members of oid sets.  Object maps created before these counters existed
+    get them from the
+    :func:`substanced.objectmap.evolve.count_objectmap_paths` evolution
+    step and count oid sets until then.
+
+    If ``intern_paths`` is ``True``, the names paths are made of are
+    interned to integer ids (see :class:`PathNames`) and every map keyed by
+    or holding paths stores them as short strings of packed ids rather than
+    as tuples of names, so that the name of a folder isn't stored again for
+    each of its descendants.  This makes the paths of the object map take
+    much less memory once loaded and less room in the database, at the
+    expense of turning names into ids and back whenever a path is used.  The
+    ``path_for`` and ``objectid_for`` APIs still take and return path
+    tuples, but paths under the same parent are no longer ordered by name
+    (e.g. by ``postorder``).  Existing object maps can be converted using
+    the :func:`substanced.objectmap.evolve.intern_objectmap_paths` evolution
+    step.
+    """
     
     _v_nextid = None
+    _v_blockend = None
+    _v_objectcache = None
     _randrange = random.randrange
+    # blocks are chosen using the OS random source so that forked processes
+    # which share the state of the random module don't pick the same ones
+    _block_randrange = random.SystemRandom().randrange
 
     family = BTrees.family64
 
-    def __init__(self, root, family=None):
+    pathindex = None # nested path index (the default)
+    childindex = None # compact path index (see ``compact_pathindex``)
+    pathcounts = None # {path_tuple:PathCount}, None on older object maps
+    pathnames = None # PathNames (see ``intern_paths``)
+    oid_block_size = None # no block allocation of object ids
+    object_cache_size = None # no object cache
+
+    def __init__(self, root, family=None, compact_pathindex=False,
+                 oid_block_size=None, object_cache_size=None,
+                 intern_paths=False):
         if family is not None:
             self.family = family
-        self.objectid_to_path = self.family.OO.BTree()
-        self.path_to_objectid = self.family.OO.BTree()
-        self.pathindex = self.family.OO.BTree()
+        if oid_block_size is not None:
+            self.oid_block_size = oid_block_size
+        if object_cache_size is not None:
+            self.object_cache_size = object_cache_size
+        if intern_paths:
+            self.pathnames = PathNames(self.family)
+            self.objectid_to_path = PathValuedMap(self.pathnames)
+        else:
+            self.objectid_to_path = self.family.OO.BTree()
+        self.path_to_objectid = self._path_btree()
+        if compact_pathindex:
+            self.childindex = self._path_btree()
+        else:
+            self.pathindex = self._path_btree()
+        self.pathcounts = self._path_btree()
         self.referencemap = ReferenceMap()
         self.extentmap = ExtentMap()
         self.root = root
 
+    def _path_btree(self):
+        # a map keyed by path tuple
+        if self.pathnames is not None:
+            return PathKeyedMap(self.pathnames)
+        return self.family.OO.BTree()
+
     def new_objectid(self):
         """ Obtain an unused integer object identifier """
+        if self.oid_block_size:
+            return self._new_objectid_from_block(self.oid_block_size)
+
         while True:
             if self._v_nextid is None:
                 self._v_nextid = self._randrange(self.family.minint, 
@@ -122,6 +298,38 @@ class ObjectMap(Persistent):
 
             self._v_nextid = None
 
+    def _new_objectid_from_block(self, size):
+        while True:
+            objectid = self._v_nextid
+
+            if objectid is None or objectid > self._v_blockend:
+                objectid = self._reserve_objectid_block(size)
+                self._v_blockend = objectid + size - 1
+
+            self._v_nextid = objectid + 1
+
+            # object id zero is reserved as "irresolveable"
+            if objectid != 0 and not objectid in self.objectid_to_path:
+                return objectid
+
+            if objectid != 0:
+                # someone else is using this block; find another one
+                self._v_nextid = None
+
+    def _reserve_objectid_block(self, size):
+        # return the first oid of a randomly chosen, size-aligned block of
+        # oids which contains no oid already in use
+        minblock = -(-self.family.minint // size)
+        maxblock = self.family.maxint // size
+        while True:
+            start = self._block_randrange(minblock, maxblock) * size
+            try:
+                used = self.objectid_to_path.minKey(start)
+            except ValueError: # no oids at or above start
+                return start
+            if used >= start + size:
+                return start
+
     def objectid_for(self, obj_or_path_tuple):
         """ Returns an objectid or ``None``, given an object or a path tuple"""
         if isinstance(obj_or_path_tuple, tuple):
@@ -140,18 +348,141 @@ class ObjectMap(Persistent):
 
     def object_for(self, objectid_or_path_tuple, context=None):
         """ Returns an object or ``None`` given an object id or a path tuple"""
+        cache = None
         if isinstance(objectid_or_path_tuple, INT_TYPES):
             path_tuple = self.objectid_to_path.get(objectid_or_path_tuple)
+            if context is None:
+                cache = self._object_cache()
         elif isinstance(objectid_or_path_tuple, tuple):
             path_tuple = objectid_or_path_tuple
         else:
             raise ValueError('Unknown input %s' % (objectid_or_path_tuple,))
         if path_tuple is None:
             return None
+        if cache is not None:
+            obj = cache.get(objectid_or_path_tuple, path_tuple)
+            if obj is not _marker:
+                return obj
         try:
-            return self._find_resource(context, path_tuple)
+            obj = self._find_resource(context, path_tuple)
         except KeyError:
             return None
+        if cache is not None:
+            cache.set(objectid_or_path_tuple, path_tuple, obj)
+        return obj
+
+    def _object_cache(self):
+        size = self.object_cache_size
+        if not size:
+            return None
+        cache = self._v_objectcache
+        if cache is None or cache.size != size:
+            cache = self._v_objectcache = ObjectCache(size)
+        return cache
+
+    def _paths_changed(self, objectids):
+        # the generation is only kept once a cached path index asked for one
+        bump_generation(self, create=False)
+        cache = self._v_objectcache
+        if cache is not None:
+            cache.invalidate(objectids)
+
+    def generation(self):
+        """ Return a token which changes whenever objects are added to,
+        removed from or moved within this object map, or ``None`` if the
+        current transaction has done so or the object map doesn't keep a
+        generation (see :func:`substanced.util.get_generation`).  The object
+        map only starts keeping one when the path index of a catalog with a
+        query cache is first changed."""
+        return get_generation(self)
+
+    def object_cache_info(self):
+        """ Return a dictionary of statistics about the object cache of this
+        connection (see ``object_cache_size``): the number of ``hits``, of
+        ``misses``, the current ``size`` and the ``maxsize``.  Return ``None``
+        if the object cache is not enabled."""
+        cache = self._object_cache()
+        if cache is None:
+            return None
+        return cache.info()
+
+    def object_for_many(self, objectids, context=None, prefetch=0):
+        """ Return an iterator of ``(objectid, object)`` pairs, one for each
+        object id in ``objectids``.  The object is ``None`` if the object id
+        is unknown or no object is found at its path.
+
+        Unknown object ids come first; the rest are ordered by path rather
+        than in the order given, so that the objects of one folder are found
+        one after the other and every folder on the way is traversed once
+        for all of them instead of once per object.
+
+        If ``prefetch`` is a positive integer, objects are found that many at
+        a time and the database connection is asked to load the state of
+        each batch at once before it is returned (on ZODB versions and
+        storages which support ``Connection.prefetch``)."""
+        found = []
+        for objectid in objectids:
+            path_tuple = self.objectid_to_path.get(objectid)
+            if path_tuple is None:
+                yield objectid, None
+            else:
+                found.append((path_tuple, objectid))
+        found.sort()
+        if context is None:
+            context = self.root
+        else:
+            context = find_root(context)
+        walked = self._walk_paths(context, found)
+        if prefetch > 0:
+            walked = self._prefetched(walked, prefetch)
+        for pair in walked:
+            yield pair
+
+    def _walk_paths(self, root, found):
+        # ``found`` is a sorted list of (path_tuple, objectid); ``stack``
+        # holds the objects along the last path traversed
+        stack = [root]
+        last = ()
+        for path_tuple, objectid in found:
+            common = 1
+            limit = min(len(stack), len(path_tuple))
+            while common < limit and last[common] == path_tuple[common]:
+                common += 1
+            del stack[common:]
+            obj = stack[-1]
+            for name in path_tuple[common:]:
+                getitem = getattr(obj, '__getitem__', None)
+                try:
+                    if getitem is None:
+                        raise KeyError(name)
+                    obj = getitem(name)
+                except KeyError:
+                    obj = None
+                    break
+                stack.append(obj)
+            last = path_tuple
+            yield objectid, obj
+
+    def _prefetched(self, pairs, size):
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) == size:
+                self._prefetch(batch)
+                for each in batch:
+                    yield each
+                batch = []
+        self._prefetch(batch)
+        for each in batch:
+            yield each
+
+    def _prefetch(self, pairs):
+        objs = [ obj for objectid, obj in pairs
+                 if getattr(obj, '_p_jar', None) is not None ]
+        if objs:
+            prefetch = getattr(objs[0]._p_jar, 'prefetch', None)
+            if prefetch is not None:
+                prefetch(objs)
 
     def _find_resource(self, context, path_tuple): # replaced in tests
         if context is None:
@@ -194,6 +525,12 @@ class ObjectMap(Persistent):
 
         self.path_to_objectid[path_tuple] = objectid
         self.objectid_to_path[objectid] = path_tuple
+        self._paths_changed((objectid,))
+        self._count_ancestors(path_tuple, {0:1})
+
+        if self.childindex is not None:
+            self._add_child_edges(path_tuple)
+            return objectid
 
         pathlen = len(path_tuple)
 
@@ -227,6 +564,26 @@ class ObjectMap(Persistent):
                 'object, an object id, or a path tuple, got %s' % (
                     (obj_objectid_or_path_tuple,)))
 
+        counts = self._subtree_counts(path_tuple)
+
+        if self.childindex is not None:
+            removed = self._remove_compact(path_tuple)
+
+        else:
+            removed = self._remove_nested(path_tuple)
+
+        if counts:
+            self._uncount_subtree(path_tuple, counts)
+
+        if not moving:
+            self.referencemap.remove(removed)
+            self.extentmap.remove(removed)
+
+        self._paths_changed(removed)
+
+        return removed
+
+    def _remove_nested(self, path_tuple):
         pathlen = len(path_tuple)
 
         omap = self.pathindex.get(path_tuple)
@@ -235,56 +592,256 @@ class ObjectMap(Persistent):
         if omap is None:
             return set()
 
-        removed = self.family.IF.Set()
-        items = omap.items()
+        items = list(omap.items())
+        # every oid under path_tuple is mentioned in exactly one of its levels
+        removed = self.family.IF.multiunion([oidset for level, oidset in items])
         removepaths = []
 
         for k, dm in self.pathindex.items(min=path_tuple):
             if k[:pathlen] == path_tuple:
-                for oidset in dm.values():
-                    removed.update(oidset)
-                    for oid in oidset:
-                        if oid in self.objectid_to_path:
-                            p = self.objectid_to_path[oid]
-                            del self.objectid_to_path[oid]
-                            del self.path_to_objectid[p]
                 # dont mutate while iterating
                 removepaths.append(k)
             else:
                 break
 
+        # the subtree's paths are a contiguous range of path_to_objectid keys
+        # and we delete objectid_to_path entries in oid order, so consecutive
+        # deletes tend to land in the same buckets
         for k in removepaths:
+            self.path_to_objectid.pop(k, None)
             del self.pathindex[k]
 
+        for oid in removed:
+            self.objectid_to_path.pop(oid, None)
+
         for x in range(pathlen-1):
 
             offset = x + 1
             els = path_tuple[:pathlen-offset]
             omap2 = self.pathindex[els]
             for level, oidset in items:
+                self._discard_oids(omap2, level + offset, oidset)
 
-                i = level + offset
-                oidset2 = omap2[i]
+        return removed
 
-                for oid in oidset:
-                    if oid in oidset2:
-                        oidset2.remove(oid)
-                        # adding to removed and removing from
-                        # objectid_to_path and path_to_objectid should have
-                        # been taken care of above in the for k, dm in
-                        # self.pathindex.items() loop
-                        assert oid in removed, oid
-                        assert not oid in self.objectid_to_path, oid
+    def _discard_oids(self, omap, level, oids):
+        # Remove ``oids`` from the oid set at ``level`` of the pathindex entry
+        # ``omap``, deleting the level if it becomes empty.  Only the oids
+        # which are actually members of the set (found with a single
+        # intersection) are removed.  The existing set is always changed in
+        # place, never replaced, so that a concurrent add to it conflicts
+        # instead of landing in an orphaned set.
+        oidset = omap.get(level)
+        if oidset is None:
+            return
+        for oid in self.family.IF.intersection(oidset, oids):
+            oidset.remove(oid)
+        if not oidset:
+            del omap[level]
 
-                if not oidset2:
-                    del omap2[i]
+    def _remove_compact(self, path_tuple):
+        pathlen = len(path_tuple)
 
-        if not moving:
-            self.referencemap.remove(removed)
-            self.extentmap.remove(removed)
+        removed = self.family.IF.Set()
+        removepaths = []
+
+        for k, oid in self.path_to_objectid.items(min=path_tuple):
+            if k[:pathlen] == path_tuple:
+                removed.insert(oid)
+                removepaths.append(k)
+            else:
+                break
+
+        for k in removepaths:
+            del self.path_to_objectid[k]
+
+        for oid in removed:
+            del self.objectid_to_path[oid]
+
+        for k in self._subtree_keys(self.childindex, path_tuple):
+            del self.childindex[k]
+
+        self._remove_child_edge(path_tuple)
 
         return removed
 
+    def _subtree_keys(self, btree, path_tuple):
+        pathlen = len(path_tuple)
+        result = []
+        for k in btree.keys(min=path_tuple):
+            if k[:pathlen] == path_tuple:
+                result.append(k)
+            else:
+                break
+        return result
+
+    def _add_child_edges(self, path_tuple):
+        # add the edge from each ancestor to its child, deepest first; once an
+        # existing edge is found, all the edges above it exist too
+        for x in range(len(path_tuple)-1, 0, -1):
+            parent = path_tuple[:x]
+            names = self.childindex.get(parent)
+            if names is None:
+                names = self.childindex[parent] = self.family.OO.TreeSet()
+            if not names.insert(path_tuple[x]):
+                break
+
+    def _remove_child_edge(self, path_tuple):
+        # remove the edge from the parent of path_tuple to path_tuple, then
+        # prune edges to ancestors which neither exist in the map nor have
+        # any remaining children
+        while len(path_tuple) > 1:
+            parent = path_tuple[:-1]
+            names = self.childindex.get(parent)
+            if names is None or not path_tuple[-1] in names:
+                break
+            names.remove(path_tuple[-1])
+            if names:
+                break
+            del self.childindex[parent]
+            if parent in self.path_to_objectid:
+                break
+            path_tuple = parent
+
+    def move(self, old_path_tuple, new_path_tuple):
+        """ Move the object at ``old_path_tuple`` and all of its descendants
+        to ``new_path_tuple`` in the object map, retaining their object
+        identifiers, references and extents.
+
+        Unlike a ``remove`` followed by an ``add`` of every node in the
+        subtree, the per-prefix entries of the path index related to the
+        subtree are rekeyed rather than rebuilt, and ancestor entries are only
+        touched when they are not shared by the old and new locations at the
+        same depth (a rename touches no ancestor entries at all).
+
+        Return the set of object ids that were moved (including the oid of the
+        object at ``old_path_tuple``).
+
+        It is an error to move an object to a path which already exists in the
+        object map or to a path inside itself.
+        """
+        if not isinstance(old_path_tuple, tuple):
+            raise ValueError('old_path_tuple argument must be a tuple')
+
+        if not isinstance(new_path_tuple, tuple):
+            raise ValueError('new_path_tuple argument must be a tuple')
+
+        if not old_path_tuple in self.path_to_objectid:
+            raise ValueError('path %s does not exist' % (old_path_tuple,))
+
+        if new_path_tuple in self.path_to_objectid:
+            raise ValueError('path %s already exists' % (new_path_tuple,))
+
+        oldlen = len(old_path_tuple)
+
+        if new_path_tuple[:oldlen] == old_path_tuple:
+            raise ValueError(
+                'cannot move %s inside itself' % (old_path_tuple,))
+
+        counts = self._subtree_counts(old_path_tuple)
+
+        if self.childindex is not None:
+            moved = self._move_compact(old_path_tuple, new_path_tuple)
+        else:
+            moved = self._move_nested(old_path_tuple, new_path_tuple)
+
+        self._paths_changed(moved)
+
+        if counts:
+            self._move_counts(old_path_tuple, new_path_tuple, counts)
+
+        return moved
+
+    def _move_nested(self, old_path_tuple, new_path_tuple):
+        oldlen = len(old_path_tuple)
+        newlen = len(new_path_tuple)
+
+        # the depth-relative oid sets of the subtree, used to adjust ancestors
+        items = list(self.pathindex[old_path_tuple].items())
+
+        # rekey the path index entries which live under the old path; the
+        # depth-relative oid sets they contain do not change
+        rekeyed = []
+
+        for k, dm in self.pathindex.items(min=old_path_tuple):
+            if k[:oldlen] == old_path_tuple:
+                rekeyed.append((k, dm))
+            else:
+                break
+
+        for k, dm in rekeyed:
+            del self.pathindex[k]
+            newk = new_path_tuple + k[oldlen:]
+            existing = self.pathindex.get(newk)
+            if existing is None:
+                self.pathindex[newk] = dm
+            else:
+                # a prefix left behind by an add of a path whose ancestors
+                # were never added; merge rather than clobber it
+                for level, oidset in dm.items():
+                    existing.setdefault(
+                        level, self.family.IF.TreeSet()).update(oidset)
+            for oid in dm.get(0, ()):
+                del self.path_to_objectid[k]
+                self.path_to_objectid[newk] = oid
+                self.objectid_to_path[oid] = newk
+
+        # find the number of ancestors shared by the old and new location
+        common = 0
+        for old_el, new_el in zip(old_path_tuple[:-1], new_path_tuple[:-1]):
+            if old_el != new_el:
+                break
+            common += 1
+
+        for x in range(1, oldlen):
+            if x <= common and oldlen == newlen:
+                # shared ancestor, the subtree is at the same depth under it
+                continue
+            omap2 = self.pathindex[old_path_tuple[:x]]
+            offset = oldlen - x
+            for level, oidset in items:
+                self._discard_oids(omap2, level + offset, oidset)
+
+        for x in range(1, newlen):
+            if x <= common and oldlen == newlen:
+                continue
+            omap2 = self.pathindex.setdefault(
+                new_path_tuple[:x], self.family.IO.BTree())
+            offset = newlen - x
+            for level, oidset in items:
+                oidset2 = omap2.setdefault(
+                    level + offset, self.family.IF.TreeSet())
+                oidset2.update(oidset)
+
+        moved = self.family.IF.multiunion([oidset for level, oidset in items])
+        return moved
+
+    def _move_compact(self, old_path_tuple, new_path_tuple):
+        oldlen = len(old_path_tuple)
+
+        moved = self.family.IF.Set()
+
+        for k in self._subtree_keys(self.path_to_objectid, old_path_tuple):
+            oid = self.path_to_objectid.pop(k)
+            newk = new_path_tuple + k[oldlen:]
+            self.path_to_objectid[newk] = oid
+            self.objectid_to_path[oid] = newk
+            moved.insert(oid)
+
+        for k in self._subtree_keys(self.childindex, old_path_tuple):
+            names = self.childindex.pop(k)
+            newk = new_path_tuple + k[oldlen:]
+            existing = self.childindex.get(newk)
+            if existing is None:
+                self.childindex[newk] = names
+            else:
+                existing.update(names)
+
+        self._remove_child_edge(old_path_tuple)
+        self._add_child_edges(new_path_tuple)
+
+        return moved
+
     def _get_path_tuple(self, obj_or_path_tuple):
         if hasattr(obj_or_path_tuple, '__parent__'):
             path_tuple = resource_path_tuple(obj_or_path_tuple)
@@ -301,6 +858,8 @@ class ObjectMap(Persistent):
         return self._navgen(path_tuple, depth)
 
     def _navgen(self, path_tuple, depth):
+        if self.childindex is not None:
+            return self._navgen_compact(path_tuple, depth)
         omap = self.pathindex.get(path_tuple)
         if omap is None:
             return []
@@ -320,6 +879,126 @@ class ObjectMap(Persistent):
                     )
         return result
 
+    def _navgen_compact(self, path_tuple, depth):
+        result = []
+        newdepth = depth-1
+        if newdepth > -1:
+            # the nested index yields children in objectid order
+            for oid, pt in sorted(self._compact_children(path_tuple)):
+                result.append(
+                    {'path':pt,
+                     'children':self._navgen_compact(pt, newdepth),
+                     'name':pt[-1],
+                     }
+                    )
+        return result
+
+    def _compact_children(self, path_tuple):
+        # return (oid, path) for each child of path_tuple in the object map
+        result = []
+        for name in self.childindex.get(path_tuple, ()):
+            pt = path_tuple + (name,)
+            oid = self.path_to_objectid.get(pt)
+            if oid is not None:
+                result.append((oid, pt))
+        return result
+
+    def _compact_lookup(self, path_tuple, depth, include_origin):
+        # return a list of the oids under path_tuple
+        if depth is None:
+            if self.pathnames is not None:
+                result = self.path_to_objectid.subtree_values(path_tuple)
+                if not include_origin:
+                    oid = self.path_to_objectid.get(path_tuple)
+                    if oid is not None:
+                        result.remove(oid)
+                return result
+            # all paths under path_tuple are a contiguous range of keys
+            pathlen = len(path_tuple)
+            result = []
+            for k, oid in self.path_to_objectid.items(min=path_tuple):
+                if k[:pathlen] != path_tuple:
+                    break
+                if include_origin or k != path_tuple:
+                    result.append(oid)
+            return result
+
+        result = []
+        if include_origin:
+            oid = self.path_to_objectid.get(path_tuple)
+            if oid is not None:
+                result.append(oid)
+        level = [path_tuple]
+        for d in range(depth):
+            nextlevel = []
+            for pt in level:
+                for name in self.childindex.get(pt, ()):
+                    nextlevel.append(pt + (name,))
+            for pt in nextlevel:
+                oid = self.path_to_objectid.get(pt)
+                if oid is not None:
+                    result.append(oid)
+            level = nextlevel
+        return result
+
+    def _counter(self, path_tuple):
+        counter = self.pathcounts.get(path_tuple)
+        if counter is None:
+            counter = self.pathcounts[path_tuple] = PathCount()
+        return counter
+
+    def _count_ancestors(self, path_tuple, counts):
+        # add ``counts`` (depth relative to path_tuple: number of objects) to
+        # the counters of every ancestor of path_tuple
+        if self.pathcounts is None:
+            return
+        pathlen = len(path_tuple)
+        for x in range(1, pathlen):
+            self._counter(path_tuple[:x]).change(counts, pathlen - x)
+
+    def _subtree_counts(self, path_tuple):
+        # the number of objects at each depth of the subtree at path_tuple,
+        # path_tuple itself being at depth 0
+        if self.pathcounts is None:
+            return None
+        counter = self.pathcounts.get(path_tuple)
+        counts = {}
+        if counter is not None:
+            counts.update(counter.counts)
+        if path_tuple in self.path_to_objectid:
+            counts[0] = 1
+        return counts
+
+    def _uncount_subtree(self, path_tuple, counts):
+        for k in self._subtree_keys(self.pathcounts, path_tuple):
+            del self.pathcounts[k]
+        self._count_ancestors(
+            path_tuple, dict([ (d, -n) for d, n in counts.items() ]))
+
+    def _move_counts(self, old_path_tuple, new_path_tuple, counts):
+        oldlen = len(old_path_tuple)
+        for k in self._subtree_keys(self.pathcounts, old_path_tuple):
+            counter = self.pathcounts.pop(k)
+            newk = new_path_tuple + k[oldlen:]
+            existing = self.pathcounts.get(newk)
+            if existing is None:
+                self.pathcounts[newk] = counter
+            else:
+                existing.change(counter.counts)
+        newlen = len(new_path_tuple)
+        start = 1
+        if oldlen == newlen:
+            # a rename or a move to the same depth changes no counter of the
+            # ancestors the old and new paths share
+            while old_path_tuple[start] == new_path_tuple[start]:
+                start += 1
+            start += 1
+        negated = dict([ (d, -n) for d, n in counts.items() ])
+        for x in range(start, oldlen):
+            self._counter(old_path_tuple[:x]).change(negated, oldlen - x)
+        for x in range(start, newlen):
+            self._counter(new_path_tuple[:x]).change(counts, newlen - x)
+
     def pathcount(self, obj_or_path_tuple, depth=None, include_origin=True):
         """ Return the total number of objectids under a given path given an
         object or a path tuple.  If ``depth`` is None, count all object ids
@@ -327,6 +1006,20 @@ class ObjectMap(Persistent):
         If ``include_origin`` is ``True``, count the object identifier of the
         object that was passed, otherwise omit it."""
         path_tuple = self._get_path_tuple(obj_or_path_tuple)
+
+        if self.pathcounts is not None:
+            result = 0
+            if include_origin and path_tuple in self.path_to_objectid:
+                result = 1
+            counter = self.pathcounts.get(path_tuple)
+            if counter is not None:
+                result += counter.count(depth)
+            return result
+
+        if self.childindex is not None:
+            return len(
+                self._compact_lookup(path_tuple, depth, include_origin))
+
         omap = self.pathindex.get(path_tuple)
 
         result = 0
@@ -364,6 +1057,12 @@ class ObjectMap(Persistent):
         ``include_origin`` is ``True``, include the object identifier of the
         object that was passed, otherwise omit it from the returned set."""
         path_tuple = self._get_path_tuple(obj_or_path_tuple)
+
+        if self.childindex is not None:
+            # sorted, as building a set from unsorted ids is quadratic
+            return self.family.IF.Set(sorted(
+                self._compact_lookup(path_tuple, depth, include_origin)))
+
         omap = self.pathindex.get(path_tuple)
 
         result = self.family.IF.Set()
@@ -394,6 +1093,38 @@ class ObjectMap(Persistent):
 
         return result
 
+    def postorder(self, obj_or_path_tuple, include_origin=True):
+        """ Yield the objectids of the objects at and under a given path given
+        an object or a path tuple, deepest first: the children of an object
+        (in name order) are yielded before the object itself, the order in
+        which :func:`substanced.util.postorder` visits the same objects
+        (unless the object map interns paths, see :class:`ObjectMap`, in
+        which case children are not ordered by name).  The
+        objectids are read from the object map, so no object in the subtree
+        is loaded.  If ``include_origin`` is ``True``, yield the object
+        identifier of the object that was passed last, otherwise omit it.
+
+        The object map must not be changed while the result is consumed."""
+        path_tuple = self._get_path_tuple(obj_or_path_tuple)
+        pathlen = len(path_tuple)
+        # all paths under path_tuple are a contiguous range of keys, sorted
+        # parents before children; keep a stack of the ancestors of the
+        # current path and yield each one once a path outside of it shows up
+        stack = []
+        for k, oid in self.path_to_objectid.items(min=path_tuple):
+            if k[:pathlen] != path_tuple:
+                break
+            while stack:
+                top = stack[-1][0]
+                if k[:len(top)] == top:
+                    break
+                yield stack.pop()[1]
+            stack.append((k, oid))
+        while stack:
+            k, oid = stack.pop()
+            if include_origin or k != path_tuple:
+                yield oid
+
     def _refids_for(self, source, target):
         sourceid, targetid = get_oid(source, source), get_oid(target, target)
         if not sourceid in self.objectid_to_path:
@@ -473,6 +1204,62 @@ class ObjectMap(Persistent):
         oid = self._refid_for(obj)
         return self._oidset(self.referencemap.targetids(oid, reftype))
 
+    def reachable_targetids(self, obj, reftypes, depth=None,
+                            include_origin=False):
+        """ Return a set of the object identifiers reachable from ``obj`` by
+        following references from their source to their target, e.g. the
+        targets of ``obj``, the targets of those, and so on.  ``reftypes`` is
+        a reference type or a sequence of reference types, any of which may
+        be followed at every step.  If ``depth`` is an integer, follow at most
+        that many references in a row; if it is ``None``, follow them until
+        no new object identifiers are found.  Each object identifier is
+        visited once, so cycles are harmless.  ``obj`` itself is only in the
+        result if ``include_origin`` is ``True``.
+
+        The result is computed on sets of object identifiers without loading
+        any object and is an integer set of the object map's BTree family, so
+        it can be intersected with (e.g.) a catalog result set's oids."""
+        return self._reachable(obj, reftypes, depth, include_origin, True)
+
+    def reachable_sourceids(self, obj, reftypes, depth=None,
+                            include_origin=False):
+        """ Like :meth:`reachable_targetids`, but follow references from
+        their target to their source, e.g. the sources of ``obj``, the
+        sources of those, and so on."""
+        return self._reachable(obj, reftypes, depth, include_origin, False)
+
+    def _reachable(self, obj, reftypes, depth, include_origin, forward):
+        oid = self._refid_for(obj)
+        if not is_nonstr_iter(reftypes):
+            reftypes = (reftypes,)
+        refmap = self.referencemap.refmap
+        edges = []
+        for reftype in reftypes:
+            refset = refmap.get(reftype)
+            if refset is None:
+                continue
+            if forward:
+                edges.append(refset.src2target)
+            else:
+                edges.append(refset.target2src)
+        IF = self.family.IF
+        origin = IF.Set((oid,))
+        seen = frontier = origin
+        hops = 0
+        while frontier and (depth is None or hops < depth):
+            found = []
+            for oids in edges:
+                for oid in frontier:
+                    next_oids = oids.get(oid)
+                    if next_oids:
+                        found.append(next_oids)
+            frontier = IF.difference(IF.multiunion(found), seen)
+            seen = IF.union(seen, frontier)
+            hops += 1
+        if not include_origin:
+            seen = IF.difference(seen, origin)
+        return seen
+
     def sources(self, obj, reftype):
         """ Return a generator which will return the objects connected to
         ``obj`` as a source using reference type ``reftype``"""
@@ -502,6 +1289,286 @@ class ObjectMap(Persistent):
         the value of ``default``."""
         return self.extentmap.get(name, default)
 
+class PathCount(Persistent):
+    """ The number of objects at each depth below a path (depth 1 being its
+    children).  Like :class:`BTrees.Length.Length`, conflicting changes made
+    by concurrent transactions are resolved by adding them up."""
+    def __init__(self):
+        self.counts = {}
+
+    def change(self, counts, offset=0):
+        """ Add each ``{depth:number}`` of ``counts`` to the number of objects
+        at ``depth + offset`` """
+        mine = self.counts
+        for depth, n in counts.items():
+            depth += offset
+            n += mine.get(depth, 0)
+            if n:
+                mine[depth] = n
+            else:
+                mine.pop(depth, None)
+        self._p_changed = True
+
+    def count(self, depth=None):
+        """ Return the number of objects at most ``depth`` levels below the
+        path, or at any depth if ``depth`` is ``None`` """
+        if depth is None:
+            return sum(self.counts.values())
+        return sum([ n for d, n in self.counts.items() if d <= depth ])
+
+    def _p_resolveConflict(self, old, committed, new):
+        oldcounts = old.get('counts', {})
+        counts = dict(committed.get('counts', {}))
+        newcounts = new.get('counts', {})
+        for depth in set(oldcounts) | set(newcounts):
+            n = (counts.get(depth, 0) + newcounts.get(depth, 0) -
+                 oldcounts.get(depth, 0))
+            if n:
+                counts[depth] = n
+            else:
+                counts.pop(depth, None)
+        state = dict(committed)
+        state['counts'] = counts
+        return state
+
+class PathNames(Persistent):
+    """ Interns the names path tuples are made of: each name gets an integer
+    id, so that a path can be stored as a short string of packed ids (see
+    :class:`PathKeyedMap` and :class:`PathValuedMap`) rather than as a tuple
+    of names.  The id of a name is derived from its CRC-32 checksum (the
+    next free id is used when names collide), so only the map of ids to
+    names is stored, and the same name gets the same id in concurrent
+    transactions.  Names are never forgotten. """
+
+    family = BTrees.family64
+    maxid = 2**32 - 1 # ids are packed as four byte unsigned integers
+
+    def __init__(self, family=None):
+        if family is not None:
+            self.family = family
+        self.names = self.family.IO.BTree()
+
+    def __len__(self):
+        return len(self.names)
+
+    def nameid(self, name, intern=False):
+        """ Return the id of ``name``.  If it has none, return ``None``,
+        unless ``intern`` is true, in which case the name is given one."""
+        if isinstance(name, bytes):
+            encoded = name
+        else:
+            encoded = name.encode('utf-8')
+        nameid = zlib.crc32(encoded) & self.maxid
+        names = self.names
+        while True:
+            existing = names.get(nameid)
+            if existing == name:
+                return nameid
+            if existing is None:
+                if not intern:
+                    return None
+                names[nameid] = name
+                return nameid
+            nameid = (nameid + 1) & self.maxid
+
+    def encode(self, path_tuple, intern=False):
+        """ Return the packed string of ids standing for ``path_tuple``.  If
+        one of its names has no id, return ``None``, unless ``intern`` is
+        true, in which case the name is given one. """
+        names = self.names
+        maxid = self.maxid
+        ids = []
+        for name in path_tuple:
+            # inlined nameid for the common case of an interned name which
+            # collided with no other
+            if isinstance(name, bytes):
+                encoded = name
+            else:
+                encoded = name.encode('utf-8')
+            nameid = zlib.crc32(encoded) & maxid
+            if names.get(nameid) != name:
+                nameid = self.nameid(name, intern)
+                if nameid is None:
+                    return None
+            ids.append(nameid)
+        return struct.pack('>%dI' % len(ids), *ids)
+
+    def decode(self, packed):
+        """ Return the path tuple ``packed`` (a result of ``encode``)
+        stands for """
+        ids = struct.unpack('>%dI' % (len(packed) // 4), packed)
+        names = self.names
+        return tuple([ names[nameid] for nameid in ids ])
+
+class PathKeyedMap(Persistent):
+    """ A mapping of path tuples to values, which stores each path as a
+    string of ids interned by ``pathnames`` (a :class:`PathNames`) in a
+    BTree.  It supports the part of the BTree API used by the object map.
+
+    Paths are ordered by the ids of their names rather than by the names
+    themselves, but all the paths under a given path are still a contiguous
+    range of keys which starts with the given path.  ``keys`` and ``items``
+    are only meant to be used to scan such ranges: if their ``min`` path has
+    a name which was never interned, no path can start with it and they
+    return nothing."""
+    def __init__(self, pathnames):
+        self.pathnames = pathnames
+        self.data = pathnames.family.OO.BTree()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, path_tuple):
+        packed = self.pathnames.encode(path_tuple)
+        return packed is not None and packed in self.data
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, path_tuple):
+        packed = self.pathnames.encode(path_tuple)
+        if packed is None:
+            raise KeyError(path_tuple)
+        return self.data[packed]
+
+    def get(self, path_tuple, default=None):
+        packed = self.pathnames.encode(path_tuple)
+        if packed is None:
+            return default
+        return self.data.get(packed, default)
+
+    def __setitem__(self, path_tuple, value):
+        self.data[self.pathnames.encode(path_tuple, intern=True)] = value
+
+    def setdefault(self, path_tuple, default):
+        packed = self.pathnames.encode(path_tuple, intern=True)
+        return self.data.setdefault(packed, default)
+
+    def update(self, items):
+        encode = self.pathnames.encode
+        self.data.update(
+            [ (encode(path_tuple, intern=True), value)
+              for path_tuple, value in items ]
+            )
+
+    def __delitem__(self, path_tuple):
+        packed = self.pathnames.encode(path_tuple)
+        if packed is None:
+            raise KeyError(path_tuple)
+        del self.data[packed]
+
+    def pop(self, path_tuple, default=_marker):
+        packed = self.pathnames.encode(path_tuple)
+        if packed is not None and packed in self.data:
+            return self.data.pop(packed)
+        if default is _marker:
+            raise KeyError(path_tuple)
+        return default
+
+    def _packed_min(self, min):
+        if min is None:
+            return None
+        packed = self.pathnames.encode(min)
+        if packed is None:
+            return _marker
+        return packed
+
+    def keys(self, min=None):
+        packed = self._packed_min(min)
+        if packed is _marker:
+            return
+        decode = self.pathnames.decode
+        for k in self.data.keys(min=packed):
+            yield decode(k)
+
+    def items(self, min=None):
+        packed = self._packed_min(min)
+        if packed is _marker:
+            return
+        decode = self.pathnames.decode
+        for k, v in self.data.items(min=packed):
+            yield decode(k), v
+
+    def values(self):
+        return self.data.values()
+
+    def subtree_values(self, path_tuple):
+        """ Return a list of the values of ``path_tuple`` and of all the paths
+        under it, without turning any key back into a path """
+        prefix = self.pathnames.encode(path_tuple)
+        if prefix is None:
+            return []
+        result = []
+        for k, v in self.data.items(min=prefix):
+            # ids are of a fixed size, so a path is under path_tuple exactly
+            # when its packed ids start with those of path_tuple
+            if not k.startswith(prefix):
+                break
+            result.append(v)
+        return result
+
+class PathValuedMap(Persistent):
+    """ A mapping of object ids to path tuples, which stores each path as a
+    string of ids interned by ``pathnames`` (a :class:`PathNames`) in a
+    BTree.  It supports the part of the BTree API used by the object map."""
+    def __init__(self, pathnames):
+        self.pathnames = pathnames
+        self.data = pathnames.family.OO.BTree()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, objectid):
+        return objectid in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, objectid):
+        return self.pathnames.decode(self.data[objectid])
+
+    def get(self, objectid, default=None):
+        packed = self.data.get(objectid)
+        if packed is None:
+            return default
+        return self.pathnames.decode(packed)
+
+    def __setitem__(self, objectid, path_tuple):
+        self.data[objectid] = self.pathnames.encode(path_tuple, intern=True)
+
+    def update(self, items):
+        encode = self.pathnames.encode
+        self.data.update(
+            [ (objectid, encode(path_tuple, intern=True))
+              for objectid, path_tuple in items ]
+            )
+
+    def __delitem__(self, objectid):
+        del self.data[objectid]
+
+    def pop(self, objectid, default=_marker):
+        if objectid in self.data:
+            return self.pathnames.decode(self.data.pop(objectid))
+        if default is _marker:
+            raise KeyError(objectid)
+        return default
+
+    def minKey(self, min=None):
+        return self.data.minKey(min)
+
+    def keys(self, min=None, max=None):
+        return self.data.keys(min, max)
+
+    def items(self):
+        decode = self.pathnames.decode
+        for objectid, packed in self.data.items():
+            yield objectid, decode(packed)
+
+    def values(self):
+        decode = self.pathnames.decode
+        for packed in self.data.values():
+            yield decode(packed)
+
 class ExtentMap(Persistent):
 
     family = BTrees.family64
@@ -540,30 +1607,74 @@ class ExtentMap(Persistent):
         return self.extent_to_oids.get(name, default)
 
 class ReferenceMap(Persistent):
+    """ A map of reference type to :class:`ReferenceSet`.
+
+    ``oid_reftypes`` maps each oid which is a source or a target of a
+    reference set to a tuple of the reference types it appears in, so that
+    ``remove`` and ``has_references`` only visit the reference sets which
+    mention an oid.  It is ``None`` on reference maps created before it
+    existed (see
+    :func:`substanced.objectmap.evolve.index_referencemap_oids`) and on
+    reference maps created with an existing ``refmap``.
+    """
     
     family = BTrees.family64
+    oid_reftypes = None
     
     def __init__(self, refmap=None):
         if refmap is None:
             refmap = self.family.OO.BTree()
+            self.oid_reftypes = self.family.OO.BTree()
         self.refmap = refmap
 
+    def _add_reftype(self, oid, reftype):
+        if self.oid_reftypes is not None:
+            reftypes = self.oid_reftypes.get(oid, ())
+            if not reftype in reftypes:
+                self.oid_reftypes[oid] = reftypes + (reftype,)
+
+    def _discard_reftype(self, oids, reftype):
+        # forget ``reftype`` for each oid of ``oids`` which is no longer
+        # mentioned by its reference set
+        refset = self.refmap[reftype]
+        for oid in oids:
+            if refset.is_source(oid) or refset.is_target(oid):
+                continue
+            reftypes = self.oid_reftypes.get(oid, ())
+            if reftype in reftypes:
+                reftypes = tuple([ r for r in reftypes if r != reftype ])
+                if reftypes:
+                    self.oid_reftypes[oid] = reftypes
+                else:
+                    del self.oid_reftypes[oid]
+
     def order_sources(self, targetid, reftype, order=_marker):
         refset = self.refmap.setdefault(reftype, ReferenceSet())
-        return refset.order_sources(targetid, order)
+        oids = refset.order_sources(targetid, order)
+        if refset.is_target(targetid):
+            self._add_reftype(targetid, reftype)
+        return oids
 
     def order_targets(self, sourceid, reftype, order=_marker):
         refset = self.refmap.setdefault(reftype, ReferenceSet())
-        return refset.order_targets(sourceid, order)
+        oids = refset.order_targets(sourceid, order)
+        if refset.is_source(sourceid):
+            self._add_reftype(sourceid, reftype)
+        return oids
         
     def connect(self, source, target, reftype):
         refset = self.refmap.setdefault(reftype, ReferenceSet())
         refset.connect(source, target)
+        self._add_reftype(source, reftype)
+        self._add_reftype(target, reftype)
 
     def disconnect(self, source, target, reftype):
         refset = self.refmap.get(reftype)
         if refset is not None:
-            refset.disconnect(source, target)
+            orphaned = []
+            refset.disconnect(source, target, orphaned)
+            if self.oid_reftypes is not None:
+                self._discard_reftype(orphaned, reftype)
 
     def targetids(self, oid, reftype):
         refset = self.refmap.get(reftype)
@@ -578,14 +1689,34 @@ class ReferenceMap(Persistent):
         return self.family.OO.Set()
 
     def remove(self, oids):
-        for refset in self.refmap.values():
-            refset.remove(oids)
+        oids = self.family.OO.Set(oids)
+        if self.oid_reftypes is None:
+            for refset in self.refmap.values():
+                refset.remove(oids)
+            return
+        # only the oids mentioned by some reference set, grouped by the
+        # reference sets which mention them
+        byreftype = []
+        for oid in self.family.OO.intersection(oids, self.oid_reftypes):
+            for reftype in self.oid_reftypes.pop(oid):
+                for r, group in byreftype:
+                    if r == reftype:
+                        group.append(oid)
+                        break
+                else:
+                    byreftype.append((reftype, [oid]))
+        for reftype, group in byreftype:
+            orphaned = []
+            self.refmap[reftype].remove(group, orphaned)
+            self._discard_reftype(orphaned, reftype)
 
     def get_reftypes(self):
         return self.refmap.keys()
 
     def has_references(self, oid, reftype=None):
         if reftype is None: # any reference type
+            if self.oid_reftypes is not None:
+                return oid in self.oid_reftypes
             for reftype, refset in self.refmap.items():
                 if refset.is_target(oid) or refset.is_source(oid):
                     return True
@@ -621,13 +1752,21 @@ class ReferenceSet(Persistent):
         sources = self.target2src.setdefault(target, self.oidset_class())
         sources.insert(source)
 
-    def disconnect(self, source, target):
+    def disconnect(self, source, target, orphaned=None):
+        """ Remove the reference from ``source`` to ``target``.  If
+        ``orphaned`` is a list, ``source`` is appended to it if it is no
+        longer a source, and ``target`` if it is no longer a target."""
         targets = self.src2target.get(source)
         if targets is not None:
             try:
                 targets.remove(target)
             except KeyError:
                 pass
+            else:
+                if not targets:
+                    del self.src2target[source]
+                    if orphaned is not None:
+                        orphaned.append(source)
             
         sources = self.target2src.get(target)
         if sources is not None:
@@ -635,6 +1774,11 @@ class ReferenceSet(Persistent):
                 sources.remove(source)
             except KeyError:
                 pass
+            else:
+                if not sources:
+                    del self.target2src[target]
+                    if orphaned is not None:
+                        orphaned.append(target)
 
     def targetids(self, oid):
         return self.src2target.get(oid, self.oidset_class())
@@ -648,27 +1792,36 @@ class ReferenceSet(Persistent):
     def is_source(self, oid):
         return oid in self.src2target
 
-    def remove(self, oidset):
-        # XXX is there a way to make this less expensive?
-        removed = self.family.OO.Set()
-        for oid in oidset:
-            if oid in self.src2target:
-                removed.insert(oid)
-                targets = self.src2target.pop(oid)
-                for target in targets:
-                    oidset = self.target2src.get(target)
-                    oidset.remove(oid)
-                    if not oidset:
-                        del self.target2src[target]
-            if oid in self.target2src:
-                removed.insert(oid)
-                sources = self.target2src.pop(oid)
-                for source in sources:
-                    oidset = self.src2target.get(source)
-                    oidset.remove(oid)
-                    if not oidset:
-                        del self.src2target[source]
-        return removed
+    def remove(self, oidset, orphaned=None):
+        """ Remove every reference from or to an oid in ``oidset`` and return
+        the set of those oids which were mentioned.  If ``orphaned`` is a
+        list, the other ends of the removed references which are no longer
+        a source (or no longer a target) are appended to it."""
+        OO = self.family.OO
+        if not isinstance(oidset, OO.Set):
+            oidset = OO.Set(oidset)
+        # intersect first, so oids without references cost nothing
+        sources = OO.intersection(oidset, self.src2target)
+        for oid in sources:
+            for target in self.src2target.pop(oid):
+                oids = self.target2src.get(target)
+                oids.remove(oid)
+                if not oids:
+                    del self.target2src[target]
+                    if orphaned is not None:
+                        orphaned.append(target)
+        # computed after the sources are removed, which may have dropped
+        # some of the targets
+        targets = OO.intersection(oidset, self.target2src)
+        for oid in targets:
+            for source in self.target2src.pop(oid):
+                oids = self.src2target.get(source)
+                oids.remove(oid)
+                if not oids:
+                    del self.src2target[source]
+                    if orphaned is not None:
+                        orphaned.append(source)
+        return OO.union(sources, targets)
 
     def order_targets(self, source, order=_marker):
         if order is _marker:
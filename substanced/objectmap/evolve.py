@@ -1,5 +1,11 @@
 import BTrees
 
+from . import (
+    PathCount,
+    PathNames,
+    PathValuedMap,
+    )
+
 def oobtreeify_referencemap(root): # pragma: no cover
     objectmap = root.__objectmap__
     refmap = objectmap.referencemap.refmap
@@ -17,6 +23,8 @@ def treesetify_objectmap_pathindex(root): # pragma: no cover
     # to avoid having huge pickles
     objectmap = root.__objectmap__
     pathindex = objectmap.pathindex
+    if pathindex is None: # compact path index
+        return
     for path, not_treesets in list(pathindex.items()):
         for d, not_treeset in list(not_treesets.items()):
             treeset = objectmap.family.IF.TreeSet(not_treeset)
@@ -34,9 +42,88 @@ def treesetify_referencesets(root): # pragma: no cover
             if oidset.__class__ != refset.oidset_class:
                 refset.target2src[reftype] = refset.oidset_class(oidset)
 
+def compact_objectmap_pathindex(root):
+    """ Convert the nested path index of the root object map into a compact
+    path index (see the ``compact_pathindex`` argument of
+    :class:`substanced.objectmap.ObjectMap`).  This step is not run unless an
+    application adds it explicitly::
+
+        from substanced.objectmap.evolve import compact_objectmap_pathindex
+        config.add_evolution_step(compact_objectmap_pathindex)
+    """
+    objectmap = root.__objectmap__
+    if objectmap.childindex is not None:
+        return
+    objectmap.childindex = objectmap._path_btree()
+    for path_tuple in objectmap.path_to_objectid.keys():
+        objectmap._add_child_edges(path_tuple)
+    del objectmap.pathindex
+
+def count_objectmap_paths(root):
+    """ Build the per-path object counters of the root object map (see
+    :class:`substanced.objectmap.PathCount`), which object maps created
+    before they existed lack, so that ``pathcount`` no longer counts the
+    members of oid sets. """
+    objectmap = root.__objectmap__
+    if objectmap.pathcounts is not None:
+        return
+    counts = {}
+    for path_tuple in objectmap.path_to_objectid.keys():
+        pathlen = len(path_tuple)
+        for x in range(1, pathlen):
+            ancestor = counts.setdefault(path_tuple[:x], {})
+            depth = pathlen - x
+            ancestor[depth] = ancestor.get(depth, 0) + 1
+    pathcounts = objectmap._path_btree()
+    for path_tuple, ancestor in counts.items():
+        counter = pathcounts[path_tuple] = PathCount()
+        counter.change(ancestor)
+    objectmap.pathcounts = pathcounts
+
+def index_referencemap_oids(root):
+    """ Build the index of the reference types each oid is mentioned by
+    (``oid_reftypes``) of the root object map's reference map, which
+    reference maps created before it existed lack. """
+    referencemap = root.__objectmap__.referencemap
+    if referencemap.oid_reftypes is not None:
+        return
+    oid_reftypes = referencemap.family.OO.BTree()
+    for reftype, refset in referencemap.refmap.items():
+        for oids in (refset.src2target.keys(), refset.target2src.keys()):
+            for oid in oids:
+                reftypes = oid_reftypes.get(oid, ())
+                if not reftype in reftypes:
+                    oid_reftypes[oid] = reftypes + (reftype,)
+    referencemap.oid_reftypes = oid_reftypes
+
+def intern_objectmap_paths(root):
+    """ Convert the maps of the root object map which are keyed by or hold
+    paths to store them as interned name ids (see the ``intern_paths``
+    argument of :class:`substanced.objectmap.ObjectMap`).  This step is not
+    run unless an application adds it explicitly::
+
+        from substanced.objectmap.evolve import intern_objectmap_paths
+        config.add_evolution_step(intern_objectmap_paths)
+    """
+    objectmap = root.__objectmap__
+    if objectmap.pathnames is not None:
+        return
+    pathnames = objectmap.pathnames = PathNames(objectmap.family)
+    objectid_to_path = PathValuedMap(pathnames)
+    objectid_to_path.update(objectmap.objectid_to_path.items())
+    objectmap.objectid_to_path = objectid_to_path
+    for name in ('path_to_objectid', 'pathindex', 'childindex', 'pathcounts'):
+        btree = getattr(objectmap, name)
+        if btree is not None:
+            interned = objectmap._path_btree()
+            interned.update(btree.items())
+            setattr(objectmap, name, interned)
+
 def includeme(config): # pragma: no cover
     config.add_evolution_step(oobtreeify_referencemap)
     config.add_evolution_step(oobtreeify_object_to_path)
     config.add_evolution_step(treesetify_objectmap_pathindex)
     config.add_evolution_step(treesetify_referencesets)
+    config.add_evolution_step(count_objectmap_paths)
+    config.add_evolution_step(index_referencemap_oids)
     
@@ -56,6 +56,78 @@ class TestObjectMap(unittest.TestCase):
         result = inst.new_objectid()
         self.assertEqual(result, 2)
 
+    def test_ctor_object_cache_size(self):
+        from .. import ObjectMap
+        inst = ObjectMap(DummyRoot(), object_cache_size=100)
+        self.assertEqual(inst.object_cache_size, 100)
+        self.assertFalse('object_cache_size' in self._makeOne().__dict__)
+
+    def test_ctor_oid_block_size(self):
+        from .. import ObjectMap
+        inst = ObjectMap(DummyRoot(), oid_block_size=100)
+        self.assertEqual(inst.oid_block_size, 100)
+        self.assertFalse('oid_block_size' in self._makeOne().__dict__)
+
+    def test_new_objectid_block_sequential_within_block(self):
+        inst = self._makeOne()
+        inst.oid_block_size = 10
+        inst._block_randrange = lambda frm, to: 5
+        result = [inst.new_objectid() for x in range(3)]
+        self.assertEqual(result, [50, 51, 52])
+
+    def test_new_objectid_block_exhausted(self):
+        inst = self._makeOne()
+        inst.oid_block_size = 2
+        blocks = [5, 7]
+        inst._block_randrange = lambda frm, to: blocks.pop(0)
+        result = [inst.new_objectid() for x in range(3)]
+        self.assertEqual(result, [10, 11, 14])
+
+    def test_new_objectid_block_skips_used_blocks(self):
+        inst = self._makeOne()
+        inst.oid_block_size = 10
+        inst.objectid_to_path[55] = True
+        blocks = [5, 9]
+        inst._block_randrange = lambda frm, to: blocks.pop(0)
+        self.assertEqual(inst.new_objectid(), 90)
+
+    def test_new_objectid_block_below_used_oid(self):
+        inst = self._makeOne()
+        inst.oid_block_size = 10
+        inst.objectid_to_path[200] = True
+        inst._block_randrange = lambda frm, to: 5
+        self.assertEqual(inst.new_objectid(), 50)
+
+    def test_new_objectid_block_skips_zero(self):
+        inst = self._makeOne()
+        inst.oid_block_size = 10
+        inst._block_randrange = lambda frm, to: 0
+        self.assertEqual(inst.new_objectid(), 1)
+
+    def test_new_objectid_block_abandoned_when_oid_taken(self):
+        inst = self._makeOne()
+        inst.oid_block_size = 10
+        blocks = [5, 9]
+        inst._block_randrange = lambda frm, to: blocks.pop(0)
+        self.assertEqual(inst.new_objectid(), 50)
+        # another connection allocated from the same block
+        inst.objectid_to_path[51] = True
+        self.assertEqual(inst.new_objectid(), 90)
+
+    def test_new_objectid_block_within_family_bounds(self):
+        import BTrees
+        inst = self._makeOne(family=BTrees.family32)
+        inst.oid_block_size = 1000
+        bounds = []
+        def randrange(frm, to):
+            bounds.append((frm, to))
+            return frm
+        inst._block_randrange = randrange
+        oid = inst.new_objectid()
+        self.assertTrue(oid >= BTrees.family32.minint)
+        frm, to = bounds[0]
+        self.assertTrue((to - 1) * 1000 + 999 <= BTrees.family32.maxint)
+
     def test_new_objectid_gt_maxint(self):
         inst = self._makeOne()
         oob = inst.family.maxint + 1
@@ -138,6 +210,75 @@ class TestObjectMap(unittest.TestCase):
         inst = self._makeOne()
         self.assertEqual(inst.object_for(1), None)
 
+    def _makeTree(self):
+        root = DummyTraversable()
+        a = root[_A] = DummyTraversable()
+        b = a[_B] = DummyTraversable()
+        c = a[_C] = DummyTraversable()
+        z = root[_Z] = DummyTraversable()
+        inst = self._makeOne(root=root)
+        for oid, path in ((1, (_BLANK,)), (2, (_BLANK, _A)),
+                          (3, (_BLANK, _A, _B)), (4, (_BLANK, _A, _C)),
+                          (5, (_BLANK, _Z)), (6, (_BLANK, _A, _Z, _B)),
+                          (7, (_BLANK, _Z, _A))):
+            inst.objectid_to_path[oid] = path
+        DummyTraversable.traversed = []
+        return inst, root, a, b, c, z
+
+    def test_object_for_many(self):
+        inst, root, a, b, c, z = self._makeTree()
+        result = list(inst.object_for_many([5, 4, 1, 3, 2]))
+        self.assertEqual(
+            result, [(1, root), (2, a), (3, b), (4, c), (5, z)]
+            )
+        # each folder is traversed once
+        self.assertEqual(DummyTraversable.traversed, [_A, _B, _C, _Z])
+
+    def test_object_for_many_missing(self):
+        inst, root, a, b, c, z = self._makeTree()
+        result = list(inst.object_for_many([7, 6, 4, 100, 5]))
+        self.assertEqual(
+            result, [(100, None), (4, c), (6, None), (5, z), (7, None)]
+            )
+        self.assertEqual(DummyTraversable.traversed, [_A, _C, _Z, _Z, _A])
+
+    def test_object_for_many_not_traversable(self):
+        inst, root, a, b, c, z = self._makeTree()
+        b[_A] = object()
+        inst.objectid_to_path[8] = (_BLANK, _A, _B, _A, _A)
+        inst.objectid_to_path[9] = (_BLANK, _A, _B, _A)
+        result = list(inst.object_for_many([8, 9]))
+        self.assertEqual(result, [(9, b[_A]), (8, None)])
+
+    def test_object_for_many_alternate_context(self):
+        inst, root, a, b, c, z = self._makeTree()
+        other = DummyTraversable()
+        other[_A] = a2 = DummyTraversable()
+        a2.__parent__ = other
+        result = list(inst.object_for_many([2], a2))
+        self.assertEqual(result, [(2, a2)])
+
+    def test_object_for_many_prefetch(self):
+        inst, root, a, b, c, z = self._makeTree()
+        jar = DummyJar()
+        for obj in (b, c, z):
+            obj._p_jar = jar
+        result = list(inst.object_for_many([1, 2, 3, 4, 5], prefetch=2))
+        self.assertEqual(
+            result, [(1, root), (2, a), (3, b), (4, c), (5, z)]
+            )
+        # batches of two: (root, a) have no jar, (b, c), then (z,)
+        self.assertEqual(len(jar.prefetched), 2)
+        self.assertTrue(jar.prefetched[0][0] is b)
+        self.assertTrue(jar.prefetched[0][1] is c)
+        self.assertTrue(jar.prefetched[1][0] is z)
+
+    def test_object_for_many_prefetch_unsupported(self):
+        inst, root, a, b, c, z = self._makeTree()
+        b._p_jar = object()
+        result = list(inst.object_for_many([3], prefetch=10))
+        self.assertEqual(result, [(3, b)])
+
     def test__find_resource_no_context(self):
         self.config.testing_resources({'/a':1})
         inst = self._makeOne()
@@ -230,6 +371,191 @@ class TestObjectMap(unittest.TestCase):
         result = inst.remove((_BLANK,))
         self.assertEqual(list(result), [])
 
+    def test_remove_drops_emptied_ancestor_levels(self):
+        inst = self._makeOne()
+        self._populate(inst, ['/', '/a', '/a/b', '/a/b/c', '/z'])
+        inst.remove((_BLANK, _A))
+        self.assertEqual(list(inst.pathindex[(_BLANK,)].keys()), [0, 1])
+        self.assertEqual(inst.path_to_objectid.get((_BLANK, _A, _B)), None)
+        self.assertEqual(len(inst.objectid_to_path), 2)
+
+    def test_remove_mostly_removed_ancestor_level_changed_in_place(self):
+        inst = self._makeOne()
+        paths = ['/', '/a', '/z', '/z/y'] + ['/a/%s' % n for n in range(10)]
+        oids = self._populate(inst, paths)
+        level = inst.pathindex[(_BLANK,)][2]
+        inst.remove((_BLANK, _A))
+        newlevel = inst.pathindex[(_BLANK,)][2]
+        self.assertTrue(newlevel is level)
+        self.assertEqual(list(newlevel), [oids['/z/y']])
+        for path in list(oids):
+            if path.startswith('/a'):
+                del oids[path]
+        self._assertMovedLike(inst, oids, [])
+
+    def test_remove_discards_oids_from_large_ancestor_level(self):
+        inst = self._makeOne()
+        paths = ['/', '/a'] + ['/z%s' % n for n in range(10)]
+        oids = self._populate(inst, paths)
+        level = inst.pathindex[(_BLANK,)][1]
+        inst.remove((_BLANK, _A))
+        self.assertTrue(inst.pathindex[(_BLANK,)][1] is level)
+        self.assertFalse(oids['/a'] in level)
+        self.assertEqual(len(level), 10)
+
+    def test_remove_matches_fresh_objectmap(self):
+        inst = self._makeOne()
+        paths = ['/', '/a', '/a/b', '/a/b/c', '/a/b/d', '/a/e', '/z', '/z/y']
+        oids = self._populate(inst, paths)
+        inst.remove((_BLANK, _A, _B))
+        for path in ('/a/b', '/a/b/c', '/a/b/d'):
+            del oids[path]
+        self._assertMovedLike(inst, oids, [])
+
+    def _populate(self, inst, paths):
+        oids = {}
+        for path in paths:
+            thing = resource(path)
+            oids[path] = inst.add(thing, thing.path_tuple)
+        return oids
+
+    def _dump_pathindex(self, inst):
+        result = {}
+        for path, omap in inst.pathindex.items():
+            levels = dict(
+                [(level, sorted(oidset)) for level, oidset in omap.items()]
+                )
+            if levels:
+                result[path] = levels
+        return result
+
+    def _assertMovedLike(self, inst, oids, moves):
+        # compare against an objectmap built from scratch at the new paths
+        expected = self._makeOne()
+        for path, oid in sorted(oids.items()):
+            for old, new in moves:
+                if path == old or path.startswith(old + '/'):
+                    path = new + path[len(old):]
+            thing = resource(path)
+            thing.__oid__ = oid
+            expected.add(thing, thing.path_tuple)
+        self.assertEqual(
+            dict(inst.objectid_to_path), dict(expected.objectid_to_path))
+        self.assertEqual(
+            dict(inst.path_to_objectid), dict(expected.path_to_objectid))
+        self.assertEqual(
+            self._dump_pathindex(inst), self._dump_pathindex(expected))
+
+    def test_generation_not_kept_until_counted(self):
+        inst = self._makeOne()
+        inst.add(testing.DummyResource(__oid__=1), (_BLANK,))
+        self.assertFalse('_generation' in inst.__dict__)
+        self.assertEqual(inst.generation(), None)
+
+    def test_generation_changes_on_add_move_and_remove(self):
+        from substanced.util import bump_generation
+        inst = self._makeOne()
+        bump_generation(inst) # as a cached path index does
+        generations = [inst.generation()]
+        root = testing.DummyResource(__oid__=1)
+        inst.add(root, (_BLANK,))
+        generations.append(inst.generation())
+        inst.add(testing.DummyResource(__oid__=2), (_BLANK, 'a'))
+        generations.append(inst.generation())
+        inst.move((_BLANK, 'a'), (_BLANK, 'b'))
+        generations.append(inst.generation())
+        inst.remove(2)
+        generations.append(inst.generation())
+        self.assertEqual(len(set(generations)), 5)
+
+    def test_generation_unchanged_by_lookups(self):
+        inst = self._makeOne()
+        inst.add(testing.DummyResource(__oid__=1), (_BLANK,))
+        generation = inst.generation()
+        inst.pathlookup((_BLANK,))
+        inst.path_for(1)
+        self.assertEqual(inst.generation(), generation)
+
+    def test_move_old_not_a_tuple(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.move, '/a', (_BLANK, _B))
+
+    def test_move_new_not_a_tuple(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.move, (_BLANK, _A), '/b')
+
+    def test_move_old_does_not_exist(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.move, (_BLANK, _A), (_BLANK, _B))
+
+    def test_move_new_already_exists(self):
+        inst = self._makeOne()
+        self._populate(inst, ['/', '/a', '/b'])
+        self.assertRaises(ValueError, inst.move, (_BLANK, _A), (_BLANK, _B))
+
+    def test_move_inside_itself(self):
+        inst = self._makeOne()
+        self._populate(inst, ['/', '/a'])
+        self.assertRaises(
+            ValueError, inst.move, (_BLANK, _A), (_BLANK, _A, _B))
+
+    def test_move_rename(self):
+        inst = self._makeOne()
+        oids = self._populate(
+            inst, ['/', '/a', '/a/b', '/a/b/c', '/a/z', '/z'])
+        result = inst.move((_BLANK, _A), (_BLANK, _B))
+        self.assertEqual(
+            sorted(result),
+            sorted([oids['/a'], oids['/a/b'], oids['/a/b/c'], oids['/a/z']])
+            )
+        self._assertMovedLike(inst, oids, [('/a', '/b')])
+
+    def test_move_rename_does_not_touch_ancestors(self):
+        inst = self._makeOne()
+        self._populate(inst, ['/', '/a', '/a/b'])
+        root_omap = inst.pathindex[(_BLANK,)]
+        before = dict([(k, list(v)) for k, v in root_omap.items()])
+        inst.move((_BLANK, _A), (_BLANK, _Z))
+        after = dict([(k, list(v)) for k, v in root_omap.items()])
+        self.assertEqual(before, after)
+
+    def test_move_deeper(self):
+        inst = self._makeOne()
+        oids = self._populate(
+            inst, ['/', '/a', '/a/b', '/a/b/c', '/z'])
+        inst.move((_BLANK, _A, _B), (_BLANK, _Z, _B))
+        self._assertMovedLike(inst, oids, [('/a/b', '/z/b')])
+
+    def test_move_to_different_depth(self):
+        inst = self._makeOne()
+        oids = self._populate(
+            inst, ['/', '/a', '/a/b', '/a/b/c', '/z'])
+        inst.move((_BLANK, _A, _B), (_BLANK, _Z, _A, _B))
+        self._assertMovedLike(inst, oids, [('/a/b', '/z/a/b')])
+        inst.move((_BLANK, _Z, _A, _B), (_BLANK, _C))
+        self._assertMovedLike(inst, oids, [('/a/b', '/c')])
+
+    def test_move_merges_existing_prefix(self):
+        inst = self._makeOne()
+        oids = self._populate(inst, ['/', '/a', '/a/b', '/z/a/b'])
+        inst.move((_BLANK, _A), (_BLANK, _Z, _A))
+        self.assertEqual(
+            set(inst.pathindex[(_BLANK, _Z, _A)][1]),
+            set([oids['/a/b'], oids['/z/a/b']]))
+        self.assertEqual(
+            set(inst.pathlookup((_BLANK, _Z))),
+            set([oids['/a'], oids['/a/b'], oids['/z/a/b']]))
+
+    def test_move_keeps_references_and_extents(self):
+        inst = self._makeOne()
+        oids = self._populate(inst, ['/', '/a', '/a/b', '/z'])
+        inst.connect(oids['/a/b'], oids['/z'], 'reftype')
+        inst.move((_BLANK, _A), (_BLANK, _Z, _A))
+        self.assertEqual(
+            list(inst.targetids(oids['/a/b'], 'reftype')), [oids['/z']])
+        self.assertEqual(
+            len(inst.get_extent('pyramid.testing.DummyResource')), 4)
+
     def test_pathlookup_not_valid(self):
         inst = self._makeOne()
         self.assertRaises(ValueError, inst.pathlookup, 1)
@@ -251,6 +577,55 @@ class TestObjectMap(unittest.TestCase):
         result = inst.pathcount(obj)
         self.assertEqual(result, 0)
 
+    def test_postorder_not_valid(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, list, inst.postorder(1))
+
+    def test_postorder_notexist(self):
+        inst = self._makeOne()
+        self.assertEqual(list(inst.postorder((_BLANK, _A))), [])
+
+    def _addPostorderTree(self, inst):
+        for path in ('/', '/a', '/a/b', '/a/b/c', '/a/c', '/ab', '/z'):
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+
+    def _postorderPaths(self, inst, obj_or_path_tuple, **kw):
+        return [ '/'.join(inst.path_for(oid)) or '/'
+                 for oid in inst.postorder(obj_or_path_tuple, **kw) ]
+
+    def test_postorder(self):
+        inst = self._makeOne()
+        self._addPostorderTree(inst)
+        self.assertEqual(
+            self._postorderPaths(inst, (_BLANK,)),
+            ['/a/b/c', '/a/b', '/a/c', '/a', '/ab', '/z', '/'],
+            )
+
+    def test_postorder_traversable_object(self):
+        inst = self._makeOne()
+        self._addPostorderTree(inst)
+        self.assertEqual(
+            self._postorderPaths(inst, resource('/a')),
+            ['/a/b/c', '/a/b', '/a/c', '/a'],
+            )
+
+    def test_postorder_include_origin_false(self):
+        inst = self._makeOne()
+        self._addPostorderTree(inst)
+        self.assertEqual(
+            self._postorderPaths(inst, (_BLANK, _A), include_origin=False),
+            ['/a/b/c', '/a/b', '/a/c'],
+            )
+
+    def test_postorder_missing_parent(self):
+        inst = self._makeOne()
+        for path in ('/a/b', '/a/c/d'):
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+        self.assertEqual(
+            self._postorderPaths(inst, (_BLANK,)), ['/a/b', '/a/c/d'])
+
     def test_navgen_notexist(self):
         inst = self._makeOne()
         result = inst.navgen((_BLANK,), 99)
@@ -633,6 +1008,72 @@ class TestObjectMap(unittest.TestCase):
         inst.referencemap = DummyReferenceMap(targetids=[2])
         self.assertEqual(list(inst.targetids(1, 'ref')), [2])
 
+    def _makeGraph(self):
+        # 1 -a-> 2 -a-> 3 -a-> 1 (a cycle), 3 -b-> 4 -b-> 5, 2 -c-> 6
+        inst = self._makeOne()
+        for oid in range(1, 8):
+            inst.objectid_to_path[oid] = (_BLANK, str(oid))
+        for source, target, reftype in ((1, 2, 'a'), (2, 3, 'a'),
+                                        (3, 1, 'a'), (3, 4, 'b'),
+                                        (4, 5, 'b'), (2, 6, 'c')):
+            inst.connect(source, target, reftype)
+        return inst
+
+    def test_reachable_targetids(self):
+        inst = self._makeGraph()
+        result = inst.reachable_targetids(1, 'a')
+        self.assertEqual(result.__class__, inst.family.IF.Set)
+        self.assertEqual(list(result), [2, 3])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, 'a', include_origin=True)),
+            [1, 2, 3])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, ('a', 'b'))), [2, 3, 4, 5])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, ['a', 'b', 'c'])),
+            [2, 3, 4, 5, 6])
+
+    def test_reachable_targetids_depth(self):
+        inst = self._makeGraph()
+        self.assertEqual(list(inst.reachable_targetids(1, 'a', depth=0)), [])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, 'a', depth=0,
+                                          include_origin=True)),
+            [1])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, ('a', 'b'), depth=1)), [2])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, ('a', 'b'), depth=3)),
+            [2, 3, 4])
+
+    def test_reachable_targetids_ordered(self):
+        inst = self._makeGraph()
+        inst.connect(2, 7, 'a')
+        inst.order_targets(2, 'a', [7, 3])
+        self.assertEqual(
+            list(inst.reachable_targetids(1, 'a')), [2, 3, 7])
+
+    def test_reachable_targetids_unknown_reftype(self):
+        inst = self._makeGraph()
+        self.assertEqual(list(inst.reachable_targetids(1, 'z')), [])
+
+    def test_reachable_targetids_not_in_objectmap(self):
+        inst = self._makeGraph()
+        self.assertRaises(ValueError, inst.reachable_targetids, 100, 'a')
+
+    def test_reachable_sourceids(self):
+        inst = self._makeGraph()
+        self.assertEqual(
+            list(inst.reachable_sourceids(5, ('a', 'b'))), [1, 2, 3, 4])
+        self.assertEqual(list(inst.reachable_sourceids(5, 'b')), [3, 4])
+        self.assertEqual(
+            list(inst.reachable_sourceids(6, ('a', 'c'), depth=2)), [1, 2])
+
+    def test_reachable_with_object(self):
+        inst = self._makeGraph()
+        obj = testing.DummyResource(__oid__=4)
+        self.assertEqual(list(inst.reachable_targetids(obj, 'b')), [5])
+
     def test_sources(self):
         inst = self._makeOne()
         inst.objectid_to_path[1] = (_BLANK,)
@@ -803,6 +1244,19 @@ class TestReferenceSet(unittest.TestCase):
         self.assertEqual(list(refset.src2target[1]), [3])
         self.assertEqual(list(refset.target2src[2]), [4])
 
+    def test_disconnect_last_reference(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect(3, 2)
+        orphaned = []
+        refset.disconnect(1, 2, orphaned)
+        self.assertFalse(refset.is_source(1))
+        self.assertTrue(refset.is_target(2))
+        self.assertEqual(orphaned, [1])
+        refset.disconnect(3, 2, orphaned)
+        self.assertFalse(refset.is_target(2))
+        self.assertEqual(orphaned, [1, 3, 2])
+
     def test_disconnect_keyerrors(self):
         refset = self._makeOne()
         refset.src2target[1] = DummyTreeSet()
@@ -853,6 +1307,30 @@ class TestReferenceSet(unittest.TestCase):
             {5:DummyTreeSet([3])}
             )
 
+    def test_remove_orphaned(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect(3, 2)
+        refset.connect(2, 4)
+        refset.connect(4, 1)
+        orphaned = []
+        result = refset.remove([2, 10], orphaned)
+        self.assertEqual(list(result), [2])
+        # 1 and 3 are no longer sources, 4 no longer a target
+        self.assertEqual(sorted(orphaned), [1, 3, 4])
+        self.assertEqual(list(refset.src2target.keys()), [4])
+        self.assertEqual(list(refset.target2src.keys()), [1])
+
+    def test_remove_source_and_target(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect(2, 3)
+        refset.order_targets(1, [2])
+        result = refset.remove(refset.family.IF.Set([1, 2]))
+        self.assertEqual(list(result), [1, 2])
+        self.assertEqual(list(refset.src2target.keys()), [])
+        self.assertEqual(list(refset.target2src.keys()), [])
+
     def test_is_target_True(self):
         refset = self._makeOne()
         refset.target2src[1] = True
@@ -993,6 +1471,29 @@ class TestReferenceSet(unittest.TestCase):
         self.assertEqual(oids, refset.oidlist_class([3,2]))
         self.assertEqual(oids, refset.target2src[1])
 
+class Test_index_referencemap_oids(unittest.TestCase):
+    def _callFUT(self, root):
+        from ..evolve import index_referencemap_oids
+        return index_referencemap_oids(root)
+
+    def test_it(self):
+        from .. import ReferenceMap
+        refs = ReferenceMap()
+        refs.connect(1, 2, 'a')
+        refs.connect(2, 3, 'a')
+        refs.connect(1, 3, 'b')
+        expected = dict(refs.oid_reftypes)
+        del refs.oid_reftypes
+        self.assertEqual(refs.oid_reftypes, None)
+        root = Dummy()
+        root.__objectmap__ = Dummy()
+        root.__objectmap__.referencemap = refs
+        self._callFUT(root)
+        self.assertEqual(dict(refs.oid_reftypes), expected)
+        oid_reftypes = refs.oid_reftypes
+        self._callFUT(root) # idempotent
+        self.assertTrue(refs.oid_reftypes is oid_reftypes)
+
 class TestListSet(unittest.TestCase):
     def _makeOne(self, *arg, **kw):
         from substanced.objectmap import ListSet
@@ -1054,13 +1555,82 @@ class TestReferenceMap(unittest.TestCase):
         L = []
         refset1 = DummyReferenceSet()
         refset2 = DummyReferenceSet()
-        refset1.remove = lambda oids: L.append(oids)
-        refset2.remove = lambda oids: L.append(oids)
+        refset1.remove = lambda oids: L.append(list(oids))
+        refset2.remove = lambda oids: L.append(list(oids))
         map = {'reftype':refset1, 'reftype2':refset2}
         refs = self._makeOne(map)
+        self.assertEqual(refs.oid_reftypes, None)
         refs.remove([1,2])
         self.assertEqual(L, [[1,2], [1,2]])
 
+    def _connected(self):
+        refs = self._makeOne()
+        refs.connect(1, 2, 'a')
+        refs.connect(2, 3, 'a')
+        refs.connect(1, 3, 'b')
+        refs.connect(4, 5, 'c')
+        return refs
+
+    def test_connect_indexes_reftypes(self):
+        refs = self._connected()
+        self.assertEqual(
+            dict(refs.oid_reftypes),
+            {1:('a', 'b'), 2:('a',), 3:('a', 'b'), 4:('c',), 5:('c',)}
+            )
+
+    def test_remove_indexed(self):
+        refs = self._connected()
+        def fail(*arg):
+            raise AssertionError('should not be visited')
+        refs.refmap['c'].remove = fail
+        refs.remove(self._makeOne().family.IF.Set([2, 6, 7]))
+        self.assertEqual(
+            dict(refs.oid_reftypes),
+            {1:('b',), 3:('b',), 4:('c',), 5:('c',)}
+            )
+        self.assertEqual(dict(refs.refmap['a'].src2target), {})
+        self.assertEqual(dict(refs.refmap['a'].target2src), {})
+        self.assertFalse(refs.has_references(2))
+        self.assertTrue(refs.has_references(1))
+
+    def test_disconnect_indexed(self):
+        refs = self._connected()
+        refs.disconnect(4, 5, 'c')
+        self.assertFalse(refs.has_references(4))
+        self.assertFalse(refs.has_references(5))
+        refs.disconnect(1, 2, 'a')
+        self.assertEqual(refs.oid_reftypes[1], ('b',))
+        self.assertEqual(refs.oid_reftypes[2], ('a',))
+        self.assertTrue(refs.has_references(2))
+        self.assertFalse(refs.has_references(1, 'a'))
+
+    def test_remove_indexed_keeps_partially_referenced(self):
+        refs = self._connected()
+        refs.connect(6, 3, 'a')
+        refs.remove([2])
+        self.assertEqual(refs.oid_reftypes[3], ('a', 'b'))
+        self.assertEqual(refs.oid_reftypes[1], ('b',))
+        self.assertEqual(list(refs.sourceids(3, 'a')), [6])
+
+    def test_remove_indexed_nothing_referenced(self):
+        refs = self._connected()
+        refs.remove([10, 11])
+        self.assertEqual(len(refs.oid_reftypes), 5)
+
+    def test_has_references_indexed(self):
+        refs = self._connected()
+        refs.refmap = None # not consulted
+        self.assertTrue(refs.has_references(5))
+        self.assertFalse(refs.has_references(6))
+
+    def test_order_indexes_reftypes(self):
+        refs = self._makeOne()
+        refs.order_sources(1, 'a')
+        refs.order_targets(2, 'b')
+        refs.order_targets(3, 'b', None)
+        self.assertEqual(dict(refs.oid_reftypes), {1:('a',), 2:('b',)})
+        self.assertTrue(refs.has_references(1))
+
     def test_has_references_True(self):
         refset = DummyReferenceSet(True)
         map = {'reftype':refset}
@@ -1137,6 +1707,717 @@ class TestReferenceMap(unittest.TestCase):
             )
         
         
+class TestObjectMapCompactPathindex(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, compact_pathindex=True):
+        from .. import ObjectMap
+        return ObjectMap(DummyRoot(), compact_pathindex=compact_pathindex)
+
+    def _makePair(self, paths):
+        compact = self._makeOne()
+        nested = self._makeOne(compact_pathindex=False)
+        for path in paths:
+            thing = resource(path)
+            oid = compact.add(thing, thing.path_tuple)
+            thing = resource(path)
+            thing.__oid__ = oid
+            nested.add(thing, thing.path_tuple)
+        return compact, nested
+
+    def _assertSameAnswers(self, compact, nested, paths):
+        for path in paths:
+            path_tuple = split(path)
+            for depth in (None, 0, 1, 2, 3, 5):
+                for include_origin in (True, False):
+                    self.assertEqual(
+                        sorted(compact.pathlookup(
+                            path_tuple, depth, include_origin)),
+                        sorted(nested.pathlookup(
+                            path_tuple, depth, include_origin)),
+                        )
+                    self.assertEqual(
+                        compact.pathcount(path_tuple, depth, include_origin),
+                        nested.pathcount(path_tuple, depth, include_origin),
+                        )
+                if depth is not None:
+                    self.assertEqual(
+                        compact.navgen(path_tuple, depth),
+                        nested.navgen(path_tuple, depth),
+                        )
+
+    _paths = ['/', '/a', '/a/b', '/a/b/c', '/a/c', '/a/c/d', '/z',
+              '/orphan/x/y', '/orphan/x/z']
+    _queries = _paths + ['/orphan', '/orphan/x', '/nonexistent']
+
+    def test_ctor(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.pathindex, None)
+        self.assertEqual(dict(inst.childindex), {})
+
+    def test_add(self):
+        inst = self._makeOne()
+        for path in ('/a/b/c', '/a', '/z'):
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+        self.assertEqual(
+            dict([(k, list(v)) for k, v in inst.childindex.items()]),
+            {(_BLANK,): [_A, _Z],
+             (_BLANK, _A): [_B],
+             (_BLANK, _A, _B): [_C]}
+            )
+
+    def test_same_answers_as_nested(self):
+        compact, nested = self._makePair(self._paths)
+        self._assertSameAnswers(compact, nested, self._queries)
+
+    def test_remove(self):
+        compact, nested = self._makePair(self._paths)
+        oid = compact.objectid_for(split('/a/c'))
+        result = compact.remove(oid)
+        self.assertEqual(sorted(result), sorted(nested.remove(oid)))
+        self.assertEqual(compact.path_for(oid), None)
+        self.assertEqual(compact.objectid_for(split('/a/c/d')), None)
+        self.assertEqual(
+            dict(compact.objectid_to_path), dict(nested.objectid_to_path))
+        self.assertEqual(list(compact.childindex[(_BLANK, _A)]), [_B])
+        self._assertSameAnswers(compact, nested, self._queries)
+
+    def test_remove_prunes_orphan_prefixes(self):
+        compact, nested = self._makePair(self._paths)
+        compact.remove(split('/orphan/x/y'))
+        compact.remove(split('/orphan/x/z'))
+        self.assertFalse((_BLANK, u('orphan')) in compact.childindex)
+        self.assertFalse(u('orphan') in compact.childindex[(_BLANK,)])
+
+    def test_remove_nonexistent(self):
+        compact, nested = self._makePair(self._paths)
+        result = compact.remove(split('/nonexistent'))
+        self.assertEqual(list(result), [])
+
+    def test_remove_keeps_parent_edge_when_parent_exists(self):
+        compact, nested = self._makePair(['/', '/a', '/a/b'])
+        compact.remove(split('/a/b'))
+        self.assertEqual(list(compact.childindex[(_BLANK,)]), [_A])
+        self.assertFalse((_BLANK, _A) in compact.childindex)
+
+    def test_move(self):
+        compact, nested = self._makePair(self._paths)
+        for old, new in (('/a/c', '/z/c'), ('/a', '/b'), ('/z', '/b/q/z')):
+            self.assertEqual(
+                sorted(compact.move(split(old), split(new))),
+                sorted(nested.move(split(old), split(new))),
+                )
+            self.assertEqual(
+                dict(compact.objectid_to_path), dict(nested.objectid_to_path))
+        self._assertSameAnswers(
+            compact, nested, self._queries + ['/b', '/b/q', '/b/q/z/c'])
+
+    def test_move_merges_existing_prefix(self):
+        compact, nested = self._makePair(['/', '/a', '/a/b', '/z/a/c'])
+        compact.move(split('/a'), split('/z/a'))
+        self.assertEqual(
+            list(compact.childindex[(_BLANK, _Z, _A)]), [_B, _C])
+        self.assertEqual(list(compact.childindex[(_BLANK,)]), [_Z])
+
+    def test_evolve_compact_objectmap_pathindex(self):
+        from ..evolve import compact_objectmap_pathindex
+        compact, nested = self._makePair(self._paths)
+        root = Dummy()
+        root.__objectmap__ = nested
+        compact_objectmap_pathindex(root)
+        self.assertEqual(nested.pathindex, None)
+        self.assertEqual(
+            dict([(k, list(v)) for k, v in nested.childindex.items()]),
+            dict([(k, list(v)) for k, v in compact.childindex.items()]),
+            )
+        childindex = nested.childindex
+        compact_objectmap_pathindex(root) # idempotent
+        self.assertTrue(nested.childindex is childindex)
+
+class TestPathNames(unittest.TestCase):
+    def _makeOne(self):
+        from .. import PathNames
+        return PathNames()
+
+    def test_encode_decode(self):
+        inst = self._makeOne()
+        packed = inst.encode((_BLANK, _A, _B), intern=True)
+        self.assertEqual(len(packed), 12)
+        self.assertEqual(len(inst), 3)
+        self.assertEqual(inst.decode(packed), (_BLANK, _A, _B))
+        self.assertEqual(inst.encode((_BLANK, _A, _B)), packed)
+        self.assertEqual(inst.decode(inst.encode(())), ())
+
+    def test_encode_unknown_name(self):
+        inst = self._makeOne()
+        inst.encode((_BLANK, _A), intern=True)
+        self.assertEqual(inst.encode((_BLANK, _B)), None)
+        self.assertEqual(len(inst), 2)
+
+    def test_encode_prefix(self):
+        inst = self._makeOne()
+        parent = inst.encode((_BLANK, _A), intern=True)
+        child = inst.encode((_BLANK, _A, _B), intern=True)
+        self.assertTrue(child.startswith(parent))
+
+    def test_nameid(self):
+        import zlib
+        inst = self._makeOne()
+        self.assertEqual(inst.nameid(_A), None)
+        nameid = inst.nameid(_A, intern=True)
+        self.assertEqual(nameid, zlib.crc32(b'a') & 0xffffffff)
+        self.assertEqual(inst.nameid(_A), nameid)
+
+    def test_nameid_collision(self):
+        import zlib
+        inst = self._makeOne()
+        nameid = zlib.crc32(b'a') & 0xffffffff
+        inst.names[nameid] = _B
+        inst.names[nameid + 1] = _C
+        self.assertEqual(inst.nameid(_A), None)
+        self.assertEqual(inst.nameid(_A, intern=True), nameid + 2)
+        self.assertEqual(inst.nameid(_A), nameid + 2)
+
+    def test_nameid_wraps(self):
+        inst = self._makeOne()
+        inst.maxid = 1 # the checksum of 'a' is odd
+        inst.names[1] = _C
+        self.assertEqual(inst.nameid(_A, intern=True), 0)
+
+class TestPathKeyedMap(unittest.TestCase):
+    def _makeOne(self):
+        from .. import (
+            PathKeyedMap,
+            PathNames,
+            )
+        return PathKeyedMap(PathNames())
+
+    def _makeFilled(self):
+        inst = self._makeOne()
+        inst.update([((_BLANK,), 1), ((_BLANK, _A), 2), ((_BLANK, _A, _B), 3),
+                     ((_BLANK, _Z), 4)])
+        return inst
+
+    def test_mapping(self):
+        inst = self._makeOne()
+        self.assertEqual(len(inst), 0)
+        inst[(_BLANK, _A)] = 1
+        self.assertEqual(len(inst), 1)
+        self.assertEqual(inst[(_BLANK, _A)], 1)
+        self.assertEqual(inst.get((_BLANK, _A)), 1)
+        self.assertTrue((_BLANK, _A) in inst)
+        self.assertFalse((_BLANK,) in inst)
+        self.assertFalse((_BLANK, _B) in inst)
+        self.assertEqual(inst.get((_BLANK, _B), 2), 2)
+        self.assertEqual(inst.get((_BLANK,), 2), 2)
+        self.assertRaises(KeyError, inst.__getitem__, (_BLANK, _B))
+        self.assertEqual(list(inst), [(_BLANK, _A)])
+        self.assertEqual(list(inst.values()), [1])
+        del inst[(_BLANK, _A)]
+        self.assertEqual(len(inst), 0)
+        self.assertRaises(KeyError, inst.__delitem__, (_BLANK, _A))
+        self.assertRaises(KeyError, inst.__delitem__, (_BLANK, _B))
+
+    def test_setdefault(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.setdefault((_BLANK, _A), 1), 1)
+        self.assertEqual(inst.setdefault((_BLANK, _A), 2), 1)
+
+    def test_pop(self):
+        inst = self._makeFilled()
+        self.assertEqual(inst.pop((_BLANK, _A)), 2)
+        self.assertEqual(inst.pop((_BLANK, _A), None), None)
+        self.assertEqual(inst.pop((_BLANK, _C), None), None)
+        self.assertRaises(KeyError, inst.pop, (_BLANK, _A))
+        self.assertRaises(KeyError, inst.pop, (_BLANK, _C))
+
+    def test_keys_and_items_min(self):
+        inst = self._makeFilled()
+        result = []
+        for k, v in inst.items(min=(_BLANK, _A)):
+            if k[:2] != (_BLANK, _A):
+                break
+            result.append((k, v))
+        self.assertEqual(
+            result, [((_BLANK, _A), 2), ((_BLANK, _A, _B), 3)])
+        self.assertEqual(
+            sorted(inst.keys()),
+            [(_BLANK,), (_BLANK, _A), (_BLANK, _A, _B), (_BLANK, _Z)])
+
+    def test_subtree_values(self):
+        inst = self._makeFilled()
+        self.assertEqual(inst.subtree_values((_BLANK, _A)), [2, 3])
+        self.assertEqual(sorted(inst.subtree_values((_BLANK,))), [1, 2, 3, 4])
+        self.assertEqual(inst.subtree_values((_BLANK, _B)), [])
+        self.assertEqual(inst.subtree_values((_BLANK, _C)), [])
+
+    def test_keys_and_items_min_unknown_name(self):
+        inst = self._makeFilled()
+        self.assertEqual(list(inst.keys(min=(_BLANK, _C))), [])
+        self.assertEqual(list(inst.items(min=(_BLANK, _C))), [])
+
+class TestPathValuedMap(unittest.TestCase):
+    def _makeOne(self):
+        from .. import (
+            PathValuedMap,
+            PathNames,
+            )
+        return PathValuedMap(PathNames())
+
+    def test_mapping(self):
+        inst = self._makeOne()
+        inst[2] = (_BLANK, _A)
+        inst.update([(1, (_BLANK,)), (3, (_BLANK, _A, _B))])
+        self.assertEqual(len(inst), 3)
+        self.assertEqual(inst[2], (_BLANK, _A))
+        self.assertEqual(inst.get(3), (_BLANK, _A, _B))
+        self.assertEqual(inst.get(4), None)
+        self.assertTrue(2 in inst)
+        self.assertFalse(4 in inst)
+        self.assertEqual(list(inst), [1, 2, 3])
+        self.assertEqual(list(inst.keys(2)), [2, 3])
+        self.assertEqual(inst.minKey(2), 2)
+        self.assertEqual(
+            list(inst.items()),
+            [(1, (_BLANK,)), (2, (_BLANK, _A)), (3, (_BLANK, _A, _B))])
+        self.assertEqual(
+            list(inst.values()), [(_BLANK,), (_BLANK, _A), (_BLANK, _A, _B)])
+        del inst[1]
+        self.assertEqual(inst.pop(2), (_BLANK, _A))
+        self.assertEqual(inst.pop(2, None), None)
+        self.assertRaises(KeyError, inst.pop, 2)
+        self.assertEqual(list(inst), [3])
+
+class TestObjectMapInternedPaths(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, intern_paths=True, compact_pathindex=False):
+        from .. import ObjectMap
+        return ObjectMap(DummyRoot(), intern_paths=intern_paths,
+                         compact_pathindex=compact_pathindex)
+
+    def _makePair(self, paths, compact_pathindex=False):
+        interned = self._makeOne(compact_pathindex=compact_pathindex)
+        plain = self._makeOne(False, compact_pathindex=compact_pathindex)
+        for path in paths:
+            thing = resource(path)
+            oid = interned.add(thing, thing.path_tuple)
+            thing = resource(path)
+            thing.__oid__ = oid
+            plain.add(thing, thing.path_tuple)
+        return interned, plain
+
+    def _assertSameAnswers(self, interned, plain, paths):
+        self.assertEqual(
+            dict(interned.objectid_to_path.items()),
+            dict(plain.objectid_to_path.items()),
+            )
+        for path in paths:
+            path_tuple = split(path)
+            self.assertEqual(
+                interned.objectid_for(path_tuple),
+                plain.objectid_for(path_tuple),
+                )
+            self.assertEqual(
+                sorted(interned.postorder(path_tuple)),
+                sorted(plain.postorder(path_tuple)),
+                )
+            for depth in (None, 0, 1, 2, 3, 5):
+                for include_origin in (True, False):
+                    self.assertEqual(
+                        sorted(interned.pathlookup(
+                            path_tuple, depth, include_origin)),
+                        sorted(plain.pathlookup(
+                            path_tuple, depth, include_origin)),
+                        )
+                    self.assertEqual(
+                        interned.pathcount(path_tuple, depth, include_origin),
+                        plain.pathcount(path_tuple, depth, include_origin),
+                        )
+                if depth is not None:
+                    self.assertEqual(
+                        interned.navgen(path_tuple, depth),
+                        plain.navgen(path_tuple, depth),
+                        )
+
+    _paths = ['/', '/a', '/a/b', '/a/b/c', '/a/c', '/a/c/d', '/z',
+              '/orphan/x/y', '/orphan/x/z']
+    _queries = _paths + ['/orphan', '/orphan/x', '/nonexistent']
+
+    def test_ctor(self):
+        from .. import (
+            PathKeyedMap,
+            PathValuedMap,
+            )
+        inst = self._makeOne()
+        self.assertEqual(len(inst.pathnames), 0)
+        self.assertEqual(inst.objectid_to_path.__class__, PathValuedMap)
+        for btree in (inst.path_to_objectid, inst.pathindex,
+                      inst.pathcounts):
+            self.assertEqual(btree.__class__, PathKeyedMap)
+            self.assertTrue(btree.pathnames is inst.pathnames)
+        inst = self._makeOne(compact_pathindex=True)
+        self.assertEqual(inst.childindex.__class__, PathKeyedMap)
+
+    def test_add(self):
+        inst = self._makeOne()
+        thing = resource('/a/b')
+        oid = inst.add(thing, thing.path_tuple)
+        self.assertEqual(len(inst.pathnames), 3)
+        self.assertEqual(inst.path_for(oid), (_BLANK, _A, _B))
+        packed = inst.pathnames.encode((_BLANK, _A, _B))
+        self.assertEqual(inst.path_to_objectid.data[packed], oid)
+        self.assertEqual(inst.objectid_to_path.data[oid], packed)
+
+    def test_same_answers(self):
+        for compact_pathindex in (False, True):
+            interned, plain = self._makePair(self._paths, compact_pathindex)
+            self._assertSameAnswers(interned, plain, self._queries)
+
+    def test_remove(self):
+        for compact_pathindex in (False, True):
+            interned, plain = self._makePair(self._paths, compact_pathindex)
+            oid = interned.objectid_for(split('/a/c'))
+            self.assertEqual(
+                sorted(interned.remove(oid)), sorted(plain.remove(oid)))
+            self.assertEqual(interned.path_for(oid), None)
+            self._assertSameAnswers(interned, plain, self._queries)
+
+    def test_move(self):
+        for compact_pathindex in (False, True):
+            interned, plain = self._makePair(self._paths, compact_pathindex)
+            for old, new in (('/a/c', '/z/c'), ('/a', '/b'),
+                             ('/z', '/b/q/z')):
+                self.assertEqual(
+                    sorted(interned.move(split(old), split(new))),
+                    sorted(plain.move(split(old), split(new))),
+                    )
+            self._assertSameAnswers(
+                interned, plain, self._queries + ['/b', '/b/q', '/b/q/z/c'])
+
+    def test_evolve_intern_objectmap_paths(self):
+        from .. import PathKeyedMap
+        from ..evolve import intern_objectmap_paths
+        for compact_pathindex in (False, True):
+            interned, plain = self._makePair(self._paths, compact_pathindex)
+            root = Dummy()
+            root.__objectmap__ = plain
+            intern_objectmap_paths(root)
+            self.assertEqual(len(plain.pathnames), len(interned.pathnames))
+            self.assertEqual(plain.path_to_objectid.__class__, PathKeyedMap)
+            self._assertSameAnswers(plain, interned, self._queries)
+            pathnames = plain.pathnames
+            intern_objectmap_paths(root) # idempotent
+            self.assertTrue(plain.pathnames is pathnames)
+
+class TestPathCount(unittest.TestCase):
+    def _makeOne(self):
+        from .. import PathCount
+        return PathCount()
+
+    def test_change_and_count(self):
+        inst = self._makeOne()
+        inst.change({0:1, 1:2}, 1)
+        inst.change({2:1})
+        self.assertEqual(inst.counts, {1:1, 2:3})
+        self.assertEqual(inst.count(), 4)
+        self.assertEqual(inst.count(1), 1)
+        self.assertEqual(inst.count(0), 0)
+        inst.change({1:-1, 2:-3})
+        self.assertEqual(inst.counts, {})
+        self.assertEqual(inst.count(), 0)
+
+    def test__p_resolveConflict(self):
+        inst = self._makeOne()
+        old = {'counts':{1:2, 2:1}}
+        committed = {'counts':{1:3, 2:1}}
+        new = {'counts':{1:2, 3:4}}
+        self.assertEqual(
+            inst._p_resolveConflict(old, committed, new),
+            {'counts':{1:3, 3:4}}
+            )
+
+    def test__p_resolveConflict_empty(self):
+        inst = self._makeOne()
+        self.assertEqual(
+            inst._p_resolveConflict({}, {'counts':{1:1}}, {'counts':{2:1}}),
+            {'counts':{1:1, 2:1}}
+            )
+
+class TestObjectMapPathCounts(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, compact_pathindex=False):
+        from .. import ObjectMap
+        return ObjectMap(DummyRoot(), compact_pathindex=compact_pathindex)
+
+    def _populate(self, inst, paths):
+        for path in paths:
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+
+    def _assertCounted(self, inst):
+        # compare the counters with counting oid sets
+        pathcounts = inst.pathcounts
+        queries = set()
+        for path_tuple in inst.path_to_objectid.keys():
+            for x in range(1, len(path_tuple) + 1):
+                queries.add(path_tuple[:x])
+        queries.add(split('/nonexistent'))
+        for path_tuple in queries:
+            for depth in (None, 0, 1, 2, 5):
+                for include_origin in (True, False):
+                    counted = inst.pathcount(path_tuple, depth, include_origin)
+                    inst.pathcounts = None
+                    try:
+                        expected = inst.pathcount(
+                            path_tuple, depth, include_origin)
+                    finally:
+                        inst.pathcounts = pathcounts
+                    self.assertEqual(counted, expected, (path_tuple, depth))
+        # counters of removed subtrees are dropped
+        for path_tuple in pathcounts.keys():
+            self.assertTrue(path_tuple in queries, path_tuple)
+
+    _paths = ['/', '/a', '/a/b', '/a/b/c', '/a/c', '/a/c/d', '/z',
+              '/orphan/x/y', '/orphan/x/z']
+
+    def test_ctor(self):
+        inst = self._makeOne()
+        self.assertEqual(dict(inst.pathcounts), {})
+
+    def test_add(self):
+        inst = self._makeOne()
+        self._populate(inst, ['/a/b/c', '/a', '/z'])
+        self.assertEqual(
+            dict([ (k, v.counts) for k, v in inst.pathcounts.items() ]),
+            {(_BLANK,): {1:2, 3:1},
+             (_BLANK, _A): {2:1},
+             (_BLANK, _A, _B): {1:1}},
+            )
+        self.assertEqual(inst.pathcount(split('/')), 3)
+        self.assertEqual(inst.pathcount(split('/'), depth=2), 2)
+
+    def _check_operations(self, compact_pathindex):
+        inst = self._makeOne(compact_pathindex)
+        self._populate(inst, self._paths)
+        self._assertCounted(inst)
+        for old, new in (('/a/c', '/z/c'), ('/a', '/b'), ('/z', '/b/q/z'),
+                         ('/b/b', '/b/e'), ('/b/e/c', '/b/c'),
+                         ('/orphan/x/y', '/b/c/y')):
+            inst.move(split(old), split(new))
+            self._assertCounted(inst)
+        for path in ('/b/q/z/c/d', '/b/c', '/b/q', '/nonexistent'):
+            inst.remove(split(path))
+            self._assertCounted(inst)
+        self._populate(inst, ['/b/c', '/b/c/d/e'])
+        self._assertCounted(inst)
+
+    def test_operations_nested(self):
+        self._check_operations(False)
+
+    def test_operations_compact(self):
+        self._check_operations(True)
+
+    def test_move_merges_existing_prefix(self):
+        inst = self._makeOne()
+        self._populate(inst, ['/', '/a', '/a/b', '/z/a/c'])
+        inst.move(split('/a'), split('/z/a'))
+        self._assertCounted(inst)
+        self.assertEqual(inst.pathcount(split('/z/a')), 3)
+
+    def test_uncounted(self):
+        inst = self._makeOne()
+        inst.pathcounts = None
+        self._populate(inst, self._paths)
+        inst.move(split('/a'), split('/b'))
+        inst.remove(split('/b/c'))
+        self.assertEqual(inst.pathcounts, None)
+        self.assertEqual(inst.pathcount(split('/b')), 3)
+
+    def test_evolve_count_objectmap_paths(self):
+        from ..evolve import count_objectmap_paths
+        inst = self._makeOne()
+        self._populate(inst, self._paths)
+        expected = dict(
+            [ (k, v.counts) for k, v in inst.pathcounts.items() ])
+        inst.pathcounts = None
+        root = Dummy()
+        root.__objectmap__ = inst
+        count_objectmap_paths(root)
+        self.assertEqual(
+            dict([ (k, v.counts) for k, v in inst.pathcounts.items() ]),
+            expected,
+            )
+        pathcounts = inst.pathcounts
+        count_objectmap_paths(root) # idempotent
+        self.assertTrue(inst.pathcounts is pathcounts)
+
+class TestObjectCache(unittest.TestCase):
+    def _makeOne(self, size=3):
+        from .. import ObjectCache
+        return ObjectCache(size)
+
+    def test_get_miss(self):
+        from .. import _marker
+        inst = self._makeOne()
+        self.assertTrue(inst.get(1, (_BLANK, _A)) is _marker)
+        self.assertEqual(inst.misses, 1)
+
+    def test_set_and_get(self):
+        inst = self._makeOne()
+        obj = object()
+        inst.set(1, (_BLANK, _A), obj)
+        self.assertTrue(inst.get(1, (_BLANK, _A)) is obj)
+        self.assertEqual(inst.hits, 1)
+
+    def test_get_other_path(self):
+        from .. import _marker
+        inst = self._makeOne()
+        inst.set(1, (_BLANK, _A), object())
+        self.assertTrue(inst.get(1, (_BLANK, _B)) is _marker)
+        self.assertEqual(inst.misses, 1)
+
+    def test_set_evicts_least_recently_used(self):
+        from .. import _marker
+        inst = self._makeOne(size=3)
+        for oid in (1, 2, 3):
+            inst.set(oid, (_BLANK, oid), oid)
+        inst.get(1, (_BLANK, 1))
+        inst.set(4, (_BLANK, 4), 4)
+        self.assertEqual(sorted(inst.entries), [1, 3, 4])
+        inst.set(3, (_BLANK, 3), 3) # replacing doesn't evict
+        self.assertEqual(sorted(inst.entries), [1, 3, 4])
+        self.assertTrue(inst.get(2, (_BLANK, 2)) is _marker)
+
+    def test_set_evicts_a_quarter(self):
+        inst = self._makeOne(size=8)
+        for oid in range(9):
+            inst.set(oid, (_BLANK, oid), oid)
+        self.assertEqual(sorted(inst.entries), [2, 3, 4, 5, 6, 7, 8])
+
+    def test_invalidate(self):
+        inst = self._makeOne()
+        inst.set(1, (_BLANK, _A), object())
+        inst.set(2, (_BLANK, _B), object())
+        inst.invalidate([1, 3])
+        self.assertEqual(list(inst.entries), [2])
+
+    def test_info(self):
+        inst = self._makeOne()
+        inst.set(1, (_BLANK, _A), object())
+        inst.get(1, (_BLANK, _A))
+        inst.get(2, (_BLANK, _B))
+        self.assertEqual(
+            inst.info(), {'hits':1, 'misses':1, 'size':1, 'maxsize':3}
+            )
+
+class TestObjectMapObjectCache(unittest.TestCase):
+    def _makeOne(self, size=10):
+        from .. import ObjectMap
+        inst = ObjectMap(DummyRoot(), object_cache_size=size)
+        found = []
+        def find_resource(context, path_tuple):
+            found.append(path_tuple)
+            if path_tuple == (_BLANK, _Z):
+                raise KeyError(_Z)
+            return path_tuple
+        inst._find_resource = find_resource
+        return inst, found
+
+    def _add(self, inst, oid, path_tuple):
+        obj = Dummy()
+        obj.__oid__ = oid
+        inst.add(obj, path_tuple)
+
+    def test_disabled(self):
+        inst, found = self._makeOne(size=None)
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for(1)
+        inst.object_for(1)
+        self.assertEqual(found, [(_BLANK, _A), (_BLANK, _A)])
+        self.assertEqual(inst.object_cache_info(), None)
+
+    def test_object_for_cached(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        self.assertEqual(inst.object_for(1), (_BLANK, _A))
+        self.assertEqual(inst.object_for(1), (_BLANK, _A))
+        self.assertEqual(found, [(_BLANK, _A)])
+        self.assertEqual(
+            inst.object_cache_info(),
+            {'hits':1, 'misses':1, 'size':1, 'maxsize':10}
+            )
+
+    def test_object_for_not_found_not_cached(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _Z))
+        self.assertEqual(inst.object_for(1), None)
+        self.assertEqual(inst.object_for(1), None)
+        self.assertEqual(found, [(_BLANK, _Z), (_BLANK, _Z)])
+
+    def test_object_for_path_tuple_or_context_not_cached(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for((_BLANK, _A))
+        inst.object_for(1, context=DummyRoot())
+        self.assertEqual(inst.object_cache_info()['size'], 0)
+
+    def test_path_changed_by_other_connection(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for(1)
+        inst.objectid_to_path[1] = (_BLANK, _B)
+        self.assertEqual(inst.object_for(1), (_BLANK, _B))
+        self.assertEqual(found, [(_BLANK, _A), (_BLANK, _B)])
+
+    def test_remove_invalidates(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for(1)
+        inst.remove(1)
+        self.assertEqual(inst.object_cache_info()['size'], 0)
+
+    def test_move_invalidates(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for(1)
+        inst.move((_BLANK, _A), (_BLANK, _B))
+        self.assertEqual(inst.object_cache_info()['size'], 0)
+        self.assertEqual(inst.object_for(1), (_BLANK, _B))
+
+    def test_add_invalidates(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for(1)
+        inst.remove(1, moving=True)
+        inst._v_objectcache.set(1, (_BLANK, _A), 'stale')
+        self._add(inst, 1, (_BLANK, _A))
+        self.assertEqual(inst.object_for(1), (_BLANK, _A))
+
+    def test_size_changed(self):
+        inst, found = self._makeOne()
+        self._add(inst, 1, (_BLANK, _A))
+        inst.object_for(1)
+        inst.object_cache_size = 20
+        self.assertEqual(
+            inst.object_cache_info(),
+            {'hits':0, 'misses':0, 'size':0, 'maxsize':20}
+            )
+
 class TestExtentMap(unittest.TestCase):
     def _makeOne(self):
         from .. import ExtentMap
@@ -2761,7 +4042,7 @@ class DummyReferenceSet(object):
     def connect(self, src, target):
         self.connected.append((src, target))
 
-    def disconnect(self, src, target):
+    def disconnect(self, src, target, orphaned=None):
         self.disconnected.append((src, target))
 
     def targetids(self, src):
@@ -2817,3 +4098,22 @@ class DummyReferenceMap(dict):
     
 class DummyRoot(object):
     pass
+
+class DummyTraversable(dict):
+    __parent__ = None
+    traversed = []
+    # compare by identity rather than by contents
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+    def __getitem__(self, name):
+        DummyTraversable.traversed.append(name)
+        return dict.__getitem__(self, name)
+
+class DummyJar(object):
+    def __init__(self):
+        self.prefetched = []
+
+    def prefetch(self, objs):
+        self.prefetched.append(objs)
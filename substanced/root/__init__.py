@@ -2,6 +2,7 @@ import colander
 from zope.interface import implementer
 
 from pyramid.exceptions import ConfigurationError
+from pyramid.settings import asbool
 from pyramid.security import (
     Allow,
     ALL_PERMISSIONS,
@@ -62,7 +63,25 @@ class Root(Folder):
         # dump system loader to successfully load a root object; if this were
         # done in __init__, the oid of the root object would not be resettable,
         # and loaded references to the root object could not be resolved.
-        self.__objectmap__ = ObjectMap(self)
+        settings = registry.settings
+        compact_pathindex = asbool(
+            settings.get('substanced.objectmap.compact_pathindex', False))
+        intern_paths = asbool(
+            settings.get('substanced.objectmap.intern_paths', False))
+        oid_block_size = settings.get('substanced.objectmap.oid_block_size')
+        if oid_block_size:
+            oid_block_size = int(oid_block_size)
+        object_cache_size = settings.get(
+            'substanced.objectmap.object_cache_size')
+        if object_cache_size:
+            object_cache_size = int(object_cache_size)
+        self.__objectmap__ = ObjectMap(
+            self,
+            compact_pathindex=compact_pathindex,
+            oid_block_size=oid_block_size,
+            object_cache_size=object_cache_size,
+            intern_paths=intern_paths,
+            )
         self.__objectmap__.add(self, ('',))
 
         catalogs = registry.content.create('Catalogs')
@@ -72,7 +91,6 @@ class Root(Folder):
         # self-index so catalogs service shows up in folder contents
         oid = get_oid(catalogs)
         catalog.index_doc(oid, catalogs)
-        settings = registry.settings
         password = settings.get('substanced.initial_password')
         if password is None:
             raise ConfigurationError(
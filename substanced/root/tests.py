@@ -74,6 +74,56 @@ class TestRoot(unittest.TestCase):
         self.assertFalse(registry.created.__sdi_deletable__)
         self.assertTrue(locks.__is_service__)
 
+    def test_after_create_compact_pathindex(self):
+        settings = {
+            'substanced.initial_password':'pass',
+            'substanced.objectmap.compact_pathindex':'true',
+            }
+        registry = self._makeRegistry(settings)
+        inst = self._makeOne()
+        inst.__oid__ = 1
+        inst.after_create(inst, registry)
+        objectmap = inst.__objectmap__
+        self.assertEqual(objectmap.pathindex, None)
+        self.assertEqual(objectmap.pathcount(inst), 4)
+        self.assertEqual(list(objectmap.pathlookup(inst, depth=0)), [1])
+
+    def test_after_create_intern_paths(self):
+        settings = {
+            'substanced.initial_password':'pass',
+            'substanced.objectmap.intern_paths':'true',
+            }
+        registry = self._makeRegistry(settings)
+        inst = self._makeOne()
+        inst.__oid__ = 1
+        inst.after_create(inst, registry)
+        objectmap = inst.__objectmap__
+        self.assertTrue(objectmap.pathnames is not None)
+        self.assertEqual(objectmap.path_for(1), ('',))
+        self.assertEqual(objectmap.pathcount(inst), 4)
+
+    def test_after_create_oid_block_size(self):
+        settings = {
+            'substanced.initial_password':'pass',
+            'substanced.objectmap.oid_block_size':'1000',
+            }
+        registry = self._makeRegistry(settings)
+        inst = self._makeOne()
+        inst.__oid__ = 1
+        inst.after_create(inst, registry)
+        self.assertEqual(inst.__objectmap__.oid_block_size, 1000)
+
+    def test_after_create_object_cache_size(self):
+        settings = {
+            'substanced.initial_password':'pass',
+            'substanced.objectmap.object_cache_size':'500',
+            }
+        registry = self._makeRegistry(settings)
+        inst = self._makeOne()
+        inst.__oid__ = 1
+        inst.after_create(inst, registry)
+        self.assertEqual(inst.__objectmap__.object_cache_size, 500)
+
     def test_after_create_without_password(self):
         from pyramid.exceptions import ConfigurationError
         settings = {}
@@ -1,16 +1,71 @@
 """ Drain deferred indexing actions """
 
+import threading
 from optparse import OptionParser
 
 from pyramid.paster import (
     setup_logging,
     bootstrap,
     )
+from pyramid.threadlocal import manager
 
-from substanced.catalog.deferred import BasicActionProcessor
+from substanced.catalog.deferred import (
+    ActionsListener,
+    BasicActionProcessor,
+    ShardedActionProcessor,
+    )
+
+def drain_shard(db, root_oid, registry, shard, stop_event, listener, sleep,
+                **kw):
+    """ Run the worker for one shard on its own ZODB connection """
+    manager.push({'registry':registry, 'request':None})
+    conn = db.open()
+    try:
+        site = conn.get(root_oid)
+        processor = ShardedActionProcessor(site, shard=shard, **kw)
+        processor.stop_event = stop_event
+        processor.listener = listener
+        processor.process(sleep=sleep) # loops until stop_event is set
+    finally:
+        conn.close()
+        manager.pop()
 
 def main():
-    parser = OptionParser(description=__doc__)
+    parser = OptionParser(
+        description=__doc__,
+        usage='usage: %prog [options] config_uri',
+        )
+    parser.add_option(
+        '-s', '--shards', dest='shards', type='int', default=None,
+        help=('Number of queue shards (defaults to the '
+              'substanced.catalogs.action_processor_shards setting); '
+              'one worker thread is started per shard'),
+        )
+    parser.add_option(
+        '--shard', dest='shard', type='int', default=None,
+        help='Drain only this shard (to run one process per shard)',
+        )
+    parser.add_option(
+        '-p', '--partition', dest='partition', type='choice',
+        choices=ShardedActionProcessor.partitions, default=None,
+        help=('Partition actions by "index" or "oid" (defaults to the '
+              'substanced.catalogs.action_processor_partition setting)'),
+        )
+    parser.add_option(
+        '-b', '--batch-size', dest='batch_size', type='int', default=None,
+        help='Commit after at most this many actions',
+        )
+    parser.add_option(
+        '-l', '--listen', dest='listen', default=None,
+        help=('Wait for notifications from committing transactions on this '
+              'host:port or socket path instead of only polling (defaults '
+              'to the substanced.catalogs.action_processor_notify setting)'),
+        )
+    parser.add_option(
+        '--sleep', dest='sleep', type='float', default=None,
+        help=('Seconds between polls of the queue (default: 5, or 60 when '
+              'listening for notifications)'),
+        )
 
     options, args = parser.parse_args()
 
@@ -22,9 +77,75 @@ def main():
     setup_logging(config_uri)
     env = bootstrap(config_uri)
     site = env['root']
+    registry = env['registry']
+    settings = registry.settings or {}
+
+    shards = options.shards
+    if shards is None:
+        shards = int(
+            settings.get('substanced.catalogs.action_processor_shards', 1)
+            )
+    partition = options.partition
+    if partition is None:
+        partition = settings.get(
+            'substanced.catalogs.action_processor_partition', 'index'
+            )
+
+    listen = options.listen
+    if listen is None:
+        listen = settings.get('substanced.catalogs.action_processor_notify')
+    listener = None
+    if listen:
+        listener = ActionsListener(listen)
+        listener.start()
+
+    sleep = options.sleep
+    if sleep is None:
+        sleep = 60 if listener is not None else 5
+
+    if shards <= 1:
+        processor = BasicActionProcessor(site, batch_size=options.batch_size)
+        processor.listener = listener
+        processor.process(sleep=sleep) # loops
+        return
+
+    kw = dict(
+        shards=shards,
+        partition=partition,
+        batch_size=options.batch_size,
+        )
+
+    if options.shard is not None:
+        processor = ShardedActionProcessor(site, shard=options.shard, **kw)
+        processor.listener = listener
+        processor.process(sleep=sleep) # loops
+        return
+
+    db = site._p_jar.db()
+    stop_event = threading.Event()
+    threads = []
+    for shard in range(shards):
+        thread = threading.Thread(
+            target=drain_shard,
+            args=(db, site._p_oid, registry, shard, stop_event, listener,
+                  sleep),
+            kwargs=kw,
+            name='indexing-shard-%s' % shard,
+            )
+        thread.start()
+        threads.append(thread)
 
-    processor = BasicActionProcessor(site)
-    processor.process() # loops
+    try:
+        while any(thread.is_alive() for thread in threads):
+            # join with a timeout so KeyboardInterrupt reaches this thread
+            for thread in threads:
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        if listener is not None:
+            listener.wake_all()
+        for thread in threads:
+            thread.join()
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,12 @@
 """ Reindex the catalog  """
 
+import multiprocessing
 import re
+import sys
 from optparse import OptionParser
 
+import transaction
+
 from pyramid.paster import (
     setup_logging,
     bootstrap,
@@ -16,6 +20,60 @@ from substanced.catalog import Catalog
 
 from substanced.util import get_dotted_name
 
+def find_catalogs(site, catalog_specs):
+    """ Yield the catalogs named by ``catalog_specs`` (or all catalogs if it
+    is empty) in ``site``."""
+    objectmap = find_objectmap(site)
+
+    catalog_oids = objectmap.get_extent(get_dotted_name(Catalog))
+
+    for oid in catalog_oids:
+
+        catalog = objectmap.object_for(oid)
+
+        path = resource_path(catalog)
+
+        if catalog_specs:
+
+            if ( (not path in catalog_specs) and 
+                 (not catalog.__name__ in catalog_specs) ):
+                    continue
+
+        yield catalog
+
+def reindex_catalogs(config_uri, catalog_specs, worker=None, workers=1, **kw):
+    """ Reindex the catalogs named by ``catalog_specs`` (or all catalogs if
+    it is empty) in the site described by ``config_uri``.  If ``worker`` is
+    not ``None``, only the ``worker``-th of ``workers`` objectid ranges of
+    each catalog is reindexed."""
+    env = bootstrap(config_uri)
+    site = env['root']
+    kw['registry'] = env['registry']
+
+    for catalog in find_catalogs(site, catalog_specs):
+
+        if worker is not None:
+            kw['oid_range'] = catalog.reindex_ranges(workers)[worker]
+
+        catalog.reindex(**kw)
+
+    env['closer']()
+
+def add_checkpoints(config_uri, catalog_specs):
+    """ Give the catalogs named by ``catalog_specs`` which were created
+    before reindex checkpoints existed their checkpoint BTree, so that
+    reindex workers don't all conflict creating it in their first batch."""
+    env = bootstrap(config_uri)
+    site = env['root']
+
+    for catalog in find_catalogs(site, catalog_specs):
+
+        if catalog.reindex_checkpoints is None:
+            catalog.reindex_checkpoints = catalog.family.OO.BTree()
+
+    transaction.commit()
+    env['closer']()
+
 def main():
     parser = OptionParser(description=__doc__)
     parser.add_option('-d', '--dry-run', dest='dry_run',
@@ -32,6 +90,20 @@ def main():
     parser.add_option('-c', '--catalog', dest='catalog_specs', action="append",
         help=("Reindex only the catalog provided (may be a path or a name "
               "and may be specified multiple times)"))
+    parser.add_option('-r', '--resume', dest='resume',
+        action="store_true", default=False,
+        help=("Resume an interrupted reindex from its last committed "
+              "checkpoint (use the same --workers value as the interrupted "
+              "run)"))
+    parser.add_option('-w', '--workers', dest='workers',
+        action="store", default=1, metavar='N',
+        help=("Split the objectids of each catalog into N ranges and "
+              "reindex them in N processes, each with its own database "
+              "connection (requires a storage which can be opened by "
+              "several processes at once, such as ZEO or RelStorage)"))
+    parser.add_option('--retries', dest='retries',
+        action="store", default=3, metavar='N',
+        help="Retry a batch N times after a conflict error")
 
     options, args = parser.parse_args()
 
@@ -46,35 +118,54 @@ def main():
     else:
         path_re = None
 
+    workers = int(options.workers)
+    if workers < 1:
+        parser.error("--workers must be at least 1")
+
     kw = {}
     if options.indexes:
         kw['indexes'] = options.indexes
 
-    setup_logging(config_uri)
-    env = bootstrap(config_uri)
-    site = env['root']
-    registry = env['registry']
-
-    kw['registry'] = registry
-
-    objectmap = find_objectmap(site)
+    kw.update(
+        path_re=path_re,
+        commit_interval=commit_interval,
+        dry_run=options.dry_run,
+        resume=options.resume,
+        retries=int(options.retries),
+        )
 
-    catalog_oids = objectmap.get_extent(get_dotted_name(Catalog))
-
-    for oid in catalog_oids:
-
-        catalog = objectmap.object_for(oid)
-
-        path = resource_path(catalog)
-
-        if options.catalog_specs:
-
-            if ( (not path in options.catalog_specs) and 
-                 (not catalog.__name__ in options.catalog_specs) ):
-                    continue
+    setup_logging(config_uri)
 
-        catalog.reindex(path_re=path_re, commit_interval=commit_interval,
-                        dry_run=options.dry_run, **kw)
+    if workers == 1:
+        reindex_catalogs(config_uri, options.catalog_specs, **kw)
+        return
+
+    if not options.dry_run:
+        add_checkpoints(config_uri, options.catalog_specs)
+
+    processes = []
+    for worker in range(workers):
+        process_kw = dict(kw, worker=worker, workers=workers)
+        process = multiprocessing.Process(
+            target=reindex_catalogs,
+            args=(config_uri, options.catalog_specs),
+            kwargs=process_kw,
+            )
+        process.start()
+        processes.append(process)
+
+    failed = 0
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            failed += 1
+
+    if failed:
+        sys.stderr.write(
+            '%s of %s reindex workers failed; rerun with --resume to '
+            'continue\n' % (failed, workers)
+            )
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
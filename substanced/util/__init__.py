@@ -11,6 +11,7 @@ try:
 except ImportError: # pragma: no cover (pypy)
     import profile as _profile
 
+from BTrees.Length import Length
 from zope.interface import providedBy
 from zope.interface.declarations import Declaration
 
@@ -43,14 +44,36 @@ def coarse_datetime_repr(date):
     return int(timetime) // 100
 
 def postorder(startnode):
-    """ Walks over nodes in a folder recursively. Yields deepest nodes first."""
-    def visit(node):
-        if is_folder(node):
-            for name, child in sorted(node.items()):
-                for result in visit(child):
-                    yield result
-        yield node
-    return visit(startnode)
+    """ Walks over nodes in a folder recursively. Yields deepest nodes first.
+
+    The children of each folder are visited in name order.  If you only need
+    the object identifiers of the nodes in a subtree which is part of the
+    object map, :meth:`substanced.objectmap.ObjectMap.postorder` yields them
+    in the same order without loading any of the nodes."""
+    # an explicit stack of (node, remaining children) rather than a generator
+    # per level: deep trees don't hit the recursion limit, and each node is
+    # yielded directly rather than through every generator above it
+    stack = [(startnode, _reversed_children(startnode))]
+    while stack:
+        node, children = stack[-1]
+        while children:
+            child = children.pop()
+            grandchildren = _reversed_children(child)
+            if grandchildren:
+                stack.append((child, grandchildren))
+                break
+            yield child # a leaf needn't go through the stack
+        else:
+            stack.pop()
+            yield node
+
+def _reversed_children(node):
+    # the children of node in reverse name order, so that they can be popped
+    # off the end in name order
+    if is_folder(node):
+        items = sorted(node.items(), reverse=True)
+        return [ child for name, child in items ]
+    return ()
 
 def get_oid(resource, default=_marker):
     """ Return the object identifer of ``resource``.  If ``resource`` has no
@@ -70,6 +93,36 @@ def set_oid(resource, oid):
     """ Set the object id of the resource to oid."""
     resource.__oid__ = oid
 
+def bump_generation(obj, create=True):
+    """ Record a change to the persistent object ``obj`` by incrementing its
+    ``_generation`` counter, a :class:`BTrees.Length.Length`.  The counter
+    is a persistent object of its own, so that changes made by concurrent
+    transactions don't conflict.  If ``obj`` has no counter yet, one is
+    created only if ``create`` is true; this writes ``obj`` itself, so a
+    concurrent change to ``obj`` which didn't see the new counter conflicts
+    rather than going unrecorded.  See :func:`get_generation`."""
+    generation = getattr(obj, '_generation', None)
+    if generation is None:
+        if not create:
+            return
+        generation = obj._generation = Length()
+    generation.change(1)
+
+def get_generation(obj):
+    """ Return a token which differs after each :func:`bump_generation` of
+    the persistent ``obj``, including the ones committed by other database
+    connections.  Return ``None`` if ``obj`` has no counter, so its changes
+    aren't tracked, or if ``obj`` has been changed by the current
+    transaction, which may still be aborted."""
+    generation = getattr(obj, '_generation', None)
+    if generation is None:
+        return None
+    value = generation() # loads a ghost before its serial is read
+    if (generation._p_changed or
+        generation._p_jar is not getattr(obj, '_p_jar', None)):
+        return None
+    return (generation._p_serial, value)
+
 def merge_url_qs(url, **kw):
     """ Merge the query string elements of a URL with the ones in ``kw``.
     If any query string element exists in ``url`` that also exists in
@@ -314,6 +367,38 @@ def chunks(stream, chunk_size=10000):
             break
         yield chunk
 
+def reversed_items(mapping, max=None, excludemax=False, chunk_size=64):
+    """ Return a generator over the ``(key, value)`` items of the BTree
+    ``mapping`` in descending key order, starting at ``max`` (or after it
+    if ``excludemax`` is true) if it's not ``None``.
+
+    ``reversed(mapping.items())`` looks each item up by index, and a BTree
+    range can only be indexed backwards by seeking from its start, so the
+    items are read forward in chunks of keys instead, walking down from
+    ``max``; the size of the chunks starts at ``chunk_size`` and doubles
+    (up to 64 times that), so that a walk which stops early reads few
+    items."""
+    hi = max
+    largest = chunk_size * 64
+    while True:
+        keys = mapping.keys(max=hi, excludemax=excludemax)
+        numkeys = len(keys)
+        if not numkeys:
+            return
+        start = numkeys - chunk_size
+        if start < 0:
+            start = 0
+        lo = keys[start]
+        chunk = list(mapping.items(min=lo, max=hi, excludemax=excludemax))
+        for item in reversed(chunk):
+            yield item
+        if not start:
+            return
+        hi = lo
+        excludemax = True
+        if chunk_size < largest:
+            chunk_size *= 2
+
 def acquire(resource, name, default=_marker):
     for node in lineage(resource):
         result = getattr(node, name, _marker)
@@ -49,6 +49,31 @@ class Test__postorder(unittest.TestCase):
         result = list(self._callFUT(model))
         self.assertEqual(result, [one, four, three, two, model])
 
+    def test_deep_tree(self):
+        import sys
+        from ..interfaces import IFolder
+        model = node = testing.DummyResource(__provides__=IFolder)
+        nodes = [model]
+        for i in range(sys.getrecursionlimit() + 10):
+            child = testing.DummyResource(__provides__=IFolder)
+            node['child'] = child
+            nodes.append(child)
+            node = child
+        result = list(self._callFUT(model))
+        self.assertEqual(result, nodes[::-1])
+
+    def test_lazy(self):
+        from ..interfaces import IFolder
+        model = testing.DummyResource(__provides__=IFolder)
+        one = testing.DummyResource(__provides__=IFolder)
+        model['one'] = one
+        two = testing.DummyResource()
+        one['two'] = two
+        result = self._callFUT(model)
+        self.assertEqual(next(result), two)
+        one['three'] = testing.DummyResource() # already listed
+        self.assertEqual(list(result), [one, model])
+
 class Test_get_oid(unittest.TestCase):
     def _callFUT(self, obj, default=_marker):
         from . import get_oid
@@ -77,6 +102,121 @@ class Test_set_oid(unittest.TestCase):
         self._callFUT(obj, 1)
         self.assertEqual(obj.__oid__, 1)
 
+class Test_bump_generation(unittest.TestCase):
+    def _callFUT(self, obj):
+        from . import bump_generation
+        return bump_generation(obj)
+
+    def test_creates_counter(self):
+        obj = testing.DummyResource()
+        self._callFUT(obj)
+        self.assertEqual(obj._generation(), 1)
+
+    def test_no_counter_not_created(self):
+        from . import bump_generation
+        obj = testing.DummyResource()
+        bump_generation(obj, create=False)
+        self.assertFalse(hasattr(obj, '_generation'))
+
+    def test_increments_counter(self):
+        obj = testing.DummyResource()
+        self._callFUT(obj)
+        generation = obj._generation
+        self._callFUT(obj)
+        self.assertTrue(obj._generation is generation)
+        self.assertEqual(generation(), 2)
+
+class Test_get_generation(unittest.TestCase):
+    def _callFUT(self, obj):
+        from . import get_generation
+        return get_generation(obj)
+
+    def test_no_counter(self):
+        obj = testing.DummyResource()
+        self.assertEqual(self._callFUT(obj), None)
+
+    def test_changes_after_bump(self):
+        from . import bump_generation
+        obj = testing.DummyResource()
+        bump_generation(obj)
+        first = self._callFUT(obj)
+        self.assertEqual(first[1], 1)
+        bump_generation(obj)
+        second = self._callFUT(obj)
+        self.assertEqual(second[1], 2)
+        self.assertNotEqual(first, second)
+
+    def test_uncommitted_change(self):
+        obj = testing.DummyResource()
+        obj._generation = DummyLength(3, changed=True)
+        self.assertEqual(self._callFUT(obj), None)
+
+    def test_counter_not_yet_stored(self):
+        obj = testing.DummyResource()
+        obj._p_jar = object()
+        obj._generation = DummyLength(1)
+        self.assertEqual(self._callFUT(obj), None)
+
+    def test_committed(self):
+        obj = testing.DummyResource()
+        obj._p_jar = object()
+        obj._generation = DummyLength(3, jar=obj._p_jar, serial=b'1')
+        self.assertEqual(self._callFUT(obj), (b'1', 3))
+
+class Test_reversed_items(unittest.TestCase):
+    def _callFUT(self, mapping, **kw):
+        from . import reversed_items
+        return list(reversed_items(mapping, **kw))
+
+    def _makeMapping(self, size):
+        import BTrees
+        mapping = BTrees.family64.OO.BTree()
+        for i in range(size):
+            mapping[i] = str(i)
+        return mapping
+
+    def test_empty(self):
+        mapping = self._makeMapping(0)
+        self.assertEqual(self._callFUT(mapping), [])
+
+    def test_all_items(self):
+        mapping = self._makeMapping(500)
+        result = self._callFUT(mapping, chunk_size=3)
+        self.assertEqual(result, list(reversed(list(mapping.items()))))
+
+    def test_max(self):
+        mapping = self._makeMapping(500)
+        result = self._callFUT(mapping, max=250, chunk_size=3)
+        self.assertEqual([ key for key, value in result ],
+                         list(range(250, -1, -1)))
+
+    def test_max_excludemax(self):
+        mapping = self._makeMapping(500)
+        result = self._callFUT(mapping, max=250, excludemax=True,
+                               chunk_size=3)
+        self.assertEqual([ key for key, value in result ],
+                         list(range(249, -1, -1)))
+
+    def test_max_below_smallest_key(self):
+        mapping = self._makeMapping(500)
+        result = self._callFUT(mapping, max=0, excludemax=True)
+        self.assertEqual(result, [])
+
+    def test_reads_only_the_chunks_walked(self):
+        from . import reversed_items
+        mapping = self._makeMapping(500)
+        ranges = []
+        items = mapping.items
+        def recording_items(**kw):
+            ranges.append((kw['min'], kw['max']))
+            return items(**kw)
+        mapping = DummyMapping(mapping, recording_items)
+        walk = reversed_items(mapping, chunk_size=3)
+        self.assertEqual([ next(walk) for i in range(4) ],
+                         [(499, '499'), (498, '498'), (497, '497'),
+                          (496, '496')])
+        self.assertEqual(ranges, [(497, None), (491, 497)])
+
 class TestBatch(unittest.TestCase):
     def _makeOne(self, seq, request, url=None, default_size=15, seqlen=None):
         from . import Batch
@@ -1032,3 +1172,17 @@ class DummyConnection(object):
             raise KeyError
         return self
 
+class DummyMapping(object):
+    def __init__(self, mapping, items):
+        self.keys = mapping.keys
+        self.items = items
+
+class DummyLength(object):
+    def __init__(self, value, changed=False, jar=None, serial=b'0'):
+        self.value = value
+        self._p_changed = changed
+        self._p_jar = jar
+        self._p_serial = serial
+
+    def __call__(self):
+        return self.value